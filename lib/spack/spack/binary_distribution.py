@@ -4,14 +4,20 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import codecs
+import errno
 import hashlib
 import json
+import mmap
+import multiprocessing.pool
 import os
 import shutil
+import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
 import traceback
+import zlib
 from contextlib import closing
 
 import ruamel.yaml as yaml
@@ -31,6 +37,7 @@
 import spack.mirror
 import spack.platforms
 import spack.relocate as relocate
+import spack.util.cpus
 import spack.util.file_cache as file_cache
 import spack.util.gpg
 import spack.util.spack_json as sjson
@@ -39,7 +46,8 @@
 import spack.util.web as web_util
 from spack.caches import misc_cache_location
 from spack.spec import Spec
-from spack.stage import Stage
+from spack.stage import Stage, get_stage_root
+from spack.util.executable import which
 
 _build_cache_relative_path = 'build_cache'
 _build_cache_keys_relative_path = '_pgp'
@@ -64,6 +72,105 @@ def __init__(self, errors):
         super(FetchCacheError, self).__init__(self.message)
 
 
+#: Version of the format of the lookup tables of cached build cache indices
+_index_lookup_version = 1
+
+
+def _index_node_dict(record):
+    """Return the node dictionary of a record of a build cache index, with
+    the name of the spec in it whatever the format of the index."""
+    spec_dict = record['spec']
+    if 'name' in spec_dict:
+        return spec_dict
+    name = next(iter(spec_dict))
+    node_dict = dict(spec_dict[name])
+    node_dict['name'] = name
+    return node_dict
+
+
+def index_lookup_table(installs):
+    """Summarize the specs of a build cache index in a table that can be
+    loaded without constructing any spec.
+
+    Args:
+        installs (dict): records of the index, keyed by DAG hash
+
+    Returns:
+        A dict mapping the DAG hash of each spec in the build cache to its
+        ``[name, version, full_hash]``
+    """
+    table = {}
+    for dag_hash, record in installs.items():
+        if not record.get('in_buildcache'):
+            continue
+        node_dict = _index_node_dict(record)
+        version = node_dict.get('version')
+        if version is None:
+            version = ','.join(node_dict.get('versions', []))
+        table[dag_hash] = [node_dict['name'], version, node_dict.get('full_hash')]
+    return table
+
+
+def _spec_from_index(dag_hash, installs, specs):
+    """Construct the spec with DAG hash ``dag_hash`` from the records of a
+    build cache index, along with its dependencies but not the other specs
+    of the index.
+
+    Args:
+        dag_hash (str): DAG hash of the spec
+        installs (dict): records of the index, keyed by DAG hash
+        specs (dict): specs already constructed from the index, keyed by
+            DAG hash, which are reused as dependencies
+    """
+    if dag_hash not in specs:
+        node_dict = dict(_index_node_dict(installs[dag_hash]))
+        node_dict[ht.dag_hash.name] = dag_hash
+        spec = Spec.from_node_dict(node_dict)
+        for _, dep_hash, dep_types, _ in Spec.read_yaml_dep_specs(
+                node_dict.get('dependencies', {})):
+            if dep_hash in installs:
+                spec._add_dependency(
+                    _spec_from_index(dep_hash, installs, specs), dep_types)
+        specs[dag_hash] = spec
+    return specs[dag_hash]
+
+
+class IndexedSpecEntry(dict):
+    """Entry of the mirrors of a spec found in the lookup table of a build
+    cache index, like ``{'mirror_url': ..., 'spec': ...}``.
+
+    The spec is only constructed from the index the first time the ``spec``
+    item is accessed, while its full hash is known from the lookup table.
+    """
+    def __init__(self, binary_index, cache_key, mirror_url, dag_hash, full_hash):
+        super(IndexedSpecEntry, self).__init__(mirror_url=mirror_url)
+        self._binary_index = binary_index
+        self._cache_key = cache_key
+        self._dag_hash = dag_hash
+        self._full_hash = full_hash
+
+    def __missing__(self, key):
+        if key != 'spec':
+            raise KeyError(key)
+        self['spec'] = self._binary_index._read_indexed_spec(
+            self._cache_key, self._dag_hash)
+        return self['spec']
+
+    @property
+    def full_hash(self):
+        if 'spec' in self:
+            return self['spec']._full_hash
+        return self._full_hash
+
+
+def _entry_full_hash(entry):
+    """Full hash of the spec of an entry of the mirrors of a spec, without
+    constructing the spec of an ``IndexedSpecEntry``."""
+    if isinstance(entry, IndexedSpecEntry):
+        return entry.full_hash
+    return entry['spec']._full_hash
+
+
 class BinaryCacheIndex(object):
     """
     The BinaryCacheIndex tracks what specs are available on (usually remote)
@@ -109,6 +216,21 @@ def __init__(self, cache_root):
         #           use the updated source if available)
         self._mirrors_for_spec = {}
 
+        # maps the cache keys of indices to their records and the specs
+        # constructed from them so far, for the entries of their lookup
+        # tables whose spec is accessed
+        self._index_records = {}
+
+        # maps the URL of mirrors with a sharded index to the table of their
+        # shards. Shards are only fetched and read when looking for specs
+        # whose DAG hash selects them.
+        self._shard_tables = {}
+
+        # (mirror URL, DAG hash) pairs already looked up in sharded indices,
+        # and (mirror URL, shard hash) pairs of shards read in full
+        self._sharded_lookups = set()
+        self._shards_read = set()
+
     def _init_local_index_cache(self):
         if not self._index_file_cache:
             self._index_file_cache = file_cache.FileCache(
@@ -134,6 +256,10 @@ def clear(self):
         self._local_index_cache = None
         self._specs_already_associated = set()
         self._mirrors_for_spec = {}
+        self._index_records = {}
+        self._shard_tables = {}
+        self._sharded_lookups = set()
+        self._shards_read = set()
 
     def _write_local_index_cache(self):
         self._init_local_index_cache()
@@ -151,56 +277,186 @@ def regenerate_spec_cache(self, clear_existing=False):
         if clear_existing:
             self._specs_already_associated = set()
             self._mirrors_for_spec = {}
+            self._index_records = {}
+            self._shard_tables = {}
+            self._sharded_lookups = set()
+            self._shards_read = set()
 
         for mirror_url in self._local_index_cache:
             cache_entry = self._local_index_cache[mirror_url]
             cached_index_path = cache_entry['index_path']
             cached_index_hash = cache_entry['index_hash']
             if cached_index_hash not in self._specs_already_associated:
-                self._associate_built_specs_with_mirror(cached_index_path,
-                                                        mirror_url)
+                if cache_entry.get('sharded'):
+                    self._shard_tables[mirror_url] = self._read_shard_table(
+                        cached_index_path)
+                else:
+                    self._associate_built_specs_with_mirror(cached_index_path,
+                                                            mirror_url)
                 self._specs_already_associated.add(cached_index_hash)
 
-    def _associate_built_specs_with_mirror(self, cache_key, mirror_url):
-        tmpdir = tempfile.mkdtemp()
+    def _read_shard_table(self, cache_key):
+        self._index_file_cache.init_entry(cache_key)
+        with self._index_file_cache.read_transaction(cache_key) as f:
+            return json.load(f)['shards']
+
+    def _shard_cache_key(self, mirror_url, prefix, shard_hash):
+        return '{0}_{1}'.format(
+            compute_hash(mirror_url)[:10],
+            index_shard_file_name(prefix, shard_hash).replace('/', '_'))
+
+    def _remove_shards(self, mirror_url, table, keep=None):
+        """Remove the local copies of the shards in ``table`` that are not
+        listed in the table ``keep``."""
+        keep_files = keep['files'] if keep else {}
+        for prefix, shard_hash in table['files'].items():
+            cache_key = self._shard_cache_key(mirror_url, prefix, shard_hash)
+            if keep_files.get(prefix) != shard_hash and os.path.exists(
+                    self._index_file_cache.cache_path(cache_key)):
+                self._index_file_cache.remove(cache_key)
+
+    def _read_shard(self, mirror_url, table, prefix, dag_hash=None):
+        """Read records from the shard of the index of ``mirror_url`` that
+        stores the specs whose DAG hash starts with ``prefix``, fetching it
+        if there is no local copy of it yet.
 
-        try:
-            db_root_dir = os.path.join(tmpdir, 'db_root')
-            db = spack_db.Database(None, db_dir=db_root_dir,
-                                   enable_transaction_locking=False)
+        Returns:
+            A dict mapping DAG hashes to spec dictionaries, see
+            ``read_index_shard``
+        """
+        shard_hash = table['files'].get(prefix)
+        if shard_hash is None:
+            return {}
 
+        cache_key = self._shard_cache_key(mirror_url, prefix, shard_hash)
+        self._index_file_cache.init_entry(cache_key)
+        cache_path = self._index_file_cache.cache_path(cache_key)
+        if not os.path.exists(cache_path):
+            shard_url = url_util.join(
+                mirror_url, _build_cache_relative_path,
+                index_shard_file_name(prefix, shard_hash))
+            tty.debug('Fetching index shard {0}'.format(shard_url))
+            try:
+                _, _, fs = web_util.read_from_url(shard_url)
+                shard_str = codecs.getreader('utf-8')(fs).read()
+            except (URLError, web_util.SpackWebError) as url_err:
+                tty.debug('Unable to read index shard {0}: {1}'.format(
+                    shard_url, url_err))
+                return {}
+            if compute_hash(shard_str) != shard_hash:
+                tty.debug('Index shard {0} does not match its hash'.format(
+                    shard_url))
+                return {}
+            with self._index_file_cache.write_transaction(cache_key) as (
+                    old, new):
+                new.write(shard_str)
+
+        with self._index_file_cache.read_transaction(cache_key):
+            return read_index_shard(cache_path, dag_hash)
+
+    def _associate_shard_records(self, mirror_url, records):
+        for spec_dict in records.values():
+            indexed_spec = Spec.from_dict(spec_dict)
+            indexed_spec._mark_concrete()
+            self._associate_built_spec(indexed_spec, mirror_url)
+
+    def _find_in_shards(self, find_hash):
+        """Add the entries of the spec with DAG hash ``find_hash`` in the
+        sharded indices to ``_mirrors_for_spec``."""
+        for mirror_url, table in self._shard_tables.items():
+            if (mirror_url, find_hash) in self._sharded_lookups:
+                continue
+            self._sharded_lookups.add((mirror_url, find_hash))
+            prefix = find_hash[:table['prefix_length']]
+            if (mirror_url, table['files'].get(prefix)) in self._shards_read:
+                continue
+            self._associate_shard_records(
+                mirror_url, self._read_shard(mirror_url, table, prefix, find_hash))
+
+    def _read_all_shards(self):
+        for mirror_url, table in self._shard_tables.items():
+            for prefix, shard_hash in table['files'].items():
+                if (mirror_url, shard_hash) in self._shards_read:
+                    continue
+                self._shards_read.add((mirror_url, shard_hash))
+                self._associate_shard_records(
+                    mirror_url, self._read_shard(mirror_url, table, prefix))
+
+    def _associate_built_spec(self, indexed_spec, mirror_url):
+        self._associate_entry(indexed_spec.dag_hash(), {
+            "mirror_url": mirror_url,
+            "spec": indexed_spec,
+        })
+
+    def _associate_entry(self, dag_hash, new_entry):
+        full_hash = _entry_full_hash(new_entry)
+        entries = self._mirrors_for_spec.setdefault(dag_hash, [])
+
+        for i, entry in enumerate(entries):
+            # A binary mirror can only have one spec per DAG hash, so
+            # if we already have an entry under this DAG hash for this
+            # mirror url, we may need to replace the spec associated
+            # with it (but only if it has a different full_hash).
+            if entry['mirror_url'] == new_entry['mirror_url']:
+                if full_hash and full_hash != _entry_full_hash(entry):
+                    entries[i] = new_entry
+                break
+        else:
+            entries.append(new_entry)
+
+    @staticmethod
+    def _lookup_cache_key(cache_key):
+        return os.path.splitext(cache_key)[0] + '.lookup.json'
+
+    def _read_lookup_table(self, cache_key):
+        """Return the lookup table of the cached index ``cache_key``, which
+        is generated and cached along with the index the first time."""
+        lookup_key = self._lookup_cache_key(cache_key)
+        if self._index_file_cache.init_entry(lookup_key):
+            with self._index_file_cache.read_transaction(lookup_key) as f:
+                lookup = json.load(f).get('lookup', {})
+            if lookup.get('version') == _index_lookup_version:
+                return lookup['specs']
+
+        self._index_file_cache.init_entry(cache_key)
+        with self._index_file_cache.read_transaction(cache_key) as f:
+            installs = json.load(f)['database']['installs']
+        table = index_lookup_table(installs)
+        with self._index_file_cache.write_transaction(lookup_key) as (old, new):
+            json.dump({'lookup': {
+                'version': _index_lookup_version,
+                'specs': table,
+            }}, new)
+        return table
+
+    def _remove_cached_index(self, cache_key):
+        """Remove a cached index, along with its lookup table."""
+        lookup_key = self._lookup_cache_key(cache_key)
+        if os.path.exists(self._index_file_cache.cache_path(lookup_key)):
+            self._index_file_cache.remove(lookup_key)
+        self._index_file_cache.remove(cache_key)
+        self._index_records.pop(cache_key, None)
+
+    def _read_indexed_spec(self, cache_key, dag_hash):
+        """Construct a spec, with its dependencies, from a cached index."""
+        if cache_key not in self._index_records:
             self._index_file_cache.init_entry(cache_key)
-            cache_path = self._index_file_cache.cache_path(cache_key)
-            with self._index_file_cache.read_transaction(cache_key):
-                db._read_from_file(cache_path)
-
-            spec_list = db.query_local(installed=False, in_buildcache=True)
-
-            for indexed_spec in spec_list:
-                dag_hash = indexed_spec.dag_hash()
-                full_hash = indexed_spec._full_hash
-
-                if dag_hash not in self._mirrors_for_spec:
-                    self._mirrors_for_spec[dag_hash] = []
-
-                for entry in self._mirrors_for_spec[dag_hash]:
-                    # A binary mirror can only have one spec per DAG hash, so
-                    # if we already have an entry under this DAG hash for this
-                    # mirror url, we may need to replace the spec associated
-                    # with it (but only if it has a different full_hash).
-                    if entry['mirror_url'] == mirror_url:
-                        if full_hash and full_hash != entry['spec']._full_hash:
-                            entry['spec'] = indexed_spec
-                        break
-                else:
-                    self._mirrors_for_spec[dag_hash].append({
-                        "mirror_url": mirror_url,
-                        "spec": indexed_spec,
-                    })
-        finally:
-            shutil.rmtree(tmpdir)
+            with self._index_file_cache.read_transaction(cache_key) as f:
+                installs = json.load(f)['database']['installs']
+            self._index_records[cache_key] = (installs, {})
+        installs, specs = self._index_records[cache_key]
+        spec = _spec_from_index(dag_hash, installs, specs)
+        spec._mark_concrete()
+        return spec
+
+    def _associate_built_specs_with_mirror(self, cache_key, mirror_url):
+        table = self._read_lookup_table(cache_key)
+        for dag_hash, (_, _, full_hash) in table.items():
+            self._associate_entry(dag_hash, IndexedSpecEntry(
+                self, cache_key, mirror_url, dag_hash, full_hash))
 
     def get_all_built_specs(self):
+        self._read_all_shards()
         spec_list = []
         for dag_hash in self._mirrors_for_spec:
             # in the absence of further information, all concrete specs
@@ -249,6 +505,7 @@ def find_by_hash(self, find_hash):
         Args:
             find_hash (str): hash of the spec to search
         """
+        self._find_in_shards(find_hash)
         if find_hash not in self._mirrors_for_spec:
             return None
         return self._mirrors_for_spec[find_hash]
@@ -348,7 +605,9 @@ def update(self):
         for item in items_to_remove:
             url = item['url']
             cache_key = item['cache_key']
-            self._index_file_cache.remove(cache_key)
+            if self._local_index_cache[url].get('sharded'):
+                self._remove_shards(url, self._read_shard_table(cache_key))
+            self._remove_cached_index(cache_key)
             del self._local_index_cache[url]
 
         # Iterate the configured mirrors now.  Any mirror urls we do not
@@ -375,9 +634,82 @@ def update(self):
         elif spec_cache_regenerate_needed:
             self.regenerate_spec_cache(clear_existing=spec_cache_clear_needed)
 
+    def _fetch_and_cache_shard_table(self, mirror_url):
+        """Fetch the table of the shards of the buildcache index of a remote
+        mirror and cache it, unless it was not modified since it was cached.
+
+        Args:
+            mirror_url (str): Base url of mirror
+
+        Returns:
+            True if this function thinks the concrete spec cache,
+                ``_mirrors_for_spec``, should be regenerated.  Returns False
+                otherwise.
+
+        Throws:
+            URLError, SpackWebError: if the mirror has no sharded index
+        """
+        table_fetch_url = url_util.join(
+            mirror_url, _build_cache_relative_path, 'index.shards.json')
+        previous_entry = self._local_index_cache.get(mirror_url, {})
+        existing_entry = previous_entry if previous_entry.get('sharded') else {}
+
+        result = web_util.read_from_url_if_modified(
+            table_fetch_url,
+            etag=existing_entry.get('etag'),
+            last_modified=existing_entry.get('last_modified'))
+        if result is None:
+            tty.debug('Cached index shards for {0} already up to date'.format(
+                mirror_url))
+            return False
+
+        _, headers, fs = result
+        table_str = codecs.getreader('utf-8')(fs).read()
+        table = sjson.load(table_str)['shards']
+        if table.get('version') != _index_shards_version:
+            raise web_util.SpackWebError(
+                'Unsupported version of the index shards at {0}'.format(
+                    table_fetch_url))
+
+        table_hash = compute_hash(table_str)
+        cache_entry = {
+            'index_hash': table_hash,
+            'index_path': existing_entry.get('index_path'),
+            'sharded': True,
+            'etag': web_util.get_header_or_none(headers, 'ETag'),
+            'last_modified': web_util.get_header_or_none(headers, 'Last-Modified'),
+        }
+        self._local_index_cache[mirror_url] = cache_entry
+        if table_hash == existing_entry.get('index_hash'):
+            tty.debug('Cached index shards for {0} already up to date'.format(
+                mirror_url))
+            return False
+
+        cache_key = '{0}_{1}.shards.json'.format(
+            compute_hash(mirror_url)[:10], table_hash[:10])
+        self._index_file_cache.init_entry(cache_key)
+        with self._index_file_cache.write_transaction(cache_key) as (old, new):
+            new.write(table_str)
+        cache_entry['index_path'] = cache_key
+
+        # Remove the shards that are not listed anymore along with the table,
+        # or the whole index cached before the mirror was sharded
+        old_cache_key = previous_entry.get('index_path')
+        if old_cache_key and existing_entry:
+            self._remove_shards(
+                mirror_url, self._read_shard_table(old_cache_key), keep=table)
+        if old_cache_key:
+            self._remove_cached_index(old_cache_key)
+        return True
+
     def _fetch_and_cache_index(self, mirror_url, expect_hash=None):
         """ Fetch a buildcache index file from a remote mirror and cache it.
 
+        Mirrors with a sharded index only have the table of their shards
+        fetched, and shards are fetched only when they are looked up. The
+        table is fetched with a conditional request, so that it is only
+        transferred when it was modified.
+
         If we already have a cached index from this mirror, then we first
         check if the hash has changed, and we avoid fetching it if not.
 
@@ -394,6 +726,11 @@ def _fetch_and_cache_index(self, mirror_url, expect_hash=None):
         Throws:
             FetchCacheError: a composite exception.
         """
+        try:
+            return self._fetch_and_cache_shard_table(mirror_url)
+        except (URLError, web_util.SpackWebError, KeyError, ValueError) as err:
+            tty.debug('No index shards at {0}: {1}'.format(mirror_url, err))
+
         index_fetch_url = url_util.join(
             mirror_url, _build_cache_relative_path, 'index.json')
         hash_fetch_url = url_util.join(
@@ -474,7 +811,7 @@ def _fetch_and_cache_index(self, mirror_url, expect_hash=None):
 
         # clean up the old cache_key if necessary
         if old_cache_key:
-            self._index_file_cache.remove(old_cache_key)
+            self._remove_cached_index(old_cache_key)
 
         # We fetched an index and updated the local index cache, we should
         # regenerate the spec cache as a result.
@@ -559,6 +896,32 @@ def __init__(self, msg):
         super(NewLayoutException, self).__init__(msg)
 
 
+class UnsupportedCompressionException(spack.error.SpackError):
+    """
+    Raised if a tarball cannot be compressed or decompressed.
+    """
+
+    def __init__(self, compression, reason=None):
+        err_msg = 'Cannot use "{0}" compression for build caches'.format(
+            compression)
+        if reason:
+            err_msg += ': {0}'.format(reason)
+        super(UnsupportedCompressionException, self).__init__(err_msg)
+
+
+class UnknownFormatException(spack.error.SpackError):
+    """
+    Raised if a tarball has a newer format than this version of Spack knows.
+    """
+
+    def __init__(self, spec_name, version):
+        err_msg = ('The binary package of {0} has format version {1}, but '
+                   'this version of Spack only supports up to version {2}'
+                   .format(spec_name, version, binary_cache_format_version))
+        long_msg = 'Update Spack to install this binary package.'
+        super(UnknownFormatException, self).__init__(err_msg, long_msg)
+
+
 def compute_hash(data):
     return hashlib.sha256(data.encode('utf-8')).hexdigest()
 
@@ -605,7 +968,7 @@ def get_buildfile_manifest(spec):
     """
     data = {"text_to_relocate": [], "binary_to_relocate": [],
             "link_to_relocate": [], "other": [],
-            "binary_to_relocate_fullpath": []}
+            "binary_to_relocate_fullpath": [], "mime_types": {}}
 
     blacklist = (".spack", "man")
 
@@ -627,6 +990,8 @@ def get_buildfile_manifest(spec):
             path_name = os.path.join(root, filename)
             m_type, m_subtype = relocate.mime_type(path_name)
             rel_path_name = os.path.relpath(path_name, spec.prefix)
+            data['mime_types'][rel_path_name] = '{0}/{1}'.format(
+                m_type, m_subtype)
             added = False
 
             if os.path.islink(path_name):
@@ -684,6 +1049,86 @@ def write_buildinfo_file(spec, workdir, rel=False):
     filename = buildinfo_file_name(workdir)
     with open(filename, 'w') as outfile:
         outfile.write(syaml.dump(buildinfo, default_flow_style=True))
+    return manifest
+
+
+def relocation_manifest_file_name(prefix):
+    """
+    Filename of the manifest of the files relocated in a binary package
+    """
+    return os.path.join(prefix, ".spack/binary_distribution_manifest.json")
+
+
+def _relocated_prefixes(buildinfo):
+    """Return the old prefixes relocated by ``relocate_package()``."""
+    old_layout_root = str(buildinfo['buildpath'])
+    prefixes = [
+        old_layout_root,
+        os.path.join(old_layout_root, buildinfo['relative_prefix']),
+        '#!/bin/bash {0}/bin/sbang'.format(buildinfo.get('spackprefix')),
+    ]
+    prefixes.extend(buildinfo.get('prefix_to_hash', {}))
+    if 'sbang_install_path' in buildinfo:
+        prefixes.append(str(buildinfo['sbang_install_path']))
+    return prefixes
+
+
+def write_relocation_manifest(workdir, mime_types):
+    """Record how each file of a binary package is relocated, so that
+    ``relocate_package()`` needs neither to classify the files again, nor
+    to search them for the old prefixes.
+
+    For each text file and binary in the buildinfo file, the manifest holds
+    its MIME type, its kind (``text``, ``elf``, ``binary`` or ``link``), its
+    size and the offsets at which old prefixes begin in it. For ELF files,
+    it also holds the ranges of the offsets of their RPATHs, which are
+    relocated with patchelf instead.
+
+    Args:
+        workdir (str): copy of the install prefix put in the tarball
+        mime_types (dict): MIME types of the files, keyed by their path
+            relative to the prefix
+    """
+    buildinfo = read_buildinfo_file(workdir)
+    prefixes = _relocated_prefixes(buildinfo)
+
+    files = {}
+    for kind, names in (('text', buildinfo['relocate_textfiles']),
+                        ('binary', buildinfo['relocate_binaries'])):
+        for name in names:
+            path = os.path.join(workdir, name)
+            entry = {'type': mime_types.get(name)}
+            files[name] = entry
+            if os.path.islink(path):
+                entry['kind'] = 'link'
+                continue
+
+            entry['size'] = os.path.getsize(path)
+            entry['offsets'] = relocate.prefix_offsets(path, prefixes)
+            file_kind = kind
+            if kind == 'binary':
+                with open(path, 'rb') as f:
+                    if f.read(4) == b'\x7fELF':
+                        file_kind = 'elf'
+            if file_kind == 'elf' and entry['offsets']:
+                entry['rpaths'] = relocate.elf_rpath_ranges(path)
+            entry['kind'] = file_kind
+
+    with open(relocation_manifest_file_name(workdir), 'w') as f:
+        sjson.dump({'manifest': {'version': 1, 'files': files}}, f)
+
+
+def read_relocation_manifest(prefix):
+    """Return the files of the relocation manifest of an install prefix
+    extracted from a binary package, or None if it has no manifest."""
+    filename = relocation_manifest_file_name(prefix)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        manifest = sjson.load(f)['manifest']
+    if manifest.get('version') != 1:
+        return None
+    return manifest['files']
 
 
 def tarball_directory_name(spec):
@@ -730,6 +1175,307 @@ def checksum_tarball(file):
     return hasher.hexdigest()
 
 
+#: Version of the format of build cache tarballs, recorded in the
+#: ``binary_cache_format`` attribute of their spec files. Version 1 tarballs
+#: predate the attribute and are compressed with gzip, version 2 tarballs
+#: can also be compressed with zstd. Spack refuses to extract tarballs of a
+#: newer format than it knows, rather than failing halfway through.
+binary_cache_format_version = 2
+
+#: Extension of the tarball of an install prefix for each compression
+compression_extensions = OrderedDict([
+    ('gzip', '.tar.gz'),
+    ('zstd', '.tar.zst'),
+    ('bzip2', '.tar.bz2'),
+])
+
+#: Extension of the archive of a spec for each compression of its tarball.
+#: Archives of zstd compressed tarballs have their own name, which releases
+#: of Spack without zstd support never download: they build the spec from
+#: source instead of failing to extract a tarball they cannot read.
+archive_extensions = OrderedDict([
+    ('gzip', '.spack'),
+    ('zstd', '.zst.spack'),
+])
+
+
+class ParallelGzipFile(object):
+    """Write-only file object compressing its data with gzip on several
+    threads.
+
+    The data is split in chunks, each compressed in its own gzip member
+    by a thread (``zlib`` releases the GIL while compressing). Concatenated
+    gzip members are a valid gzip file, which ``gzip`` and ``tarfile`` read
+    as usual.
+    """
+
+    def __init__(self, fileobj, jobs=None, chunk_size=1 << 20, level=6):
+        self.fileobj = fileobj
+        self.jobs = jobs or spack.util.cpus.cpus_available()
+        self.chunk_size = chunk_size
+        self.level = level
+        self.pool = multiprocessing.pool.ThreadPool(processes=self.jobs)
+        self.buffer = []
+        self.buffered = 0
+        self.chunks = []
+
+    def _compress(self, chunk):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(chunk) + compressor.flush()
+
+    def _write_chunks(self):
+        for data in self.pool.map(self._compress, self.chunks):
+            self.fileobj.write(data)
+        self.chunks = []
+
+    def _cut_chunk(self):
+        data = b''.join(self.buffer)
+        self.chunks.append(data[:self.chunk_size])
+        rest = data[self.chunk_size:]
+        self.buffer = [rest] if rest else []
+        self.buffered = len(rest)
+        # Keep at most one chunk per thread in memory
+        if len(self.chunks) == self.jobs:
+            self._write_chunks()
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        while self.buffered >= self.chunk_size:
+            self._cut_chunk()
+
+    def close(self):
+        try:
+            if self.buffered:
+                self.chunks.append(b''.join(self.buffer))
+                self.buffer, self.buffered = [], 0
+            self._write_chunks()
+        finally:
+            self.pool.terminate()
+            self.pool.join()
+
+
+def _zstd():
+    zstd = which('zstd')
+    if not zstd:
+        raise UnsupportedCompressionException(
+            'zstd', 'the `zstd` executable is not in PATH')
+    return zstd
+
+
+def compress_prefix(prefix, arcname, tarfile_path, compression='gzip',
+                    jobs=None):
+    """Archive a directory in a compressed tarball.
+
+    Compression runs on ``jobs`` threads, as the directory is archived: gzip
+    tarballs are compressed in parallel by Spack itself and zstd tarballs by
+    the ``zstd`` executable.
+
+    Args:
+        prefix (str): directory to archive
+        arcname (str): name of the directory in the tarball
+        tarfile_path (str): path of the tarball
+        compression (str): either ``'gzip'`` or ``'zstd'``
+        jobs (int): number of compression threads (default: all the cpus
+            available)
+    """
+    jobs = jobs or spack.util.cpus.cpus_available()
+    if compression == 'gzip':
+        with open(tarfile_path, 'wb') as f:
+            gzip_file = ParallelGzipFile(f, jobs)
+            try:
+                with closing(tarfile.open(fileobj=gzip_file, mode='w|')) as tar:
+                    tar.add(name=prefix, arcname=arcname)
+            finally:
+                gzip_file.close()
+    elif compression == 'zstd':
+        zstd = _zstd()
+        proc = subprocess.Popen(
+            zstd.exe + ['-q', '-f', '-T{0}'.format(jobs), '-o', tarfile_path],
+            stdin=subprocess.PIPE)
+        try:
+            with closing(tarfile.open(fileobj=proc.stdin, mode='w|')) as tar:
+                tar.add(name=prefix, arcname=arcname)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise UnsupportedCompressionException(
+                compression, 'zstd exited with status {0}'.format(
+                    proc.returncode))
+    else:
+        raise UnsupportedCompressionException(compression)
+
+
+class HashingReader(object):
+    """Read-only file object computing the sha256 checksum of the data read
+    from another file object."""
+
+    def __init__(self, fileobj, block_size=65536):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+    def hexdigest(self):
+        """Return the checksum of the whole file object, including the data
+        that was not read yet."""
+        while self.read(self.block_size):
+            pass
+        return self.hasher.hexdigest()
+
+
+class GzipReader(object):
+    """Read-only file object decompressing a gzip stream made of one or more
+    members, like the tarballs written by ``ParallelGzipFile``.
+
+    Unlike ``tarfile`` in stream mode, which stops at the end of the first
+    member, it reads all of them, and unlike ``gzip.GzipFile`` it never
+    seeks the underlying file object.
+    """
+
+    def __init__(self, fileobj, block_size=1 << 16):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        # compressed data read from the file but not decompressed yet
+        self.input = b''
+
+    def _decompress(self, size):
+        """Return at most ``size`` bytes of decompressed data, and an empty
+        string only at the end of the stream.
+
+        Decompressing only what is asked for keeps each read proportional
+        to its size, however much the data is compressed.
+        """
+        while True:
+            if not self.input:
+                self.input = self.fileobj.read(self.block_size)
+                if not self.input:
+                    return b''
+            data = self.decompressor.decompress(self.input, size)
+            if self.decompressor.unused_data:
+                # start a new decompressor at the beginning of the next member
+                self.input = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                self.input = self.decompressor.unconsumed_tail
+            if data:
+                return data
+
+    def read(self, size=-1):
+        chunks = []
+        remaining = size
+        while remaining != 0:
+            data = self._decompress(
+                self.block_size if remaining < 0 else remaining)
+            if not data:
+                break
+            chunks.append(data)
+            if remaining > 0:
+                remaining -= len(data)
+        return b''.join(chunks)
+
+
+def _checked_members(tar, path):
+    """Yield the members of ``tar`` in order, raising if one of them would
+    be extracted out of ``path``, since they are extracted before the
+    checksum of the tarball is known."""
+    symlinks = set()
+    for member in tar:
+        names = [member.name]
+        if member.islnk():
+            names.append(member.linkname)
+        for name in names:
+            parts = name.split('/')
+            parents = ('/'.join(parts[:i]) for i in range(1, len(parts)))
+            if (os.path.isabs(name) or '..' in parts or
+                    any(p in symlinks for p in parents)):
+                raise NoChecksumException(
+                    'Package tarball contains an unsafe path: {0}'.format(
+                        name))
+        if member.issym():
+            symlinks.add(member.name.rstrip('/'))
+        yield member
+
+
+def extract_prefix_stream(fileobj, path, compression='gzip'):
+    """Extract a tarball created by ``compress_prefix()`` in ``path``, while
+    reading it sequentially from a file object.
+
+    Args:
+        fileobj (file): file object of the tarball
+        path (str): directory where the tarball is extracted
+        compression (str): compression of the tarball, either ``'gzip'``,
+            ``'bzip2'`` or ``'zstd'``
+    """
+    if compression == 'gzip':
+        with closing(tarfile.open(fileobj=GzipReader(fileobj), mode='r|')) as tar:
+            tar.extractall(path=path, members=_checked_members(tar, path))
+    elif compression == 'bzip2':
+        with closing(tarfile.open(fileobj=fileobj, mode='r|bz2')) as tar:
+            tar.extractall(path=path, members=_checked_members(tar, path))
+    elif compression == 'zstd':
+        zstd = _zstd()
+        proc = subprocess.Popen(zstd.exe + ['-q', '-d', '-c'],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        # feed zstd from another thread, so that it never blocks on a full
+        # pipe while the tarball is extracted
+        def feed():
+            try:
+                for data in iter(lambda: fileobj.read(65536), b''):
+                    proc.stdin.write(data)
+            except (IOError, OSError):
+                # zstd stopped reading, its exit status tells why
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except (IOError, OSError):
+                    pass
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+        try:
+            with closing(tarfile.open(fileobj=proc.stdout, mode='r|')) as tar:
+                tar.extractall(path=path, members=_checked_members(tar, path))
+            # read the padding after the end of the archive
+            while proc.stdout.read(65536):
+                pass
+        except Exception:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            feeder.join()
+            proc.wait()
+        if proc.returncode != 0:
+            raise UnsupportedCompressionException(
+                compression, 'zstd exited with status {0}'.format(
+                    proc.returncode))
+    else:
+        raise UnsupportedCompressionException(compression)
+
+
+def extract_prefix(tarfile_path, path, compression='gzip'):
+    """Extract a tarball created by ``compress_prefix()`` in ``path``.
+
+    Args:
+        tarfile_path (str): path of the tarball
+        path (str): directory where the tarball is extracted
+        compression (str): compression of the tarball, either ``'gzip'``,
+            ``'bzip2'`` or ``'zstd'``
+    """
+    with open(tarfile_path, 'rb') as f:
+        extract_prefix_stream(f, path, compression)
+
+
 def select_signing_key(key=None):
     if key is None:
         keys = spack.util.gpg.signing_keys()
@@ -758,17 +1504,260 @@ def sign_tarball(key, force, specfile_path):
     spack.util.gpg.sign(key, specfile_path, '%s.asc' % specfile_path)
 
 
-def generate_package_index(cache_prefix):
-    """Create the build cache index page.
+#: Version of the format of the manifest of the build cache index
+_index_manifest_version = 1
 
-    Creates (or replaces) the "index.json" page at the location given in
+#: Version of the format of the table of the shards of the build cache index
+_index_shards_version = 1
+
+#: Number of leading characters of the DAG hash of a spec selecting the shard
+#: of the build cache index it is stored in
+_index_shard_prefix_length = 2
+
+
+def index_shard_file_name(prefix, shard_hash):
+    """Name of the shard of the build cache index storing the specs whose
+    DAG hash starts with ``prefix``, relative to the build cache.
+
+    Shards are named after the hash of their content, so that clients
+    never read a shard that does not match the table listing it.
+    """
+    return 'index/{0}-{1}.jsonl'.format(prefix, shard_hash)
+
+
+def index_shard_line(dag_hash, spec_dict):
+    """Format the record of a spec in a shard of the build cache index.
+
+    Each line of a shard is a JSON object mapping the DAG hash of a spec to
+    its dictionary, so that a spec can be found without parsing the rest
+    of the shard.
+    """
+    return '{{"{0}":{1}}}\n'.format(
+        dag_hash, json.dumps(spec_dict, sort_keys=True, separators=(',', ':')))
+
+
+def read_index_shard(path, dag_hash=None):
+    """Read the records of a shard of the build cache index.
+
+    Args:
+        path (str): local path of the shard
+        dag_hash (str): if given, only read the record of the spec with
+            this DAG hash, by searching for it in the memory mapped shard
+
+    Returns:
+        A dict mapping DAG hashes to spec dictionaries
+    """
+    if dag_hash is None:
+        with open(path) as f:
+            records = {}
+            for line in f:
+                if line.strip():
+                    records.update(json.loads(line))
+            return records
+
+    needle = '{{"{0}":'.format(dag_hash).encode('utf-8')
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = data.find(needle)
+            while start > 0 and data[start - 1:start] != b'\n':
+                start = data.find(needle, start + 1)
+            if start < 0:
+                return {}
+            end = data.find(b'\n', start)
+            line = data[start:end if end >= 0 else len(data)]
+        finally:
+            data.close()
+    return json.loads(line.decode('utf-8'))
+
+
+def _read_index_shard_table(cache_prefix):
+    """Return the table of the shards of the index of the build cache at
+    ``cache_prefix``, or ``None`` if it cannot be read."""
+    try:
+        _, _, table_file = web_util.read_from_url(
+            url_util.join(cache_prefix, 'index.shards.json'))
+        table = sjson.load(codecs.getreader('utf-8')(table_file).read())
+    except (URLError, web_util.SpackWebError, ValueError) as err:
+        tty.debug('Cannot read the index shards at {0}: {1}'.format(
+            cache_prefix, err))
+        return None
+
+    table = table.get('shards', {})
+    return table if table.get('version') == _index_shards_version else None
+
+
+def _push_index_shards(cache_prefix, db, index_hash, tmpdir, old_table=None):
+    """Split the specs of the build cache index ``db`` into shards by prefix
+    of their DAG hash, and push the shards that changed since ``old_table``
+    to the build cache, followed by their table.
+
+    Args:
+        cache_prefix (str): URL of the build cache
+        db (spack.database.Database): build cache index
+        index_hash (str): hash of the ``index.json`` of ``db``
+        tmpdir (str): directory where files are staged before being pushed
+        old_table (dict): table of the shards currently in the build cache
+    """
+    shards = {}
+    for indexed_spec in db.query_local(installed=any, in_buildcache=True):
+        dag_hash = indexed_spec.dag_hash()
+        shards.setdefault(dag_hash[:_index_shard_prefix_length], []).append(
+            index_shard_line(dag_hash, indexed_spec.to_dict(hash=ht.full_hash)))
+
+    old_files = old_table['files'] if old_table else {}
+    files = {}
+    shard_path = os.path.join(tmpdir, 'index-shard.jsonl')
+    for prefix, lines in shards.items():
+        content = ''.join(sorted(lines))
+        files[prefix] = compute_hash(content)
+        if old_files.get(prefix) == files[prefix]:
+            continue
+        with open(shard_path, 'w') as f:
+            f.write(content)
+        web_util.push_to_url(
+            shard_path,
+            url_util.join(cache_prefix,
+                          index_shard_file_name(prefix, files[prefix])),
+            keep_original=False,
+            extra_args={'ContentType': 'application/x-ndjson'})
+
+    table_path = os.path.join(tmpdir, 'index.shards.json')
+    with open(table_path, 'w') as f:
+        sjson.dump({'shards': {
+            'version': _index_shards_version,
+            'index_hash': index_hash,
+            'prefix_length': _index_shard_prefix_length,
+            'files': files,
+        }}, f)
+    web_util.push_to_url(
+        table_path,
+        url_util.join(cache_prefix, 'index.shards.json'),
+        keep_original=False,
+        extra_args={'ContentType': 'application/json'})
+
+    # Shards are only removed once no longer listed, clients holding the
+    # previous table fall back to fetching spec files directly
+    for prefix, shard_hash in old_files.items():
+        if files.get(prefix) != shard_hash:
+            try:
+                web_util.remove_url(url_util.join(
+                    cache_prefix, index_shard_file_name(prefix, shard_hash)))
+            except Exception as err:
+                tty.debug('Cannot remove index shard {0}: {1}'.format(
+                    prefix, err))
+
+
+def _read_spec_file(spec_url):
+    """Fetch and read the spec file at ``spec_url``, and return the record of
+    its spec in a build cache index."""
+    tty.debug('fetching {0}'.format(spec_url))
+    _, _, spec_file = web_util.read_from_url(spec_url)
+    spec_file_contents = codecs.getreader('utf-8')(spec_file).read()
+    # Need full spec.json name or this gets confused with index.json.
+    if spec_url.endswith('.json'):
+        spec_dict = sjson.load(spec_file_contents)
+        s = Spec.from_json(spec_file_contents)
+    elif spec_url.endswith('.yaml'):
+        spec_dict = syaml.load(spec_file_contents)
+        s = Spec.from_yaml(spec_file_contents)
+    return {
+        'spec_url': spec_url,
+        'spec': s,
+        'num_deps': len(list(s.traverse(root=False))),
+        'binary_cache_checksum': spec_dict['binary_cache_checksum'],
+        'buildinfo': spec_dict['buildinfo'],
+    }
+
+
+def _read_spec_files(cache_prefix, file_list, concurrency=32):
+    """Read the spec files in ``file_list`` concurrently.
+
+    Args:
+        cache_prefix (str): URL of the build cache
+        file_list (list): names of the spec files under ``cache_prefix``
+        concurrency (int): maximum number of spec files fetched at once
+
+    Returns:
+        A dict of the names of the spec files that could be read mapped to
+        the record of their spec in the index.
+    """
+    def read(file_path):
+        try:
+            record = _read_spec_file(url_util.join(cache_prefix, file_path))
+            record['file_path'] = file_path
+            return file_path, record
+        except (URLError, web_util.SpackWebError) as url_err:
+            tty.error('Error reading specfile: {0}'.format(file_path))
+            tty.error(url_err)
+            return file_path, None
+
+    tp = multiprocessing.pool.ThreadPool(
+        processes=max(min(concurrency, len(file_list)), 1))
+    try:
+        return dict((file_path, record)
+                    for file_path, record in tp.map(read, file_list) if record)
+    finally:
+        tp.terminate()
+        tp.join()
+
+
+def _read_package_index(cache_prefix, db_root_dir):
+    """Fetch the index of the build cache at ``cache_prefix`` into
+    ``db_root_dir``, with its manifest.
+
+    Returns:
+        The manifest of the index, or ``None`` if there is no index, or no
+        manifest matching it.
+    """
+    try:
+        _, _, index_file = web_util.read_from_url(
+            url_util.join(cache_prefix, 'index.json'))
+        index_string = codecs.getreader('utf-8')(index_file).read()
+        _, _, manifest_file = web_util.read_from_url(
+            url_util.join(cache_prefix, 'index.manifest.json'))
+        manifest = sjson.load(codecs.getreader('utf-8')(manifest_file).read())
+    except (URLError, web_util.SpackWebError) as url_err:
+        tty.debug('Cannot read the index at {0}: {1}'.format(
+            cache_prefix, url_err))
+        return None
+
+    manifest = manifest.get('manifest', {})
+    if (manifest.get('version') != _index_manifest_version or
+            manifest.get('index_hash') != compute_hash(index_string)):
+        tty.debug('The manifest of the index at {0} is out of date'.format(
+            cache_prefix))
+        return None
+
+    with open(os.path.join(db_root_dir, 'index.json'), 'w') as f:
+        f.write(index_string)
+    return manifest
+
+
+def generate_package_index(cache_prefix, concurrency=32, full=False):
+    """Create or update the build cache index page.
+
+    Creates (or updates) the "index.json" page at the location given in
     cache_prefix.  This page contains a link for each binary package (.yaml or
     .json) under cache_prefix.
+
+    The index is pushed with a manifest of the spec files it was generated
+    from, so that only the spec files pushed since are read to update it.
+    The index is regenerated from all the spec files if there is no such
+    manifest, or if spec files were removed or modified since.
+
+    Args:
+        cache_prefix (str): URL of the build cache
+        concurrency (int): maximum number of spec files fetched at once
+        full (bool): if True, always regenerate the index from all the spec
+            files
     """
     try:
-        file_list = (
-            entry
-            for entry in web_util.list_url(cache_prefix)
+        file_mtimes = dict(
+            (entry, mtime)
+            for entry, mtime in web_util.list_url_mtimes(cache_prefix).items()
             if entry.endswith('.yaml') or entry.endswith('spec.json'))
     except KeyError as inst:
         msg = 'No packages at {0}: {1}'.format(cache_prefix, inst)
@@ -783,45 +1772,71 @@ def generate_package_index(cache_prefix):
         tty.warn(msg)
         return
 
-    tty.debug('Retrieving spec descriptor files from {0} to build index'.format(
-        cache_prefix))
-
-    all_mirror_specs = {}
+    tmpdir = tempfile.mkdtemp()
+    db_root_dir = os.path.join(tmpdir, 'db_root')
+    mkdirp(db_root_dir)
+    db = spack_db.Database(None, db_dir=db_root_dir,
+                           enable_transaction_locking=False,
+                           record_fields=['spec', 'ref_count', 'in_buildcache'],
+                           backend='json')
 
-    for file_path in file_list:
+    # Only read the spec files added since the index was last generated,
+    # unless others were removed or modified since
+    def modified(file_path, entry):
+        if file_path not in file_mtimes:
+            return True
+        mtime = file_mtimes[file_path]
+        return None not in (mtime, entry['mtime']) and mtime != entry['mtime']
+
+    manifest = None if full else _read_package_index(cache_prefix, db_root_dir)
+    indexed = manifest['files'] if manifest else {}
+    if any(modified(f, entry) for f, entry in indexed.items()):
+        tty.debug('Spec files were removed or modified at {0}'.format(
+            cache_prefix))
+        manifest, indexed = None, {}
+    file_list = sorted(f for f in file_mtimes if f not in indexed)
+
+    if manifest and not file_list:
+        shard_table = _read_index_shard_table(cache_prefix)
         try:
-            spec_url = url_util.join(cache_prefix, file_path)
-            tty.debug('fetching {0}'.format(spec_url))
-            _, _, spec_file = web_util.read_from_url(spec_url)
-            spec_file_contents = codecs.getreader('utf-8')(spec_file).read()
-            # Need full spec.json name or this gets confused with index.json.
-            if spec_url.endswith('.json'):
-                spec_dict = sjson.load(spec_file_contents)
-                s = Spec.from_json(spec_file_contents)
-            elif spec_url.endswith('.yaml'):
-                spec_dict = syaml.load(spec_file_contents)
-                s = Spec.from_yaml(spec_file_contents)
-            all_mirror_specs[s.dag_hash()] = {
-                'spec_url': spec_url,
-                'spec': s,
-                'num_deps': len(list(s.traverse(root=False))),
-                'binary_cache_checksum': spec_dict['binary_cache_checksum'],
-                'buildinfo': spec_dict['buildinfo'],
-            }
-        except (URLError, web_util.SpackWebError) as url_err:
-            tty.error('Error reading specfile: {0}'.format(file_path))
-            tty.error(url_err)
+            if shard_table and \
+                    shard_table.get('index_hash') == manifest['index_hash']:
+                tty.debug('The index at {0} is up to date'.format(cache_prefix))
+            else:
+                tty.debug('Sharding the index at {0}'.format(cache_prefix))
+                db._read_from_file(os.path.join(db_root_dir, 'index.json'))
+                _push_index_shards(cache_prefix, db, manifest['index_hash'],
+                                   tmpdir, shard_table)
+        except Exception as err:
+            msg = 'Encountered problem pushing index shards to {0}: {1}'
+            tty.warn(msg.format(cache_prefix, err))
+            tty.debug('\n' + traceback.format_exc())
+        finally:
+            shutil.rmtree(tmpdir)
+        return
+
+    tty.debug('Retrieving {0} spec descriptor files from {1} to {2} index'.format(
+        len(file_list), cache_prefix, 'update the' if manifest else 'build an'))
+
+    spec_records = _read_spec_files(cache_prefix, file_list, concurrency)
+    all_mirror_specs = dict(
+        (record['spec'].dag_hash(), record) for record in spec_records.values())
 
     sorted_specs = sorted(all_mirror_specs.keys(),
                           key=lambda k: all_mirror_specs[k]['num_deps'])
 
-    tmpdir = tempfile.mkdtemp()
-    db_root_dir = os.path.join(tmpdir, 'db_root')
-    db = spack_db.Database(None, db_dir=db_root_dir,
-                           enable_transaction_locking=False,
-                           record_fields=['spec', 'ref_count', 'in_buildcache'])
-
     try:
+        if manifest:
+            db._read_from_file(os.path.join(db_root_dir, 'index.json'))
+
+        def indexed_spec(dag_hash):
+            if dag_hash in all_mirror_specs:
+                return all_mirror_specs[dag_hash]['spec']
+            if dag_hash in db._data:
+                return db._data[dag_hash].spec
+            return None
+
+        spliced_files = []
         tty.debug('Specs sorted by number of dependencies:')
         for dag_hash in sorted_specs:
             spec_record = all_mirror_specs[dag_hash]
@@ -839,11 +1854,9 @@ def generate_package_index(cache_prefix):
                 # all_mirror_specs dictionary with this spliced spec.
                 to_splice = []
                 for dep in s.dependencies():
-                    dep_dag_hash = dep.dag_hash()
-                    if dep_dag_hash in all_mirror_specs:
-                        true_dep = all_mirror_specs[dep_dag_hash]['spec']
-                        if true_dep.full_hash() != dep.full_hash():
-                            to_splice.append(true_dep)
+                    true_dep = indexed_spec(dep.dag_hash())
+                    if true_dep and true_dep.full_hash() != dep.full_hash():
+                        to_splice.append(true_dep)
 
                 if to_splice:
                     tty.debug('    needs the following deps spliced:')
@@ -867,10 +1880,17 @@ def generate_package_index(cache_prefix):
                     tty.debug('    spliced and wrote {0}'.format(
                         spliced_spec_url))
                     spec_record['spec'] = s
+                    spliced_files.append(spec_record['file_path'])
 
             db.add(s, None)
             db.mark(s, 'in_buildcache', True)
 
+        # Spec files pushed back to the mirror have new modification times
+        if spliced_files:
+            new_mtimes = web_util.list_url_mtimes(cache_prefix)
+            for file_path in spliced_files:
+                file_mtimes[file_path] = new_mtimes.get(file_path)
+
         # Now that we have fixed any old specfiles that might have had the wrong
         # full hash for their dependencies, we can generate the index, compute
         # the hash, and push those files to the mirror.
@@ -888,6 +1908,20 @@ def generate_package_index(cache_prefix):
         with open(index_hash_path, 'w') as f:
             f.write(index_hash)
 
+        # Write the manifest of the spec files in the index
+        for file_path, record in spec_records.items():
+            indexed[file_path] = {
+                'hash': record['spec'].dag_hash(),
+                'mtime': file_mtimes[file_path],
+            }
+        manifest_path = os.path.join(db_root_dir, 'index.manifest.json')
+        with open(manifest_path, 'w') as f:
+            sjson.dump({'manifest': {
+                'version': _index_manifest_version,
+                'index_hash': index_hash,
+                'files': indexed,
+            }}, f)
+
         # Push the index itself
         web_util.push_to_url(
             index_json_path,
@@ -901,6 +1935,19 @@ def generate_package_index(cache_prefix):
             url_util.join(cache_prefix, 'index.json.hash'),
             keep_original=False,
             extra_args={'ContentType': 'text/plain'})
+
+        # Push the shards of the index, for clients to fetch only the specs
+        # they look for
+        _push_index_shards(cache_prefix, db, index_hash, tmpdir,
+                           _read_index_shard_table(cache_prefix))
+
+        # Push the manifest last, since it is only used along with an index
+        # matching it
+        web_util.push_to_url(
+            manifest_path,
+            url_util.join(cache_prefix, 'index.manifest.json'),
+            keep_original=False,
+            extra_args={'ContentType': 'application/json'})
     except Exception as err:
         msg = 'Encountered problem pushing package index to {0}: {1}'.format(
             cache_prefix, err)
@@ -976,33 +2023,47 @@ def generate_key_index(key_prefix, tmpdir=None):
 
 
 def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
-                  allow_root=False, key=None, regenerate_index=False):
+                  allow_root=False, key=None, regenerate_index=False,
+                  compression=None):
     """
     Build a tarball from given spec and put it into the directory structure
     used at the mirror (following <tarball_directory_name>).
+
+    The install prefix is compressed with ``compression``, either ``'gzip'``
+    or ``'zstd'`` (default: the ``config:binary_compression`` setting).
     """
     if not spec.concrete:
         raise ValueError('spec must be concrete to build tarball')
 
+    compression = compression or config.get(
+        'config:binary_compression', 'gzip')
+    if compression not in ('gzip', 'zstd'):
+        raise UnsupportedCompressionException(compression)
+
     # set up some paths
     tmpdir = tempfile.mkdtemp()
     cache_prefix = build_cache_prefix(tmpdir)
 
-    tarfile_name = tarball_name(spec, '.tar.gz')
+    tarfile_name = tarball_name(spec, compression_extensions[compression])
     tarfile_dir = os.path.join(cache_prefix, tarball_directory_name(spec))
     tarfile_path = os.path.join(tarfile_dir, tarfile_name)
     spackfile_path = os.path.join(
-        cache_prefix, tarball_path_name(spec, '.spack'))
+        cache_prefix, tarball_path_name(spec, archive_extensions[compression]))
 
     remote_spackfile_path = url_util.join(
         outdir, os.path.relpath(spackfile_path, tmpdir))
 
     mkdirp(tarfile_dir)
-    if web_util.url_exists(remote_spackfile_path):
-        if force:
-            web_util.remove_url(remote_spackfile_path)
-        else:
-            raise NoOverwriteException(url_util.format(remote_spackfile_path))
+    # an archive of the spec with another compression is replaced as well
+    for ext in archive_extensions.values():
+        remote_archive_path = url_util.join(outdir, os.path.relpath(
+            os.path.join(cache_prefix, tarball_path_name(spec, ext)), tmpdir))
+        if web_util.url_exists(remote_archive_path):
+            if force:
+                web_util.remove_url(remote_archive_path)
+            else:
+                raise NoOverwriteException(
+                    url_util.format(remote_archive_path))
 
     # need to copy the spec file so the build cache can be downloaded
     # without concretizing with the current spack packages
@@ -1044,7 +2105,7 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     os.remove(temp_tarfile_path)
 
     # create info for later relocation and create tar
-    write_buildinfo_file(spec, workdir, rel)
+    manifest = write_buildinfo_file(spec, workdir, rel)
 
     # optionally make the paths in the binaries relative to each other
     # in the spack install tree before creating tarball
@@ -1065,10 +2126,13 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
             shutil.rmtree(tmpdir)
             tty.die(e)
 
-    # create gzip compressed tarball of the install prefix
-    with closing(tarfile.open(tarfile_path, 'w:gz')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='%s' % os.path.basename(spec.prefix))
+    # record the offsets of the prefixes in the files as they are in the
+    # tarball, after the binaries were made relative
+    write_relocation_manifest(workdir, manifest['mime_types'])
+
+    # create compressed tarball of the install prefix
+    compress_prefix(workdir, os.path.basename(spec.prefix), tarfile_path,
+                    compression)
     # remove copy of install directory
     shutil.rmtree(workdir)
 
@@ -1091,6 +2155,10 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     bchecksum['hash_algorithm'] = 'sha256'
     bchecksum['hash'] = checksum
     spec_dict['binary_cache_checksum'] = bchecksum
+    spec_dict['binary_cache_format'] = {
+        'version': binary_cache_format_version,
+        'compression': compression,
+    }
     # Add original install prefix relative to layout root to spec.json.
     # This will be used to determine is the directory layout has changed.
     buildinfo = {}
@@ -1148,6 +2216,14 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     return None
 
 
+def _tarball_stage_path(spec):
+    """Return the directory the binary tarball of a spec is downloaded to.
+
+    Each spec has its own, so that tarballs can be downloaded concurrently.
+    """
+    return os.path.join(get_stage_root(), 'build_cache', spec.dag_hash())
+
+
 def download_tarball(spec, preferred_mirrors=None):
     """
     Download binary tarball for given package into stage area, returning
@@ -1167,23 +2243,25 @@ def download_tarball(spec, preferred_mirrors=None):
         tty.die("Please add a spack mirror to allow " +
                 "download of pre-compiled packages.")
 
-    tarball = tarball_path_name(spec, '.spack')
-
-    urls_to_try = []
-
-    if preferred_mirrors:
-        for preferred_url in preferred_mirrors:
-            urls_to_try.append(url_util.join(
-                preferred_url, _build_cache_relative_path, tarball))
+    # the archive of a spec is named after the compression of its tarball
+    tarballs = [tarball_path_name(spec, ext)
+                for ext in archive_extensions.values()]
 
+    mirror_urls = list(preferred_mirrors or [])
     for mirror in spack.mirror.MirrorCollection().values():
         if not preferred_mirrors or mirror.fetch_url not in preferred_mirrors:
-            urls_to_try.append(url_util.join(
-                mirror.fetch_url, _build_cache_relative_path, tarball))
+            mirror_urls.append(mirror.fetch_url)
+
+    urls_to_try = []
+    for mirror_url in mirror_urls:
+        urls_to_try.extend(
+            url_util.join(mirror_url, _build_cache_relative_path, tarball)
+            for tarball in tarballs)
 
     for try_url in urls_to_try:
         # stage the tarball into standard place
-        stage = Stage(try_url, name="build_cache", keep=True)
+        stage = Stage(try_url, name="build_cache",
+                      path=_tarball_stage_path(spec), keep=True)
         stage.create()
         try:
             stage.fetch()
@@ -1196,6 +2274,67 @@ def download_tarball(spec, preferred_mirrors=None):
     return None
 
 
+def _prefetch_tarball(spec, full_hash_match):
+    matches = get_mirrors_for_spec(spec, full_hash_match=full_hash_match)
+    if not matches:
+        return [], None
+
+    preferred_mirrors = [match['mirror_url'] for match in matches]
+    return matches, download_tarball(
+        matches[0]['spec'], preferred_mirrors=preferred_mirrors)
+
+
+class TarballPrefetcher(object):
+    """Download the binary tarballs of specs in the background, with a
+    bounded pool of threads."""
+
+    def __init__(self, concurrency=4):
+        """
+        Args:
+            concurrency (int): maximum number of tarballs downloaded at once
+        """
+        # Read the local copies of the mirror indexes once, and create the
+        # stage root, before threads use them
+        binary_index.regenerate_spec_cache()
+        get_stage_root()
+
+        self.pool = multiprocessing.pool.ThreadPool(processes=concurrency)
+        self.downloads = {}
+
+    def prefetch(self, spec, full_hash_match=False):
+        """Start downloading the tarball of a concrete spec, from the first
+        mirror it is found on by ``get_mirrors_for_spec``."""
+        key = spec.dag_hash()
+        if key not in self.downloads:
+            self.downloads[key] = self.pool.apply_async(
+                _prefetch_tarball, (spec, full_hash_match))
+
+    def result(self, spec):
+        """Wait for the download of the tarball of a spec.
+
+        Returns:
+            The mirrors the spec was found on, as returned by
+            ``get_mirrors_for_spec``, and the path to the tarball or ``None``
+            if it could not be downloaded. If the spec was not prefetched or
+            its download failed with an error, returns ``None``.
+        """
+        download = self.downloads.get(spec.dag_hash())
+        if download is None:
+            return None
+
+        try:
+            return download.get()
+        except (Exception, SystemExit) as e:
+            tty.debug('Cannot prefetch the tarball of {0}: {1}'.format(
+                spec.name, str(e)))
+            return None
+
+    def close(self):
+        """Stop the downloads still running and the threads of the pool."""
+        self.pool.terminate()
+        self.pool.join()
+
+
 def make_package_relative(workdir, spec, allow_root):
     """
     Change paths in binaries to relative paths. Change absolute symlinks
@@ -1314,14 +2453,66 @@ def is_backup_file(file):
         if not is_backup_file(text_name):
             text_names.append(text_name)
 
+    # Files recorded in the relocation manifest are relocated at the offsets
+    # of the old prefixes in them, without classifying or searching them
+    platform = spack.platforms.by_name(spec.platform)
+    manifest = read_relocation_manifest(workdir)
+    if 'macho' in platform.binary_formats:
+        manifest = None
+    text_offsets = {}
+    if manifest:
+        text_names = [name for name in text_names if manifest.get(
+            os.path.relpath(name, workdir), {}).get('kind') != 'link']
+        for name in text_names:
+            entry = manifest.get(os.path.relpath(name, workdir), {})
+            if 'offsets' in entry:
+                text_offsets[name] = (entry['offsets'], entry['size'])
+
     # If we are not installing back to the same install tree do the relocation
-    if old_prefix != new_prefix:
+    if old_prefix != new_prefix and manifest:
+        # Strings outside of RPATHs are replaced before patchelf runs, since
+        # it moves the content of the binaries
+        binary_offsets = {}
+        elf_binaries = []
+        unrecorded_binaries = []
+        for filename in buildinfo['relocate_binaries']:
+            entry = manifest.get(filename, {})
+            path = os.path.join(workdir, filename)
+            if entry.get('kind') == 'link':
+                continue
+            if entry.get('kind') != 'elf':
+                unrecorded_binaries.append(path)
+                continue
+            ranges = entry.get('rpaths', [])
+            in_rpaths = set(o for o in entry['offsets']
+                            if any(start <= o < end for start, end in ranges))
+            binary_offsets[path] = ([o for o in entry['offsets']
+                                     if o not in in_rpaths], entry['size'])
+            if rel or in_rpaths:
+                elf_binaries.append(path)
+        relocate.relocate_text_bin(
+            list(binary_offsets), prefix_to_prefix_bin, offsets=binary_offsets)
+
+        relocate.relocate_elf_binaries(elf_binaries + unrecorded_binaries,
+                                       old_layout_root,
+                                       new_layout_root,
+                                       prefix_to_prefix_bin, rel,
+                                       old_prefix,
+                                       new_prefix)
+        relocate.relocate_text_bin(unrecorded_binaries, prefix_to_prefix_bin)
+        links = [link for link in buildinfo.get('relocate_links', [])]
+        relocate.relocate_links(
+            links, old_layout_root, old_prefix, new_prefix
+        )
+        relocate.relocate_text(
+            text_names, prefix_to_prefix_text, offsets=text_offsets)
+
+    elif old_prefix != new_prefix:
         files_to_relocate = [os.path.join(workdir, filename)
                              for filename in buildinfo.get('relocate_binaries')
                              ]
         # If the buildcache was not created with relativized rpaths
         # do the relocation of path in binaries
-        platform = spack.platforms.by_name(spec.platform)
         if 'macho' in platform.binary_formats:
             relocate.relocate_macho_binaries(files_to_relocate,
                                              old_layout_root,
@@ -1360,13 +2551,19 @@ def is_backup_file(file):
     # relocate the sbang location if the spack directory changed
     else:
         if old_spack_prefix != new_spack_prefix:
-            relocate.relocate_text(text_names, prefix_to_prefix_text)
+            relocate.relocate_text(
+                text_names, prefix_to_prefix_text, offsets=text_offsets)
 
 
 def extract_tarball(spec, filename, allow_root=False, unsigned=False,
                     force=False):
     """
     extract binary tarball for given package into install area
+
+    The tarball of the install prefix is read straight from the ``.spack``
+    archive, and its checksum computed while it is extracted in a staging
+    directory of the store, which is renamed to the prefix once the checksum
+    is verified.
     """
     if os.path.exists(spec.prefix):
         if force:
@@ -1375,98 +2572,119 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
             raise NoOverwriteException(str(spec.prefix))
 
     tmpdir = tempfile.mkdtemp()
-    stagepath = os.path.dirname(filename)
-    spackfile_name = tarball_name(spec, '.spack')
-    spackfile_path = os.path.join(stagepath, spackfile_name)
-    tarfile_name = tarball_name(spec, '.tar.gz')
-    tarfile_path = os.path.join(tmpdir, tarfile_name)
+    spackfile_path = filename
     specfile_is_json = True
     deprecated_yaml_name = tarball_name(spec, '.spec.yaml')
     deprecated_yaml_path = os.path.join(tmpdir, deprecated_yaml_name)
     json_name = tarball_name(spec, '.spec.json')
     json_path = os.path.join(tmpdir, json_name)
-    with closing(tarfile.open(spackfile_path, 'r')) as tar:
-        tar.extractall(tmpdir)
-    # some buildcache tarfiles use bzip2 compression
-    if not os.path.exists(tarfile_path):
-        tarfile_name = tarball_name(spec, '.tar.bz2')
-        tarfile_path = os.path.join(tmpdir, tarfile_name)
-
-    if os.path.exists(json_path):
-        specfile_path = json_path
-    elif os.path.exists(deprecated_yaml_path):
-        specfile_is_json = False
-        specfile_path = deprecated_yaml_path
-    else:
-        raise ValueError('Cannot find spec file for {0}.'.format(tmpdir))
-
-    if not unsigned:
-        if os.path.exists('%s.asc' % specfile_path):
-            try:
-                suppress = config.get('config:suppress_gpg_warnings', False)
-                spack.util.gpg.verify(
-                    '%s.asc' % specfile_path, specfile_path, suppress)
-            except Exception as e:
-                shutil.rmtree(tmpdir)
-                raise e
+    try:
+        spackfile = tarfile.open(spackfile_path, 'r')
+    except Exception:
+        shutil.rmtree(tmpdir)
+        raise
+
+    with closing(spackfile):
+        # only the small spec and signature files are extracted
+        members = dict((m.name, m) for m in spackfile.getmembers())
+        spackfile.extractall(tmpdir, members=[
+            members[name] for name in
+            (json_name, json_name + '.asc',
+             deprecated_yaml_name, deprecated_yaml_name + '.asc')
+            if name in members])
+
+        if os.path.exists(json_path):
+            specfile_path = json_path
+        elif os.path.exists(deprecated_yaml_path):
+            specfile_is_json = False
+            specfile_path = deprecated_yaml_path
         else:
             shutil.rmtree(tmpdir)
-            raise NoVerifyException(
-                "Package spec file failed signature verification.\n"
-                "Use spack buildcache keys to download "
-                "and install a key for verification from the mirror.")
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
-
-    # get the sha256 checksum recorded at creation
-    spec_dict = {}
-    with open(specfile_path, 'r') as inputfile:
-        content = inputfile.read()
-        if specfile_is_json:
-            spec_dict = sjson.load(content)
-        else:
-            spec_dict = syaml.load(content)
-    bchecksum = spec_dict['binary_cache_checksum']
+            raise ValueError('Cannot find spec file for {0}.'.format(tmpdir))
 
-    # if the checksums don't match don't install
-    if bchecksum['hash'] != checksum:
+        if not unsigned:
+            if os.path.exists('%s.asc' % specfile_path):
+                try:
+                    suppress = config.get('config:suppress_gpg_warnings', False)
+                    spack.util.gpg.verify(
+                        '%s.asc' % specfile_path, specfile_path, suppress)
+                except Exception as e:
+                    shutil.rmtree(tmpdir)
+                    raise e
+            else:
+                shutil.rmtree(tmpdir)
+                raise NoVerifyException(
+                    "Package spec file failed signature verification.\n"
+                    "Use spack buildcache keys to download "
+                    "and install a key for verification from the mirror.")
+
+        spec_dict = {}
+        with open(specfile_path, 'r') as inputfile:
+            content = inputfile.read()
+            if specfile_is_json:
+                spec_dict = sjson.load(content)
+            else:
+                spec_dict = syaml.load(content)
         shutil.rmtree(tmpdir)
-        raise NoChecksumException(
-            "Package tarball failed checksum verification.\n"
-            "It cannot be installed.")
-
-    new_relative_prefix = str(os.path.relpath(spec.prefix,
-                                              spack.store.layout.root))
-    # if the original relative prefix is in the spec file use it
-    buildinfo = spec_dict.get('buildinfo', {})
-    old_relative_prefix = buildinfo.get('relative_prefix', new_relative_prefix)
-    rel = buildinfo.get('relative_rpaths')
-    info = 'old relative prefix %s\nnew relative prefix %s\nrelative rpaths %s'
-    tty.debug(info %
-              (old_relative_prefix, new_relative_prefix, rel))
-
-    # Extract the tarball into the store root, presumably on the same filesystem.
-    # The directory created is the base directory name of the old prefix.
-    # Moving the old prefix name to the new prefix location should preserve
-    # hard links and symbolic links.
-    extract_tmp = os.path.join(spack.store.layout.root, '.tmp')
-    mkdirp(extract_tmp)
-    extracted_dir = os.path.join(extract_tmp,
-                                 old_relative_prefix.split(os.path.sep)[-1])
-
-    with closing(tarfile.open(tarfile_path, 'r')) as tar:
+
+        # tarballs without a format are gzip or bzip2 compressed
+        binary_format = spec_dict.get('binary_cache_format', {'version': 1})
+        if binary_format['version'] > binary_cache_format_version:
+            raise UnknownFormatException(spec.name, binary_format['version'])
+        compression = binary_format.get('compression', 'gzip')
+        if compression not in compression_extensions:
+            raise UnsupportedCompressionException(compression)
+        tarfile_name = tarball_name(spec, compression_extensions[compression])
+        if 'compression' not in binary_format and tarfile_name not in members:
+            compression = 'bzip2'
+            tarfile_name = tarball_name(spec, '.tar.bz2')
+
+        # get the sha256 checksum recorded at creation
+        bchecksum = spec_dict['binary_cache_checksum']
+
+        new_relative_prefix = str(os.path.relpath(spec.prefix,
+                                                  spack.store.layout.root))
+        # if the original relative prefix is in the spec file use it
+        buildinfo = spec_dict.get('buildinfo', {})
+        old_relative_prefix = buildinfo.get(
+            'relative_prefix', new_relative_prefix)
+        rel = buildinfo.get('relative_rpaths')
+        info = ('old relative prefix %s\nnew relative prefix %s\n'
+                'relative rpaths %s')
+        tty.debug(info %
+                  (old_relative_prefix, new_relative_prefix, rel))
+
+        # Extract the tarball into a staging directory of the store root,
+        # presumably on the same filesystem. The directory created is the
+        # base directory name of the old prefix. Renaming it to the new
+        # prefix is atomic and preserves hard links and symbolic links.
+        extract_tmp = os.path.join(spack.store.layout.root, '.tmp')
+        mkdirp(extract_tmp)
+        staging_dir = tempfile.mkdtemp(dir=extract_tmp)
+        extracted_dir = os.path.join(
+            staging_dir, old_relative_prefix.split(os.path.sep)[-1])
         try:
-            tar.extractall(path=extract_tmp)
-        except Exception as e:
-            shutil.rmtree(extracted_dir)
-            raise e
-    try:
-        shutil.move(extracted_dir, spec.prefix)
-    except Exception as e:
-        shutil.rmtree(extracted_dir)
-        raise e
-    os.remove(tarfile_path)
-    os.remove(specfile_path)
+            if tarfile_name not in members:
+                raise ValueError('Cannot find {0} in {1}.'.format(
+                    tarfile_name, spackfile_path))
+            reader = HashingReader(spackfile.extractfile(members[tarfile_name]))
+            extract_prefix_stream(reader, staging_dir, compression)
+
+            # if the checksums don't match don't install
+            if bchecksum['hash'] != reader.hexdigest():
+                raise NoChecksumException(
+                    "Package tarball failed checksum verification.\n"
+                    "It cannot be installed.")
+
+            mkdirp(os.path.dirname(spec.prefix))
+            try:
+                os.rename(extracted_dir, spec.prefix)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(extracted_dir, spec.prefix)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
     try:
         relocate_package(spec, allow_root)
@@ -1481,9 +2699,10 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
             spec_id = spec.format('{name}/{hash:7}')
             tty.warn('No manifest file in tarball for spec %s' % spec_id)
     finally:
-        shutil.rmtree(tmpdir)
         if os.path.exists(filename):
             os.remove(filename)
+        if os.path.dirname(filename) == _tarball_stage_path(spec):
+            shutil.rmtree(os.path.dirname(filename), ignore_errors=True)
 
 
 def try_direct_fetch(spec, full_hash_match=False, mirrors=None):
@@ -1571,7 +2790,7 @@ def get_mirrors_for_spec(spec=None, full_hash_match=False,
     def filter_candidates(candidate_list):
         filtered_candidates = []
         for candidate in candidate_list:
-            candidate_full_hash = candidate['spec']._full_hash
+            candidate_full_hash = _entry_full_hash(candidate)
             if lenient or spec_full_hash == candidate_full_hash:
                 filtered_candidates.append(candidate)
         return filtered_candidates
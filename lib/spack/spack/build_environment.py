@@ -62,7 +62,9 @@
 import spack.store
 import spack.subprocess_context
 import spack.user_environment
+import spack.util.jobserver
 import spack.util.path
+import spack.version
 from spack.error import NoHeadersError, NoLibrariesError
 from spack.util.cpus import cpus_available
 from spack.util.environment import (
@@ -75,7 +77,7 @@
     system_dirs,
     validate,
 )
-from spack.util.executable import Executable
+from spack.util.executable import Executable, ProcessError, which_string
 from spack.util.log_parse import make_log_context, parse_log_events
 from spack.util.module_cmd import load_module, module, path_from_modules
 from spack.util.string import plural
@@ -122,11 +124,16 @@ class MakeExecutable(Executable):
 
        Note that if the SPACK_NO_PARALLEL_MAKE env var is set it overrides
        everything.
+
+       When the build is connected to a jobserver and the executable
+       supports it, parallel calls get their jobs from the jobserver through
+       ``MAKEFLAGS`` instead of a fixed ``-j`` value.
     """
 
-    def __init__(self, name, jobs):
+    def __init__(self, name, jobs, supports_jobserver=False):
         super(MakeExecutable, self).__init__(name)
         self.jobs = jobs
+        self.supports_jobserver = supports_jobserver
 
     def __call__(self, *args, **kwargs):
         """parallel, and jobs_env from kwargs are swallowed and used here;
@@ -135,17 +142,72 @@ def __call__(self, *args, **kwargs):
 
         disable = env_flag(SPACK_NO_PARALLEL_MAKE)
         parallel = (not disable) and kwargs.pop('parallel', self.jobs > 1)
+        jobserver = spack.util.jobserver.client()
 
+        extra_env = {}
         if parallel:
-            args = ('-j{0}'.format(self.jobs),) + args
+            makeflags = jobserver and self._jobserver_makeflags(jobserver)
+            if makeflags:
+                extra_env['MAKEFLAGS'] = makeflags
+            else:
+                args = ('-j{0}'.format(self.jobs),) + args
             jobs_env = kwargs.pop('jobs_env', None)
             if jobs_env:
                 # Caller wants us to set an environment variable to
                 # control the parallelism.
-                kwargs['extra_env'] = {jobs_env: str(self.jobs)}
+                extra_env[jobs_env] = str(self.jobs)
+        elif jobserver:
+            # Do not let a serial call join the jobserver of the build
+            extra_env['MAKEFLAGS'] = ''
+
+        if extra_env:
+            kwargs['extra_env'] = extra_env
 
         return super(MakeExecutable, self).__call__(*args, **kwargs)
 
+    def _jobserver_makeflags(self, jobserver):
+        """Value of ``MAKEFLAGS`` making this executable a client of the
+        jobserver of the build, or None if it cannot be one."""
+        if not self.supports_jobserver:
+            return None
+        return jobserver.makeflags(self.jobs)
+
+
+#: Whether the ninja executables seen so far join jobservers, by path
+_ninja_jobserver_support = {}
+
+
+class NinjaExecutable(MakeExecutable):
+    """Special callable executable object for ninja.
+
+    ninja only joins a jobserver advertised in ``MAKEFLAGS`` as of version
+    1.13, and only through a named pipe, so older versions keep their
+    ``-j`` value.
+    """
+
+    def __init__(self, name, jobs):
+        super(NinjaExecutable, self).__init__(name, jobs,
+                                              supports_jobserver=True)
+
+    def _jobserver_makeflags(self, jobserver):
+        path = which_string(self.path)
+        if path is None:
+            return None
+        if path not in _ninja_jobserver_support:
+            supported = False
+            try:
+                output = Executable(path)('--version', output=str, error=str)
+                supported = spack.version.Version(
+                    output.strip()) >= spack.version.Version('1.13')
+            except (ProcessError, ValueError, TypeError) as e:
+                tty.debug('Cannot read the version of {0}: {1}'.format(
+                    path, str(e)))
+            _ninja_jobserver_support[path] = supported
+
+        if not _ninja_jobserver_support[path]:
+            return None
+        return jobserver.makeflags(self.jobs, fifo=True)
+
 
 def _on_cray():
     host_platform = spack.platforms.host()
@@ -502,10 +564,10 @@ def _set_variables_for_single_module(pkg, module):
     m.make_jobs = jobs
 
     # TODO: make these build deps that can be installed if not found.
-    m.make = MakeExecutable('make', jobs)
-    m.gmake = MakeExecutable('gmake', jobs)
+    m.make = MakeExecutable('make', jobs, supports_jobserver=True)
+    m.gmake = MakeExecutable('gmake', jobs, supports_jobserver=True)
     m.scons = MakeExecutable('scons', jobs)
-    m.ninja = MakeExecutable('ninja', jobs)
+    m.ninja = NinjaExecutable('ninja', jobs)
 
     # easy shortcut to os.environ
     m.env = os.environ
@@ -1021,10 +1083,29 @@ def _setup_pkg_and_run(serialized_pkg, function, kwargs, child_pipe,
 
         pkg = serialized_pkg.restore()
 
+        # Builds running concurrently with other builds only get their share
+        # of the global job budget (see ``PackageInstaller``).
+        build_jobs = kwargs.get('build_jobs')
+        if build_jobs:
+            scope = 'command_line' if 'command_line' in spack.config.scopes() \
+                else None
+            spack.config.set('config:build_jobs', build_jobs, scope=scope)
+
+        # Draw the jobs of the build from the jobserver of the installer
+        jobserver = kwargs.get('jobserver')
+        if jobserver:
+            jobserver = spack.util.jobserver.connect(jobserver)
+
         if not kwargs.get('fake', False):
             kwargs['unmodified_env'] = os.environ.copy()
             kwargs['env_modifications'] = setup_package(
                 pkg, dirty=kwargs.get('dirty', False), context=context)
+
+            # Tools run through the compiler wrappers (e.g. LTO link steps)
+            # get their jobs from the jobserver too.
+            if jobserver and pkg.parallel:
+                os.environ['MAKEFLAGS'] = jobserver.makeflags(
+                    determine_number_of_jobs(parallel=True))
         return_value = function(pkg, kwargs)
         child_pipe.send(return_value)
 
@@ -1072,7 +1153,7 @@ def _setup_pkg_and_run(serialized_pkg, function, kwargs, child_pipe,
             input_multiprocess_fd.close()
 
 
-def start_build_process(pkg, function, kwargs):
+def start_build_process(pkg, function, kwargs, wait=True):
     """Create a child process to do part of a spack build.
 
     Args:
@@ -1081,6 +1162,9 @@ def start_build_process(pkg, function, kwargs):
             child process for.
         function (typing.Callable): argless function to run in the child
             process.
+        wait (bool): if ``True`` (the default) block until the child process
+            completes and return its result, otherwise return a
+            ``BuildProcess`` handle that can be polled and completed later.
 
     Usage::
 
@@ -1117,8 +1201,10 @@ def child_fun():
     serialized_pkg = spack.subprocess_context.PackageInstallContext(pkg)
 
     try:
-        # Forward sys.stdin when appropriate, to allow toggling verbosity
-        if sys.stdin.isatty() and hasattr(sys.stdin, 'fileno'):
+        # Forward sys.stdin when appropriate, to allow toggling verbosity.
+        # Background builds share the terminal with other builds, so they
+        # never get the input stream.
+        if wait and sys.stdin.isatty() and hasattr(sys.stdin, 'fileno'):
             input_fd = os.dup(sys.stdin.fileno())
             input_multiprocess_fd = MultiProcessFd(input_fd)
 
@@ -1137,27 +1223,76 @@ def child_fun():
         if input_multiprocess_fd is not None:
             input_multiprocess_fd.close()
 
-    child_result = parent_pipe.recv()
-    p.join()
+    build = BuildProcess(pkg, p, parent_pipe)
+    if not wait:
+        return build
+
+    return build.complete()
 
-    # If returns a StopPhase, raise it
-    if isinstance(child_result, StopPhase):
-        # do not print
-        raise child_result
 
-    # let the caller know which package went wrong.
-    if isinstance(child_result, InstallError):
-        child_result.pkg = pkg
+class BuildProcess(object):
+    """Handle on a child process started by ``start_build_process``.
 
-    if isinstance(child_result, ChildError):
-        # If the child process raised an error, print its output here rather
-        # than waiting until the call to SpackError.die() in main(). This
-        # allows exception handling output to be logged from within Spack.
-        # see spack.main.SpackCommand.
-        child_result.print_context()
-        raise child_result
+    Builds started with ``wait=False`` return one of these, so that the
+    caller can run several of them at once and collect each result as soon
+    as the corresponding child process is done.
+    """
 
-    return child_result
+    def __init__(self, pkg, process, pipe):
+        self.pkg = pkg
+        self.process = process
+        self.pipe = pipe
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def poll(self, timeout=0):
+        """Return ``True`` if the result of the child process is available,
+        waiting at most ``timeout`` seconds for it."""
+        return self.pipe.poll(timeout) or not self.process.is_alive()
+
+    def complete(self):
+        """Wait for the child process and return its result, raising any
+        error it reported."""
+        try:
+            child_result = self.pipe.recv()
+        except EOFError:
+            # The child died without sending anything back (e.g. it was
+            # killed), so report it like any other failure in the child.
+            self.process.join()
+            child_result = InstallError(
+                'Build process for {0} exited with code {1}'
+                .format(self.pkg.name, self.process.exitcode))
+            child_result.pkg = self.pkg
+            raise child_result
+
+        self.process.join()
+
+        # If returns a StopPhase, raise it
+        if isinstance(child_result, StopPhase):
+            # do not print
+            raise child_result
+
+        # let the caller know which package went wrong.
+        if isinstance(child_result, InstallError):
+            child_result.pkg = self.pkg
+
+        if isinstance(child_result, ChildError):
+            # If the child process raised an error, print its output here
+            # rather than waiting until the call to SpackError.die() in
+            # main(). This allows exception handling output to be logged from
+            # within Spack. see spack.main.SpackCommand.
+            child_result.print_context()
+            raise child_result
+
+        return child_result
+
+    def terminate(self):
+        """Kill the child process without waiting for its result."""
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
 
 
 def get_package_context(traceback, context=3):
@@ -555,6 +555,11 @@ def find_environment(args):
         (spack.environment.Environment): a found environment, or ``None``
     """
 
+    # spack.environment is slow to import, so only use it when there may
+    # be an environment to find
+    if not (args.env or args.env_dir or os.environ.get('SPACK_ENV')):
+        return None
+
     # treat env as a name
     env = args.env
     if env:
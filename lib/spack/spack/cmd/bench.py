@@ -0,0 +1,799 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+from __future__ import division, print_function
+
+import argparse
+import base64
+import datetime
+import gc
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+from ordereddict_backport import OrderedDict
+
+import llnl.util.tty as tty
+
+import spack
+import spack.cmd
+import spack.database
+import spack.util.spack_json as sjson
+from spack.util.executable import which
+
+description = "run benchmarks of Spack internals"
+section = "developer"
+level = "long"
+
+#: Specs concretized by ``spack bench concretize`` if none is given, from
+#: single packages to large DAGs with many virtuals and conditional
+#: dependencies
+concretize_corpus = [
+    'zlib', 'cmake', 'hdf5', 'openmpi', 'py-numpy', 'py-scipy', 'petsc',
+    'mfem', 'gromacs', 'trilinos', 'paraview',
+]
+
+#: Phases of a solve, in the order they run
+solver_phases = ['setup', 'load', 'ground', 'solve', 'build specs']
+
+
+def setup_parser(subparser):
+    sp = subparser.add_subparsers(metavar='SUBCOMMAND', dest='bench_command')
+
+    database = sp.add_parser('database', help=bench_database.__doc__)
+    database.add_argument(
+        '-n', '--records', type=int, default=50000,
+        help='number of records of the synthetic database (default 50000)')
+    database.add_argument(
+        '-q', '--queries', type=int, default=100,
+        help='number of queries of each kind (default 100)')
+    database.add_argument(
+        '--json', action='store_true', default=False,
+        help='print the results as JSON')
+
+    specs = sp.add_parser('specs', help=bench_specs.__doc__)
+    specs.add_argument(
+        '-n', '--records', type=int, default=20000,
+        help='number of specs of the synthetic database and lockfile '
+        '(default 20000)')
+    specs.add_argument(
+        '--json', action='store_true', default=False,
+        help='print the results as JSON')
+
+    concretize = sp.add_parser('concretize', help=bench_concretize.__doc__)
+    concretize.add_argument(
+        '-r', '--repeat', type=int, default=1,
+        help='number of solves of each spec, the fastest is kept (default 1)')
+    concretize.add_argument(
+        '--reuse', action='store_true', default=False,
+        help='maximize the reuse of installed specs in the solves')
+    concretize.add_argument(
+        '--json', action='store_true', default=False,
+        help='print the results as JSON')
+    concretize.add_argument(
+        'specs', nargs=argparse.REMAINDER,
+        help='specs to concretize (default: a fixed corpus of builtin specs)')
+
+    buildcache = sp.add_parser('buildcache', help=bench_buildcache.__doc__)
+    buildcache.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of compression threads (default: all the cpus available)')
+    buildcache.add_argument(
+        '-s', '--synthetic', type=int, default=None, metavar='MB',
+        help='compress a synthetic, very compressible prefix of about this '
+        'many megabytes instead of installed specs')
+    buildcache.add_argument(
+        '--json', action='store_true', default=False,
+        help='print the results as JSON')
+    buildcache.add_argument(
+        'specs', nargs=argparse.REMAINDER,
+        help='installed specs whose prefix is compressed')
+
+    relocate = sp.add_parser('relocate', help=bench_relocate.__doc__)
+    relocate.add_argument(
+        '-n', '--files', type=int, default=1000,
+        help='number of text files and of binaries of the prefix '
+        '(default 1000)')
+    relocate.add_argument(
+        '-s', '--size', type=int, default=256,
+        help='size of each file in kilobytes (default 256)')
+    relocate.add_argument(
+        '-p', '--prefixes', type=int, default=40,
+        help='number of prefixes to relocate (default 40)')
+    relocate.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of parallel relocations (default: all the cpus available)')
+    relocate.add_argument(
+        '--json', action='store_true', default=False,
+        help='print the results as JSON')
+
+    compare = sp.add_parser('compare', help=bench_compare.__doc__)
+    compare.add_argument(
+        '-t', '--threshold', type=float, default=10.0,
+        help='slowdown, in percent, flagged as a regression (default 10)')
+    compare.add_argument(
+        '--min-time', type=float, default=0.05,
+        help='slowdown, in seconds, below which times are not compared '
+        '(default 0.05)')
+    compare.add_argument(
+        'before', help='JSON results of `spack bench concretize` to compare to')
+    compare.add_argument(
+        'after', help='JSON results of `spack bench concretize` to compare')
+
+
+def _synthetic_hash(i):
+    digest = hashlib.sha1(str(i).encode('utf-8')).digest()
+    return base64.b32encode(digest)[:32].decode('utf-8').lower()
+
+
+def synthetic_database(root, records, stack_size=200, layers=10):
+    """Write a synthetic database of ``records`` records under ``root``.
+
+    There is a package name for every 10 records. Records are split in
+    software stacks of ``stack_size`` records, themselves split in
+    ``layers`` layers, and each record depends on up to 3 records of the
+    layer below it in its stack, with different names. Every 10th record is
+    explicit and every 20th is not installed. Installation times are one
+    minute apart.
+
+    Args:
+        root (str): root of the install tree of the database
+        records (int): number of records
+        stack_size (int): number of records of each software stack
+        layers (int): depth of the DAG of each software stack
+
+    Return:
+        (spack.database.Database): the database
+    """
+    db = spack.database.Database(root, backend='json')
+    packages = max(records // 10, 1)
+    layer_size = max(stack_size // layers, 1)
+    hashes = [_synthetic_hash(i) for i in range(records)]
+    ref_counts = [0] * records
+    now = time.time()
+
+    installs = {}
+    for i, h in enumerate(hashes):
+        name = 'pkg-{0}'.format(i % packages)
+        # Dependencies must have distinct names, other than the dependent's
+        stack, layer = divmod(i, stack_size)
+        layer //= layer_size
+        names = {i % packages: i}
+        deps = []
+        for k in (1, 2, 3) if layer else ():
+            j = (stack * stack_size + (layer - 1) * layer_size +
+                 (i * k * 7919) % layer_size)
+            if j < i and j % packages not in names:
+                names[j % packages] = j
+                deps.append(j)
+        node = {
+            'name': name,
+            'version': '1.{0}'.format(i // packages),
+            'arch': {'platform': 'linux', 'platform_os': 'centos8',
+                     'target': 'x86_64'},
+            'compiler': {'name': 'gcc', 'version': '10.2.0'},
+            'namespace': 'builtin',
+            'parameters': {'shared': True, 'cflags': [], 'cppflags': [],
+                           'cxxflags': [], 'fflags': [], 'ldflags': [],
+                           'ldlibs': []},
+            'hash': h,
+        }
+        if deps:
+            node['dependencies'] = [
+                {'name': 'pkg-{0}'.format(j % packages), 'hash': hashes[j],
+                 'type': ['build', 'link']} for j in deps]
+        for j in deps:
+            ref_counts[j] += 1
+
+        installs[h] = {
+            'spec': node,
+            'path': '/synthetic/{0}-{1}'.format(name, h),
+            'installed': i % 20 != 19,
+            'explicit': i % 10 == 9,
+            'installation_time': now - 60 * (records - i),
+        }
+
+    for i, h in enumerate(hashes):
+        installs[h]['ref_count'] = ref_counts[i]
+
+    with open(db._index_path, 'w') as f:
+        sjson.dump({'database': {
+            'installs': installs,
+            'version': str(spack.database._db_version)
+        }}, f)
+
+    # Write the database back, as Spack would, to get a verifier file
+    with db.write_transaction():
+        pass
+    return db
+
+
+def _time(root, query, count, indexed):
+    """Return the time taken by ``count`` calls of ``query`` on the database
+    at ``root``, with or without indexes.
+
+    Queries run on a freshly read database, so that the time accounts for
+    building the specs they need and the indexes, as a command would.
+    """
+    db = spack.database.Database(root, backend='json')
+    db._use_query_index = indexed
+    with db.read_transaction():
+        start = time.time()
+        for i in range(count):
+            query(db, i)
+        return time.time() - start
+
+
+def bench_database(args):
+    """compare database queries with and without secondary indexes"""
+    if args.records < 1 or args.queries < 1:
+        tty.die('the number of records and queries must be positive')
+
+    records = args.records
+    packages = max(records // 10, 1)
+    start_date = datetime.datetime.now() - datetime.timedelta(
+        minutes=records)
+
+    def record_hash(i):
+        return _synthetic_hash(i * 7919 % records)
+
+    def installed_relatives(db, i):
+        spec = db.get_by_hash_local(record_hash(i))[0]
+        return db.installed_relatives(spec, 'parents')
+
+    queries = [
+        ('find name', lambda db, i: db.query_local(
+            'pkg-{0}'.format(i * 7919 % packages))),
+        ('find /hash', lambda db, i: db.get_by_hash_local(
+            record_hash(i)[:7])),
+        ('find hashes', lambda db, i: db.query_local(
+            hashes=set([record_hash(i)]))),
+        ('find explicit name', lambda db, i: db.query_local(
+            'pkg-{0}'.format(i * 7919 % packages), explicit=True)),
+        ('find date range', lambda db, i: db.query_local(
+            start_date=start_date + datetime.timedelta(minutes=10 * i),
+            end_date=start_date + datetime.timedelta(minutes=10 * i + 10))),
+        ('dependents', installed_relatives),
+    ]
+
+    root = tempfile.mkdtemp(prefix='spack-bench-')
+    try:
+        synthetic_database(root, records)
+        results = {'records': records, 'queries': []}
+        for name, query in queries:
+            results['queries'].append({
+                'name': name,
+                'count': args.queries,
+                'scan': _time(root, query, args.queries, False),
+                'indexed': _time(root, query, args.queries, True),
+            })
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        sjson.dump(results, sys.stdout)
+        print()
+        return
+
+    print('{0} queries of each kind on {1} records'.format(
+        args.queries, records))
+    print('{0:<20}{1:>12}{2:>12}{3:>10}'.format(
+        'Query', 'Scan (s)', 'Indexed (s)', 'Speedup'))
+    for query in results['queries']:
+        print('{0:<20}{1:>12.4f}{2:>12.4f}{3:>9.1f}x'.format(
+            query['name'], query['scan'], query['indexed'],
+            query['scan'] / max(query['indexed'], 1e-9)))
+
+
+def synthetic_lockfile(path, db):
+    """Write an environment in ``path`` whose lockfile has the specs of a
+    synthetic database, and the specs no other spec depends on as roots.
+
+    Args:
+        path (str): directory of the environment
+        db (spack.database.Database): database written by
+            ``synthetic_database()``
+    """
+    import spack.environment as ev
+    import spack.spec
+
+    with open(db._index_path) as f:
+        installs = sjson.load(f)['database']['installs']
+
+    # Synthetic specs have the same DAG hash and build hash
+    concrete_specs, roots = {}, []
+    for h, record in sorted(installs.items()):
+        concrete_specs[h] = record['spec']
+        if not record['ref_count']:
+            roots.append({'hash': h, 'spec': record['spec']['name']})
+
+    with open(os.path.join(path, ev.manifest_name), 'w') as f:
+        f.write('spack:\n  specs: []\n  view: false\n')
+    with open(os.path.join(path, ev.lockfile_name), 'w') as f:
+        sjson.dump({
+            '_meta': {
+                'file-type': 'spack-lockfile',
+                'lockfile-version': ev.environment.lockfile_format_version,
+                'specfile-version': spack.spec.specfile_format_version,
+            },
+            'roots': roots,
+            'concrete_specs': concrete_specs,
+        }, f)
+
+
+def traced_memory(function):
+    """Call ``function`` and return the memory in kilobytes allocated by the
+    call that is still in use after it, or ``None`` if it cannot be measured
+    on this version of Python."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()  # noqa: F841
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current // 1024
+
+
+def spec_load_benchmark(name, load):
+    """Time a load path of concrete specs, the traversal and the copy of the
+    specs it loads, and measure the memory used by these specs.
+
+    Nodes shared among specs are cleared before each load, so that every
+    load starts from scratch.
+
+    Args:
+        name (str): name of the load path
+        load: function loading the specs, and returning them with the
+            roots to traverse and copy
+
+    Return:
+        (dict): the benchmark results
+    """
+    import spack.spec
+
+    spack.spec._interned_components.clear()
+    memory = traced_memory(load)
+
+    spack.spec._interned_components.clear()
+    gc.collect()
+    start = time.time()
+    specs, roots = load()
+    load_time = time.time() - start
+
+    start = time.time()
+    nodes = sum(1 for root in roots for _ in root.traverse())
+    traverse_time = time.time() - start
+
+    start = time.time()
+    for root in roots:
+        root.copy()
+    copy_time = time.time() - start
+
+    return {
+        'name': name,
+        'specs': len(specs),
+        'roots': len(roots),
+        'nodes': nodes,
+        'load': load_time,
+        'memory': memory,
+        'traverse': traverse_time,
+        'copy': copy_time,
+    }
+
+
+def bench_specs(args):
+    """time the database and lockfile load paths of concrete specs"""
+    import spack.environment as ev
+
+    if args.records < 1:
+        tty.die('the number of records must be positive')
+
+    def load_database():
+        db = spack.database.Database(root, backend='json')
+        with db.read_transaction():
+            records = list(db._data.values())
+        specs = [r.spec for r in records]
+        return specs, [r.spec for r in records if not r.ref_count]
+
+    def load_lockfile():
+        env = ev.Environment(env_path)
+        roots = list(env.specs_by_hash.values())
+        return list(env.all_specs()), roots
+
+    root = tempfile.mkdtemp(prefix='spack-bench-')
+    try:
+        # Specs are copied by package name, so they must be unique in the
+        # DAG of each software stack
+        stack_size = min(200, max(args.records // 10, 1))
+        db = synthetic_database(root, args.records, stack_size=stack_size)
+        env_path = os.path.join(root, 'env')
+        os.mkdir(env_path)
+        synthetic_lockfile(env_path, db)
+
+        results = {'records': args.records, 'loads': [
+            spec_load_benchmark('database', load_database),
+            spec_load_benchmark('lockfile', load_lockfile),
+        ]}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        sjson.dump(results, sys.stdout)
+        print()
+        return
+
+    print('{0} concrete specs'.format(args.records))
+    print('{0:<10}{1:>10}{2:>13}{3:>14}{4:>10}'.format(
+        'Load', 'Load (s)', 'Memory (MB)', 'Traverse (s)', 'Copy (s)'))
+    for r in results['loads']:
+        memory = '-' if r['memory'] is None else '{0:.1f}'.format(
+            r['memory'] / 1024.0)
+        print('{0:<10}{1:>10.3f}{2:>13}{3:>14.3f}{4:>10.3f}'.format(
+            r['name'], r['load'], memory, r['traverse'], r['copy']))
+
+
+def buildcache_benchmark(prefix, compression, jobs=None):
+    """Compress ``prefix`` as ``spack buildcache create`` would, extract it
+    again as ``spack install`` would, and return the time taken by each
+    step with the size of the tarball.
+
+    Args:
+        prefix (str): directory to compress
+        compression (str): compression of the tarball
+        jobs (int): number of compression threads
+
+    Gzip tarballs are also extracted with ``tarfile`` as a reference, which
+    the extraction of Spack is expected to keep up with.
+
+    Return:
+        (dict): the benchmark results
+    """
+    import tarfile
+
+    import spack.binary_distribution as bindist
+
+    workdir = tempfile.mkdtemp(prefix='spack-bench-')
+    try:
+        tarfile_path = os.path.join(
+            workdir, 'prefix' + bindist.compression_extensions[compression])
+        start = time.time()
+        bindist.compress_prefix(
+            prefix, os.path.basename(prefix), tarfile_path, compression, jobs)
+        push = time.time() - start
+
+        start = time.time()
+        bindist.extract_prefix(
+            tarfile_path, os.path.join(workdir, 'extract'), compression)
+        pull = time.time() - start
+
+        reference = None
+        if compression == 'gzip':
+            start = time.time()
+            with closing(tarfile.open(tarfile_path, 'r:gz')) as tar:
+                tar.extractall(os.path.join(workdir, 'reference'))
+            reference = time.time() - start
+        return {
+            'compression': compression,
+            'push': push,
+            'pull': pull,
+            'reference': reference,
+            'size': os.path.getsize(tarfile_path),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _prefix_size(prefix):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(prefix) for f in files)
+
+
+def bench_buildcache(args):
+    """compare the build cache compressions on installed prefixes"""
+    if not args.specs and not args.synthetic:
+        tty.die('at least one installed spec or --synthetic is required')
+
+    compressions = ['gzip', 'zstd']
+    if not which('zstd'):
+        tty.warn('zstd is not in PATH, only gzip is benchmarked')
+        compressions.remove('zstd')
+
+    results = {'spack': spack.spack_version, 'specs': []}
+    if args.synthetic:
+        # text files and binaries of 256 KB, mostly repeated lines and blocks
+        root = tempfile.mkdtemp(prefix='spack-bench-')
+        try:
+            prefix = os.path.join(root, 'prefix')
+            synthetic_prefix(prefix, max(args.synthetic * 2, 1), 256, 40)
+            results['specs'].append({
+                'spec': 'synthetic',
+                'size': _prefix_size(prefix),
+                'formats': [buildcache_benchmark(prefix, c, args.jobs)
+                            for c in compressions],
+            })
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    for spec in spack.cmd.parse_specs(args.specs):
+        spec = spack.cmd.disambiguate_spec(spec, None, installed=True)
+        results['specs'].append({
+            'spec': spec.format('{name}/{hash:7}'),
+            'size': _prefix_size(spec.prefix),
+            'formats': [buildcache_benchmark(spec.prefix, c, args.jobs)
+                        for c in compressions],
+        })
+
+    if args.json:
+        sjson.dump(results, sys.stdout)
+        print()
+        return
+
+    print('{0:<24}{1:<8}{2:>10}{3:>10}{4:>10}{5:>12}{6:>8}'.format(
+        'Spec', 'Format', 'Push (s)', 'Pull (s)', 'Ref (s)', 'Size (MB)',
+        'Ratio'))
+    for result in results['specs']:
+        for f in result['formats']:
+            reference = f['reference']
+            reference = '-' if reference is None else '%.3f' % reference
+            print('{0:<24}{1:<8}{2:>10.3f}{3:>10.3f}{4:>10}{5:>12.1f}{6:>8.2f}'
+                  .format(result['spec'], f['compression'], f['push'],
+                          f['pull'], reference, f['size'] / 1e6,
+                          result['size'] / max(f['size'], 1)))
+
+
+def synthetic_prefix(root, files, size, prefixes):
+    """Write a synthetic install prefix under ``root``, with ``files`` text
+    files and ``files`` binaries of ``size`` kilobytes each, referring to
+    ``prefixes`` install prefixes of dependencies.
+
+    Args:
+        root (str): directory of the prefix
+        files (int): number of text files, and of binaries
+        size (int): size of each file in kilobytes
+        prefixes (int): number of dependency prefixes
+
+    Return:
+        (tuple): the text files, the binaries and the dependency prefixes
+    """
+    old_root = '/spack-bench/old/opt/spack/linux-centos8-x86_64/gcc-10.2.0'
+    deps = ['{0}/pkg-{1}-1.0-{2}'.format(old_root, i, _synthetic_hash(i))
+            for i in range(prefixes)]
+
+    text_files, binaries = [], []
+    for i in range(files):
+        # every file refers to a few dependencies
+        paths = [deps[(i * 7 + k * 13) % prefixes] for k in range(3)]
+        line = ' '.join('-L{0}/lib -I{0}/include'.format(p) for p in paths)
+        line = (line + ' # some text of the file\n').encode('utf-8')
+        text = line * (size * 1024 // len(line) + 1)
+        path = os.path.join(root, 'share', 'file-{0}.txt'.format(i))
+        text_files.append(path)
+        _write_bench_file(path, text[:size * 1024])
+
+        strings = b''.join(p.encode('utf-8') + b'/lib\0' for p in paths)
+        block = os.urandom(4096)
+        binary = (block + strings) * (size * 1024 // (4096 + len(strings)) + 1)
+        path = os.path.join(root, 'lib', 'lib-{0}.so'.format(i))
+        binaries.append(path)
+        _write_bench_file(path, binary[:size * 1024])
+    return text_files, binaries, deps
+
+
+def _write_bench_file(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def bench_relocate(args):
+    """time the relocation of the text and binaries of a large prefix"""
+    import spack.relocate
+
+    if args.files < 1 or args.size < 1 or args.prefixes < 1:
+        tty.die('the number of files, their size and the number of prefixes '
+                'must be positive')
+
+    root = tempfile.mkdtemp(prefix='spack-bench-')
+    try:
+        text_files, binaries, deps = synthetic_prefix(
+            root, args.files, args.size, args.prefixes)
+        new_prefixes = OrderedDict(
+            (p, p.replace('/spack-bench/old', '/new')) for p in deps)
+
+        results = {'files': args.files, 'size': args.size,
+                   'prefixes': args.prefixes, 'relocations': []}
+        for name, relocate, files in (
+                ('text', spack.relocate.relocate_text, text_files),
+                ('binary', spack.relocate.relocate_text_bin, binaries)):
+            start = time.time()
+            relocate(files, new_prefixes, concurrency=args.jobs)
+            results['relocations'].append({
+                'name': name,
+                'time': time.time() - start,
+                'bytes': len(files) * args.size * 1024,
+            })
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        sjson.dump(results, sys.stdout)
+        print()
+        return
+
+    print('{0} files of {1} KB with {2} prefixes'.format(
+        args.files, args.size, args.prefixes))
+    print('{0:<10}{1:>10}{2:>10}'.format('Files', 'Time (s)', 'MB/s'))
+    for r in results['relocations']:
+        print('{0:<10}{1:>10.3f}{2:>10.1f}'.format(
+            r['name'], r['time'], r['bytes'] / 1e6 / max(r['time'], 1e-9)))
+
+
+def peak_memory():
+    """Return the peak resident memory of the current process in kilobytes,
+    or ``None`` if it cannot be measured on this platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes instead of kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _solver_statistics(statistics):
+    """Return a summary of the statistics of a clingo solve."""
+    lp = statistics['problem']['lp']
+    solvers = statistics['solving']['solvers']
+    return {
+        'atoms': int(lp['atoms']),
+        'rules': int(lp['rules']),
+        'choices': int(solvers['choices']),
+        'conflicts': int(solvers['conflicts']),
+        'restarts': int(solvers['restarts']),
+        'models': int(statistics['summary']['models']['enumerated']),
+    }
+
+
+def concretize_benchmark(spec, reuse=False):
+    """Solve for ``spec`` and return the time taken by each phase of the
+    solve, with the statistics of the solver.
+
+    The concretization cache is not used, so that every phase runs.
+
+    Args:
+        spec (spack.spec.Spec): abstract spec to concretize
+        reuse (bool): whether to maximize the reuse of installed specs
+
+    Return:
+        (dict): the benchmark results
+    """
+    import spack.solver.asp as asp
+
+    driver = asp.PyclingoDriver()
+    result = driver.solve(asp.SpackSolverSetup(), [spec], reuse=reuse)
+    driver.timer.stop()
+    return {
+        'spec': str(spec),
+        'satisfiable': bool(result.satisfiable),
+        'phases': dict(
+            (p, driver.timer.phases.get(p, 0.0)) for p in solver_phases),
+        'total': driver.timer.total,
+        'peak_memory': peak_memory(),
+        'statistics': _solver_statistics(driver.control.statistics),
+    }
+
+
+def bench_concretize(args):
+    """time the phases of the concretization of a corpus of specs"""
+    if args.repeat < 1:
+        tty.die('the number of solves must be positive')
+
+    specs = spack.cmd.parse_specs(args.specs or concretize_corpus)
+    results = {'spack': spack.spack_version, 'specs': []}
+    for spec in specs:
+        runs = [concretize_benchmark(spec, args.reuse)
+                for _ in range(args.repeat)]
+        results['specs'].append(min(runs, key=lambda r: r['total']))
+
+    if args.json:
+        sjson.dump(results, sys.stdout)
+        print()
+        return
+
+    columns = ['Setup', 'Load', 'Ground', 'Solve', 'Build', 'Total']
+    print(('{:<24}' + '{:>9}' * len(columns) + '{:>12}').format(
+        'Spec', *(columns + ['Peak (MB)'])))
+    for result in results['specs']:
+        times = [result['phases'][p] for p in solver_phases]
+        memory = result['peak_memory']
+        print(('{:<24}' + '{:>9.3f}' * len(columns) + '{:>12}').format(
+            result['spec'] + ('' if result['satisfiable'] else ' (unsat)'),
+            *(times + [result['total'],
+                       '-' if memory is None else memory // 1024])))
+
+
+def compare_concretize_results(before, after, threshold=10.0, min_time=0.05):
+    """Compare two runs of ``spack bench concretize``.
+
+    A phase, or the total time, of the solve of a spec is a regression if it
+    is slower after than before by more than ``threshold`` percent and more
+    than ``min_time`` seconds, so that the noise on short times is ignored.
+
+    Args:
+        before (dict): results of the reference run
+        after (dict): results of the run to compare to the reference
+        threshold (float): slowdown in percent flagged as a regression
+        min_time (float): slowdown in seconds below which times are not
+            compared
+
+    Return:
+        (list): a ``(spec, phase, before, after, regression)`` tuple for
+        each phase and total time of the specs in both runs
+    """
+    before_specs = dict((r['spec'], r) for r in before['specs'])
+    comparison = []
+    for new in after['specs']:
+        old = before_specs.get(new['spec'])
+        if not old:
+            continue
+        times = [(p, old['phases'][p], new['phases'][p]) for p in solver_phases
+                 if p in old['phases'] and p in new['phases']]
+        times.append(('total', old['total'], new['total']))
+        for phase, old_time, new_time in times:
+            regression = (new_time - old_time > min_time and
+                          new_time > old_time * (1 + threshold / 100.0))
+            comparison.append(
+                (new['spec'], phase, old_time, new_time, regression))
+    return comparison
+
+
+def bench_compare(args):
+    """compare two runs of `spack bench concretize --json`"""
+    runs = []
+    for path in (args.before, args.after):
+        with open(path) as f:
+            runs.append(sjson.load(f))
+
+    comparison = compare_concretize_results(
+        runs[0], runs[1], args.threshold, args.min_time)
+    if not comparison:
+        tty.die('the runs have no spec in common')
+
+    print('{0:<24}{1:<14}{2:>10}{3:>10}{4:>9}'.format(
+        'Spec', 'Phase', 'Before', 'After', 'Change'))
+    for spec, phase, old_time, new_time, regression in comparison:
+        change = (new_time - old_time) / max(old_time, 1e-9) * 100
+        print('{0:<24}{1:<14}{2:>10.3f}{3:>10.3f}{4:>8.1f}%{5}'.format(
+            spec, phase, old_time, new_time, change,
+            '  REGRESSION' if regression else ''))
+
+    regressions = [c for c in comparison if c[-1]]
+    if regressions:
+        tty.die('{0} regressions above {1}%'.format(
+            len(regressions), args.threshold))
+    tty.msg('No regression above {0}%'.format(args.threshold))
+
+
+def bench(parser, args):
+    action = {
+        'buildcache': bench_buildcache,
+        'compare': bench_compare,
+        'concretize': bench_concretize,
+        'database': bench_database,
+        'relocate': bench_relocate,
+        'specs': bench_specs,
+    }
+    action[args.bench_command](args)
@@ -77,6 +77,10 @@ def setup_parser(subparser):
     create.add_argument('--spec-file', default=None,
                         help=('Create buildcache entry for spec from json or ' +
                               'yaml file'))
+    create.add_argument('--compression', default=None,
+                        choices=['gzip', 'zstd'],
+                        help=('compression of the tarballs (default: the ' +
+                              'config:binary_compression setting, or gzip)'))
     create.add_argument('--only', default='package,dependencies',
                         dest='things_to_install',
                         choices=['package', 'dependencies'],
@@ -275,6 +279,10 @@ def setup_parser(subparser):
     update_index.add_argument(
         '-k', '--keys', default=False, action='store_true',
         help='If provided, key index will be updated as well as package index')
+    update_index.add_argument(
+        '--full', default=False, action='store_true',
+        help='Regenerate the package index from all the spec files, instead'
+             ' of adding only the ones pushed since it was last updated')
     update_index.set_defaults(func=buildcache_update_index)
 
 
@@ -380,7 +388,8 @@ def match_downloaded_specs(pkgs, allow_multiple_matches=False, force=False,
 def _createtarball(env, spec_file=None, packages=None, add_spec=True,
                    add_deps=True, output_location=os.getcwd(),
                    signing_key=None, force=False, make_relative=False,
-                   unsigned=False, allow_root=False, rebuild_index=False):
+                   unsigned=False, allow_root=False, rebuild_index=False,
+                   compression=None):
     if spec_file:
         with open(spec_file, 'r') as fd:
             specfile_contents = fd.read()
@@ -462,7 +471,7 @@ def _createtarball(env, spec_file=None, packages=None, add_spec=True,
         try:
             bindist.build_tarball(spec, outdir, force, make_relative,
                                   unsigned, allow_root, signing_key,
-                                  rebuild_index)
+                                  rebuild_index, compression)
         except bindist.NoOverwriteException as e:
             tty.warn(e)
 
@@ -516,7 +525,8 @@ def createtarball(args):
                    output_location=output_location, signing_key=args.key,
                    force=args.force, make_relative=args.rel,
                    unsigned=args.unsigned, allow_root=args.allow_root,
-                   rebuild_index=args.rebuild_index)
+                   rebuild_index=args.rebuild_index,
+                   compression=args.compression)
 
 
 def installtarball(args):
@@ -651,14 +661,15 @@ def check_binaries(args):
 
 def download_buildcache_files(concrete_spec, local_dest, require_cdashid,
                               mirror_url=None):
-    tarfile_name = bindist.tarball_name(concrete_spec, '.spack')
     tarball_dir_name = bindist.tarball_directory_name(concrete_spec)
-    tarball_path_name = os.path.join(tarball_dir_name, tarfile_name)
+    tarball_path_names = [
+        bindist.tarball_path_name(concrete_spec, ext)
+        for ext in bindist.archive_extensions.values()]
     local_tarball_path = os.path.join(local_dest, tarball_dir_name)
 
     files_to_fetch = [
         {
-            'url': [tarball_path_name],
+            'url': tarball_path_names,
             'path': local_tarball_path,
             'required': True,
         }, {
@@ -807,9 +818,13 @@ def buildcache_copy(args):
 
     build_cache_dir = bindist.build_cache_relative_path()
 
-    tarball_rel_path = os.path.join(
-        build_cache_dir, bindist.tarball_path_name(spec, '.spack'))
-    tarball_src_path = os.path.join(args.base_dir, tarball_rel_path)
+    # copy the archive of the spec, whatever the compression of its tarball
+    for ext in bindist.archive_extensions.values():
+        tarball_rel_path = os.path.join(
+            build_cache_dir, bindist.tarball_path_name(spec, ext))
+        tarball_src_path = os.path.join(args.base_dir, tarball_rel_path)
+        if os.path.exists(tarball_src_path):
+            break
     tarball_dest_path = os.path.join(dest_root_path, tarball_rel_path)
 
     specfile_rel_path = os.path.join(
@@ -923,8 +938,9 @@ def buildcache_sync(args):
             '* ' if s in env.roots() else '  ', s.name, s.dag_hash()))
 
         buildcache_rel_paths.extend([
-            os.path.join(
-                build_cache_dir, bindist.tarball_path_name(s, '.spack')),
+            os.path.join(build_cache_dir, bindist.tarball_path_name(s, ext))
+            for ext in bindist.archive_extensions.values()])
+        buildcache_rel_paths.extend([
             os.path.join(
                 build_cache_dir, bindist.tarball_name(s, '.spec.yaml')),
             os.path.join(
@@ -965,12 +981,12 @@ def buildcache_sync(args):
         shutil.rmtree(tmpdir)
 
 
-def update_index(mirror_url, update_keys=False):
+def update_index(mirror_url, update_keys=False, full=False):
     mirror = spack.mirror.MirrorCollection().lookup(mirror_url)
     outdir = url_util.format(mirror.push_url)
 
     bindist.generate_package_index(
-        url_util.join(outdir, bindist.build_cache_relative_path()))
+        url_util.join(outdir, bindist.build_cache_relative_path()), full=full)
 
     if update_keys:
         keys_url = url_util.join(outdir,
@@ -986,7 +1002,7 @@ def buildcache_update_index(args):
     if args.mirror_url:
         outdir = args.mirror_url
 
-    update_index(outdir, update_keys=args.keys)
+    update_index(outdir, update_keys=args.keys, full=args.full)
 
 
 def buildcache(parser, args):
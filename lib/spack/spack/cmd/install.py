@@ -48,6 +48,7 @@ def update_kwargs_from_args(args, kwargs):
         'stop_at': args.until,
         'unsigned': args.unsigned,
         'full_hash_match': args.full_hash_match,
+        'concurrent_packages': args.concurrent_packages,
     })
 
     kwargs.update({
@@ -79,6 +80,9 @@ def setup_parser(subparser):
         '-u', '--until', type=str, dest='until', default=None,
         help="phase to stop after when installing (default None)")
     arguments.add_common_arguments(subparser, ['jobs', 'reuse'])
+    subparser.add_argument(
+        '--concurrent-packages', type=int, default=None, metavar='N',
+        help="build up to N independent packages at the same time")
     subparser.add_argument(
         '--overwrite', action='store_true',
         help="reinstall an existing spec, even if it has dependents")
@@ -326,10 +330,18 @@ def get_tests(specs):
         else:
             return False
 
+    if args.concurrent_packages is not None and args.concurrent_packages < 1:
+        tty.die('--concurrent-packages must be a positive integer')
+
     # Parse cli arguments and construct a dictionary
     # that will be passed to the package installer
     update_kwargs_from_args(args, kwargs)
 
+    # Reports are collected as each package build completes, so packages
+    # have to be built one at a time.
+    if args.log_format:
+        kwargs['concurrent_packages'] = 1
+
     if not args.spec and not args.specfiles:
         # if there are no args but an active environment
         # then install the packages from it.
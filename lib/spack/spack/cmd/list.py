@@ -84,9 +84,9 @@ def match(p, f):
                 if f.match(p):
                     return True
 
-                pkg = spack.repo.get(p)
-                if pkg.__doc__:
-                    return f.match(pkg.__doc__)
+                doc = spack.repo.path.get_pkg_metadata(p).doc
+                if doc:
+                    return f.match(doc)
                 return False
         else:
             def match(p, f):
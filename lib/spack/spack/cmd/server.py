@@ -0,0 +1,136 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+from __future__ import print_function
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import llnl.util.tty as tty
+
+import spack.paths
+import spack.server
+
+description = "run commands in a persistent server process"
+section = "admin"
+level = "long"
+
+
+def setup_parser(subparser):
+    sp = subparser.add_subparsers(metavar='SUBCOMMAND', dest='server_command')
+
+    start = sp.add_parser('start', help='start a server for this Spack')
+    start.add_argument(
+        '--timeout', type=float, default=None, metavar='MINUTES',
+        help='stop the server after it has been idle for this long')
+    start.add_argument(
+        '-f', '--foreground', action='store_true',
+        help='run the server in this process')
+
+    sp.add_parser('stop', help='stop the server')
+    sp.add_parser('status', help='show whether the server runs')
+
+
+def _status(path):
+    """Status of the server listening on a socket, or None."""
+    try:
+        return spack.server.request(path, {'command': 'status'})
+    except (EOFError, ValueError, socket.error):
+        return None
+
+
+def _serve(path, args):
+    server = spack.server.Server(
+        path, timeout=args.timeout * 60 if args.timeout else None)
+
+    def stop(signum, frame):
+        server.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, stop)
+
+    tty.msg('Loading Spack')
+    server.warm()
+    tty.msg('Listening on {0}'.format(path))
+    server.serve()
+
+    if server.outdated:
+        # Start again with the new files, in this process
+        tty.msg('Files changed, restarting')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def server_start(path, args):
+    if _status(path):
+        tty.msg('The Spack server is already running')
+        return
+
+    if args.foreground:
+        _serve(path, args)
+        return
+
+    # The server loads all modules anyway, and restarts as a new process
+    # of bin/spack when files change
+    command = [sys.executable, spack.paths.spack_script,
+               'server', 'start', '--foreground']
+    if args.timeout:
+        command += ['--timeout', str(args.timeout)]
+    env = dict(os.environ, SPACK_LAZY_IMPORTS='0', SPACK_SERVER='0')
+
+    log_path = os.path.splitext(path)[0] + '.log'
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), 0o700)
+    with open(os.devnull) as devnull, open(log_path, 'w') as log:
+        process = subprocess.Popen(
+            command, stdin=devnull, stdout=log, stderr=subprocess.STDOUT,
+            env=env, cwd='/', close_fds=True, start_new_session=True)
+
+    while process.poll() is None:
+        if _status(path):
+            tty.msg('Started the Spack server', 'Log: {0}'.format(log_path))
+            return
+        time.sleep(0.1)
+    tty.die('The Spack server failed to start, see {0}'.format(log_path))
+
+
+def server_stop(path, args):
+    try:
+        spack.server.request(path, {'command': 'stop'})
+    except (EOFError, ValueError, socket.error):
+        tty.msg('The Spack server is not running')
+        return
+    tty.msg('Stopped the Spack server')
+
+
+def server_status(path, args):
+    status = _status(path)
+    if not status:
+        tty.msg('The Spack server is not running')
+        return
+
+    tty.msg('The Spack server is running', *[
+        'PID: {0}'.format(status['pid']),
+        'Uptime: {0:.0f}s'.format(status['uptime']),
+        'Commands: {0}'.format(status['requests']),
+        'Socket: {0}'.format(path),
+    ])
+
+
+def server(parser, args):
+    if not spack.server.supported():
+        tty.die('The Spack server requires Python 3.3 or later')
+
+    path = spack.server.socket_path(spack.paths.prefix)
+    action = {
+        'start': server_start,
+        'stop': server_stop,
+        'status': server_status,
+    }
+    action[args.server_command](path, args)
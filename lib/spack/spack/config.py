@@ -31,15 +31,20 @@
 import collections
 import contextlib
 import copy
+import errno
 import functools
+import hashlib
 import os
+import pickle
 import re
 import sys
+import time
 from contextlib import contextmanager
-from typing import List  # novm
+from typing import Any, Dict, List, Tuple  # novm
 
 import ruamel.yaml as yaml
 from ordereddict_backport import OrderedDict
+from ruamel.yaml.comments import Comment, CommentedBase
 from ruamel.yaml.error import MarkedYAMLError
 from six import iteritems
 
@@ -112,6 +117,21 @@
 #: Base name for the (internal) overrides scope.
 overrides_base_name = 'overrides-'
 
+#: Directory of the cache of parsed and validated configuration files. This
+#: is in the default ``misc_cache``, as the one set in ``config.yaml`` is
+#: only known once configuration files have been read.
+config_cache_path = os.path.join(spack.paths.default_misc_cache_path, 'config')
+
+#: Version of the format of the cache of configuration files
+_config_cache_version = 2
+
+#: Files modified less than this many seconds before they are read are not
+#: cached, as they may be modified again without changing their mtime
+_config_cache_min_age = 2
+
+#: Digests of the schemas that configuration files are validated against
+_schema_digests = {}  # type: Dict[int, Tuple[Any, str]]
+
 
 def first_existing(dictionary, keys):
     """Get the value of the first key in keys that is in the dictionary."""
@@ -982,11 +1002,93 @@ def validate(data, schema, filename=None):
     return test_data
 
 
+def _schema_digest(schema):
+    """Digest of a schema, memoized while the schema is alive."""
+    if id(schema) not in _schema_digests:
+        digest = hashlib.sha1(repr(schema).encode('utf-8')).hexdigest()
+        _schema_digests[id(schema)] = (schema, digest)
+    return _schema_digests[id(schema)][1]
+
+
+def _config_cache_entry(filename, schema):
+    """Path of the cache entry of a configuration file, and the key that
+    the entry must have to be up to date with the file and the schema."""
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    key = (_config_cache_version, str(spack.spack_version), filename,
+           st.st_mtime, st.st_size, st.st_ino, _schema_digest(schema))
+
+    # Pickles of different versions of Python are kept apart
+    name = '{0}:{1}.{2}'.format(filename, *sys.version_info[:2])
+    name = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return os.path.join(config_cache_path, name + '.pickle'), key
+
+
+def _commented_nodes(data):
+    """Mappings and sequences of configuration data that can hold comments,
+    in the order of a depth first traversal."""
+    if isinstance(data, CommentedBase):
+        yield data
+    if isinstance(data, dict):
+        for value in data.values():
+            for node in _commented_nodes(value):
+                yield node
+    elif isinstance(data, list):
+        for value in data:
+            for node in _commented_nodes(value):
+                yield node
+
+
+def _read_config_cache(filename, schema):
+    """Data of a configuration file stored in the cache, along with its
+    marks and comments, or None if it is not there or not up to date."""
+    try:
+        path, key = _config_cache_entry(filename, schema)
+        with open(path, 'rb') as f:
+            cached_key, data, comments = pickle.load(f)
+    except Exception as e:
+        # Any error means that the entry cannot be used
+        if not isinstance(e, (IOError, OSError)) or e.errno != errno.ENOENT:
+            tty.debug('Cannot read cached config for %s: %s' % (filename, e))
+        return None
+    if cached_key != key:
+        return None
+
+    for node, comment in zip(_commented_nodes(data), comments):
+        if comment is not None:
+            setattr(node, Comment.attrib, comment)
+    return data
+
+
+def _write_config_cache(filename, schema, data):
+    """Store the data of a configuration file that was validated against
+    a schema in the cache."""
+    try:
+        if time.time() - os.path.getmtime(filename) < _config_cache_min_age:
+            return
+        path, key = _config_cache_entry(filename, schema)
+        mkdirp(config_cache_path)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        # Comments are kept in a slot of ruamel mappings, which pickle only
+        # saves as of Python 3.11, so they are stored on their own
+        comments = [getattr(node, Comment.attrib, None)
+                    for node in _commented_nodes(data)]
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, data, comments), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except (IOError, OSError, pickle.PicklingError, TypeError) as e:
+        tty.debug('Cannot cache config for %s: %s' % (filename, e))
+
+
 def read_config_file(filename, schema=None):
     """Read a YAML configuration file.
 
     User can provide a schema for validation. If no schema is provided,
-    we will infer the schema from the top-level key."""
+    we will infer the schema from the top-level key.
+
+    Files read with a schema are cached in ``config_cache_path``, so that
+    they are only parsed and validated again once they are modified."""
     # Dev: Inferring schema and allowing it to be provided directly allows us
     # to preserve flexibility in calling convention (don't need to provide
     # schema when it's not necessary) while allowing us to validate against a
@@ -1003,6 +1105,14 @@ def read_config_file(filename, schema=None):
     elif not os.access(filename, os.R_OK):
         raise ConfigFileError("Config file is not readable: %s" % filename)
 
+    # Only files read with a known schema are cached
+    cache = bool(schema)
+    if cache:
+        data = _read_config_cache(filename, schema)
+        if data is not None:
+            tty.debug("Reading cached config file %s" % filename)
+            return data
+
     try:
         tty.debug("Reading config file %s" % filename)
         with open(filename) as f:
@@ -1013,6 +1123,8 @@ def read_config_file(filename, schema=None):
                 key = next(iter(data))
                 schema = all_schemas[key]
             validate(data, schema)
+            if cache:
+                _write_config_cache(filename, schema, data)
         return data
 
     except StopIteration:
@@ -20,8 +20,12 @@
 filesystem.
 """
 
+import bisect
 import contextlib
 import datetime
+import functools
+import itertools
+import json
 import os
 import socket
 import sys
@@ -37,6 +41,12 @@
     _use_uuid = False
     pass
 
+try:
+    import sqlite3
+    _use_sqlite = True
+except ImportError:
+    _use_sqlite = False
+
 import llnl.util.filesystem as fs
 import llnl.util.tty as tty
 
@@ -180,6 +190,10 @@ class InstallRecord(object):
         explicit (bool or None): whether or not this spec was explicitly
             installed, or pulled-in as a dependency of something else
         installation_time (datetime.datetime or None): time of the installation
+
+    Records read from a database file build their spec only when it is first
+    accessed (see ``defer_spec``), while the name, version and hash of the
+    spec are available right away.
     """
 
     def __init__(
@@ -202,20 +216,101 @@ def __init__(
         self.deprecated_for = deprecated_for
         self.in_buildcache = in_buildcache
 
-    def install_type_matches(self, installed):
-        installed = InstallStatuses.canonicalize(installed)
+    @property
+    def spec(self):
+        if self._spec is None and self._load_spec is not None:
+            self._spec = self._load_spec()
+            self._load_spec = None
+            self._spec_dict = None
+        return self._spec
+
+    @spec.setter
+    def spec(self, spec):
+        self._spec = spec
+        self._load_spec = None
+        self._spec_dict = None
+
+    def defer_spec(self, load_spec, spec_dict):
+        """Build the spec of this record only when it is first accessed.
+
+        Args:
+            load_spec (typing.Callable): function returning the concrete spec
+                of this record
+            spec_dict (dict): node dict of the spec, as found in the database
+                file, used to get the name and version of the spec and to
+                write the record back without building the spec
+        """
+        self._spec = None
+        self._load_spec = load_spec
+        self._spec_dict = spec_dict
+
+    def _take_spec(self, other):
+        """Share the spec of another record of the same hash, built or not."""
+        self._spec = other._spec
+        self._load_spec = other._load_spec
+        self._spec_dict = other._spec_dict
+
+    @property
+    def spec_loaded(self):
+        """Whether the spec of this record was built."""
+        return self._load_spec is None
+
+    def _node_dict(self):
+        node = self._spec_dict
+        if 'name' not in node:
+            # old format, keyed by name
+            node = next(iter(node.values()))
+        return node
+
+    @property
+    def name(self):
+        if self.spec_loaded:
+            return self._spec.name
+        node = self._node_dict()
+        return node['name'] if 'name' in node else next(iter(self._spec_dict))
+
+    @property
+    def version(self):
+        if self.spec_loaded:
+            return self._spec.version
+        node = self._node_dict()
+        return Version(node['version']) if 'version' in node else self.spec.version
+
+    @property
+    def external(self):
+        if self.spec_loaded:
+            return self._spec.external
+        return bool(self._node_dict().get('external'))
+
+    def dependency_hashes(self):
+        """Return the hashes of the dependencies of the spec, without
+        building it."""
+        if self.spec_loaded:
+            return [d.dag_hash() for d in self._spec.dependencies()]
+        deps = self._node_dict().get('dependencies', {})
+        return [dhash for _, dhash, _, _ in
+                spack.spec.Spec.read_yaml_dep_specs(deps)]
+
+    @property
+    def install_status(self):
         if self.installed:
-            return InstallStatuses.INSTALLED in installed
+            return InstallStatuses.INSTALLED
         elif self.deprecated_for:
-            return InstallStatuses.DEPRECATED in installed
+            return InstallStatuses.DEPRECATED
         else:
-            return InstallStatuses.MISSING in installed
+            return InstallStatuses.MISSING
+
+    def install_type_matches(self, installed):
+        installed = InstallStatuses.canonicalize(installed)
+        return self.install_status in installed
 
     def to_dict(self, include_fields=default_install_record_fields):
         rec_dict = {}
 
         for field_name in include_fields:
-            if field_name == 'spec':
+            if field_name == 'spec' and not self.spec_loaded:
+                rec_dict.update({'spec': self._spec_dict})
+            elif field_name == 'spec':
                 rec_dict.update({'spec': self.spec.node_dict_with_hashes()})
             elif field_name == 'deprecated_for' and self.deprecated_for:
                 rec_dict.update({'deprecated_for': self.deprecated_for})
@@ -239,6 +334,439 @@ def from_dict(cls, spec, dictionary):
         return InstallRecord(spec, **d)
 
 
+class SQLiteIndex(object):
+    """Install records of a ``Database`` stored in a SQLite file.
+
+    Each install record is a row of the ``installs`` table. The fields of
+    ``InstallRecord`` have their own columns, so that records can be selected
+    without reading any spec, and the node dict of the spec is stored as JSON.
+
+    Every write bumps a generation number, which is stored in the rows it
+    changes and in a tombstone for each row it deletes. A reader that has
+    seen generation ``N`` only needs the rows and tombstones newer than ``N``
+    to catch up with the file. Tombstones are kept for the last
+    ``tombstone_generations`` writes; readers older than that read all the
+    records again.
+
+    This class does no locking: it is meant to be used within the
+    transactions of a ``Database``.
+    """
+
+    #: Columns holding the fields of ``InstallRecord``, in table order
+    record_columns = ('path', 'installed', 'ref_count', 'explicit',
+                      'installation_time', 'deprecated_for', 'in_buildcache')
+
+    #: Number of writes tombstones of deleted records are kept for
+    tombstone_generations = 100
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS installs (
+            hash TEXT PRIMARY KEY,
+            name TEXT,
+            version TEXT,
+            path TEXT,
+            installed INTEGER,
+            ref_count INTEGER,
+            explicit INTEGER,
+            installation_time REAL,
+            deprecated_for TEXT,
+            in_buildcache INTEGER,
+            spec TEXT,
+            generation INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS installs_name ON installs (name);
+        CREATE INDEX IF NOT EXISTS installs_generation
+            ON installs (generation);
+        CREATE TABLE IF NOT EXISTS deleted (
+            hash TEXT PRIMARY KEY,
+            generation INTEGER
+        );
+    """
+
+    def __init__(self, path, timeout=None):
+        """Refer to the SQLite index at ``path``, which is created on the
+        first write.
+
+        Args:
+            path (str): path to the SQLite file
+            timeout (int or None): how long to wait for SQLite's own file lock
+        """
+        self.path = path
+        self.timeout = timeout or _db_lock_timeout
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _connect(self):
+        return contextlib.closing(
+            sqlite3.connect(self.path, timeout=self.timeout))
+
+    def _row_to_dict(self, row):
+        """Convert a row of ``installs`` to a record as found in
+        ``index.json``."""
+        rec = dict(zip(self.record_columns, row[1:-1]))
+        for field in ('installed', 'explicit', 'in_buildcache'):
+            rec[field] = bool(rec[field])
+        if rec['deprecated_for'] is None:
+            del rec['deprecated_for']
+        rec['spec'] = sjson.load(row[-1])
+        return rec
+
+    def read(self, since=None):
+        """Read the records written after generation ``since``.
+
+        Args:
+            since (int or None): last generation seen by the caller, or
+                ``None`` to read all the records
+
+        Return:
+            (tuple): the database version, the current generation, a dict
+            mapping hashes to the new or changed records, the hashes of the
+            deleted records, and whether the records are only the ones
+            changed since ``since`` (``False`` if they are all the records)
+        """
+        columns = ', '.join(('hash',) + self.record_columns + ('spec',))
+        with self._connect() as conn:
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+            version = Version(meta.get('version', str(_db_version)))
+            generation = int(meta.get('generation', 0))
+            oldest = int(meta.get('oldest', 0))
+
+            incremental = since is not None and oldest <= since <= generation
+            if incremental:
+                rows = conn.execute(
+                    'SELECT %s FROM installs WHERE generation > ?' % columns,
+                    (since,))
+                deleted = [h for h, in conn.execute(
+                    'SELECT hash FROM deleted WHERE generation > ?', (since,))]
+            else:
+                rows = conn.execute('SELECT %s FROM installs' % columns)
+                deleted = []
+
+            installs = dict((row[0], self._row_to_dict(row)) for row in rows)
+
+        return version, generation, installs, deleted, incremental
+
+    def generation(self):
+        """Return the generation of the last write, or ``None`` if nothing
+        has been written yet."""
+        if not self.exists():
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else None
+
+    def write(self, installs, deleted=(), replace=False):
+        """Write new or changed records and delete others in a single
+        SQLite transaction.
+
+        Args:
+            installs (dict): mapping from hashes to records, as returned by
+                ``InstallRecord.to_dict``
+            deleted (typing.Iterable): hashes of the records to delete
+            replace (bool): if ``True``, ``installs`` replaces all the
+                records in the file
+
+        Return:
+            (int): the new generation of the file
+        """
+        with self._connect() as conn:
+            conn.executescript(self._schema)
+            with conn:
+                row = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'generation'"
+                ).fetchone()
+                generation = (int(row[0]) if row else 0) + 1
+
+                oldest = None
+                if replace:
+                    conn.execute('DELETE FROM installs')
+                    conn.execute('DELETE FROM deleted')
+                    oldest = generation
+                elif generation % self.tombstone_generations == 0:
+                    oldest = generation - self.tombstone_generations
+                    conn.execute(
+                        'DELETE FROM deleted WHERE generation < ?', (oldest,))
+
+                conn.executemany(
+                    'DELETE FROM installs WHERE hash = ?',
+                    [(h,) for h in deleted])
+                conn.executemany(
+                    'INSERT OR REPLACE INTO deleted VALUES (?, ?)',
+                    [(h, generation) for h in deleted])
+                conn.executemany(
+                    'DELETE FROM deleted WHERE hash = ?',
+                    [(h,) for h in installs])
+                conn.executemany(
+                    'INSERT OR REPLACE INTO installs VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [self._dict_to_row(h, rec, generation)
+                     for h, rec in installs.items()])
+
+                meta = [('version', str(_db_version)),
+                        ('generation', str(generation))]
+                if oldest is not None:
+                    meta.append(('oldest', str(oldest)))
+                conn.executemany(
+                    'INSERT OR REPLACE INTO meta VALUES (?, ?)', meta)
+
+        return generation
+
+    def _dict_to_row(self, hash_key, rec, generation):
+        spec = rec['spec']
+        version = spec.get('version') if 'name' in spec else None
+        return ((hash_key, spec.get('name'), version) +
+                tuple(rec.get(c) for c in self.record_columns) +
+                (json.dumps(spec, separators=(',', ':')), generation))
+
+    def select(self, **conditions):
+        """Select records by the value of their columns, without reading
+        their specs.
+
+        Args:
+            **conditions: required value for some of the ``name``,
+                ``version``, ``hash`` and ``record_columns`` columns
+
+        Return:
+            (list): a dict per matching record, mapping ``hash``, ``name``,
+            ``version`` and the ``record_columns`` to their values
+        """
+        columns = ('hash', 'name', 'version') + self.record_columns
+        unknown = set(conditions) - set(columns)
+        if unknown:
+            raise ValueError(
+                'cannot select records by %s' % ', '.join(sorted(unknown)))
+
+        query = 'SELECT %s FROM installs' % ', '.join(columns)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(
+                '%s = ?' % c for c in sorted(conditions))
+        values = tuple(conditions[c] for c in sorted(conditions))
+
+        if not self.exists():
+            return []
+        with self._connect() as conn:
+            return [dict(zip(columns, row))
+                    for row in conn.execute(query, values)]
+
+
+class _RecordDict(dict):
+    """Mapping from hashes to install records that counts the changes to
+    its keys, so that the indexes built on it know when they are stale."""
+
+    def __init__(self, *args, **kwargs):
+        super(_RecordDict, self).__init__(*args, **kwargs)
+        self.changes = 0
+
+    def __setitem__(self, key, value):
+        self.changes += 1
+        super(_RecordDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.changes += 1
+        super(_RecordDict, self).__delitem__(key)
+
+    def pop(self, *args):
+        self.changes += 1
+        return super(_RecordDict, self).pop(*args)
+
+    def popitem(self):
+        self.changes += 1
+        return super(_RecordDict, self).popitem()
+
+    def setdefault(self, *args):
+        self.changes += 1
+        return super(_RecordDict, self).setdefault(*args)
+
+    def update(self, *args, **kwargs):
+        self.changes += 1
+        super(_RecordDict, self).update(*args, **kwargs)
+
+    def clear(self):
+        self.changes += 1
+        super(_RecordDict, self).clear()
+
+
+def _timestamp(date, default):
+    """Convert a naive local ``datetime`` to a timestamp."""
+    try:
+        return time.mktime(date.timetuple()) + date.microsecond / 1e6
+    except (OverflowError, ValueError):
+        return default
+
+
+class QueryIndex(object):
+    """Secondary indexes on the install records of a ``Database``.
+
+    The records are indexed by package name, hash (sorted, to look up hash
+    prefixes), install status, explicit flag and installation time, and by
+    the hashes of their dependencies. Indexes only rely on the fields of
+    the records and on the node dicts of their specs, so they are built
+    without building any spec, and each of them is only built the first
+    time a query needs it.
+
+    Indexes are only used to select the records a query needs to look at,
+    which are then checked like any other record.
+    """
+
+    #: Margin in seconds when converting query dates to timestamps, to
+    #: account for changes of UTC offset
+    date_margin = 2 * 24 * 3600
+
+    def __init__(self, data):
+        """Index the records in ``data``.
+
+        Args:
+            data (dict): mapping from hashes to ``InstallRecord``
+        """
+        self.data = data
+        self.changes = getattr(data, 'changes', None)
+
+        self._names = None
+        self._hashes = None
+        self._statuses = None
+        self._explicit = None
+        self._times = None
+        self._dependents = None
+        self._positions = None
+
+    def is_current(self, data):
+        """Whether this index is up to date with ``data``."""
+        return self.data is data and self.changes == getattr(
+            data, 'changes', None)
+
+    @property
+    def names(self):
+        """Mapping from package names to the hashes of their records."""
+        if self._names is None:
+            self._names = {}
+            for key, rec in self.data.items():
+                self._names.setdefault(rec.name, set()).add(key)
+        return self._names
+
+    @property
+    def hashes(self):
+        """Sorted list of the hashes of the records."""
+        if self._hashes is None:
+            self._hashes = sorted(self.data)
+        return self._hashes
+
+    @property
+    def statuses(self):
+        """Mapping from ``InstallStatus`` to the hashes of the records."""
+        if self._statuses is None:
+            self._statuses = dict((status, set()) for status in (
+                InstallStatuses.INSTALLED,
+                InstallStatuses.DEPRECATED,
+                InstallStatuses.MISSING))
+            for key, rec in self.data.items():
+                self._statuses[rec.install_status].add(key)
+        return self._statuses
+
+    @property
+    def explicit(self):
+        """Hashes of the explicitly installed records."""
+        if self._explicit is None:
+            self._explicit = set(
+                key for key, rec in self.data.items() if rec.explicit)
+        return self._explicit
+
+    @property
+    def dependents(self):
+        """Mapping from hashes to the hashes of their direct dependents."""
+        if self._dependents is None:
+            self._dependents = {}
+            for key, rec in self.data.items():
+                for dep_key in rec.dependency_hashes():
+                    self._dependents.setdefault(dep_key, set()).add(key)
+        return self._dependents
+
+    @property
+    def positions(self):
+        """Mapping from hashes to the position of their records in the
+        database."""
+        if self._positions is None:
+            self._positions = dict(
+                (key, i) for i, key in enumerate(self.data))
+        return self._positions
+
+    def in_order(self, keys):
+        """Return the hashes in ``keys`` that are in the database, in the
+        order of their records."""
+        positions = self.positions
+        return sorted((key for key in keys if key in positions),
+                      key=positions.__getitem__)
+
+    def with_hash_prefix(self, prefix):
+        """Return the hashes starting with ``prefix``."""
+        hashes = self.hashes
+        start = bisect.bisect_left(hashes, prefix)
+        end = start
+        while end < len(hashes) and hashes[end].startswith(prefix):
+            end += 1
+        return hashes[start:end]
+
+    def installed_between(self, start_date=None, end_date=None):
+        """Return the hashes of the records installed between two dates,
+        or possibly slightly outside of them."""
+        if self._times is None:
+            times = sorted((rec.installation_time, key)
+                           for key, rec in self.data.items())
+            self._times = ([t for t, _ in times], [key for _, key in times])
+        times, keys = self._times
+
+        start, end = 0, len(times)
+        if start_date:
+            start = bisect.bisect_left(times, _timestamp(
+                start_date, float('-inf')) - self.date_margin)
+        if end_date:
+            end = bisect.bisect_right(times, _timestamp(
+                end_date, float('inf')) + self.date_margin)
+        return keys[start:end]
+
+    def dependents_closure(self, keys):
+        """Return the hashes of all the direct and indirect dependents of
+        the records with the hashes in ``keys``."""
+        result, stack = set(), list(keys)
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in result:
+                    result.add(dependent)
+                    stack.append(dependent)
+        return result
+
+    def candidates(self, name=None, installed=any, explicit=any,
+                   start_date=None, end_date=None, hashes=None):
+        """Return a selection of hashes that contains all the records
+        matching a query, from the most selective index the query can use.
+
+        Return:
+            (list or None): hashes to check in the order of their records,
+            which may include hashes of records that do not match the query,
+            or ``None`` if all the records need to be checked
+        """
+        if hashes is not None and hasattr(hashes, '__len__'):
+            return self.in_order(hashes)
+        elif name is not None:
+            return self.in_order(self.names.get(name, ()))
+        elif start_date or end_date:
+            return self.in_order(self.installed_between(start_date, end_date))
+        elif explicit is True:
+            return self.in_order(self.explicit)
+
+        # Most records are installed, only select the others
+        statuses = InstallStatuses.canonicalize(installed)
+        if InstallStatuses.INSTALLED not in statuses:
+            return self.in_order(
+                itertools.chain(*(self.statuses[s] for s in statuses)))
+        return None
+
+
 class ForbiddenLockError(SpackError):
     """Raised when an upstream DB attempts to acquire a lock"""
 
@@ -308,7 +836,7 @@ class Database(object):
 
     def __init__(self, root, db_dir=None, upstream_dbs=None,
                  is_upstream=False, enable_transaction_locking=True,
-                 record_fields=default_install_record_fields):
+                 record_fields=default_install_record_fields, backend=None):
         """Create a Database for Spack installations under ``root``.
 
         A Database is a cache of Specs data from ``$prefix/spec.yaml``
@@ -332,6 +860,14 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         transaction locking is required.  To use this feature, provide
         ``enable_transaction_locking=False``, and specify a list of needed
         fields in ``record_fields``.
+
+        The ``backend`` (``config:db_backend`` by default) selects how the
+        install records are stored: ``json`` rewrites ``index.json`` at the
+        end of each write transaction, while ``sqlite`` only writes the
+        records that changed to ``index.sqlite``, and only reads back the
+        records written by other processes.  Records are always read from
+        whichever of the two files was written last, so that switching
+        backends imports the records of the other one.
         """
         self.root = root
 
@@ -341,6 +877,7 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         # Set up layout of database files within the db dir
         self._index_path = os.path.join(self._db_dir, 'index.json')
         self._verifier_path = os.path.join(self._db_dir, 'index_verifier')
+        self._sqlite_path = os.path.join(self._db_dir, 'index.sqlite')
         self._lock_path = os.path.join(self._db_dir, 'lock')
 
         # This is for other classes to use to lock prefix directories.
@@ -385,6 +922,10 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
                                 desc='database')
         self._data = {}
 
+        # Secondary indexes used by queries, built when first needed
+        self._query_index = None
+        self._use_query_index = True
+
         # For every installed spec we keep track of its install prefix, so that
         # we can answer the simple query whether a given path is already taken
         # before installing a different spec.
@@ -409,6 +950,44 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
 
         self._record_fields = record_fields
 
+        backend = backend or spack.config.get('config:db_backend', 'json')
+        if backend == 'sqlite' and not _use_sqlite:
+            tty.warn('SQLite is not available, using the JSON database backend')
+            backend = 'json'
+        self.backend = backend
+
+        # Records written to or read from the SQLite file, and the state of
+        # each of them, used to write only the records that changed.
+        self._sqlite = SQLiteIndex(self._sqlite_path, self.db_lock_timeout)
+        self._sqlite_generation = None
+        self._sqlite_states = None
+
+    @property
+    def _data(self):
+        """Mapping from hashes to the install records of the database."""
+        return self._records
+
+    @_data.setter
+    def _data(self, data):
+        if not isinstance(data, _RecordDict):
+            data = _RecordDict(data)
+        self._records = data
+
+    def _get_query_index(self):
+        """Return the secondary indexes of the records, up to date.
+
+        Does no locking.
+        """
+        if self._query_index is None or not self._query_index.is_current(
+                self._data):
+            self._query_index = QueryIndex(self._data)
+        return self._query_index
+
+    def _invalidate_query_index(self):
+        """Rebuild the secondary indexes on the next query, after the
+        fields of some records changed."""
+        self._query_index = None
+
     def write_transaction(self):
         """Get a write lock context manager for use in a `with` block."""
         return self._write_transaction_impl(
@@ -689,10 +1268,9 @@ def query_by_spec_hash(self, hash_key, data=None):
                 return True, db._data[hash_key]
         return False, None
 
-    def _assign_dependencies(self, hash_key, installs, data):
+    def _assign_dependencies(self, spec, hash_key, installs, data):
         # Add dependencies from other records in the install DB to
         # form a full spec.
-        spec = data[hash_key].spec
         spec_node_dict = installs[hash_key]['spec']
         if 'name' not in spec_node_dict:
             # old format
@@ -753,8 +1331,18 @@ def check(cond, msg):
 
         installs = db['installs']
 
+        if self._needs_reindex(Version(db['version'])):
+            self.reindex(spack.store.layout)
+            installs = dict(
+                (k, v.to_dict(include_fields=self._record_fields))
+                for k, v in self._data.items()
+            )
+
+        self._load_installs(installs, filename)
+
+    def _needs_reindex(self, version):
+        """Whether records written with DB ``version`` need a reindex."""
         # TODO: better version checking semantics.
-        version = Version(db['version'])
         if version > _db_version:
             raise InvalidDatabaseVersionError(_db_version, version)
         elif version < _db_version:
@@ -766,66 +1354,185 @@ def check(cond, msg):
                     "Spack database version changed from %s to %s. Upgrading."
                     % (version, _db_version)
                 )
+                return True
+        return False
 
-                self.reindex(spack.store.layout)
-                installs = dict(
-                    (k, v.to_dict(include_fields=self._record_fields))
-                    for k, v in self._data.items()
-                )
+    def _invalid_record(self, hash_key, error, filename):
+        msg = ("Invalid record in Spack database: "
+               "hash: %s, cause: %s: %s")
+        msg %= (hash_key, type(error).__name__, str(error))
+        raise CorruptDatabaseError(msg, filename)
+
+    def _load_installs(self, installs, filename):
+        """Replace the data of the database with the records in
+        ``installs``, as read from ``filename``.
+
+        Specs are not built here: each record builds its spec the first
+        time it is accessed, so that reading the database only costs as
+        much as the specs that are actually used (see ``_load_spec``).
 
-        def invalid_record(hash_key, error):
-            msg = ("Invalid record in Spack database: "
-                   "hash: %s, cause: %s: %s")
-            msg %= (hash_key, type(error).__name__, str(error))
-            raise CorruptDatabaseError(msg, self._index_path)
-
-        # Build up the database in three passes:
-        #
-        #   1. Read in all specs without dependencies.
-        #   2. Hook dependencies up among specs.
-        #   3. Mark all specs concrete.
-        #
-        # The database is built up so that ALL specs in it share nodes
-        # (i.e., its specs are a true Merkle DAG, unlike most specs.)
-
-        # Pass 1: Iterate through database and build specs w/o dependencies
-        data = {}
-        installed_prefixes = set()
+        Does not do any locking.
+        """
+        data = _RecordDict()
         for hash_key, rec in installs.items():
             try:
-                # This constructs a spec DAG from the list of all installs
-                spec = self._read_spec_from_dict(hash_key, installs)
+                data[hash_key] = self._deferred_record(
+                    hash_key, rec, installs, data, filename)
+            except Exception as e:
+                self._invalid_record(hash_key, e, filename)
 
-                # Insert the brand new spec in the database.  Each
-                # spec has its own copies of its dependency specs.
-                # TODO: would a more immmutable spec implementation simplify
-                #       this?
-                data[hash_key] = InstallRecord.from_dict(spec, rec)
+        self._data = data
+        self._installed_prefixes = set(
+            rec.path for rec in data.values()
+            if rec.installed and not rec.external)
+
+    def _deferred_record(self, hash_key, rec, installs, data, filename):
+        """Return a record for ``rec`` building its spec on first access."""
+        record = InstallRecord.from_dict(None, rec)
+        record.defer_spec(
+            functools.partial(
+                self._load_spec, hash_key, installs, data, filename),
+            rec['spec'])
+        return record
 
-                if not spec.external and 'installed' in rec and rec['installed']:
-                    installed_prefixes.add(rec['path'])
-            except Exception as e:
-                invalid_record(hash_key, e)
+    def _load_spec(self, hash_key, installs, data, filename):
+        """Build the spec of the record ``hash_key`` in ``installs``.
+
+        The database is built up so that ALL specs in it share nodes
+        (i.e., its specs are a true Merkle DAG, unlike most specs): the
+        dependencies of the spec are the specs of their own records in
+        ``data`` or in the upstream databases, which are built first.
+
+        Does not do any locking.
+        """
+        try:
+            spec = self._read_spec_from_dict(hash_key, installs)
+        except Exception as e:
+            self._invalid_record(hash_key, e, filename)
+
+        try:
+            self._assign_dependencies(spec, hash_key, installs, data)
+        except (MissingDependenciesError, CorruptDatabaseError):
+            # Errors building the specs of dependencies
+            raise
+        except Exception as e:
+            self._invalid_record(hash_key, e, filename)
+
+        # Mark the spec concrete only *after* all dependencies are
+        # connected, because if we do it *while* we're constructing specs,
+        # it causes hashes to be cached prematurely.
+        spec._mark_root_concrete()
+        return spec
+
+    def _update_installs(self, installs, deleted, filename):
+        """Bring the data of the database up to date with the records in
+        ``installs`` that were added or changed, and the hashes of the
+        records that were ``deleted``, as read from ``filename``.
+
+        Existing specs are kept, built or not, since the spec of a hash
+        never changes.
+
+        Does not do any locking.
+        """
+        data = self._data
+        for hash_key in deleted:
+            rec = data.pop(hash_key, None)
+            if rec is None or not rec.spec_loaded:
+                continue
+            for dep in rec.spec.dependencies():
+                edge = dep._dependents.get(rec.spec.name)
+                if edge and edge.parent is rec.spec:
+                    del dep._dependents[rec.spec.name]
 
-        # Pass 2: Assign dependencies once all specs are created.
-        for hash_key in data:
+        for hash_key, rec in installs.items():
             try:
-                self._assign_dependencies(hash_key, installs, data)
-            except MissingDependenciesError:
-                raise
+                record = self._deferred_record(
+                    hash_key, rec, installs, data, filename)
+                if hash_key in data:
+                    record._take_spec(data[hash_key])
+                data[hash_key] = record
             except Exception as e:
-                invalid_record(hash_key, e)
+                self._invalid_record(hash_key, e, filename)
 
-        # Pass 3: Mark all specs concrete.  Specs representing real
-        # installations must be explicitly marked.
-        # We do this *after* all dependencies are connected because if we
-        # do it *while* we're constructing specs,it causes hashes to be
-        # cached prematurely.
-        for hash_key, rec in data.items():
-            rec.spec._mark_root_concrete()
+        self._installed_prefixes = set(
+            rec.path for rec in data.values()
+            if rec.installed and not rec.external)
 
-        self._data = data
-        self._installed_prefixes = installed_prefixes
+    def _record_states(self):
+        """Return the fields of each record, to find out which records
+        changed since they were last read or written."""
+        return dict(
+            (k, tuple(getattr(rec, f) for f in SQLiteIndex.record_columns))
+            for k, rec in self._data.items())
+
+    def _read_from_sqlite(self):
+        """Read the records written to the SQLite file since it was last
+        read or written by this process.
+
+        Does not do any locking.
+        """
+        try:
+            version, generation, installs, deleted, incremental = \
+                self._sqlite.read(since=self._sqlite_generation)
+        except sqlite3.Error as e:
+            raise CorruptDatabaseError(
+                "error reading database:", "%s: %s" % (self._sqlite_path, e))
+
+        if self._needs_reindex(version):
+            self.reindex(spack.store.layout)
+            return
+
+        if incremental:
+            self._update_installs(installs, deleted, self._sqlite_path)
+        else:
+            self._load_installs(installs, self._sqlite_path)
+
+        self._sqlite_generation = generation
+        self._sqlite_states = self._record_states()
+
+    def _write_to_sqlite(self):
+        """Write the records that changed since the SQLite file was last
+        read or written by this process.
+
+        Does not do any locking.
+        """
+        states = self._record_states()
+        if self._sqlite_states is None:
+            # The file was not in sync with this process, rewrite it all
+            changed, deleted = list(states), []
+        else:
+            old_states = self._sqlite_states
+            changed = [k for k, v in states.items() if old_states.get(k) != v]
+            deleted = [k for k in old_states if k not in states]
+
+        installs = dict(
+            (k, self._data[k].to_dict(include_fields=self._record_fields))
+            for k in changed)
+        self._sqlite_generation = self._sqlite.write(
+            installs, deleted, replace=self._sqlite_states is None)
+        self._sqlite_states = states
+
+    def _newest_index(self):
+        """Return the path of the newest of the JSON and SQLite files,
+        preferring the file of the current backend, or ``None`` if there
+        is neither."""
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime
+            except OSError:
+                return None
+
+        json_mtime = mtime(self._index_path)
+        sqlite_mtime = mtime(self._sqlite_path) if _use_sqlite else None
+        if json_mtime is None and sqlite_mtime is None:
+            return None
+        elif sqlite_mtime is None:
+            return self._index_path
+        elif json_mtime is None or sqlite_mtime > json_mtime:
+            return self._sqlite_path
+        elif json_mtime > sqlite_mtime or self.backend == 'json':
+            return self._index_path
+        return self._sqlite_path
 
     def reindex(self, directory_layout):
         """Build database index from scratch based on a directory layout.
@@ -840,8 +1547,7 @@ def reindex(self, directory_layout):
         # ignore errors if we need to rebuild a corrupt database.
         def _read_suppress_error():
             try:
-                if os.path.isfile(self._index_path):
-                    self._read_from_file(self._index_path)
+                self._read(force=True)
             except CorruptDatabaseError as e:
                 self._error = e
                 self._data = {}
@@ -996,6 +1702,10 @@ def _write(self, type, value, traceback):
         if type is not None:
             return
 
+        if self.backend == 'sqlite':
+            self._write_to_sqlite()
+            return
+
         temp_file = self._index_path + (
             '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
 
@@ -1016,9 +1726,26 @@ def _write(self, type, value, traceback):
                 os.remove(temp_file)
             raise
 
-    def _read(self):
-        """Re-read Database from the data in the set location. This does no locking."""
-        if os.path.isfile(self._index_path):
+    def _read(self, force=False):
+        """Re-read Database from the data in the set location. This does no locking.
+
+        Args:
+            force (bool): read all the records even if they did not change
+                since they were last read
+        """
+        index_path = self._newest_index()
+        if index_path == self._sqlite_path:
+            # Re-read index.json next time it is the newest file
+            self.last_seen_verifier = ''
+            if force:
+                self._sqlite_generation = None
+            if self._sqlite.generation() != self._sqlite_generation:
+                self._read_from_sqlite()
+            return
+        elif index_path:
+            # The SQLite file is not in sync with the records anymore
+            self._sqlite_generation = None
+            self._sqlite_states = None
             current_verifier = ''
             if _use_uuid:
                 try:
@@ -1027,7 +1754,7 @@ def _read(self):
                 except BaseException:
                     pass
             if ((current_verifier != self.last_seen_verifier) or
-                    (current_verifier == '')):
+                    (current_verifier == '') or force):
                 self.last_seen_verifier = current_verifier
                 # Read from file if a database exists
                 self._read_from_file(self._index_path)
@@ -1141,6 +1868,7 @@ def _add(
             self._data[key].installation_time = _now()
 
         self._data[key].explicit = explicit
+        self._invalidate_query_index()
 
     @_autospec
     def add(self, spec, directory_layout, explicit=False):
@@ -1209,6 +1937,7 @@ def _remove(self, spec):
 
         if rec.ref_count > 0:
             rec.installed = False
+            self._invalidate_query_index()
             return rec.spec
 
         del self._data[key]
@@ -1279,6 +2008,7 @@ def _deprecate(self, spec, deprecator):
         spec_rec.deprecated_for = deprecator_key
         spec_rec.installed = False
         self._data[spec_key] = spec_rec
+        self._invalidate_query_index()
 
     @_autospec
     def mark(self, spec, key, value):
@@ -1289,6 +2019,7 @@ def mark(self, spec, key, value):
     def _mark(self, spec, key, value):
         record = self._data[self._get_matching_spec_key(spec)]
         setattr(record, key, value)
+        self._invalidate_query_index()
 
     @_autospec
     def deprecate(self, spec, deprecator):
@@ -1303,8 +2034,12 @@ def installed_relatives(self, spec, direction='children', transitive=True,
         if direction not in ('parents', 'children'):
             raise ValueError("Invalid direction: %s" % direction)
 
+        specs = self.query(spec)
+        if direction == 'parents':
+            self._build_dependents(specs)
+
         relatives = set()
-        for spec in self.query(spec):
+        for spec in specs:
             if transitive:
                 to_add = spec.traverse(
                     direction=direction, root=False, deptype=deptype)
@@ -1332,6 +2067,19 @@ def installed_relatives(self, spec, direction='children', transitive=True,
                 relatives.add(relative)
         return relatives
 
+    def _build_dependents(self, specs):
+        """Build the specs of all the local dependents of ``specs``, which
+        are only connected to the dependents that were built."""
+        with self.read_transaction():
+            if self._use_query_index:
+                index = self._get_query_index()
+                keys = index.dependents_closure(s.dag_hash() for s in specs)
+            else:
+                keys = list(self._data)
+
+            for key in keys:
+                self._data[key].spec
+
     @_autospec
     def installed_extensions_for(self, extendee_spec):
         """
@@ -1370,9 +2118,12 @@ def _get_by_hash_local(self, dag_hash, default=None, installed=any):
 
         # check if hash is a prefix of some installed (or previously
         # installed) spec.
-        matches = [record.spec for h, record in self._data.items()
-                   if h.startswith(dag_hash) and
-                   record.install_type_matches(installed)]
+        if self._use_query_index:
+            keys = self._get_query_index().with_hash_prefix(dag_hash)
+        else:
+            keys = [h for h in self._data if h.startswith(dag_hash)]
+        matches = [self._data[h].spec for h in keys
+                   if self._data[h].install_type_matches(installed)]
         if matches:
             return matches
 
@@ -1459,6 +2210,12 @@ def _query(
         # TODO: like installed and known that can be queried?  Or are
         # TODO: these really special cases that only belong here?
 
+        # Strings are kept to check specs against, so that the results are
+        # memoized by Spec.satisfies()
+        query = query_spec
+        if isinstance(query_spec, six.string_types):
+            query_spec = spack.spec.interned_spec(query_spec)
+
         # Just look up concrete specs with hashes; no fancy search.
         if isinstance(query_spec, spack.spec.Spec) and query_spec.concrete:
             # TODO: handling of hashes restriction is not particularly elegant.
@@ -1469,14 +2226,39 @@ def _query(
             else:
                 return []
 
-        # Abstract specs require more work -- currently we test
-        # against everything.
+        # Abstract specs require more work: we test them against the
+        # records selected by the secondary indexes.
         results = []
+
+        # Specs only satisfy a named query spec if they have its name, or
+        # if they provide it: compare names first, when no package provides
+        # the name, to avoid building other specs.
+        name = None
+        if (isinstance(query_spec, spack.spec.Spec) and query_spec.name and
+                not spack.repo.path.is_virtual(query_spec.name)):
+            name = query_spec.name
+
+        keys = None
+        if self._use_query_index:
+            keys = self._get_query_index().candidates(
+                name=name, installed=installed, explicit=explicit,
+                start_date=start_date, end_date=end_date, hashes=hashes)
+        if keys is None:
+            keys = list(self._data)
+
+        check_dates = start_date or end_date
         start_date = start_date or datetime.datetime.min
         end_date = end_date or datetime.datetime.max
 
-        for key, rec in self._data.items():
-            if hashes is not None and rec.spec.dag_hash() not in hashes:
+        for key in keys:
+            rec = self._data.get(key)
+            if rec is None:
+                continue
+
+            if name is not None and rec.name != name:
+                continue
+
+            if hashes is not None and key not in hashes:
                 continue
 
             if not rec.install_type_matches(installed):
@@ -1489,10 +2271,10 @@ def _query(
                 continue
 
             if known is not any and spack.repo.path.exists(
-                    rec.spec.name) != known:
+                    rec.name) != known:
                 continue
 
-            if start_date or end_date:
+            if check_dates:
                 inst_date = datetime.datetime.fromtimestamp(
                     rec.installation_time
                 )
@@ -1500,7 +2282,7 @@ def _query(
                     continue
 
             if (query_spec is any or
-                rec.spec.satisfies(query_spec, strict=True)):
+                rec.spec.satisfies(query, strict=True)):
                 results.append(rec.spec)
 
         return results
@@ -1600,6 +2382,7 @@ def update_explicit(self, spec, explicit):
                 status = 'explicit' if explicit else 'implicit'
                 tty.debug(message.format(status, s=spec))
                 rec.explicit = explicit
+                self._invalidate_query_index()
 
 
 class UpstreamDatabaseLockingError(SpackError):
@@ -1167,25 +1167,38 @@ def _concretize_separately(self, tests=False, reuse=False):
         if len(arguments) == 0:
             return []
 
-        # Solve the environment in parallel on Linux
         start = time.time()
+        concretized_root_specs = [None] * len(arguments)
+
+        # Solve in a single batch, sharing the setup and grounding of the
+        # solves, the specs which do not need their own setup
+        if spack.config.get('config:concretizer') == 'clingo' and len(arguments) > 1:
+            concretized_root_specs = _concretize_in_batch(arguments, tests, reuse)
+
+        # Solve the other ones in parallel on Linux
+        remaining = [i for i, concrete in enumerate(concretized_root_specs)
+                     if concrete is None]
         max_processes = min(
-            len(arguments),  # Number of specs
+            len(remaining),  # Number of specs
             16  # Cap on 16 cores
         )
 
-        # TODO: revisit this print as soon as darwin is parallel too
-        msg = 'Starting concretization'
-        if sys.platform != 'darwin':
-            pool_size = spack.util.parallel.num_processes(max_processes=max_processes)
-            if pool_size > 1:
-                msg = msg + ' pool with {0} processes'.format(pool_size)
-        tty.msg(msg)
-
-        concretized_root_specs = spack.util.parallel.parallel_map(
-            _concretize_task, arguments, max_processes=max_processes,
-            debug=tty.is_debug()
-        )
+        if remaining:
+            # TODO: revisit this print as soon as darwin is parallel too
+            msg = 'Starting concretization'
+            if sys.platform != 'darwin':
+                pool_size = spack.util.parallel.num_processes(
+                    max_processes=max_processes)
+                if pool_size > 1:
+                    msg = msg + ' pool with {0} processes'.format(pool_size)
+            tty.msg(msg)
+
+            concretized = spack.util.parallel.parallel_map(
+                _concretize_task, [arguments[i] for i in remaining],
+                max_processes=max_processes, debug=tty.is_debug()
+            )
+            for i, concrete in zip(remaining, concretized):
+                concretized_root_specs[i] = concrete
 
         finish = time.time()
         tty.msg('Environment concretized in %.2f seconds.' % (finish - start))
@@ -2036,6 +2049,46 @@ def _concretize_from_constraints(spec_constraints, tests=False, reuse=False):
             invalid_constraints.extend(inv_variant_constraints)
 
 
+def _concretize_in_batch(arguments, tests=False, reuse=False):
+    """Concretize together, with the solver, the specs that can be
+    concretized in a batch.
+
+    Arguments:
+        arguments (list): arguments of ``_concretize_task`` for each spec
+
+    Return:
+        (list): the concrete spec for each of the arguments, or ``None`` if
+        it must be concretized on its own
+    """
+    import spack.solver.asp
+
+    indices, specs = [], []
+    for i, (spec_constraints, _, _) in enumerate(arguments):
+        named = [s for s in spec_constraints if s.name]
+        if len(named) != 1:
+            continue
+        spec = named[0].copy()
+        try:
+            for c in spec_constraints:
+                if c is not named[0]:
+                    spec.constrain(c)
+        except spack.error.SpackError:
+            continue
+        indices.append(i)
+        specs.append(spec)
+
+    concretized = [None] * len(arguments)
+    if len(specs) < 2:
+        return concretized
+
+    with tty.SuppressOutput(msg_enabled=False):
+        results = spack.solver.asp.solve_separately(specs, tests, reuse)
+    for i, result in zip(indices, results):
+        if result is not None:
+            concretized[i] = result.specs[0]
+    return concretized
+
+
 def _concretize_task(packed_arguments):
     spec_constraints, tests, reuse = packed_arguments
     with tty.SuppressOutput(msg_enabled=False):
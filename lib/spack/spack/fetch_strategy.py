@@ -445,10 +445,12 @@ def _fetch_curl(self, url):
             # Timeout if can't establish a connection after n sec.
             curl_args.extend(['--connect-timeout', str(connect_timeout)])
 
-        # Run curl but grab the mime type from the http headers
+        # Run curl but grab the mime type from the http headers. Run it in
+        # the stage rather than changing the directory of Spack, since
+        # binaries are downloaded from several threads.
         curl = self.curl
-        with working_dir(self.stage.path):
-            headers = curl(*curl_args, output=str, fail_on_error=False)
+        headers = curl(*curl_args, output=str, fail_on_error=False,
+                       cwd=self.stage.path)
 
         if curl.returncode != 0:
             # clean up archive on failure.
@@ -34,6 +34,7 @@
 import os
 import shutil
 import sys
+import threading
 import time
 from collections import defaultdict
 
@@ -47,14 +48,17 @@
 
 import spack.binary_distribution as binary_distribution
 import spack.compilers
+import spack.config
 import spack.error
 import spack.hooks
+import spack.mirror
 import spack.monitor
 import spack.package
 import spack.package_prefs as prefs
 import spack.repo
 import spack.store
 import spack.util.executable
+import spack.util.jobserver
 from spack.util.environment import EnvironmentModifications, dump_environment
 from spack.util.executable import which
 from spack.util.timer import Timer
@@ -84,6 +88,12 @@
 #: queue invariants).
 STATUS_REMOVED = 'removed'
 
+#: Error message raised when terminating after the first install failure
+_fail_fast_err = 'Terminating after first install failure'
+
+#: Seconds to wait between checks of running background builds
+_poll_interval = 0.1
+
 
 class InstallAction(object):
     #: Don't perform an install
@@ -259,7 +269,7 @@ def _hms(seconds):
 
 
 def _install_from_cache(pkg, cache_only, explicit, unsigned=False,
-                        full_hash_match=False):
+                        full_hash_match=False, prefetched=None):
     """
     Extract the package from binary cache
 
@@ -270,13 +280,16 @@ def _install_from_cache(pkg, cache_only, explicit, unsigned=False,
             requested by the user, otherwise, ``False``
         unsigned (bool): ``True`` if binary package signatures to be checked,
             otherwise, ``False``
+        prefetched (tuple): the mirrors and the tarball of the package, if
+            they were prefetched by a ``TarballPrefetcher``
 
     Return:
         bool: ``True`` if the package was extract from binary cache,
             ``False`` otherwise
     """
     installed_from_cache = _try_install_from_binary_cache(
-        pkg, explicit, unsigned=unsigned, full_hash_match=full_hash_match)
+        pkg, explicit, unsigned=unsigned, full_hash_match=full_hash_match,
+        prefetched=prefetched)
     pkg_id = package_id(pkg)
     if not installed_from_cache:
         pre = 'No binary for {0} found'.format(pkg_id)
@@ -349,7 +362,7 @@ def _process_external_package(pkg, explicit):
 
 
 def _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned,
-                                  preferred_mirrors=None):
+                                  preferred_mirrors=None, tarball=None):
     """
     Process the binary cache tarball.
 
@@ -361,13 +374,15 @@ def _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned,
             otherwise, ``False``
         preferred_mirrors (list): Optional list of urls to prefer when
             attempting to download the tarball
+        tarball (str): the tarball, if it was already downloaded
 
     Return:
         bool: ``True`` if the package was extracted from binary cache,
             else ``False``
     """
-    tarball = binary_distribution.download_tarball(
-        binary_spec, preferred_mirrors=preferred_mirrors)
+    if tarball is None:
+        tarball = binary_distribution.download_tarball(
+            binary_spec, preferred_mirrors=preferred_mirrors)
     # see #10063 : install from source if tarball doesn't exist
     if tarball is None:
         tty.msg('{0} exists in binary cache but with different hash'
@@ -389,7 +404,7 @@ def _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned,
 
 
 def _try_install_from_binary_cache(pkg, explicit, unsigned=False,
-                                   full_hash_match=False):
+                                   full_hash_match=False, prefetched=None):
     """
     Try to extract the package from binary cache.
 
@@ -398,11 +413,17 @@ def _try_install_from_binary_cache(pkg, explicit, unsigned=False,
         explicit (bool): the package was explicitly requested by the user
         unsigned (bool): ``True`` if binary package signatures to be checked,
             otherwise, ``False``
+        prefetched (tuple): the mirrors and the tarball of the package, if
+            they were prefetched by a ``TarballPrefetcher``
     """
     pkg_id = package_id(pkg)
-    tty.debug('Searching for binary cache of {0}'.format(pkg_id))
-    matches = binary_distribution.get_mirrors_for_spec(
-        pkg.spec, full_hash_match=full_hash_match)
+    tarball = None
+    if prefetched:
+        matches, tarball = prefetched
+    else:
+        tty.debug('Searching for binary cache of {0}'.format(pkg_id))
+        matches = binary_distribution.get_mirrors_for_spec(
+            pkg.spec, full_hash_match=full_hash_match)
 
     if not matches:
         return False
@@ -412,7 +433,66 @@ def _try_install_from_binary_cache(pkg, explicit, unsigned=False,
     preferred_mirrors = [match['mirror_url'] for match in matches]
     binary_spec = matches[0]['spec']
     return _process_binary_cache_tarball(pkg, binary_spec, explicit, unsigned,
-                                         preferred_mirrors=preferred_mirrors)
+                                         preferred_mirrors=preferred_mirrors,
+                                         tarball=tarball)
+
+
+class BinaryExtraction(object):
+    """Extraction of a package from a binary cache tarball in a background
+    thread.
+
+    It can be completed by the installer like the background build processes
+    returned by ``spack.build_environment.start_build_process``.
+    """
+
+    def __init__(self, pkg, binary_spec, tarball, unsigned):
+        """
+        Args:
+            pkg (spack.package.PackageBase): the package being installed
+            binary_spec (spack.spec.Spec): the spec of the tarball
+            tarball (str): the downloaded tarball
+            unsigned (bool): ``True`` if binary package signatures are not
+                to be checked, otherwise, ``False``
+        """
+        self.pkg = pkg
+        self.error = None
+
+        tty.msg('Extracting {0} from binary cache'.format(package_id(pkg)))
+        self.thread = threading.Thread(
+            target=self._extract, args=(binary_spec, tarball, unsigned))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _extract(self, binary_spec, tarball, unsigned):
+        try:
+            binary_distribution.extract_tarball(
+                binary_spec, tarball, allow_root=False, unsigned=unsigned,
+                force=False)
+        except BaseException as e:
+            self.error = e
+
+    def poll(self, timeout=0):
+        """Return whether the extraction is done, waiting at most
+        ``timeout`` seconds for it."""
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def complete(self):
+        """Wait for the extraction, and raise its error if it failed.
+
+        Return:
+            (bool) the verbosity setting of the installer, as build
+                processes return it
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        self.pkg.installed_from_binary_cache = True
+        return spack.package.PackageBase._verbose
+
+    def terminate(self):
+        # Threads cannot be killed, let the extraction finish
+        self.thread.join()
 
 
 def clear_failures():
@@ -702,6 +782,32 @@ def __init__(self, installs=[]):
         # fast then that option applies to all build requests.
         self.fail_fast = False
 
+        # Maximum number of packages built at the same time.  The largest
+        # value requested by the build requests applies to all of them.
+        requested = [request.install_args.get('concurrent_packages')
+                     for request in self.build_requests]
+        requested = [n for n in requested if n]
+        self.concurrent_packages = max(requested) if requested else \
+            spack.config.get('config:concurrent_packages', 1)
+
+        # Share of the global job budget for each concurrent build
+        self.build_jobs = None
+
+        # Build processes running in the background, keyed on the package's
+        # unique id
+        self.active_builds = {}
+
+        # Jobserver shared by the build processes, if enabled
+        self.jobserver = None
+
+        # Job slots held by the build processes, keyed on the package's
+        # unique id, and the slot reserved for the next build, if any
+        self.job_slots = {}
+        self._reserved_job = None
+
+        # Downloads of the binary tarballs of the packages to install
+        self.prefetcher = None
+
     def __repr__(self):
         """Returns a formal representation of the package installer."""
         rep = '{0}('.format(self.__class__.__name__)
@@ -1144,13 +1250,22 @@ def _add_tasks(self, request, all_deps):
         fail_fast = request.install_args.get('fail_fast')
         self.fail_fast = self.fail_fast or fail_fast
 
-    def _install_task(self, task):
+    def _install_task(self, task, wait=True):
         """
         Perform the installation of the requested spec and/or dependency
         represented by the build task.
 
         Args:
-            task (BuildTask): the installation build task for a package"""
+            task (BuildTask): the installation build task for a package
+            wait (bool): if ``False``, start the build process in the
+                background and return it instead of waiting for it
+
+        Return:
+            (spack.build_environment.BuildProcess or None) the background
+                build process, which must be completed with
+                ``_complete_install_task``, or ``None`` if the installation
+                is already done
+        """
 
         install_args = task.request.install_args
         cache_only = install_args.get('cache_only')
@@ -1166,10 +1281,18 @@ def _install_task(self, task):
         task.start = task.start or time.time()
         task.status = STATUS_INSTALLING
 
-        # Use the binary cache if requested
+        # Use the binary cache if requested, extracting prefetched tarballs
+        # in the background along with other installations.
+        prefetched = None
+        if use_cache and self.prefetcher:
+            prefetched = self.prefetcher.result(pkg.spec)
+            if prefetched and prefetched[1] and not wait:
+                return BinaryExtraction(
+                    pkg, prefetched[0][0]['spec'], prefetched[1], unsigned)
+
         if use_cache and \
                 _install_from_cache(pkg, cache_only, explicit, unsigned,
-                                    full_hash_match):
+                                    full_hash_match, prefetched):
             self._update_installed(task)
             if task.compiler:
                 spack.compilers.add_compilers_to_config(
@@ -1186,28 +1309,323 @@ def _install_task(self, task):
         try:
             self._setup_install_dir(pkg)
 
+            # Build processes get their share of the job budget, and draw
+            # their jobs from the jobserver if there is one.
+            self._take_job(pkg_id)
+            install_args = dict(
+                install_args, build_jobs=self.build_jobs,
+                jobserver=self.jobserver.path if self.jobserver else None)
+
             # Create a child process to do the actual installation.
-            # Preserve verbosity settings across installs.
-            spack.package.PackageBase._verbose = (
-                spack.build_environment.start_build_process(
-                    pkg, build_process, install_args)
-            )
+            if not wait:
+                try:
+                    return spack.build_environment.start_build_process(
+                        pkg, build_process, install_args, wait=False)
+                except BaseException:
+                    self._release_job(pkg_id)
+                    raise
+
+            try:
+                # Preserve verbosity settings across installs.
+                spack.package.PackageBase._verbose = (
+                    spack.build_environment.start_build_process(
+                        pkg, build_process, install_args)
+                )
+            finally:
+                self._release_job(pkg_id)
+            self._register_install(task)
+        except spack.build_environment.StopPhase as e:
+            self._stop_phase(pkg, e)
 
-            # Note: PARENT of the build process adds the new package to
-            # the database, so that we don't need to re-read from file.
-            spack.store.db.add(pkg.spec, spack.store.layout,
-                               explicit=explicit)
+    def _complete_install_task(self, task, build):
+        """
+        Wait for the background build process of the task and finish the
+        installation of its package.
 
-            # If a compiler, ensure it is added to the configuration
-            if task.compiler:
-                spack.compilers.add_compilers_to_config(
-                    spack.compilers.find_compilers([pkg.spec.prefix]))
+        Args:
+            task (BuildTask): the installation build task for a package
+            build (spack.build_environment.BuildProcess): the build process
+                returned by ``_install_task``
+        """
+        try:
+            # Preserve verbosity settings across installs.
+            spack.package.PackageBase._verbose = build.complete()
+            self._register_install(task)
+
+            # Hooks run in the build process of packages built from source
+            if isinstance(build, BinaryExtraction):
+                tty.debug('Successfully extracted {0} from binary cache'
+                          .format(task.pkg_id))
+                _print_installed_pkg(task.pkg.spec.prefix)
+                spack.hooks.post_install(task.pkg.spec)
         except spack.build_environment.StopPhase as e:
-            # A StopPhase exception means that do_install was asked to
-            # stop early from clients, and is not an error at this point
-            pid = '{0}: '.format(self.pid) if tty.show_pid() else ''
-            tty.debug('{0}{1}'.format(pid, str(e)))
-            tty.debug('Package stage directory: {0}' .format(pkg.stage.source_path))
+            self._stop_phase(task.pkg, e)
+        finally:
+            self._release_job(task.pkg_id)
+
+    def _start_prefetch(self):
+        """
+        Start downloading the binary tarballs of all the packages to install
+        from binary caches, if prefetching is enabled.
+
+        Return:
+            (spack.binary_distribution.TarballPrefetcher or None) the
+                downloads
+        """
+        concurrency = spack.config.get('config:binary_prefetch', 0)
+        if not concurrency or not spack.mirror.MirrorCollection():
+            return None
+
+        tasks = [task for task in self.build_tasks.values()
+                 if task.request.install_args.get('use_cache') and
+                 task.pkg_id not in self.installed and
+                 not task.pkg.spec.external and
+                 not task.pkg.installed_upstream and
+                 not task.pkg.installed]
+        if not tasks:
+            return None
+
+        prefetcher = binary_distribution.TarballPrefetcher(concurrency)
+        for task in sorted(tasks, key=lambda t: t.priority):
+            prefetcher.prefetch(
+                task.pkg.spec,
+                task.request.install_args.get('full_hash_match', False))
+        tty.debug('Prefetching the binaries of {0} packages'.format(len(tasks)))
+        return prefetcher
+
+    def _start_jobserver(self):
+        """
+        Join the jobserver Spack runs under or create a new one, if the
+        jobserver is enabled.
+
+        Return:
+            (spack.util.jobserver.JobServer or None) the jobserver
+        """
+        if not spack.config.get('config:jobserver', False):
+            return None
+
+        jobserver = spack.util.jobserver.JobServer.from_environment()
+        if jobserver is not None:
+            return jobserver
+
+        jobs = spack.build_environment.determine_number_of_jobs(parallel=True)
+        try:
+            return spack.util.jobserver.JobServer.create(jobs)
+        except OSError as e:
+            tty.warn('Cannot create a jobserver: {0}'.format(str(e)))
+            return None
+
+    def _reserve_job(self):
+        """
+        Reserve a job slot of the jobserver for the next build process.
+
+        Return:
+            True if a job slot is reserved or no jobserver is used, False
+            otherwise
+        """
+        if self.jobserver is None:
+            return True
+
+        if self._reserved_job is None:
+            self._reserved_job = self.jobserver.acquire()
+        return self._reserved_job is not None
+
+    def _take_job(self, pkg_id):
+        """
+        Assign the reserved job slot to the build process of the package,
+        waiting for one if none is reserved yet.
+
+        Args:
+            pkg_id (str): identifier for the package being built
+        """
+        if self.jobserver is None:
+            return
+
+        while not self._reserve_job():
+            time.sleep(_poll_interval)
+        self.job_slots[pkg_id] = self._reserved_job
+        self._reserved_job = None
+
+    def _release_job(self, pkg_id):
+        """
+        Give back the job slot of the build process of the package, if any.
+
+        Args:
+            pkg_id (str): identifier for the package that was being built
+        """
+        job_token = self.job_slots.pop(pkg_id, None)
+        if job_token is not None:
+            self.jobserver.release(job_token)
+
+    def _register_install(self, task):
+        """
+        Add the newly built package to the database and, if it is a compiler,
+        to the configuration.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+        """
+        pkg = task.pkg
+
+        # Note: PARENT of the build process adds the new package to
+        # the database, so that we don't need to re-read from file.
+        spack.store.db.add(pkg.spec, spack.store.layout,
+                           explicit=task.explicit)
+
+        # If a compiler, ensure it is added to the configuration
+        if task.compiler:
+            spack.compilers.add_compilers_to_config(
+                spack.compilers.find_compilers([pkg.spec.prefix]))
+
+    def _stop_phase(self, pkg, e):
+        """Report that the installation of ``pkg`` stopped early."""
+        # A StopPhase exception means that do_install was asked to
+        # stop early from clients, and is not an error at this point
+        pid = '{0}: '.format(self.pid) if tty.show_pid() else ''
+        tty.debug('{0}{1}'.format(pid, str(e)))
+        tty.debug('Package stage directory: {0}' .format(pkg.stage.source_path))
+
+    def _can_start_build(self):
+        """
+        Determine if another build can be started while the background
+        builds are running.
+
+        Return:
+            True if there is a free build slot, the next build task has
+            no uninstalled dependencies and a job slot of the jobserver is
+            available, False otherwise
+        """
+        if len(self.active_builds) >= self.concurrent_packages:
+            return False
+
+        # Discard removed tasks so the next one is at the front of the queue
+        while self.build_pq and self.build_pq[0][1].status == STATUS_REMOVED:
+            heapq.heappop(self.build_pq)
+
+        return (bool(self.build_pq) and self._next_is_pri0() and
+                self._reserve_job())
+
+    def _complete_builds(self, block, single_explicit_spec, failed_explicits):
+        """
+        Complete the background builds whose processes are done.
+
+        Args:
+            block (bool): ``True`` to wait until at least one build is done,
+                ``False`` to only complete builds that are already done
+            single_explicit_spec (bool): whether a single spec was requested
+            failed_explicits (list): the (package id, error) of failed
+                explicit specs
+        """
+        while True:
+            done = [pkg_id for pkg_id, (_, build) in self.active_builds.items()
+                    if build.poll()]
+            if done or not block:
+                break
+            time.sleep(_poll_interval)
+
+        for pkg_id in done:
+            task, build = self.active_builds.pop(pkg_id)
+            self._run_install(
+                task, InstallAction.INSTALL,
+                lambda: self._complete_install_task(task, build),
+                single_explicit_spec, failed_explicits)
+
+    def _terminate_builds(self):
+        """Kill the background builds that are still running."""
+        for pkg_id, (task, build) in self.active_builds.items():
+            tty.debug('Terminating the build of {0}'.format(pkg_id))
+            build.terminate()
+            self._release_job(pkg_id)
+            if not task.request.install_args.get('keep_prefix'):
+                task.pkg.remove_prefix()
+            task.pkg.stage.created = False
+        self.active_builds.clear()
+
+    def _run_install(self, task, action, install, single_explicit_spec,
+                     failed_explicits):
+        """
+        Run the installation of the task's package and handle its outcome.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+            action (InstallAction): how the package is being installed
+            install (typing.Callable): performs the installation and returns
+                the build process if it continues in the background
+            single_explicit_spec (bool): whether a single spec was requested
+            failed_explicits (list): the (package id, error) of failed
+                explicit specs, which is updated on failure
+        """
+        pkg, pkg_id = task.pkg, task.pkg_id
+        keep_prefix = task.request.install_args.get('keep_prefix')
+        build = None
+        try:
+            build = install()
+            if build is not None:
+                # The outcome is handled when the build process is done
+                self.active_builds[pkg_id] = (task, build)
+                return
+
+            self._update_installed(task)
+
+            # If we installed then we should keep the prefix
+            stop_before_phase = getattr(pkg, 'stop_before_phase', None)
+            last_phase = getattr(pkg, 'last_phase', None)
+            keep_prefix = keep_prefix or \
+                (stop_before_phase is None and last_phase is None)
+
+        except KeyboardInterrupt as exc:
+            # The build has been terminated with a Ctrl-C so terminate
+            # regardless of the number of remaining specs.
+            err = 'Failed to install {0} due to {1}: {2}'
+            tty.error(err.format(pkg.name, exc.__class__.__name__,
+                      str(exc)))
+            spack.hooks.on_install_failure(task.request.pkg.spec)
+            raise
+
+        except (Exception, SystemExit) as exc:
+            self._update_failed(task, True, exc)
+            spack.hooks.on_install_failure(task.request.pkg.spec)
+
+            # Best effort installs suppress the exception and mark the
+            # package as a failure.
+            if (not isinstance(exc, spack.error.SpackError) or
+                not exc.printed):
+                exc.printed = True
+                # SpackErrors can be printed by the build process or at
+                # lower levels -- skip printing if already printed.
+                # TODO: sort out this and SpackError.print_context()
+                tty.error('Failed to install {0} due to {1}: {2}'
+                          .format(pkg.name, exc.__class__.__name__,
+                                  str(exc)))
+            # Terminate if requested to do so on the first failure.
+            if self.fail_fast:
+                raise InstallError('{0}: {1}'
+                                   .format(_fail_fast_err, str(exc)))
+
+            # Terminate at this point if the single explicit spec has
+            # failed to install.
+            if single_explicit_spec and task.explicit:
+                raise
+
+            # Track explicit spec id and error to summarize when done
+            if task.explicit:
+                failed_explicits.append((pkg_id, str(exc)))
+
+        finally:
+            if build is None:
+                # Remove the install prefix if anything went wrong during
+                # install.
+                if not keep_prefix and not action == InstallAction.OVERWRITE:
+                    pkg.remove_prefix()
+
+                # The subprocess *may* have removed the build stage. Mark it
+                # not created so that the next time pkg.stage is invoked, we
+                # check the filesystem for it.
+                pkg.stage.created = False
+
+        # Perform basic task cleanup for the installed spec to
+        # include downgrading the write to a read lock
+        self._cleanup_task(pkg)
 
     def _next_is_pri0(self):
         """
@@ -1498,215 +1916,193 @@ def install(self):
             pkg (spack.package.Package): the package to be built and installed"""
 
         self._init_queue()
-        fail_fast_err = 'Terminating after first install failure'
         single_explicit_spec = len(self.build_requests) == 1
         failed_explicits = []
 
         term_title = TermTitle(len(self.build_pq))
 
-        while self.build_pq:
-            task = self._pop_task()
-            if task is None:
-                continue
-
-            spack.hooks.on_install_start(task.request.pkg.spec)
-            install_args = task.request.install_args
-            keep_prefix = install_args.get('keep_prefix')
-
-            pkg, pkg_id, spec = task.pkg, task.pkg_id, task.pkg.spec
-            term_title.next_pkg(pkg)
-            term_title.set('Processing {0}'.format(pkg.name))
-            tty.debug('Processing {0}: task={1}'.format(pkg_id, task))
-            # Ensure that the current spec has NO uninstalled dependencies,
-            # which is assumed to be reflected directly in its priority.
-            #
-            # If the spec has uninstalled dependencies, then there must be
-            # a bug in the code (e.g., priority queue or uninstalled
-            # dependencies handling).  So terminate under the assumption that
-            # all subsequent tasks will have non-zero priorities or may be
-            # dependencies of this task.
-            if task.priority != 0:
-                tty.error('Detected uninstalled dependencies for {0}: {1}'
-                          .format(pkg_id, task.uninstalled_deps))
-                left = [dep_id for dep_id in task.uninstalled_deps if
-                        dep_id not in self.installed]
-                if not left:
-                    tty.warn('{0} does NOT actually have any uninstalled deps'
-                             ' left'.format(pkg_id))
-                dep_str = 'dependencies' if task.priority > 1 else 'dependency'
-
-                # Hook to indicate task failure, but without an exception
-                spack.hooks.on_install_failure(task.request.pkg.spec)
+        # Concurrent builds share the job budget of a single build, either
+        # dynamically through the jobserver or split evenly between them.
+        # Tools that cannot join the jobserver, like ninja before 1.13, get
+        # the even share in both cases.
+        self.jobserver = self._start_jobserver()
+        if self.concurrent_packages > 1:
+            jobs = spack.build_environment.determine_number_of_jobs(
+                parallel=True)
+            self.build_jobs = max(1, jobs // self.concurrent_packages)
+            tty.debug('Building up to {0} packages at once with {1} jobs each'
+                      .format(self.concurrent_packages, self.build_jobs))
 
-                raise InstallError(
-                    'Cannot proceed with {0}: {1} uninstalled {2}: {3}'
-                    .format(pkg_id, task.priority, dep_str,
-                            ','.join(task.uninstalled_deps)))
-
-            # Skip the installation if the spec is not being installed locally
-            # (i.e., if external or upstream) BUT flag it as installed since
-            # some package likely depends on it.
-            if not task.explicit:
-                if _handle_external_and_upstream(pkg, False):
-                    self._flag_installed(pkg, task.dependents)
+        try:
+            self.prefetcher = self._start_prefetch()
+
+            while self.build_pq or self.active_builds:
+                # Finish the background builds that are done, waiting for
+                # one of them if no other build can be started yet.
+                if self.active_builds:
+                    self._complete_builds(not self._can_start_build(),
+                                          single_explicit_spec,
+                                          failed_explicits)
+                    if not self._can_start_build():
+                        continue
+
+                task = self._pop_task()
+                if task is None:
                     continue
 
-            # Flag a failed spec.  Do not need an (install) prefix lock since
-            # assume using a separate (failed) prefix lock file.
-            if pkg_id in self.failed or spack.store.db.prefix_failed(spec):
-                tty.warn('{0} failed to install'.format(pkg_id))
-                self._update_failed(task)
-
-                # Mark that the package failed
-                # TODO: this should also be for the task.pkg, but we don't
-                # model transitive yet.
-                spack.hooks.on_install_failure(task.request.pkg.spec)
+                spack.hooks.on_install_start(task.request.pkg.spec)
+
+                pkg, pkg_id, spec = task.pkg, task.pkg_id, task.pkg.spec
+                term_title.next_pkg(pkg)
+                term_title.set('Processing {0}'.format(pkg.name))
+                tty.debug('Processing {0}: task={1}'.format(pkg_id, task))
+                # Ensure that the current spec has NO uninstalled dependencies,
+                # which is assumed to be reflected directly in its priority.
+                #
+                # If the spec has uninstalled dependencies, then there must be
+                # a bug in the code (e.g., priority queue or uninstalled
+                # dependencies handling).  So terminate under the assumption that
+                # all subsequent tasks will have non-zero priorities or may be
+                # dependencies of this task.
+                if task.priority != 0:
+                    tty.error('Detected uninstalled dependencies for {0}: {1}'
+                              .format(pkg_id, task.uninstalled_deps))
+                    left = [dep_id for dep_id in task.uninstalled_deps if
+                            dep_id not in self.installed]
+                    if not left:
+                        tty.warn('{0} does NOT actually have any uninstalled deps'
+                                 ' left'.format(pkg_id))
+                    dep_str = 'dependencies' if task.priority > 1 else 'dependency'
+
+                    # Hook to indicate task failure, but without an exception
+                    spack.hooks.on_install_failure(task.request.pkg.spec)
+
+                    raise InstallError(
+                        'Cannot proceed with {0}: {1} uninstalled {2}: {3}'
+                        .format(pkg_id, task.priority, dep_str,
+                                ','.join(task.uninstalled_deps)))
+
+                # Skip the installation if the spec is not being installed locally
+                # (i.e., if external or upstream) BUT flag it as installed since
+                # some package likely depends on it.
+                if not task.explicit:
+                    if _handle_external_and_upstream(pkg, False):
+                        self._flag_installed(pkg, task.dependents)
+                        continue
+
+                # Flag a failed spec.  Do not need an (install) prefix lock since
+                # assume using a separate (failed) prefix lock file.
+                if pkg_id in self.failed or spack.store.db.prefix_failed(spec):
+                    tty.warn('{0} failed to install'.format(pkg_id))
+                    self._update_failed(task)
+
+                    # Mark that the package failed
+                    # TODO: this should also be for the task.pkg, but we don't
+                    # model transitive yet.
+                    spack.hooks.on_install_failure(task.request.pkg.spec)
+
+                    if self.fail_fast:
+                        raise InstallError(_fail_fast_err)
 
-                if self.fail_fast:
-                    raise InstallError(fail_fast_err)
+                    continue
 
-                continue
+                # Attempt to get a write lock.  If we can't get the lock then
+                # another process is likely (un)installing the spec or has
+                # determined the spec has already been installed (though the
+                # other process may be hung).
+                term_title.set('Acquiring lock for {0}'.format(pkg.name))
+                ltype, lock = self._ensure_locked('write', pkg)
+                if lock is None:
+                    # Attempt to get a read lock instead.  If this fails then
+                    # another process has a write lock so must be (un)installing
+                    # the spec (or that process is hung).
+                    ltype, lock = self._ensure_locked('read', pkg)
+
+                # Requeue the spec if we cannot get at least a read lock so we
+                # can check the status presumably established by another process
+                # -- failed, installed, or uninstalled -- on the next pass.
+                if lock is None:
+                    self._requeue_task(task)
+                    continue
 
-            # Attempt to get a write lock.  If we can't get the lock then
-            # another process is likely (un)installing the spec or has
-            # determined the spec has already been installed (though the
-            # other process may be hung).
-            term_title.set('Acquiring lock for {0}'.format(pkg.name))
-            ltype, lock = self._ensure_locked('write', pkg)
-            if lock is None:
-                # Attempt to get a read lock instead.  If this fails then
-                # another process has a write lock so must be (un)installing
-                # the spec (or that process is hung).
-                ltype, lock = self._ensure_locked('read', pkg)
-
-            # Requeue the spec if we cannot get at least a read lock so we
-            # can check the status presumably established by another process
-            # -- failed, installed, or uninstalled -- on the next pass.
-            if lock is None:
-                self._requeue_task(task)
-                continue
+                # Take a timestamp with the overwrite argument to allow checking
+                # whether another process has already overridden the package.
+                if task.request.overwrite and task.explicit:
+                    task.request.overwrite_time = time.time()
+
+                # Determine state of installation artifacts and adjust accordingly.
+                term_title.set('Preparing {0}'.format(pkg.name))
+                self._prepare_for_install(task)
+
+                # Flag an already installed package
+                if pkg_id in self.installed:
+                    # Downgrade to a read lock to preclude other processes from
+                    # uninstalling the package until we're done installing its
+                    # dependents.
+                    ltype, lock = self._ensure_locked('read', pkg)
+                    if lock is not None:
+                        self._update_installed(task)
+                        _print_installed_pkg(pkg.prefix)
+
+                        # It's an already installed compiler, add it to the config
+                        if task.compiler:
+                            spack.compilers.add_compilers_to_config(
+                                spack.compilers.find_compilers([pkg.spec.prefix]))
 
-            # Take a timestamp with the overwrite argument to allow checking
-            # whether another process has already overridden the package.
-            if task.request.overwrite and task.explicit:
-                task.request.overwrite_time = time.time()
-
-            # Determine state of installation artifacts and adjust accordingly.
-            term_title.set('Preparing {0}'.format(pkg.name))
-            self._prepare_for_install(task)
-
-            # Flag an already installed package
-            if pkg_id in self.installed:
-                # Downgrade to a read lock to preclude other processes from
-                # uninstalling the package until we're done installing its
-                # dependents.
-                ltype, lock = self._ensure_locked('read', pkg)
-                if lock is not None:
-                    self._update_installed(task)
-                    _print_installed_pkg(pkg.prefix)
-
-                    # It's an already installed compiler, add it to the config
-                    if task.compiler:
-                        spack.compilers.add_compilers_to_config(
-                            spack.compilers.find_compilers([pkg.spec.prefix]))
+                    else:
+                        # At this point we've failed to get a write or a read
+                        # lock, which means another process has taken a write
+                        # lock between our releasing the write and acquiring the
+                        # read.
+                        #
+                        # Requeue the task so we can re-check the status
+                        # established by the other process -- failed, installed,
+                        # or uninstalled -- on the next pass.
+                        self.installed.remove(pkg_id)
+                        self._requeue_task(task)
+                    continue
 
-                else:
-                    # At this point we've failed to get a write or a read
-                    # lock, which means another process has taken a write
-                    # lock between our releasing the write and acquiring the
-                    # read.
-                    #
-                    # Requeue the task so we can re-check the status
-                    # established by the other process -- failed, installed,
-                    # or uninstalled -- on the next pass.
-                    self.installed.remove(pkg_id)
+                # Having a read lock on an uninstalled pkg may mean another
+                # process completed an uninstall of the software between the
+                # time we failed to acquire the write lock and the time we
+                # took the read lock.
+                #
+                # Requeue the task so we can check the status presumably
+                # established by the other process -- failed, installed, or
+                # uninstalled -- on the next pass.
+                if ltype == 'read':
+                    lock.release_read()
                     self._requeue_task(task)
-                continue
-
-            # Having a read lock on an uninstalled pkg may mean another
-            # process completed an uninstall of the software between the
-            # time we failed to acquire the write lock and the time we
-            # took the read lock.
-            #
-            # Requeue the task so we can check the status presumably
-            # established by the other process -- failed, installed, or
-            # uninstalled -- on the next pass.
-            if ltype == 'read':
-                lock.release_read()
-                self._requeue_task(task)
-                continue
+                    continue
 
-            # Proceed with the installation since we have an exclusive write
-            # lock on the package.
-            term_title.set('Installing {0}'.format(pkg.name))
-            try:
+                # Proceed with the installation since we have an exclusive
+                # write lock on the package.
+                term_title.set('Installing {0}'.format(pkg.name))
                 action = self._install_action(task)
-
-                if action == InstallAction.INSTALL:
-                    self._install_task(task)
-                elif action == InstallAction.OVERWRITE:
-                    OverwriteInstall(self, spack.store.db, task).install()
-
-                self._update_installed(task)
-
-                # If we installed then we should keep the prefix
-                stop_before_phase = getattr(pkg, 'stop_before_phase', None)
-                last_phase = getattr(pkg, 'last_phase', None)
-                keep_prefix = keep_prefix or \
-                    (stop_before_phase is None and last_phase is None)
-
-            except KeyboardInterrupt as exc:
-                # The build has been terminated with a Ctrl-C so terminate
-                # regardless of the number of remaining specs.
-                err = 'Failed to install {0} due to {1}: {2}'
-                tty.error(err.format(pkg.name, exc.__class__.__name__,
-                          str(exc)))
-                spack.hooks.on_install_failure(task.request.pkg.spec)
-                raise
-
-            except (Exception, SystemExit) as exc:
-                self._update_failed(task, True, exc)
-                spack.hooks.on_install_failure(task.request.pkg.spec)
-
-                # Best effort installs suppress the exception and mark the
-                # package as a failure.
-                if (not isinstance(exc, spack.error.SpackError) or
-                    not exc.printed):
-                    exc.printed = True
-                    # SpackErrors can be printed by the build process or at
-                    # lower levels -- skip printing if already printed.
-                    # TODO: sort out this and SpackError.print_context()
-                    tty.error('Failed to install {0} due to {1}: {2}'
-                              .format(pkg.name, exc.__class__.__name__,
-                                      str(exc)))
-                # Terminate if requested to do so on the first failure.
-                if self.fail_fast:
-                    raise InstallError('{0}: {1}'
-                                       .format(fail_fast_err, str(exc)))
-
-                # Terminate at this point if the single explicit spec has
-                # failed to install.
-                if single_explicit_spec and task.explicit:
-                    raise
-
-                # Track explicit spec id and error to summarize when done
-                if task.explicit:
-                    failed_explicits.append((pkg_id, str(exc)))
-
-            finally:
-                # Remove the install prefix if anything went wrong during
-                # install.
-                if not keep_prefix and not action == InstallAction.OVERWRITE:
-                    pkg.remove_prefix()
-
-                # The subprocess *may* have removed the build stage. Mark it
-                # not created so that the next time pkg.stage is invoked, we
-                # check the filesystem for it.
-                pkg.stage.created = False
-
-            # Perform basic task cleanup for the installed spec to
-            # include downgrading the write to a read lock
-            self._cleanup_task(pkg)
+                if action == InstallAction.OVERWRITE:
+                    install = OverwriteInstall(self, spack.store.db, task).install
+                elif action == InstallAction.INSTALL and \
+                        self.concurrent_packages > 1:
+                    install = lambda: self._install_task(task, wait=False)
+                elif action == InstallAction.INSTALL:
+                    install = lambda: self._install_task(task)
+                else:
+                    install = lambda: None
+
+                self._run_install(task, action, install,
+                                  single_explicit_spec, failed_explicits)
+        finally:
+            # Do not leave background builds behind on errors
+            self._terminate_builds()
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            if self.jobserver is not None:
+                if self._reserved_job is not None:
+                    self.jobserver.release(self._reserved_job)
+                    self._reserved_job = None
+                self.jobserver.close()
+                self.jobserver = None
 
         # Cleanup, which includes releasing all of the read locks
         self._cleanup_all_tasks()
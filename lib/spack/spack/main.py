@@ -11,6 +11,7 @@
 from __future__ import print_function
 
 import argparse
+import atexit
 import inspect
 import operator
 import os
@@ -31,7 +32,7 @@
 import llnl.util.tty as tty
 import llnl.util.tty.colify
 import llnl.util.tty.color as color
-from llnl.util.tty.log import log_output
+import llnl.util.tty.log
 
 import spack
 import spack.cmd
@@ -47,6 +48,7 @@
 import spack.util.debug
 import spack.util.environment
 import spack.util.executable as exe
+import spack.util.imp.startup
 import spack.util.path
 from spack.error import SpackError
 
@@ -457,6 +459,9 @@ def make_argument_parser(**kwargs):
     parser.add_argument(
         '--lines', default=20, action='store',
         help="lines of profile output or 'all' (default: 20)")
+    parser.add_argument(
+        '--import-profile', action='store_true',
+        help="report the time taken to import each module")
     parser.add_argument(
         '-v', '--verbose', action='store_true',
         help="print additional output during builds")
@@ -608,7 +613,7 @@ def __call__(self, *argv, **kwargs):
 
         out = StringIO()
         try:
-            with log_output(out):
+            with llnl.util.tty.log.log_output(out):
                 self.returncode = _invoke_command(
                     self.command, self.parser, args, unknown)
 
@@ -639,15 +644,20 @@ def _log_command_output(self, out):
                     tty.verbose(fmt.format(ln.replace('==> ', '')))
 
 
-def _profile_wrapper(command, parser, args, unknown_args):
-    import cProfile
-
+def _profile_lines(args):
+    """Number of lines of profile output, or -1 for all of them."""
     try:
-        nlines = int(args.lines)
+        return int(args.lines)
     except ValueError:
         if args.lines != 'all':
             tty.die('Invalid number for --lines: %s' % args.lines)
-        nlines = -1
+        return -1
+
+
+def _profile_wrapper(command, parser, args, unknown_args):
+    import cProfile
+
+    nlines = _profile_lines(args)
 
     # allow comma-separated list of fields
     sortby = ['time']
@@ -672,6 +682,20 @@ def _profile_wrapper(command, parser, args, unknown_args):
         stats.print_stats(nlines)
 
 
+def _setup_import_profile(args):
+    """Report the time taken to import modules when Spack exits.
+
+    The profiler is installed by ``bin/spack`` before ``spack.main`` is
+    imported, and reports modules imported by the command as well.
+    """
+    profiler = spack.util.imp.startup.profiler
+    if profiler is None:
+        tty.warn('Import times are only recorded when running bin/spack '
+                 'with Python 3.5 or later')
+        return
+    atexit.register(profiler.report, _profile_lines(args))
+
+
 @llnl.util.lang.memoized
 def _compatible_sys_types():
     """Return a list of all the platform-os-target tuples compatible
@@ -783,6 +807,9 @@ def _main(argv=None):
     parser.add_argument('command', nargs=argparse.REMAINDER)
     args, unknown = parser.parse_known_args(argv)
 
+    if args.import_profile:
+        _setup_import_profile(args)
+
     # Recover stored LD_LIBRARY_PATH variables from spack shell function
     # This is necessary because MacOS System Integrity Protection clears
     # (DY?)LD_LIBRARY_PATH variables on process start.
@@ -0,0 +1,518 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Read the metadata of packages without importing their modules.
+
+Importing a ``package.py`` file executes all of its directives, which is
+slow when done for every package in a repository. Most packages, though,
+only call directives with literal arguments in the body of their class.
+For those, the arguments of the directives are read from the syntax tree
+of the file and kept in a ``MetadataIndex``, which ``spack.repo`` caches
+along with its other indexes. Packages using any dynamic construct are
+marked as such, and their metadata is read from the imported class.
+"""
+import ast
+import sys
+
+if sys.version_info >= (3, 5):
+    from collections.abc import Mapping  # novm
+else:
+    from collections import Mapping
+
+import six
+
+import llnl.util.tty as tty
+
+import spack.directives
+import spack.error
+import spack.spec
+import spack.util.naming as nm
+import spack.util.spack_json as sjson
+from spack.version import Version
+
+#: Version of the format of the metadata read from package files
+_metadata_version = 1
+
+#: Directives whose arguments are read from package files
+static_directives = (
+    'version', 'variant', 'depends_on', 'extends', 'provides', 'conflicts',
+    'patch', 'resource'
+)
+
+#: Class attributes exposed by ``PackageMetadata``, which cannot be
+#: assigned values that are not literals
+static_attributes = ('tags', 'homepage', 'virtual')
+
+#: Nodes of constant expressions, such as docstrings
+_constant_node = getattr(ast, 'Constant', None) or ast.Str
+
+
+class DynamicPackageError(spack.error.SpackError):
+    """Raised when the metadata of a package cannot be read statically."""
+
+
+def _literal(node, what):
+    """Value of a literal expression that can be stored as JSON."""
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        raise DynamicPackageError(
+            '{0} is not a literal (line {1})'.format(what, node.lineno))
+
+    def check(value):
+        if isinstance(value, (list, tuple, set)):
+            return all(check(x) for x in value)
+        if isinstance(value, dict):
+            return all(isinstance(k, six.string_types) and check(v)
+                       for k, v in value.items())
+        return value is None or isinstance(
+            value, six.string_types + (bool, int, float))
+
+    if not check(value):
+        raise DynamicPackageError(
+            '{0} cannot be stored (line {1})'.format(what, node.lineno))
+    if isinstance(value, set):
+        value = sorted(value)
+    return value
+
+
+def _directive_call(node, context):
+    """Directive called by an expression in the body of a package class, as
+    a ``[name, args, kwargs, context]`` list."""
+    call = node.value
+    if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name):
+        raise DynamicPackageError(
+            'unknown expression (line {0})'.format(node.lineno))
+
+    name = call.func.id
+    if name not in static_directives:
+        raise DynamicPackageError(
+            '{0}() is not a directive (line {1})'.format(name, node.lineno))
+
+    # Python < 3.5 has separate nodes for *args and **kwargs
+    starred = getattr(ast, 'Starred', ())
+    if getattr(call, 'starargs', None) or getattr(call, 'kwargs', None) or \
+            any(isinstance(arg, starred) for arg in call.args) or \
+            any(kw.arg is None for kw in call.keywords):
+        raise DynamicPackageError(
+            '{0}() has unpacked arguments (line {1})'.format(
+                name, node.lineno))
+
+    what = 'an argument of {0}()'.format(name)
+    args = [_literal(arg, what) for arg in call.args]
+    kwargs = dict((kw.arg, _literal(kw.value, what)) for kw in call.keywords)
+    return [name, args, kwargs, list(context)]
+
+
+def _when_context(node):
+    """Spec strings of the ``when`` contexts opened by a ``with`` statement."""
+    # Python 3 has one node per context manager, Python 2 nests statements
+    items = getattr(node, 'items', None) or [node]
+    context = []
+    for item in items:
+        call = item.context_expr
+        if item.optional_vars or not isinstance(call, ast.Call) or \
+                not isinstance(call.func, ast.Name) or \
+                call.func.id != 'when' or call.keywords or \
+                len(call.args) != 1:
+            raise DynamicPackageError(
+                'unknown context manager (line {0})'.format(node.lineno))
+        context.append(_literal(call.args[0], 'a when() context'))
+    return context
+
+
+def _read_class_body(body, context, data):
+    """Read the directives and literal attributes in the body of a class."""
+    for node in body:
+        if isinstance(node, ast.Expr):
+            if isinstance(node.value, _constant_node):
+                continue  # docstrings
+            data['directives'].append(_directive_call(node, context))
+
+        elif isinstance(node, ast.With):
+            _read_class_body(
+                node.body, context + _when_context(node), data)
+
+        elif isinstance(node, ast.Assign):
+            names = [t.id for t in node.targets if isinstance(t, ast.Name)]
+            try:
+                value = _literal(node.value, 'the value of an attribute')
+            except DynamicPackageError:
+                if any(n in static_attributes for n in names):
+                    raise
+                continue
+            for name in names:
+                data['attributes'][name] = value
+
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Pass)) or \
+                type(node).__name__ == 'AsyncFunctionDef':
+            continue
+
+        else:
+            raise DynamicPackageError(
+                'unknown statement in class body (line {0})'.format(
+                    node.lineno))
+
+
+def read_package_source(source, pkg_name):
+    """Read the metadata of a package from the source of its file.
+
+    Args:
+        source (str or bytes): content of the ``package.py`` file of the
+            package
+        pkg_name (str): name of the package
+
+    Returns:
+        A dictionary, which can be stored as JSON, with the name of the class
+        of the package, the names of its base classes, its docstring, the
+        literal values of its class attributes, and the directives it calls
+        as ``[name, args, kwargs, when_context]`` lists.
+
+    Raises:
+        DynamicPackageError: if the package uses constructs that cannot be
+            read without importing it
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise DynamicPackageError('invalid syntax: {0}'.format(e))
+
+    class_name = nm.mod_to_class(pkg_name)
+    classes = [node for node in tree.body
+               if isinstance(node, ast.ClassDef) and node.name == class_name]
+    if len(classes) != 1:
+        raise DynamicPackageError(
+            'class {0} is not defined once'.format(class_name))
+    class_def = classes[0]
+
+    if class_def.decorator_list or getattr(class_def, 'keywords', None):
+        raise DynamicPackageError(
+            'class {0} is decorated or has keywords'.format(class_name))
+
+    # Build systems import most of Spack, which imports this module
+    import spack.pkgkit
+
+    bases = []
+    for base in class_def.bases:
+        if not isinstance(base, ast.Name) or not isinstance(
+                getattr(spack.pkgkit, base.id, None), type):
+            raise DynamicPackageError(
+                'class {0} derives from a class outside of spack.pkgkit'
+                .format(class_name))
+        bases.append(base.id)
+
+    data = {
+        'class_name': class_name,
+        'bases': bases,
+        'doc': ast.get_docstring(class_def, clean=False),
+        'attributes': {},
+        'directives': [],
+    }
+    _read_class_body(class_def.body, [], data)
+    return data
+
+
+def read_package_file(path, pkg_name):
+    """Read the metadata of a package from its ``package.py`` file.
+
+    Args:
+        path (str): path to the ``package.py`` file
+        pkg_name (str): name of the package
+
+    Returns:
+        The metadata as returned by ``read_package_source()``, or None if
+        the package cannot be read statically.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+    try:
+        return read_package_source(source, pkg_name)
+    except DynamicPackageError as e:
+        tty.debug('Package {0} is read from its module: {1}'.format(
+            pkg_name, e))
+        return None
+
+
+#: Names of the positional parameters of the directives read statically
+_directive_parameters = {
+    'version': ('ver', 'checksum'),
+    'variant': ('name', 'default', 'description', 'values', 'multi',
+                'validator', 'when'),
+    'depends_on': ('spec', 'when', 'type', 'patches'),
+    'extends': ('spec', 'type'),
+    'conflicts': ('conflict_spec', 'when', 'msg'),
+    'patch': ('url_or_filename', 'level', 'when', 'working_dir'),
+}
+
+
+def _arguments(name, args, kwargs):
+    """Arguments of a call to a directive, by name."""
+    arguments = dict(zip(_directive_parameters.get(name, ()), args))
+    arguments.update(kwargs)
+    return arguments
+
+
+class PackageMetadata(object):
+    """Metadata of a package, as read statically from its ``package.py``
+    file, or from its class for packages that cannot be read statically.
+
+    Args:
+        fullname (str): name of the package with its namespace
+        data (dict or None): metadata as returned by
+            ``read_package_source()``, or None for dynamic packages
+        package_class (type or None): class of a dynamic package, if it
+            was already imported
+    """
+
+    def __init__(self, fullname, data=None, package_class=None):
+        self.fullname = fullname
+        self.namespace, _, self.name = fullname.rpartition('.')
+        self.data = data
+        self._package_class = package_class
+        self._base_dicts = None
+
+    @property
+    def static(self):
+        """True if the metadata was read without importing the package."""
+        return self.data is not None
+
+    @property
+    def package_class(self):
+        """Class of the package, which is imported on first access."""
+        if self._package_class is None:
+            self._package_class = spack.repo.path.get_pkg_class(self.fullname)
+        return self._package_class
+
+    def _directives(self, *names):
+        """Arguments of the calls to the given directives, by name, with
+        their ``when`` contexts."""
+        for name, args, kwargs, context in self.data['directives']:
+            if name not in names:
+                continue
+            arguments = _arguments(name, args, kwargs)
+            # Directives other than variant() are discarded if never applied
+            if arguments.get('when') is False and name != 'variant':
+                continue
+            yield arguments, context
+
+    @property
+    def bases(self):
+        """Base classes of a statically read package."""
+        import spack.pkgkit
+        return [getattr(spack.pkgkit, b) for b in self.data['bases']]
+
+    def _attribute(self, name, default=None):
+        if name in self.data['attributes']:
+            return self.data['attributes'][name]
+        for base in self.bases:
+            if hasattr(base, name):
+                return getattr(base, name)
+        return default
+
+    def _from_bases(self, name):
+        """Dictionary of directives filled in by the base classes, which are
+        not package classes and only queue their directives."""
+        if self._base_dicts is None:
+            stub = type(self.name, (object,), dict(
+                (d, {}) for d in spack.directives.DirectiveMeta._directive_names))
+            stub.name = self.name
+            executed = set()
+            for base in reversed(self.bases):
+                for directive in base._directives_to_be_executed:
+                    if directive not in executed:
+                        executed.add(directive)
+                        directive(stub)
+            self._base_dicts = dict(
+                (d, getattr(stub, d))
+                for d in spack.directives.DirectiveMeta._directive_names)
+        return self._base_dicts[name]
+
+    @staticmethod
+    def _when_spec(when, context):
+        """Condition of a directive, as merged by the directive decorator."""
+        if context:
+            constraints = [spack.spec.Spec(x) for x in context]
+            if when:
+                constraints.append(spack.spec.Spec(when))
+            when = spack.spec.merge_abstract_anonymous_specs(*constraints)
+        return spack.directives.make_when_spec(when)
+
+    @property
+    def doc(self):
+        """Docstring of the package class."""
+        if not self.static:
+            return self.package_class.__doc__
+        return self.data['doc']
+
+    @property
+    def tags(self):
+        """Tags of the package."""
+        if not self.static:
+            return getattr(self.package_class, 'tags', [])
+        return self._attribute('tags', [])
+
+    @property
+    def virtual(self):
+        """True if the package is virtual."""
+        if not self.static:
+            return self.package_class.virtual
+        return self._attribute('virtual', False)
+
+    @property
+    def homepage(self):
+        """Homepage of the package."""
+        if not self.static:
+            return getattr(self.package_class, 'homepage', None)
+        return self._attribute('homepage')
+
+    @property
+    def versions(self):
+        """Versions of the package, sorted from the oldest."""
+        if not self.static:
+            return sorted(self.package_class.versions)
+        versions = set(self._from_bases('versions'))
+        for arguments, _ in self._directives('version'):
+            versions.add(Version(arguments['ver']))
+        return sorted(versions)
+
+    @property
+    def variants(self):
+        """Names of the variants of the package."""
+        if not self.static:
+            return sorted(self.package_class.variants)
+        variants = set(self._from_bases('variants'))
+        for arguments, _ in self._directives('variant'):
+            variants.add(arguments['name'])
+        return sorted(variants)
+
+    @property
+    def dependencies(self):
+        """Names of the packages the package may depend on."""
+        if not self.static:
+            return sorted(self.package_class.dependencies)
+        dependencies = set(self._from_bases('dependencies'))
+        for arguments, _ in self._directives('depends_on', 'extends'):
+            dependencies.add(spack.spec.Spec(arguments['spec']).name)
+        return sorted(dependencies)
+
+    @property
+    def provided(self):
+        """Virtual specs provided by the package, mapped to the conditions
+        under which they are, as in ``PackageBase.provided``."""
+        if not self.static:
+            return self.package_class.provided
+        provided = dict((spec, set(conditions)) for spec, conditions
+                        in self._from_bases('provided').items())
+        for name, args, kwargs, context in self.data['directives']:
+            if name != 'provides':
+                continue
+            when_spec = self._when_spec(kwargs.get('when'), context)
+            if not when_spec:
+                continue
+            when_spec.name = self.name
+            for string in args:
+                for provided_spec in spack.spec.parse(string):
+                    provided.setdefault(provided_spec, set()).add(when_spec)
+        return provided
+
+    @property
+    def conflicts(self):
+        """Specs the package conflicts with, mapped to the conditions under
+        which it does, as spec strings."""
+        if not self.static:
+            return dict(
+                (spec, [str(when) for when, _ in conditions])
+                for spec, conditions in self.package_class.conflicts.items())
+        conflicts = dict(
+            (spec, [str(when) for when, _ in conditions])
+            for spec, conditions in self._from_bases('conflicts').items())
+        for arguments, context in self._directives('conflicts'):
+            when_spec = self._when_spec(arguments.get('when'), context)
+            if when_spec is False:
+                continue
+            conflicts.setdefault(arguments['conflict_spec'], []).append(
+                str(when_spec))
+        return conflicts
+
+    @property
+    def has_patches(self):
+        """True if the package patches its own source or its dependencies."""
+        if not self.static:
+            pkg_class = self.package_class
+            return bool(pkg_class.patches) or any(
+                dependency.patches
+                for conditions in pkg_class.dependencies.values()
+                for dependency in conditions.values())
+        if any(self._directives('patch')) or any(
+                arguments.get('patches')
+                for arguments, _ in self._directives('depends_on')):
+            return True
+        return bool(self._from_bases('patches')) or any(
+            dependency.patches
+            for conditions in self._from_bases('dependencies').values()
+            for dependency in conditions.values())
+
+
+class MetadataIndex(Mapping):
+    """Maps the names of the packages in a repository to their metadata, as
+    returned by ``read_package_source()``, or to None for packages that
+    cannot be read statically."""
+
+    def __init__(self):
+        self._metadata = {}
+
+    def to_json(self, stream):
+        sjson.dump({'metadata': {
+            'version': _metadata_version,
+            'packages': self._metadata,
+        }}, stream)
+
+    @staticmethod
+    def from_json(stream):
+        d = sjson.load(stream)
+
+        if not isinstance(d, dict) or 'metadata' not in d:
+            raise MetadataIndexError(
+                "MetadataIndex data does not start with 'metadata'")
+
+        r = MetadataIndex()
+
+        # Packages missing from an index in an older format are read again
+        # when their metadata is requested
+        if d['metadata'].get('version') == _metadata_version:
+            r._metadata.update(d['metadata']['packages'])
+
+        return r
+
+    def __getitem__(self, item):
+        return self._metadata[item]
+
+    def __iter__(self):
+        return iter(self._metadata)
+
+    def __len__(self):
+        return len(self._metadata)
+
+    def update_package(self, pkg_fullname):
+        """Updates a package in the metadata index.
+
+        Args:
+            pkg_fullname (str): name of the package, with its namespace
+        """
+        pkg_name = pkg_fullname.split('.')[-1]
+        repo = spack.repo.path.repo_for_pkg(pkg_fullname)
+        path = repo.filename_for_package_name(pkg_name)
+        self._metadata[pkg_name] = read_package_file(path, pkg_name)
+
+    def remove_package(self, pkg_fullname):
+        """Removes a package from the metadata index.
+
+        Args:
+            pkg_fullname (str): name of the package, with its namespace
+        """
+        self._metadata.pop(pkg_fullname.split('.')[-1], None)
+
+
+class MetadataIndexError(spack.error.SpackError):
+    """Raised when there is a problem with a MetadataIndex."""
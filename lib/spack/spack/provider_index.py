@@ -66,8 +66,7 @@ def providers_for(self, virtual_spec):
         """
         result = set()
         # Allow string names to be passed as input, as well as specs
-        if isinstance(virtual_spec, six.string_types):
-            virtual_spec = spack.spec.Spec(virtual_spec)
+        virtual_spec = spack.spec.interned_spec(virtual_spec)
 
         # Add all the providers that satisfy the vpkg spec.
         if virtual_spec.name in self.providers:
@@ -175,7 +174,8 @@ def update(self, spec):
 
         assert not spec.virtual, "cannot update an index using a virtual spec"
 
-        pkg_provided = spec.package_class.provided
+        pkg_metadata = spack.repo.path.get_pkg_metadata(spec.fullname)
+        pkg_provided = pkg_metadata.provided
         for provided_spec, provider_specs in six.iteritems(pkg_provided):
             for provider_spec in provider_specs:
                 # TODO: fix this comment.
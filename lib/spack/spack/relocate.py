@@ -2,11 +2,15 @@
 # Spack Project Developers. See the top-level COPYRIGHT file for details.
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import mmap
+import multiprocessing
 import multiprocessing.pool
 import os
 import re
 import shutil
-from collections import defaultdict
+import struct
+import threading
+from collections import defaultdict, namedtuple
 
 import macholib.mach_o
 import macholib.MachO
@@ -18,6 +22,7 @@
 import spack.platforms
 import spack.repo
 import spack.spec
+import spack.util.cpus
 import spack.util.executable as executable
 
 is_macos = (str(spack.platforms.real_host()) == 'darwin')
@@ -65,6 +70,7 @@ def __init__(self, old_path, new_path):
             new_path (str): candidate path for substitution
         """
 
+        self.old_path, self.new_path = old_path, new_path
         msg = "New path longer than old path: binary text"
         msg += " replacement not possible."
         err_msg = "The new path %s" % new_path
@@ -104,10 +110,158 @@ def _patchelf():
     return exe_path if os.path.exists(exe_path) else None
 
 
+#: Types of the program headers and tags of the dynamic entries of ELF
+#: files that are needed to locate RPATHs
+_PT_LOAD, _PT_DYNAMIC = 1, 2
+_DT_NULL, _DT_STRTAB, _DT_RPATH, _DT_RUNPATH = 0, 5, 15, 29
+
+#: Location of an RPATH in an ELF file: ``tags`` maps the tag of each
+#: RPATH and RUNPATH entry of the dynamic section to the file offset of its
+#: string, ``offset`` and ``value`` are those of the string the dynamic
+#: loader uses, i.e. the RUNPATH if present, otherwise the RPATH.
+ElfRpath = namedtuple('ElfRpath', ['tags', 'offset', 'value'])
+
+
+class ElfParsingError(ValueError):
+    """Raised when a file cannot be parsed as an ELF object."""
+
+
+def _elf_structs(ident):
+    """Return the structs that unpack the file header, the program headers
+    and the dynamic entries of an ELF file, given its identification bytes.
+    Program headers are unpacked to ``(p_type, p_offset, p_vaddr, p_filesz)``
+    for both 32 and 64 bit objects.
+    """
+    if len(ident) < 16 or ident[:4] != b'\x7fELF':
+        raise ElfParsingError('not an ELF file')
+    endianness = {b'\x01': '<', b'\x02': '>'}.get(ident[5:6])
+    if endianness is None:
+        raise ElfParsingError('unknown ELF data encoding')
+
+    if ident[4:5] == b'\x01':
+        header = struct.Struct(endianness + '16xHHIIIIIHHHHHH')
+        phdr = struct.Struct(endianness + 'III4xI4x4x4x')
+        dyn = struct.Struct(endianness + 'iI')
+    elif ident[4:5] == b'\x02':
+        header = struct.Struct(endianness + '16xHHIQQQIHHHHHH')
+        phdr = struct.Struct(endianness + 'I4xQQ8xQ8x8x')
+        dyn = struct.Struct(endianness + 'qQ')
+    else:
+        raise ElfParsingError('unknown ELF class')
+    return header, phdr, dyn
+
+
+def _read_cstring(f, offset, chunk_size=256):
+    """Read the null terminated string stored at ``offset`` in ``f``."""
+    f.seek(offset)
+    chunks = []
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ElfParsingError('unterminated string')
+        end = chunk.find(b'\0')
+        if end >= 0:
+            chunks.append(chunk[:end])
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def read_elf_rpath(f):
+    """Locate the RPATH of an ELF object by reading its dynamic section.
+
+    Args:
+        f (file): ELF object opened in binary mode
+
+    Return:
+        (ElfRpath): location and value of the RPATH, or None if the
+            object has neither a dynamic section nor RPATH/RUNPATH entries
+
+    Raises:
+        ElfParsingError: if the file is not a well formed ELF object
+    """
+    f.seek(0)
+    ident = f.read(64)
+    header, phdr, dyn = _elf_structs(ident)
+    if len(ident) < header.size:
+        raise ElfParsingError('truncated ELF header')
+    fields = header.unpack(ident[:header.size])
+    phoff, phentsize, phnum = fields[4], fields[8], fields[9]
+    if phentsize < phdr.size:
+        raise ElfParsingError('invalid program header size')
+
+    f.seek(phoff)
+    table = f.read(phentsize * phnum)
+    if len(table) < phentsize * phnum:
+        raise ElfParsingError('truncated program header table')
+    segments = [phdr.unpack_from(table, i * phentsize) for i in range(phnum)]
+    dynamic = [s for s in segments if s[0] == _PT_DYNAMIC]
+    if not dynamic:
+        return None
+
+    _, dynamic_offset, _, dynamic_size = dynamic[0]
+    f.seek(dynamic_offset)
+    entries = f.read(dynamic_size)
+    strtab, strings = None, OrderedDict()
+    for start in range(0, len(entries) - dyn.size + 1, dyn.size):
+        tag, value = dyn.unpack_from(entries, start)
+        if tag == _DT_NULL:
+            break
+        elif tag == _DT_STRTAB:
+            strtab = value
+        elif tag in (_DT_RPATH, _DT_RUNPATH):
+            strings[tag] = value
+    if not strings:
+        return None
+    if strtab is None:
+        raise ElfParsingError('dynamic section without a string table')
+
+    # DT_STRTAB holds a virtual address, map it back to the file
+    for p_type, p_offset, p_vaddr, p_filesz in segments:
+        if p_type == _PT_LOAD and p_vaddr <= strtab < p_vaddr + p_filesz:
+            strtab += p_offset - p_vaddr
+            break
+    else:
+        raise ElfParsingError('string table is not mapped by any segment')
+
+    tags = dict((tag, strtab + value) for tag, value in strings.items())
+    offset = tags.get(_DT_RUNPATH, tags.get(_DT_RPATH))
+    return ElfRpath(tags, offset, _read_cstring(f, offset))
+
+
+def _set_elf_rpaths_in_place(target, rpaths_str):
+    """Overwrite the RPATH string of an ELF object with ``rpaths_str``,
+    padding the bytes left over by the old value with nulls.
+
+    Args:
+        target (str): path to the ELF object
+        rpaths_str (str): new RPATH
+
+    Return:
+        (bool): True if the RPATH was rewritten, False if it has to be
+            done by patchelf because the new value does not fit in the
+            string table or the object has no RPATH entry to update
+
+    Raises:
+        ElfParsingError: if the target is not a well formed ELF object
+    """
+    new_value = rpaths_str.encode('utf-8')
+    with open(target, 'rb+') as f:
+        rpath = read_elf_rpath(f)
+        if rpath is None or len(new_value) > len(rpath.value):
+            return False
+        # Different strings for RPATH and RUNPATH are left to patchelf
+        if len(set(rpath.tags.values())) > 1:
+            return False
+        f.seek(rpath.offset)
+        f.write(new_value.ljust(len(rpath.value) + 1, b'\0'))
+    return True
+
+
 def _elf_rpaths_for(path):
     """Return the RPATHs for an executable or a library.
 
-    The RPATHs are obtained by ``patchelf --print-rpath PATH``.
+    The RPATHs are read from the dynamic section of the object, falling
+    back to ``patchelf --print-rpath PATH`` for files that cannot be parsed.
 
     Args:
         path (str): full path to the executable or library
@@ -115,6 +269,14 @@ def _elf_rpaths_for(path):
     Return:
         RPATHs as a list of strings.
     """
+    try:
+        with open(path, 'rb') as f:
+            rpath = read_elf_rpath(f)
+        value = rpath.value.decode('utf-8') if rpath else ''
+        return value.split(':') if value else []
+    except (IOError, OSError, ElfParsingError, struct.error, UnicodeDecodeError):
+        pass
+
     # If we're relocating patchelf itself, use it
     patchelf_path = path if path.endswith("/bin/patchelf") else _patchelf()
     patchelf = executable.Executable(patchelf_path)
@@ -130,6 +292,45 @@ def _elf_rpaths_for(path):
     return output.split(':') if output else []
 
 
+def elf_rpath_ranges(path):
+    """Return the ``[start, end]`` ranges of the offsets of the RPATHs of an
+    ELF file in its content, i.e. those of the null terminated string of its
+    RPATHs joined by ``:``.
+
+    Args:
+        path (str): full path to the executable or library
+
+    Return:
+        (list): the ranges of offsets
+    """
+    try:
+        with open(path, 'rb') as f:
+            rpath = read_elf_rpath(f)
+        if not rpath or not rpath.value:
+            return []
+        offsets = sorted(set(rpath.tags.values()))
+        return [[start, start + len(rpath.value)] for start in offsets]
+    except (IOError, OSError, ElfParsingError, struct.error):
+        pass
+
+    rpaths = _elf_rpaths_for(path)
+    if not rpaths:
+        return []
+    needle = b'\0' + ':'.join(rpaths).encode('utf-8') + b'\0'
+
+    ranges = []
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = data.find(needle)
+            while start >= 0:
+                ranges.append([start + 1, start + len(needle) - 1])
+                start = data.find(needle, start + 1)
+        finally:
+            data.close()
+    return ranges
+
+
 def _make_relative(reference_file, path_root, paths):
     """Return a list where any path in ``paths`` that starts with
     ``path_root`` is made relative to the directory in which the
@@ -406,7 +607,9 @@ def _set_elf_rpaths(target, rpaths):
     """Replace the original RPATH of the target with the paths passed
     as arguments.
 
-    This function uses ``patchelf`` to set RPATHs.
+    The RPATH is rewritten in place when the new value fits in the space
+    of the old one, which is always the case when relocating to a shorter
+    or equally long prefix. Otherwise ``patchelf`` is used to set RPATHs.
 
     Args:
         target: target executable. Must be an ELF object.
@@ -414,11 +617,17 @@ def _set_elf_rpaths(target, rpaths):
 
     Returns:
         A string concatenating the stdout and stderr of the call
-        to ``patchelf``
+        to ``patchelf``, empty if the RPATH was rewritten in place
     """
     # Join the paths using ':' as a separator
     rpaths_str = ':'.join(rpaths)
 
+    try:
+        if _set_elf_rpaths_in_place(target, rpaths_str):
+            return ''
+    except (IOError, OSError, ElfParsingError, struct.error):
+        pass
+
     # If we're relocating patchelf itself, make a copy and use it
     bak_path = None
     if target.endswith("/bin/patchelf"):
@@ -465,23 +674,264 @@ def needs_text_relocation(m_type, m_subtype):
     return m_type == 'text'
 
 
+class PrefixRelocator(object):
+    """Replace old install prefixes by new ones in files, scanning each file
+    only once, whatever the number of prefixes.
+
+    All the old prefixes are matched together by a single expression, in
+    which longer prefixes come first, so that a file is scanned in a single
+    pass of the regular expression engine and each occurrence is replaced by
+    the new prefix of the longest old prefix matching there. Files are
+    memory mapped and only written if they contain an old prefix.
+
+    In text files, prefixes are only replaced at the beginning of a path,
+    that is when the word they are attached to is not preceded by ``/``.
+    In binaries, the new prefixes are padded with ``os.sep`` to keep the
+    length of the strings, and cannot be longer than the old ones.
+    """
+
+    #: Characters of the words attached to a prefix
+    _word = re.compile(b'[\\w\\-_]')
+
+    #: Rest of a path after a prefix
+    _path_tail = re.compile(b'[\\w\\-_/]*')
+
+    def __init__(self, prefixes, binary=False):
+        """
+        Args:
+            prefixes (dict): new prefixes keyed by the old prefixes, as
+                str or bytes
+            binary (bool): whether to relocate binaries or text files
+        """
+        self.binary = binary
+        self.prefixes = OrderedDict()
+        for orig_prefix, new_prefix in prefixes.items():
+            if orig_prefix != new_prefix and new_prefix is not None:
+                self.prefixes[_as_bytes(orig_prefix)] = _as_bytes(new_prefix)
+        self.regex = None
+        if self.prefixes:
+            ordered = sorted(self.prefixes, key=len, reverse=True)
+            self.regex = re.compile(b'|'.join(re.escape(p) for p in ordered))
+
+    def _at_path_start(self, data, start):
+        while start > 0 and self._word.match(data[start - 1:start]):
+            start -= 1
+        return start == 0 or data[start - 1:start] != b'/'
+
+    def _matches(self, data, offsets):
+        """Yield the matches of the old prefixes in ``data`` that begin at
+        or after the position sent to the generator, searching the whole
+        data, or only the candidate ``offsets`` if they are given."""
+        pos = 0
+        candidates = iter(offsets) if offsets is not None else None
+        while True:
+            if candidates is None:
+                match = self.regex.search(data, pos)
+            else:
+                match = None
+                for offset in candidates:
+                    if offset >= pos:
+                        match = self.regex.match(data, offset)
+                        if match:
+                            break
+            if not match:
+                return
+            pos = yield match
+
+    def replacements(self, data, offsets=None):
+        """Return the ``(start, end, new bytes)`` replacements of the old
+        prefixes in ``data``.
+
+        Args:
+            data (bytes): content of the file
+            offsets (list): sorted offsets at which old prefixes may begin,
+                the whole data is searched if not given
+
+        Raises:
+            BinaryTextReplaceError: when a new prefix is longer than an old
+                prefix found in a binary
+        """
+        result = []
+        if self.regex is None:
+            return result
+
+        matches = self._matches(data, offsets)
+        match = next(matches, None)
+        while match:
+            start, end = match.span()
+            orig_bytes = match.group()
+            new_bytes = self.prefixes[orig_bytes]
+            if self.binary:
+                if len(new_bytes) > len(orig_bytes):
+                    raise BinaryTextReplaceError(orig_bytes, new_bytes)
+                padding = os.sep.encode('utf-8') * (
+                    len(orig_bytes) - len(new_bytes))
+                result.append((start, end, new_bytes + padding))
+                pos = end
+            elif self._at_path_start(data, start):
+                result.append((start, end, new_bytes))
+                # the rest of the path is not relocated
+                pos = self._path_tail.match(data, end).end()
+            else:
+                pos = start + 1
+            try:
+                match = matches.send(pos)
+            except StopIteration:
+                match = None
+        return result
+
+    def relocate(self, filename, offsets=None, size=None):
+        """Replace the old prefixes in a file.
+
+        Args:
+            filename (str): file to relocate
+            offsets (list): sorted offsets at which old prefixes may begin
+                in the file, as returned by ``prefix_offsets()``, so that
+                the rest of the file is not searched
+            size (int): size of the file when the offsets were recorded,
+                the whole file is searched if it changed since then
+
+        Return:
+            (bool): whether the file contained old prefixes
+        """
+        if self.regex is None:
+            return False
+        if offsets == [] and size == os.path.getsize(filename):
+            return False
+
+        access = mmap.ACCESS_WRITE if self.binary else mmap.ACCESS_READ
+        with open(filename, 'rb+') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=access)
+            except ValueError:
+                # empty files cannot be mapped
+                return False
+            try:
+                if size is not None and size != len(data):
+                    offsets = None
+                replacements = self.replacements(data, offsets)
+                if self.binary:
+                    # binaries keep their size, and are modified in place
+                    for start, end, new_bytes in replacements:
+                        data[start:end] = new_bytes
+                    content = None
+                else:
+                    pieces, pos = [], 0
+                    for start, end, new_bytes in replacements:
+                        pieces.extend((data[pos:start], new_bytes))
+                        pos = end
+                    pieces.append(data[pos:])
+                    content = b''.join(pieces)
+            finally:
+                data.close()
+
+            if replacements and content is not None:
+                f.seek(0)
+                f.write(content)
+                f.truncate()
+        return bool(replacements)
+
+
+def prefix_offsets(filename, prefixes):
+    """Return the offsets at which any of the prefixes begins in a file,
+    to relocate it later with ``PrefixRelocator.relocate()`` without
+    searching the whole file.
+
+    Args:
+        filename (str): file to search
+        prefixes (list): prefixes to search for, as str or bytes
+
+    Return:
+        (list): the sorted offsets
+    """
+    prefixes = sorted(set(_as_bytes(p) for p in prefixes), key=len, reverse=True)
+    if not prefixes:
+        return []
+    regex = re.compile(b'|'.join(re.escape(p) for p in prefixes))
+
+    offsets = []
+    with open(filename, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return offsets
+        try:
+            match = regex.search(data)
+            while match:
+                offsets.append(match.start())
+                match = regex.search(data, match.start() + 1)
+            match = None
+        finally:
+            data.close()
+    return offsets
+
+
+def _as_bytes(prefix):
+    return prefix if isinstance(prefix, bytes) else prefix.encode('utf-8')
+
+
+def _relocate_file(args):
+    # Errors of relocation are returned rather than raised, as they are sent
+    # back from worker processes, and their arguments do not survive pickling
+    relocator, filename, offsets = args
+    try:
+        relocator.relocate(filename, *(offsets or (None, None)))
+    except BinaryTextReplaceError as e:
+        return e.old_path, e.new_path
+
+
+def _relocate_files(files, relocator, concurrency=None, offsets=None):
+    """Relocate files with a ``PrefixRelocator``, in parallel.
+
+    ``offsets`` maps files to the ``(offsets, size)`` arguments of
+    ``PrefixRelocator.relocate()``.
+
+    Files are relocated by a pool of processes, since the regular expression
+    engine holds the GIL, unless Spack runs on macOS or this is not the main
+    thread, where forking is unsafe, in which case a pool of threads is used.
+
+    Raises:
+        BinaryTextReplaceError: when a new prefix is longer than an old
+            prefix found in a binary
+    """
+    files = list(files)
+    if relocator.regex is None or not files:
+        return
+
+    concurrency = min(concurrency or spack.util.cpus.cpus_available(),
+                      len(files))
+    offsets = offsets or {}
+    args = [(relocator, filename, offsets.get(filename)) for filename in files]
+    if concurrency <= 1:
+        errors = [_relocate_file(arg) for arg in args]
+    else:
+        use_processes = (not is_macos and
+                         threading.current_thread().name == 'MainThread')
+        pool_class = (multiprocessing.Pool if use_processes
+                      else multiprocessing.pool.ThreadPool)
+        pool = pool_class(processes=concurrency)
+        try:
+            errors = pool.map(_relocate_file, args)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    for filename, error in zip(files, errors):
+        if error:
+            tty.debug('Binary failing to relocate is %s' % filename)
+            raise BinaryTextReplaceError(*error)
+
+
 def _replace_prefix_text(filename, compiled_prefixes):
-    """Replace all the occurrences of the old install prefix with a
-    new install prefix in text files that are utf-8 encoded.
+    """Replace all the occurrences of the old install prefixes with the
+    new install prefixes in a text file that is utf-8 encoded.
 
     Args:
         filename (str): target text file (utf-8 encoded)
-        compiled_prefixes (OrderedDict): OrderedDictionary where the keys are
-        precompiled regex of the old prefixes and the values are the new
-        prefixes (uft-8 encoded)
+        compiled_prefixes (OrderedDict): new prefixes keyed by the old
+            prefixes
     """
-    with open(filename, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        for orig_prefix_rexp, new_bytes in compiled_prefixes.items():
-            data = orig_prefix_rexp.sub(new_bytes, data)
-        f.write(data)
-        f.truncate()
+    PrefixRelocator(compiled_prefixes).relocate(filename)
 
 
 def _replace_prefix_bin(filename, byte_prefixes):
@@ -493,36 +943,9 @@ def _replace_prefix_bin(filename, byte_prefixes):
 
     Args:
         filename (str): target binary file
-        byte_prefixes (OrderedDict): OrderedDictionary where the keys are
-        precompiled regex of the old prefixes and the values are the new
-        prefixes (uft-8 encoded)
+        byte_prefixes (OrderedDict): new prefixes keyed by the old prefixes
     """
-
-    with open(filename, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        for orig_bytes, new_bytes in byte_prefixes.items():
-            original_data_len = len(data)
-            # Skip this hassle if not found
-            if orig_bytes not in data:
-                continue
-            # We only care about this problem if we are about to replace
-            length_compatible = len(new_bytes) <= len(orig_bytes)
-            if not length_compatible:
-                tty.debug('Binary failing to relocate is %s' % filename)
-                raise BinaryTextReplaceError(orig_bytes, new_bytes)
-            pad_length = len(orig_bytes) - len(new_bytes)
-            padding = os.sep * pad_length
-            padding = padding.encode('utf-8')
-            data = data.replace(orig_bytes, new_bytes + padding)
-            # Really needs to be the same length
-            if not len(data) == original_data_len:
-                print('Length of pad:', pad_length, 'should be', len(padding))
-                print(new_bytes, 'was to replace', orig_bytes)
-                raise BinaryStringReplacementError(
-                    filename, original_data_len, len(data))
-        f.write(data)
-        f.truncate()
+    PrefixRelocator(byte_prefixes, binary=True).relocate(filename)
 
 
 def relocate_macho_binaries(path_names, old_layout_root, new_layout_root,
@@ -791,7 +1214,7 @@ def relocate_links(links, orig_layout_root,
             tty.warn(msg.format(link_target, abs_link, new_install_prefix))
 
 
-def relocate_text(files, prefixes, concurrency=32):
+def relocate_text(files, prefixes, concurrency=None, offsets=None):
     """Relocate text file from the original installation prefix to the
      new prefix.
 
@@ -800,39 +1223,20 @@ def relocate_text(files, prefixes, concurrency=32):
      Args:
          files (list): Text files to be relocated
          prefixes (OrderedDict): String prefixes which need to be changed
-         concurrency (int): Preferred degree of parallelism
+         concurrency (int): Preferred degree of parallelism (default: the
+            number of cpus available)
+         offsets (dict): maps files to the offsets of the old prefixes in
+            them and to their size, as recorded with ``prefix_offsets()``
     """
 
     # This now needs to be handled by the caller in all cases
     # orig_sbang = '#!/bin/bash {0}/bin/sbang'.format(orig_spack)
     # new_sbang = '#!/bin/bash {0}/bin/sbang'.format(new_spack)
 
-    compiled_prefixes = OrderedDict({})
-
-    for orig_prefix, new_prefix in prefixes.items():
-        if orig_prefix != new_prefix:
-            orig_bytes = orig_prefix.encode('utf-8')
-            orig_prefix_rexp = re.compile(
-                b'(?<![\\w\\-_/])([\\w\\-_]*?)%s([\\w\\-_/]*)' % orig_bytes)
-            new_bytes = b'\\1%s\\2' % new_prefix.encode('utf-8')
-            compiled_prefixes[orig_prefix_rexp] = new_bytes
+    _relocate_files(files, PrefixRelocator(prefixes), concurrency, offsets)
 
-    # Do relocations on text that refers to the install tree
-    # multiprocesing.ThreadPool.map requires single argument
 
-    args = []
-    for filename in files:
-        args.append((filename, compiled_prefixes))
-
-    tp = multiprocessing.pool.ThreadPool(processes=concurrency)
-    try:
-        tp.map(llnl.util.lang.star(_replace_prefix_text), args)
-    finally:
-        tp.terminate()
-        tp.join()
-
-
-def relocate_text_bin(binaries, prefixes, concurrency=32):
+def relocate_text_bin(binaries, prefixes, concurrency=None, offsets=None):
     """Replace null terminated path strings hard coded into binaries.
 
     The new install prefix must be shorter than the original one.
@@ -840,39 +1244,16 @@ def relocate_text_bin(binaries, prefixes, concurrency=32):
     Args:
         binaries (list): binaries to be relocated
         prefixes (OrderedDict): String prefixes which need to be changed.
-        concurrency (int): Desired degree of parallelism.
+        concurrency (int): Desired degree of parallelism (default: the
+            number of cpus available)
+        offsets (dict): maps binaries to the offsets of the old prefixes in
+            them and to their size, as recorded with ``prefix_offsets()``
 
     Raises:
       BinaryTextReplaceError: when the new path is longer than the old path
     """
-    byte_prefixes = OrderedDict({})
-
-    for orig_prefix, new_prefix in prefixes.items():
-        if orig_prefix != new_prefix:
-            if isinstance(orig_prefix, bytes):
-                orig_bytes = orig_prefix
-            else:
-                orig_bytes = orig_prefix.encode('utf-8')
-            if isinstance(new_prefix, bytes):
-                new_bytes = new_prefix
-            else:
-                new_bytes = new_prefix.encode('utf-8')
-            byte_prefixes[orig_bytes] = new_bytes
-
-    # Do relocations on text in binaries that refers to the install tree
-    # multiprocesing.ThreadPool.map requires single argument
-    args = []
-
-    for binary in binaries:
-        args.append((binary, byte_prefixes))
-
-    tp = multiprocessing.pool.ThreadPool(processes=concurrency)
-
-    try:
-        tp.map(llnl.util.lang.star(_replace_prefix_bin), args)
-    finally:
-        tp.terminate()
-        tp.join()
+    _relocate_files(
+        binaries, PrefixRelocator(prefixes, binary=True), concurrency, offsets)
 
 
 def is_relocatable(spec):
@@ -4,9 +4,11 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import abc
+import collections
 import contextlib
 import errno
 import functools
+import hashlib
 import inspect
 import itertools
 import os
@@ -34,13 +36,17 @@
 import spack.caches
 import spack.config
 import spack.error
+import spack.package_metadata
 import spack.patch
 import spack.provider_index
 import spack.spec
 import spack.tag
+import spack.util.executable
+import spack.util.file_cache
 import spack.util.imp as simp
 import spack.util.naming as nm
 import spack.util.path
+import spack.util.spack_json as sjson
 
 #: Super-namespace for all packages.
 #: Package modules are imported as spack.pkg.<namespace>.<pkg-name>.
@@ -127,16 +133,58 @@ def __getattr__(self, name):
         return getattr(self, name)
 
 
+#: Fingerprint of a ``package.py`` file: its modification time and size, and
+#: the hash of its content, which tells whether indexes need to be updated
+PackageFingerprint = collections.namedtuple(
+    'PackageFingerprint', ['mtime', 'size', 'content_hash'])
+
+#: Version of the format of the tables of fingerprints of repositories
+_fingerprints_version = 2
+
+
+def _fingerprint_package(pkg_file, previous=None):
+    """Return the fingerprint of a ``package.py`` file, or None if it does not
+    exist. Its content is only hashed if its modification time or size
+    differs from the ``previous`` fingerprint.
+    """
+    # Use stat here to avoid lots of calls to the filesystem.
+    try:
+        sinfo = os.stat(pkg_file)
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            # No package.py file here.
+            return None
+        elif e.errno == errno.EACCES:
+            tty.warn("Can't read package file %s." % pkg_file)
+            return None
+        raise e
+
+    # If it's not a file, skip it.
+    if stat.S_ISDIR(sinfo.st_mode):
+        return None
+
+    if previous and (previous.mtime, previous.size) == (
+            sinfo.st_mtime, sinfo.st_size):
+        return previous
+
+    with open(pkg_file, 'rb') as f:
+        content_hash = hashlib.sha1(f.read()).hexdigest()
+    return PackageFingerprint(sinfo.st_mtime, sinfo.st_size, content_hash)
+
+
 class FastPackageChecker(Mapping):
-    """Cache that maps package names to the stats obtained on the
+    """Cache that maps package names to the fingerprints of the
     'package.py' files associated with them.
 
     For each repository a cache is maintained at class level, and shared among
     all instances referring to it. Update of the global cache is done lazily
     during instance initialization.
+
+    Fingerprints are also persisted in the misc cache, so that only the
+    files whose modification time or size changed since are read again.
     """
     #: Global cache, reused by every instance
-    _paths_cache = {}  # type: Dict[str, Dict[str, os.stat_result]]
+    _paths_cache = {}  # type: Dict[str, Dict[str, PackageFingerprint]]
 
     def __init__(self, packages_path):
         # The path of the repository managed by this instance
@@ -154,59 +202,91 @@ def invalidate(self):
         self._paths_cache[self.packages_path] = self._create_new_cache()
         self._packages_to_stats = self._paths_cache[self.packages_path]
 
-    def _create_new_cache(self):  # type: () -> Dict[str, os.stat_result]
+    @property
+    def _cache_key(self):
+        path_hash = hashlib.sha1(self.packages_path.encode('utf-8'))
+        return 'fingerprints/{0}.json'.format(path_hash.hexdigest())
+
+    def _read_fingerprints(self):
+        """Return the table of fingerprints persisted in the misc cache, or
+        None if there is none for this repository."""
+        misc_cache = spack.caches.misc_cache
+        try:
+            if not misc_cache.init_entry(self._cache_key):
+                return None
+            with misc_cache.read_transaction(self._cache_key) as f:
+                table = sjson.load(f)['fingerprints']
+        except (spack.util.file_cache.CacheError, ValueError, KeyError) as e:
+            tty.debug('Cannot read package fingerprints: {0}'.format(e))
+            return None
+        if table.get('version') != _fingerprints_version or \
+                table.get('packages_path') != self.packages_path:
+            return None
+        table['packages'] = dict(
+            (name, PackageFingerprint(*fingerprint))
+            for name, fingerprint in table['packages'].items())
+        return table
+
+    def _write_fingerprints(self, packages):
+        misc_cache = spack.caches.misc_cache
+        try:
+            misc_cache.init_entry(self._cache_key)
+            with misc_cache.write_transaction(self._cache_key) as (old, new):
+                sjson.dump({'fingerprints': {
+                    'version': _fingerprints_version,
+                    'packages_path': self.packages_path,
+                    'packages': dict(
+                        (name, list(fingerprint))
+                        for name, fingerprint in packages.items()),
+                }}, new)
+        except (spack.util.file_cache.CacheError, OSError, IOError) as e:
+            tty.debug('Cannot write package fingerprints: {0}'.format(e))
+
+    def _fingerprint(self, pkg_name, previous=None):
+        """Fingerprint of the package with the given name, or None if there
+        is no such package in this repository."""
+        # Warn about invalid names that look like packages.
+        if not nm.valid_module_name(pkg_name):
+            if not pkg_name.startswith('.'):
+                pkg_dir = os.path.join(self.packages_path, pkg_name)
+                tty.warn('Skipping package at {0}. "{1}" is not '
+                         'a valid Spack module name.'.format(
+                             pkg_dir, pkg_name))
+            return None
+
+        # Construct the file name from the directory
+        pkg_file = os.path.join(
+            self.packages_path, pkg_name, package_file_name
+        )
+        return _fingerprint_package(pkg_file, previous)
+
+    def _create_new_cache(self):  # type: () -> Dict[str, PackageFingerprint]
         """Create a new cache for packages in a repo.
 
         The implementation here should try to minimize filesystem
-        calls.  At the moment, it is O(number of packages) and makes
-        about one stat call per package.  This is reasonably fast, and
-        avoids actually importing packages in Spack, which is slow.
+        calls.  At the moment, it makes one stat call per package, and
+        only reads the files whose stats changed since their fingerprints
+        were persisted. This is reasonably fast, and avoids actually
+        importing packages in Spack, which is slow.
         """
+        table = self._read_fingerprints()
+        previous = table['packages'] if table else {}
+
         # Create a dictionary that will store the mapping between a
-        # package name and its stat info
-        cache = {}  # type: Dict[str, os.stat_result]
+        # package name and its fingerprint
+        cache = {}  # type: Dict[str, PackageFingerprint]
         for pkg_name in os.listdir(self.packages_path):
-            # Skip non-directories in the package root.
-            pkg_dir = os.path.join(self.packages_path, pkg_name)
-
-            # Warn about invalid names that look like packages.
-            if not nm.valid_module_name(pkg_name):
-                if not pkg_name.startswith('.'):
-                    tty.warn('Skipping package at {0}. "{1}" is not '
-                             'a valid Spack module name.'.format(
-                                 pkg_dir, pkg_name))
-                continue
-
-            # Construct the file name from the directory
-            pkg_file = os.path.join(
-                self.packages_path, pkg_name, package_file_name
-            )
-
-            # Use stat here to avoid lots of calls to the filesystem.
-            try:
-                sinfo = os.stat(pkg_file)
-            except OSError as e:
-                if e.errno == errno.ENOENT:
-                    # No package.py file here.
-                    continue
-                elif e.errno == errno.EACCES:
-                    tty.warn("Can't read package file %s." % pkg_file)
-                    continue
-                raise e
-
-            # If it's not a file, skip it.
-            if stat.S_ISDIR(sinfo.st_mode):
-                continue
-
-            # If it is a file, then save the stats under the
-            # appropriate key
-            cache[pkg_name] = sinfo
+            fingerprint = self._fingerprint(pkg_name, previous.get(pkg_name))
+            if fingerprint:
+                cache[pkg_name] = fingerprint
 
+        if cache != previous:
+            self._write_fingerprints(cache)
         return cache
 
     def last_mtime(self):
         return max(
-            sinfo.st_mtime for sinfo in self._packages_to_stats.values())
+            fingerprint.mtime for fingerprint in self._packages_to_stats.values())
 
     def __getitem__(self, item):
         return self._packages_to_stats[item]
@@ -253,11 +333,32 @@ def read(self, stream):
     def update(self, pkg_fullname):
         """Update the index in memory with information about a package."""
 
+    def remove(self, pkg_fullname):
+        """Remove a package that does not exist anymore from the index."""
+
     @abc.abstractmethod
     def write(self, stream):
         """Write the index to a file object."""
 
 
+class MetadataIndexer(Indexer):
+    """Lifecycle methods for the static metadata of packages."""
+    def _create(self):
+        return spack.package_metadata.MetadataIndex()
+
+    def read(self, stream):
+        self.index = spack.package_metadata.MetadataIndex.from_json(stream)
+
+    def update(self, pkg_fullname):
+        self.index.update_package(pkg_fullname)
+
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname)
+
+    def write(self, stream):
+        self.index.to_json(stream)
+
+
 class TagIndexer(Indexer):
     """Lifecycle methods for a TagIndex on a Repo."""
     def _create(self):
@@ -269,6 +370,9 @@ def read(self, stream):
     def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname)
+
     def write(self, stream):
         self.index.to_json(stream)
 
@@ -288,6 +392,9 @@ def update(self, pkg_fullname):
         self.index.remove_provider(pkg_fullname)
         self.index.update(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_provider(pkg_fullname)
+
     def write(self, stream):
         self.index.to_json(stream)
 
@@ -313,13 +420,18 @@ def write(self, stream):
     def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname)
+
 
 class RepoIndex(object):
     """Container class that manages a set of Indexers for a Repo.
 
     This class is responsible for checking packages in a repository for
     updates (using ``FastPackageChecker``) and for regenerating indexes
-    when they're needed.
+    when they're needed. Each index is stored along with the hashes of the
+    package files it was generated from, so that only the packages whose
+    files changed since are updated.
 
     ``Indexers`` should be added to the ``RepoIndex`` using
     ``add_index(name, indexer)``, and they should support the interface
@@ -334,7 +446,7 @@ def __init__(self, package_checker, namespace):
         self.packages_path = self.checker.packages_path
         self.namespace = namespace
 
-        self.indexers = {}
+        self.indexers = collections.OrderedDict()
         self.indexes = {}
 
     def add_indexer(self, name, indexer):
@@ -346,6 +458,8 @@ def add_indexer(self, name, indexer):
             indexer (object): an object that supports create(), read(),
                 write(), and get_index() operations
 
+        Indexes are built in the order their indexers were added, so an
+        indexer can use the indexes added before it.
         """
         self.indexers[name] = indexer
 
@@ -378,33 +492,58 @@ def _build_index(self, name, indexer):
 
         # Filename of the provider index cache (we assume they're all json)
         cache_filename = '{0}/{1}-index.json'.format(name, self.namespace)
+        hashes_filename = '{0}/{1}-hashes.json'.format(name, self.namespace)
 
         # Compute which packages needs to be updated in the cache
         misc_cache = spack.caches.misc_cache
-        index_mtime = misc_cache.mtime(cache_filename)
-
-        needs_update = [
-            x for x, sinfo in self.checker.items()
-            if sinfo.st_mtime > index_mtime
-        ]
-
         index_existed = misc_cache.init_entry(cache_filename)
-        if index_existed and not needs_update:
+        indexed_hashes = None
+        if index_existed and misc_cache.init_entry(hashes_filename):
+            with misc_cache.read_transaction(hashes_filename) as f:
+                indexed_hashes = sjson.load(f)
+
+        if indexed_hashes is not None:
+            needs_update = [
+                x for x, fingerprint in self.checker.items()
+                if indexed_hashes.get(x) != fingerprint.content_hash
+            ]
+            removed = [x for x in indexed_hashes if x not in self.checker]
+        else:
+            # Indexes written without hashes are updated based on the
+            # modification times of package files
+            index_mtime = misc_cache.mtime(cache_filename)
+            needs_update = [
+                x for x, fingerprint in self.checker.items()
+                if fingerprint.mtime > index_mtime
+            ]
+            removed = []
+
+        if index_existed and not needs_update and not removed:
             # If the index exists and doesn't need an update, read it
             with misc_cache.read_transaction(cache_filename) as f:
                 indexer.read(f)
+            if indexed_hashes is not None:
+                return indexer.index
 
         else:
             # Otherwise update it and rewrite the cache file
             with misc_cache.write_transaction(cache_filename) as (old, new):
                 indexer.read(old) if old else indexer.create()
 
+                for pkg_name in removed:
+                    indexer.remove('%s.%s' % (self.namespace, pkg_name))
+
                 for pkg_name in needs_update:
                     namespaced_name = '%s.%s' % (self.namespace, pkg_name)
                     indexer.update(namespaced_name)
 
                 indexer.write(new)
 
+        with misc_cache.write_transaction(hashes_filename) as (old, new):
+            sjson.dump(dict(
+                (x, fingerprint.content_hash)
+                for x, fingerprint in self.checker.items()), new)
+
         return indexer.index
 
 
@@ -646,6 +785,11 @@ def get_pkg_class(self, pkg_name):
         """Find a class for the spec's package and return the class object."""
         return self.repo_for_pkg(pkg_name).get_pkg_class(pkg_name)
 
+    def get_pkg_metadata(self, pkg_name):
+        """Find the metadata of a package, without importing it if
+        possible."""
+        return self.repo_for_pkg(pkg_name).get_pkg_metadata(pkg_name)
+
     @autospec
     def dump_provenance(self, spec, path):
         """Dump provenance information for a spec to a particular path.
@@ -681,7 +825,7 @@ def is_virtual(self, pkg_name, use_index=True):
             return have_name and pkg_name in self.provider_index
         else:
             return have_name and (not self.exists(pkg_name) or
-                                  self.get_pkg_class(pkg_name).virtual)
+                                  self.get_pkg_metadata(pkg_name).virtual)
 
     def __contains__(self, pkg_name):
         return self.exists(pkg_name)
@@ -744,6 +888,7 @@ def check(condition, msg):
         # These are internal cache variables.
         self._modules = {}
         self._classes = {}
+        self._pkg_metadata = {}
         self._instances = {}
 
         # Maps that goes from package name to corresponding file stat
@@ -942,6 +1087,8 @@ def index(self):
         """Construct the index for this repo lazily."""
         if self._repo_index is None:
             self._repo_index = RepoIndex(self._pkg_checker, self.namespace)
+            # Other indexes are built from the metadata of packages
+            self._repo_index.add_indexer('metadata', MetadataIndexer())
             self._repo_index.add_indexer('providers', ProviderIndexer())
             self._repo_index.add_indexer('tags', TagIndexer())
             self._repo_index.add_indexer('patches', PatchIndexer())
@@ -1112,6 +1259,35 @@ def get_pkg_class(self, pkg_name):
 
         return cls
 
+    def get_pkg_metadata(self, pkg_name):
+        """Get the metadata of a package, without importing its module
+        unless it cannot be read statically.
+
+        Returns:
+            spack.package_metadata.PackageMetadata: metadata of the package
+        """
+        namespace, _, pkg_name = pkg_name.rpartition('.')
+        if namespace and (namespace != self.namespace):
+            raise InvalidNamespaceError('Invalid namespace for %s repo: %s'
+                                        % (self.namespace, namespace))
+
+        if pkg_name not in self._pkg_metadata:
+            if not self.exists(pkg_name):
+                raise UnknownPackageError(pkg_name, self)
+
+            metadata_index = self.index['metadata']
+            if pkg_name in metadata_index:
+                data = metadata_index[pkg_name]
+            else:
+                data = spack.package_metadata.read_package_file(
+                    self.filename_for_package_name(pkg_name), pkg_name)
+
+            fullname = '%s.%s' % (self.namespace, pkg_name)
+            self._pkg_metadata[pkg_name] = \
+                spack.package_metadata.PackageMetadata(fullname, data)
+
+        return self._pkg_metadata[pkg_name]
+
     def __str__(self):
         return "[Repo '%s' at '%s']" % (self.namespace, self.root)
 
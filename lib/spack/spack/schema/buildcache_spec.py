@@ -37,5 +37,12 @@
                 'hash': {'type': 'string'},
             },
         },
+        'binary_cache_format': {
+            'type': 'object',
+            'properties': {
+                'version': {'type': 'integer'},
+                'compression': {'type': 'string'},
+            },
+        },
     },
 }
@@ -85,12 +85,33 @@
             'dirty': {'type': 'boolean'},
             'build_language': {'type': 'string'},
             'build_jobs': {'type': 'integer', 'minimum': 1},
+            'concurrent_packages': {'type': 'integer', 'minimum': 1},
+            'jobserver': {'type': 'boolean'},
+            'binary_prefetch': {'type': 'integer', 'minimum': 0},
+            'binary_compression': {
+                'type': 'string',
+                'enum': ['gzip', 'zstd']
+            },
             'ccache': {'type': 'boolean'},
             'concretizer': {
                 'type': 'string',
                 'enum': ['original', 'clingo']
             },
+            'concretization_cache': {
+                'type': 'object',
+                'additionalProperties': False,
+                'properties': {
+                    'enable': {'type': 'boolean'},
+                    'max_entries': {'type': 'integer', 'minimum': 0},
+                    'max_size': {'type': 'integer', 'minimum': 0},
+                    'package_facts': {'type': 'boolean'},
+                },
+            },
             'db_lock_timeout': {'type': 'integer', 'minimum': 1},
+            'db_backend': {
+                'type': 'string',
+                'enum': ['json', 'sqlite']
+            },
             'package_lock_timeout': {
                 'anyOf': [
                     {'type': 'integer', 'minimum': 1},
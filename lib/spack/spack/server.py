@@ -0,0 +1,496 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Run Spack commands in a persistent server process.
+
+Every ``spack`` command starts a new Python process, which reads the
+configuration, the repository indexes and the database before doing any
+work. ``spack server start`` runs a daemon that loads all of this once and
+listens on a UNIX socket. When it runs, ``bin/spack`` sends its arguments,
+working directory, environment and standard streams to the daemon instead
+of running the command itself. The daemon forks a worker for each command,
+so commands start from its warm state without changing it.
+
+The daemon compares the modification times of configuration files, package
+directories and Spack's own modules before each command, and restarts
+itself when they change. The thousands of package files are only compared
+every ``package_check_interval`` seconds. Commands it cannot run from its
+state, such as commands of clients running another Python, and all commands
+while it restarts, fall back to a new process.
+
+This module is imported by ``bin/spack`` for every command, so the client
+side only uses the standard library.
+"""
+from __future__ import print_function
+
+import array
+import errno
+import hashlib
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+import types
+
+#: Directory of the sockets of servers, one per Spack prefix
+socket_dir = os.path.join('~', '.spack', 'server')
+
+#: Environment variables that are read for every command, and can differ
+#: between the server and its clients. Other variables starting with
+#: ``SPACK_`` may change the state of the server, and must be the same.
+command_variables = (
+    'SPACK_COLOR', 'SPACK_DYLD_FALLBACK_LIBRARY_PATH',
+    'SPACK_DYLD_LIBRARY_PATH', 'SPACK_ENV', 'SPACK_LAZY_IMPORTS',
+    'SPACK_LD_LIBRARY_PATH', 'SPACK_SERVER', 'SPACK_STACKTRACE',
+)
+
+#: Seconds between two checks of the package files of repositories, which
+#: are too many to stat before every command. Packages added or removed,
+#: and all the other watched files, are checked before every command.
+package_check_interval = 10.0
+
+#: Signals that clients forward to the worker running their command
+forwarded_signals = ('SIGHUP', 'SIGINT', 'SIGQUIT', 'SIGTERM')
+
+_header = struct.Struct('!I')
+
+
+def supported():
+    """Whether this Python can pass file descriptors over UNIX sockets."""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket.socket, 'sendmsg')
+
+
+def _python():
+    """Interpreter of this process, which clients and the server compare."""
+    return {'executable': sys.executable, 'version': list(sys.version_info)}
+
+
+def socket_path(prefix):
+    """Path of the socket of the server for a Spack prefix.
+
+    Args:
+        prefix (str): root of the Spack installation
+    """
+    digest = hashlib.sha1(os.path.realpath(prefix).encode('utf-8'))
+    return os.path.join(
+        os.path.expanduser(socket_dir), digest.hexdigest()[:16] + '.sock')
+
+
+def _send(sock, message, fds=()):
+    """Send a JSON message, and optionally some file descriptors."""
+    data = json.dumps(message).encode('utf-8')
+    header = _header.pack(len(data))
+    if fds:
+        rights = array.array('i', fds)
+        sock.sendmsg(
+            [header], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, rights)])
+    else:
+        sock.sendall(header)
+    sock.sendall(data)
+
+
+def _receive_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('connection closed')
+        data += chunk
+    return data
+
+
+def _receive(sock, nfds=0):
+    """Receive a JSON message sent by ``_send()``, and the file descriptors
+    sent with it.
+
+    Returns:
+        A tuple of the message and the list of file descriptors
+    """
+    fds = array.array('i')
+    header = b''
+    if nfds:
+        space = socket.CMSG_SPACE(nfds * fds.itemsize)
+        header, ancillary, _, _ = sock.recvmsg(_header.size, space)
+        for level, kind, data in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+        if not header:
+            raise EOFError('connection closed')
+
+    header += _receive_exactly(sock, _header.size - len(header))
+    size, = _header.unpack(header)
+    message = json.loads(_receive_exactly(sock, size).decode('utf-8'))
+    return message, list(fds)
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def request(path, message):
+    """Send a request that is not a command to a server, and return its
+    reply.
+
+    Raises:
+        socket.error: if no server listens on the socket
+    """
+    sock = _connect(path)
+    try:
+        _send(sock, message)
+        reply, _ = _receive(sock)
+        return reply
+    finally:
+        sock.close()
+
+
+def forward(argv, prefix):
+    """Run a command in the server of a Spack prefix, if it runs.
+
+    The command uses the standard streams, working directory and environment
+    of this process, and the signals this process receives are sent to it.
+
+    Args:
+        argv (list): arguments of the ``spack`` command
+        prefix (str): root of the Spack installation
+
+    Returns:
+        The exit code of the command, or None if it has to run in this
+        process instead.
+    """
+    if not supported() or os.environ.get('SPACK_SERVER') == '0':
+        return None
+
+    path = socket_path(prefix)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        sock = _connect(path)
+    except socket.error:
+        return None
+
+    with sock:
+        try:
+            message = {
+                'command': 'run',
+                'argv': list(argv),
+                'cwd': os.getcwd(),
+                'env': dict(os.environ),
+                'python': _python(),
+            }
+            _send(sock, message, fds=[0, 1, 2])
+            reply, _ = _receive(sock)
+            pid = reply['pid']
+        except (EOFError, KeyError, OSError, ValueError, socket.error):
+            # The command did not start: run it here instead
+            return None
+
+        def forward_signal(signum, frame):
+            os.kill(pid, signum)
+
+        handlers = {}
+        for name in forwarded_signals:
+            signum = getattr(signal, name)
+            handlers[signum] = signal.signal(signum, forward_signal)
+
+        try:
+            reply, _ = _receive(sock)
+            return reply['exit']
+        except (EOFError, KeyError, OSError, ValueError, socket.error):
+            # The command started, so it must not run twice
+            print('==> Error: the Spack server stopped during the command',
+                  file=sys.stderr)
+            return 1
+        finally:
+            for signum, handler in handlers.items():
+                if handler is not None:
+                    signal.signal(signum, handler)
+
+
+class Server(object):
+    """Server that runs Spack commands from a warm state.
+
+    Args:
+        path (str): path of the UNIX socket to listen on
+        timeout (float or None): stop after this many seconds without
+            commands, or never if None
+    """
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.started = time.time()
+        self.requests = 0
+
+        #: Whether the server stopped because its state is outdated
+        self.outdated = False
+
+        self._last_request = self.started
+        self._mtimes = {}
+        self._package_mtimes = {}
+        self._packages_checked = self.started
+        self._workers = set()
+        self._socket = None
+        self._stopped = False
+
+    def warm(self):
+        """Load the modules of all commands, the configuration, the indexes
+        of package repositories and the database."""
+        import llnl.util.tty as tty
+
+        import spack.cmd
+        import spack.config
+        import spack.repo
+        import spack.store
+
+        for name in spack.cmd.all_commands():
+            try:
+                spack.cmd.get_module(name)
+            except Exception as e:
+                # The command fails in its worker, if it is ever run
+                tty.debug('Cannot load command {0}: {1}'.format(name, e))
+
+        for section in spack.config.section_schemas:
+            spack.config.get(section)
+
+        spack.repo.path.provider_index
+        spack.repo.path.tag_index
+        spack.repo.path.patch_index
+
+        with spack.store.db.read_transaction():
+            pass
+
+        self._mtimes = self._current_mtimes()
+        self._package_mtimes = self._current_mtimes(self._package_files())
+        self._packages_checked = time.time()
+
+    def _watched_files(self):
+        """Files whose changes invalidate the state of the server."""
+        import spack.config
+        import spack.repo
+
+        for module in list(sys.modules.values()):
+            # Lazy modules, like the aliases of ``py``, import on any access
+            if type(module) is not types.ModuleType:
+                continue
+            filename = getattr(module, '__file__', None)
+            if filename:
+                yield filename
+
+        for scope in spack.config.config.scopes.values():
+            if isinstance(scope, spack.config.InternalConfigScope):
+                continue
+            elif isinstance(scope, spack.config.SingleFileScope):
+                yield scope.path
+            elif isinstance(scope, spack.config.ConfigScope):
+                for section in spack.config.section_schemas:
+                    yield scope.get_section_filename(section)
+
+        for repo in spack.repo.path.repos:
+            yield repo.config_file
+            yield repo.packages_path
+
+    def _package_files(self):
+        """Package files of the repositories, which are checked at most every
+        ``package_check_interval`` seconds."""
+        import spack.repo
+
+        for repo in spack.repo.path.repos:
+            for name in repo.all_package_names():
+                yield os.path.join(
+                    repo.packages_path, name, spack.repo.package_file_name)
+
+    def _current_mtimes(self, filenames=None):
+        mtimes = {}
+        if filenames is None:
+            filenames = self._watched_files()
+        for filename in filenames:
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime
+            except OSError:
+                mtimes[filename] = None
+        return mtimes
+
+    def _packages_changed(self):
+        """Whether package files changed, if they were last checked more
+        than ``package_check_interval`` seconds ago."""
+        now = time.time()
+        if now - self._packages_checked < package_check_interval:
+            return False
+        self._packages_checked = now
+        package_files = self._package_files()
+        return self._current_mtimes(package_files) != self._package_mtimes
+
+    def _refuse(self, message):
+        """Reason for not running a command from the current state, if any.
+        """
+        import spack.main
+
+        if self._current_mtimes() != self._mtimes or self._packages_changed():
+            self.outdated = True
+            return 'files changed'
+
+        if message.get('python') != _python():
+            return 'Python changed'
+
+        env = message['env']
+        for name in set(env) | set(os.environ):
+            if name == 'HOME' or (name.startswith('SPACK_') and
+                                  name not in command_variables):
+                if env.get(name) != os.environ.get(name):
+                    return '{0} changed'.format(name)
+
+        # Command line scopes are only read with the configuration
+        parser = spack.main.make_argument_parser()
+        parser.add_argument('command', nargs='*')
+        try:
+            args, _ = parser.parse_known_args(message['argv'])
+        except SystemExit:
+            return None
+        if args.config_scopes:
+            return 'command line scopes'
+        return None
+
+    def serve(self):
+        """Serve commands until the server is stopped, times out, or its
+        state is outdated."""
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent, 0o700)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            old_umask = os.umask(0o177)
+            try:
+                self._socket.bind(self.path)
+            finally:
+                os.umask(old_umask)
+            self._socket.listen(16)
+
+            while not self._stopped and not self.outdated:
+                readable, _, _ = select.select([self._socket], [], [], 1.0)
+                self._reap()
+                if readable:
+                    connection, _ = self._socket.accept()
+                    with connection:
+                        self._handle(connection)
+                elif self.timeout is not None and not self._workers and \
+                        time.time() - self._last_request > self.timeout:
+                    break
+        finally:
+            self._socket.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def stop(self):
+        """Stop serving after the current request."""
+        self._stopped = True
+
+    def _reap(self):
+        for pid in list(self._workers):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                done = pid
+            if done:
+                self._workers.discard(pid)
+
+    def _handle(self, connection):
+        try:
+            message, fds = _receive(connection, nfds=3)
+        except (EOFError, ValueError, socket.error):
+            return
+
+        try:
+            command = message.get('command')
+            if command == 'status':
+                _send(connection, {
+                    'pid': os.getpid(),
+                    'uptime': time.time() - self.started,
+                    'requests': self.requests,
+                })
+            elif command == 'stop':
+                self.stop()
+                _send(connection, {'pid': os.getpid()})
+            elif command == 'run':
+                reason = self._refuse(message)
+                if reason:
+                    _send(connection, {'fallback': reason})
+                elif len(fds) == 3:
+                    self.requests += 1
+                    self._last_request = time.time()
+                    self._fork_worker(connection, message, fds)
+        except socket.error:
+            pass
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _fork_worker(self, connection, message, fds):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            self._workers.add(pid)
+            return
+
+        code = 1
+        try:
+            self._socket.close()
+            code = _run_command(connection, message, fds)
+        finally:
+            os._exit(code)
+
+
+def _run_command(connection, message, fds):
+    """Run a command in a worker forked by the server, with the standard
+    streams, working directory and environment of the client."""
+    import io
+
+    import spack.main
+
+    for name in forwarded_signals:
+        signal.signal(getattr(signal, name), signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+    sys.stdin = io.open(0, 'r', closefd=False)
+    sys.stdout = io.open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = io.open(2, 'w', buffering=1, closefd=False)
+
+    os.environ.clear()
+    os.environ.update(message['env'])
+    os.chdir(message['cwd'])
+    spack.main.spack_ld_library_path = os.environ.get('LD_LIBRARY_PATH', '')
+
+    argv = message['argv']
+    sys.argv = [sys.argv[0]] + argv
+    _send(connection, {'pid': os.getpid()})
+
+    try:
+        code = spack.main.main(argv)
+    except SystemExit as e:
+        code = e.code
+    code = code if isinstance(code, int) else 0 if code is None else 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    _send(connection, {'exit': code})
+    return code
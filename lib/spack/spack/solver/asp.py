@@ -43,8 +43,10 @@
 import spack.package_prefs
 import spack.platforms
 import spack.repo
+import spack.solver.cache
 import spack.spec
 import spack.store
+import spack.target
 import spack.util.timer
 import spack.variant
 import spack.version
@@ -491,6 +493,15 @@ def __init__(self, cores=True, asp=None):
         self.out = asp or llnl.util.lang.Devnull()
         self.cores = cores
 
+        # Timer of the phases of the last solve
+        self.timer = None
+
+        # Roots the facts generated are specific to, when solving several
+        # roots separately, or None for facts shared by all of them
+        self.scope = None
+        self.scoped_facts = None
+        self.shared_symbols = None
+
     def title(self, name, char):
         self.out.write('\n')
         self.out.write("%" + (char * 76))
@@ -518,7 +529,15 @@ def fact(self, head, assumption=False):
         """
         symbol = head.symbol() if hasattr(head, 'symbol') else head
 
+        if self.scope is not None:
+            self.out.write("%s.  %% roots %s\n" % (
+                str(symbol), ', '.join(str(i) for i in sorted(self.scope))))
+            self.scoped_facts.setdefault(symbol, set()).update(self.scope)
+            return
+
         self.out.write("%s.\n" % str(symbol))
+        if self.shared_symbols is not None:
+            self.shared_symbols.add(symbol)
 
         atom = self.backend.add_atom(symbol)
 
@@ -535,8 +554,88 @@ def solve(
             timers=False, stats=False, tests=False, reuse=False,
     ):
         timer = spack.util.timer.Timer()
+        self.timer = timer
 
         # Initialize the control object for the solver
+        self._init_control(nmodels)
+
+        # set up the problem -- this generates facts and rules
+        with self.control.backend() as backend:
+            self.backend = backend
+            solver_setup.setup(self, specs, tests=tests, reuse=reuse)
+        timer.phase("setup")
+
+        self._load_program()
+        timer.phase("load")
+
+        # Grounding is the first step in the solve -- it turns our facts
+        # and first-order logic rules into propositional logic.
+        self.control.ground([("base", [])])
+        timer.phase("ground")
+
+        # With a grounded program, we can run the solve.
+        result = self._solve(specs, self.assumptions, timer)
+        timer.phase("build specs")
+
+        if timers:
+            timer.write_tty()
+            print()
+        if stats:
+            print("Statistics:")
+            pprint.pprint(self.control.statistics)
+
+        return result
+
+    def solve_separately(self, solver_setup, specs, tests=False, reuse=False):
+        """Solve for each of ``specs`` on its own, grounding once the facts
+        the solves share.
+
+        The facts specific to some of the roots are implied by a choice
+        atom for each of the roots, and each solve assumes the atom of its
+        root is true and all the other ones are false.
+
+        Arguments:
+            solver_setup (SpackSolverSetup): object generating the facts
+            specs (list): abstract specs to solve, which must not constrain
+                the operating system or target, use compilers that are not
+                configured or depend on concrete specs
+
+        Return:
+            (list): one ``Result`` for each spec. The results of
+            unsatisfiable specs have no cores.
+        """
+        self._init_control(0)
+        self.scoped_facts = {}
+        self.shared_symbols = set()
+
+        with self.control.backend() as backend:
+            self.backend = backend
+            solver_setup.setup(
+                self, specs, tests=tests, reuse=reuse, separately=True)
+
+            roots = [backend.add_atom() for _ in specs]
+            for atom in roots:
+                backend.add_rule([atom], [], choice=True)
+
+            for symbol, scope in self.scoped_facts.items():
+                if symbol in self.shared_symbols:
+                    continue
+                atom = backend.add_atom(symbol)
+                for i in scope:
+                    backend.add_rule([atom], [roots[i]])
+
+        self._load_program()
+        self.control.ground([("base", [])])
+
+        results = []
+        for i, spec in enumerate(specs):
+            assumptions = self.assumptions + [
+                atom if j == i else -atom for j, atom in enumerate(roots)
+            ]
+            results.append(self._solve([spec], assumptions))
+        return results
+
+    def _init_control(self, nmodels):
         self.control = clingo.Control()
         self.control.configuration.solve.models = nmodels
         self.control.configuration.asp.trans_ext = 'all'
@@ -544,14 +643,9 @@ def solve(
         self.control.configuration.configuration = 'tweety'
         self.control.configuration.solve.parallel_mode = '1'
         self.control.configuration.solver.opt_strategy = "usc,one"
-
-        # set up the problem -- this generates facts and rules
         self.assumptions = []
-        with self.control.backend() as backend:
-            self.backend = backend
-            solver_setup.setup(self, specs, tests=tests, reuse=reuse)
-        timer.phase("setup")
 
+    def _load_program(self):
         # read in the main ASP program and display logic -- these are
         # handwritten, not generated, so we load them as resources
         parent_dir = os.path.dirname(__file__)
@@ -573,14 +667,11 @@ def visit(node):
         # Load the file itself
         self.control.load(os.path.join(parent_dir, 'concretize.lp'))
         self.control.load(os.path.join(parent_dir, "display.lp"))
-        timer.phase("load")
 
-        # Grounding is the first step in the solve -- it turns our facts
-        # and first-order logic rules into propositional logic.
-        self.control.ground([("base", [])])
-        timer.phase("ground")
-
-        # With a grounded program, we can run the solve.
+    def _solve(self, specs, assumptions, timer=None):
+        """Solve the grounded program under ``assumptions``, and return the
+        result for ``specs``. The time taken by the solve itself, without
+        building the specs, is recorded as a phase of ``timer``."""
         result = Result(specs)
         models = []  # stable models if things go well
         cores = []   # unsatisfiable cores if they do not
@@ -588,14 +679,15 @@ def visit(node):
         def on_model(model):
             models.append((model.cost, model.symbols(shown=True, terms=True)))
 
-        solve_kwargs = {"assumptions": self.assumptions,
+        solve_kwargs = {"assumptions": assumptions,
                         "on_model": on_model,
                         "on_core": cores.append}
 
         if clingo_cffi:
             solve_kwargs["on_unsat"] = cores.append
         solve_result = self.control.solve(**solve_kwargs)
-        timer.phase("solve")
+        if timer:
+            timer.phase("solve")
 
         # once done, construct the solve result
         result.satisfiable = solve_result.satisfiable
@@ -631,16 +723,58 @@ def stringify(x):
             result.control = self.control
             result.cores.extend(cores)
 
-        if timers:
-            timer.write_tty()
-            print()
-        if stats:
-            print("Statistics:")
-            pprint.pprint(self.control.statistics)
-
         return result
 
 
+class _LocalConditionId(int):
+    """Id of a condition relative to the first condition of a block of
+    cached facts."""
+
+
+class _FactRecorder(object):
+    """Stand-in for ``PyclingoDriver`` recording facts to cache them."""
+
+    def __init__(self):
+        self.facts = []
+
+    def fact(self, head, assumption=False):
+        assert not assumption, "assumptions cannot be cached"
+        self.facts.append(head)
+
+    def newline(self):
+        pass
+
+    def h1(self, name):
+        pass
+
+    def h2(self, name):
+        pass
+
+    def block(self, conditions):
+        """Return the recorded facts in a form that can be cached.
+
+        Arguments:
+            conditions (int): number of conditions created for the facts
+        """
+        def arg(a):
+            if isinstance(a, _LocalConditionId):
+                return {'id': int(a)}
+            elif isinstance(a, (bool, int)):
+                return a
+            return str(a)
+
+        facts = [[f.name, [arg(a) for a in f.args]] for f in self.facts]
+
+        # Whether dependencies are virtual depends on the whole repository
+        virtuals = {}
+        for name, args in facts:
+            if (name in ('condition_requirement', 'imposed_constraint') and
+                    args[1] in ('node', 'virtual_node')):
+                virtuals[args[2]] = args[1] == 'virtual_node'
+
+        return {'conditions': conditions, 'facts': facts, 'virtuals': virtuals}
+
+
 class SpackSolverSetup(object):
     """Class to set up and run a Spack concretization solve."""
 
@@ -663,11 +797,18 @@ def __init__(self):
         # hashes we've already added facts for
         self.seen_hashes = set()
 
+        # roots solved separately, with the versions and variant values
+        # only their own specs declare
+        self.roots = []
+        self.root_declared_versions = {}
+        self.root_variant_values = {}
+
         # id for dummy variables
         self._condition_id_counter = itertools.count()
 
         # Caches to optimize the setup phase of the solver
         self.target_specs_cache = None
+        self.facts_cache = spack.solver.cache.package_facts_cache()
 
     def pkg_version_rules(self, pkg):
         """Output declared versions of a package.
@@ -683,15 +824,33 @@ def key_fn(version):
             # 4. Directives in package.py
             return version.origin, version.idx
 
+        def declare(declared_versions):
+            most_to_least_preferred = sorted(declared_versions, key=key_fn)
+            for weight, declared_version in enumerate(most_to_least_preferred):
+                self.gen.fact(fn.version_declared(
+                    pkg.name, declared_version.version, weight,
+                    version_origin_str[declared_version.origin]
+                ))
+
         pkg = packagize(pkg)
         declared_versions = self.declared_versions[pkg.name]
-        most_to_least_preferred = sorted(declared_versions, key=key_fn)
 
-        for weight, declared_version in enumerate(most_to_least_preferred):
-            self.gen.fact(fn.version_declared(
-                pkg.name, declared_version.version, weight,
-                version_origin_str[declared_version.origin]
-            ))
+        # Versions from the specs of some roots, when solving them separately,
+        # change the weights of all the versions for those roots
+        root_versions = dict(
+            (i, versions[pkg.name])
+            for i, versions in self.root_declared_versions.items()
+            if pkg.name in versions
+        )
+        if not root_versions:
+            declare(declared_versions)
+        else:
+            self.gen.scope = set(range(len(self.roots))) - set(root_versions)
+            declare(declared_versions)
+            for i, versions in sorted(root_versions.items()):
+                self.gen.scope = set([i])
+                declare(declared_versions + versions)
+            self.gen.scope = None
 
         # Declare deprecated versions for this package, if any
         deprecated = self.deprecated_versions[pkg.name]
@@ -810,7 +969,39 @@ def pkg_rules(self, pkg, tests):
         self.pkg_version_rules(pkg)
         self.gen.newline()
 
+        # variants, conflicts, virtuals and dependencies
+        if self.facts_cache:
+            self.cached_directive_rules(pkg, tests)
+        else:
+            self.directive_rules(pkg, tests)
+
+        # default compilers for this package
+        self.package_compiler_defaults(pkg)
+
+        # virtual preferences
+        self.virtual_preferences(
+            pkg.name,
+            lambda v, p, i: self.gen.fact(
+                fn.pkg_provider_preference(pkg.name, v, p, i)
+            )
+        )
+
+    def directive_rules(self, pkg, tests):
+        """Facts from the directives of a package, which only depend on its
+        package.py file and on whether its tests are requested."""
         # variants
+        self.variant_rules(pkg)
+
+        # conflicts
+        self.conflict_rules(pkg)
+
+        # virtuals
+        self.package_provider_rules(pkg)
+
+        # dependencies
+        self.package_dependencies_rules(pkg, tests)
+
+    def variant_rules(self, pkg):
         for name, entry in sorted(pkg.variants.items()):
             variant, when = entry
 
@@ -857,25 +1048,80 @@ def pkg_rules(self, pkg, tests):
 
             self.gen.newline()
 
-        # conflicts
-        self.conflict_rules(pkg)
-
-        # default compilers for this package
-        self.package_compiler_defaults(pkg)
-
-        # virtuals
-        self.package_provider_rules(pkg)
-
-        # dependencies
-        self.package_dependencies_rules(pkg, tests)
+    def cached_directive_rules(self, pkg, tests):
+        """Replay the ``directive_rules`` of a package from the facts cache,
+        generating and caching them first if needed."""
+        tests = tests is True or (
+            not isinstance(tests, bool) and pkg.name in tests)
+        key = self.facts_cache.key(pkg, tests)
+        if key is None:
+            return self.directive_rules(pkg, tests)
+
+        block = self.facts_cache.fetch(pkg.name, key)
+        if block is None:
+            block = self.record_directive_rules(pkg, tests)
+            self.facts_cache.store(pkg.name, key, block)
+
+        # Condition ids in the block are relative to its first condition
+        first_id = None
+        for _ in range(block['conditions']):
+            condition_id = next(self._condition_id_counter)
+            first_id = condition_id if first_id is None else first_id
+
+        def arg(a):
+            return first_id + a['id'] if isinstance(a, dict) else a
+
+        for name, args in block['facts']:
+            self.gen.fact(AspFunction(name, tuple(arg(a) for a in args)))
+        self.gen.newline()
 
-        # virtual preferences
-        self.virtual_preferences(
-            pkg.name,
-            lambda v, p, i: self.gen.fact(
-                fn.pkg_provider_preference(pkg.name, v, p, i)
-            )
-        )
+        self.version_constraints.update(
+            (name, spack.version.VersionList(v))
+            for name, v in block['version_constraints'])
+        self.target_constraints.update(
+            (name, spack.target.Target(t))
+            for name, t in block['target_constraints'])
+        self.compiler_version_constraints.update(
+            (name, spack.spec.CompilerSpec(c))
+            for name, c in block['compiler_version_constraints'])
+        self.variant_values_from_specs.update(
+            tuple(v) for v in block['variant_values_from_specs'])
+
+    def record_directive_rules(self, pkg, tests):
+        """Run ``directive_rules`` for a package, and return the facts and
+        constraints it generates in a form that can be cached."""
+        recorder = _FactRecorder()
+        saved = (self.gen, self._condition_id_counter,
+                 self.version_constraints, self.target_constraints,
+                 self.compiler_version_constraints,
+                 self.variant_values_from_specs)
+
+        self.gen = recorder
+        self._condition_id_counter = (
+            _LocalConditionId(i) for i in itertools.count())
+        self.version_constraints = set()
+        self.target_constraints = set()
+        self.compiler_version_constraints = set()
+        self.variant_values_from_specs = set()
+        try:
+            self.directive_rules(pkg, tests)
+            block = recorder.block(next(self._condition_id_counter))
+            block.update({
+                'version_constraints': sorted(
+                    [n, str(v)] for n, v in self.version_constraints),
+                'target_constraints': sorted(
+                    [n, str(t)] for n, t in self.target_constraints),
+                'compiler_version_constraints': sorted(
+                    [n, str(c)] for n, c in self.compiler_version_constraints),
+                'variant_values_from_specs': [
+                    list(v) for v in self.variant_values_from_specs],
+            })
+        finally:
+            (self.gen, self._condition_id_counter,
+             self.version_constraints, self.target_constraints,
+             self.compiler_version_constraints,
+             self.variant_values_from_specs) = saved
+        return block
 
     def condition(self, required_spec, imposed_spec=None, name=None):
         """Generate facts for a dependency or virtual provider condition.
@@ -1289,17 +1535,22 @@ def key_fn(item):
                 ))
 
         for spec in specs:
-            for dep in spec.traverse():
-                if dep.versions.concrete:
-                    # Concrete versions used in abstract specs from cli. They
-                    # all have idx equal to 0, which is the best possible. In
-                    # any case they will be used due to being set from the cli.
-                    self.declared_versions[dep.name].append(DeclaredVersion(
-                        version=dep.version,
-                        idx=0,
-                        origin=version_provenance.spec
-                    ))
-                    self.possible_versions[dep.name].add(dep.version)
+            self.declare_spec_versions(spec, self.declared_versions)
+
+    def declare_spec_versions(self, spec, declared_versions):
+        """Add the concrete versions used in an abstract spec to
+        ``declared_versions``."""
+        for dep in spec.traverse():
+            if dep.versions.concrete:
+                # Concrete versions used in abstract specs from cli. They
+                # all have idx equal to 0, which is the best possible. In
+                # any case they will be used due to being set from the cli.
+                declared_versions[dep.name].append(DeclaredVersion(
+                    version=dep.version,
+                    idx=0,
+                    origin=version_provenance.spec
+                ))
+                self.possible_versions[dep.name].add(dep.version)
 
     def _supported_targets(self, compiler_name, compiler_version, targets):
         """Get a list of which targets are supported by the compiler.
@@ -1603,6 +1854,12 @@ def define_variant_values(self):
         for pkg, variant, value in sorted(self.variant_values_from_specs):
             self.gen.fact(fn.variant_possible_value(pkg, variant, value))
 
+        for i, values in sorted(self.root_variant_values.items()):
+            self.gen.scope = set([i])
+            for pkg, variant, value in sorted(values):
+                self.gen.fact(fn.variant_possible_value(pkg, variant, value))
+        self.gen.scope = None
+
     def _facts_from_concrete_spec(self, spec, possible):
         # tell the solver about any installed packages that could
         # be dependencies (don't tell it about the others)
@@ -1652,7 +1909,7 @@ def define_installed_packages(self, specs, possible):
             # TODO: (or any mirror really) doesn't have binaries.
             pass
 
-    def setup(self, driver, specs, tests=False, reuse=False):
+    def setup(self, driver, specs, tests=False, reuse=False, separately=False):
         """Generate an ASP program with relevant constraints for specs.
 
         This calls methods on the solve driver to set up the problem with
@@ -1661,6 +1918,9 @@ def setup(self, driver, specs, tests=False, reuse=False):
 
         Arguments:
             specs (list): list of Specs to solve
+            separately (bool): if True, generate the constraints from each
+                spec, and the versions they declare, in the scope of the
+                driver for that spec, to solve for each spec on its own
         """
         self._condition_id_counter = itertools.count()
 
@@ -1671,18 +1931,22 @@ def setup(self, driver, specs, tests=False, reuse=False):
         self.possible_virtuals = set(
             x.name for x in specs if x.virtual
         )
-        possible = spack.package.possible_dependencies(
-            *specs,
-            virtuals=self.possible_virtuals,
-            deptype=spack.dependency.all_deptypes
-        )
+        possible = {}
+        for group in ([[s] for s in specs] if separately else [specs]):
+            group_possible = spack.package.possible_dependencies(
+                *group,
+                virtuals=self.possible_virtuals,
+                deptype=spack.dependency.all_deptypes
+            )
+            possible.update(group_possible)
 
-        # Fail if we already know an unreachable node is requested
-        for spec in specs:
-            missing_deps = [d for d in spec.traverse()
-                            if d.name not in possible and not d.virtual]
-            if missing_deps:
-                raise spack.spec.InvalidDependencyError(spec.name, missing_deps)
+            # Fail if we already know an unreachable node is requested
+            for spec in group:
+                missing_deps = [d for d in spec.traverse()
+                                if d.name not in group_possible and not d.virtual]
+                if missing_deps:
+                    raise spack.spec.InvalidDependencyError(
+                        spec.name, missing_deps)
 
         pkgs = set(possible)
 
@@ -1694,7 +1958,14 @@ def setup(self, driver, specs, tests=False, reuse=False):
         self.possible_compilers = self.generate_possible_compilers(specs)
 
         # traverse all specs and packages to build dict of possible versions
-        self.build_version_dict(possible, specs)
+        self.build_version_dict(possible, [] if separately else specs)
+        if separately:
+            self.roots = list(specs)
+            for i, spec in enumerate(specs):
+                versions = collections.defaultdict(list)
+                self.declare_spec_versions(spec, versions)
+                if versions:
+                    self.root_declared_versions[i] = versions
 
         self.gen.h1("Concrete input spec definitions")
         self.define_concrete_input_specs(specs, possible)
@@ -1736,8 +2007,14 @@ def setup(self, driver, specs, tests=False, reuse=False):
                     _develop_specs_from_env(dep, env)
 
         self.gen.h1('Spec Constraints')
-        for spec in sorted(specs):
+        for i, spec in (enumerate(specs) if separately
+                        else enumerate(sorted(specs))):
             self.gen.h2('Spec: %s' % str(spec))
+            if separately:
+                self.gen.scope = set([i])
+                shared_values = self.variant_values_from_specs
+                self.variant_values_from_specs = set()
+
             self.gen.fact(
                 fn.virtual_root(spec.name) if spec.virtual
                 else fn.root(spec.name)
@@ -1748,6 +2025,11 @@ def setup(self, driver, specs, tests=False, reuse=False):
                     self.gen.fact(fn.variant_default_value_from_cli(
                         *clause.args
                     ))
+
+            if separately:
+                self.gen.scope = None
+                self.root_variant_values[i] = self.variant_values_from_specs
+                self.variant_values_from_specs = shared_values
         self.gen.h1("Variant Values defined in specs")
         self.define_variant_values()
 
@@ -2038,10 +2320,6 @@ def solve(specs, dump=(), models=0, timers=False, stats=False, tests=False,
         dump (tuple): what to dump
         models (int): number of models to search (default: 0)
     """
-    driver = PyclingoDriver()
-    if "asp" in dump:
-        driver.out = sys.stdout
-
     # Check upfront that the variants are admissible
     for root in specs:
         for s in root.traverse():
@@ -2049,10 +2327,99 @@ def solve(specs, dump=(), models=0, timers=False, stats=False, tests=False,
                 continue
             spack.spec.Spec.ensure_valid_variants(s)
 
+    # Reuse the result of a previous solve with the same inputs, unless
+    # the solve itself has to be shown
+    cache = None
+    if "asp" not in dump and not timers and not stats:
+        cache = spack.solver.cache.concretization_cache()
+    if cache:
+        key = spack.solver.cache.input_hash(specs, models, tests, reuse)
+        result = cache.fetch(key, specs)
+        if result:
+            return result
+
+    driver = PyclingoDriver()
+    if "asp" in dump:
+        driver.out = sys.stdout
+
     setup = SpackSolverSetup()
-    return driver.solve(
+    result = driver.solve(
         setup, specs, dump, models, timers, stats, tests, reuse
     )
+    if cache and result.satisfiable:
+        cache.store(key, result)
+    return result
+
+
+def _can_solve_separately(spec):
+    """Whether ``spec`` can be solved in a batch with other roots, i.e. if it
+    does not add facts that the other roots would share, like concrete
+    dependencies, operating systems, targets or allowed compilers."""
+    for s in spec.traverse():
+        if s.concrete or (s.compiler and s.compiler.concrete):
+            return False
+        if s.architecture and (s.architecture.os or s.architecture.target):
+            return False
+    return True
+
+
+def solve_separately(specs, tests=False, reuse=False):
+    """Solve for a stable model of each of specs on its own.
+
+    The specs that can be are solved together with a single grounding of
+    the facts they share. The result of the other ones, or of the ones
+    that are not satisfiable, is ``None``: they must be solved on their own
+    with ``solve`` to get them, or a proper error.
+
+    Arguments:
+        specs (list): list of Specs to solve.
+
+    Return:
+        (list): the ``Result`` of each spec, or ``None``
+    """
+    results = [None] * len(specs)
+    cache = spack.solver.cache.concretization_cache()
+
+    batch = []
+    for i, spec in enumerate(specs):
+        try:
+            check_packages_exist([spec])
+            for s in spec.traverse():
+                if not s.virtual:
+                    spack.spec.Spec.ensure_valid_variants(s)
+        except spack.error.SpackError:
+            continue
+
+        if not _can_solve_separately(spec):
+            continue
+
+        key = None
+        if cache:
+            key = spack.solver.cache.input_hash([spec], 0, tests, reuse)
+            results[i] = cache.fetch(key, [spec])
+            if results[i]:
+                continue
+        batch.append((i, spec, key))
+
+    if len(batch) < 2:
+        return results
+
+    driver = PyclingoDriver(cores=False)
+    try:
+        batch_results = driver.solve_separately(
+            SpackSolverSetup(), [spec for _, spec, _ in batch], tests, reuse
+        )
+    except spack.error.SpackError as e:
+        tty.debug('Cannot solve the specs in a batch: {0}'.format(str(e)))
+        return results
+
+    for (i, spec, key), result in zip(batch, batch_results):
+        if not result.satisfiable:
+            continue
+        results[i] = result
+        if cache:
+            cache.store(key, result)
+    return results
 
 
 class UnsatisfiableSpecError(spack.error.UnsatisfiableSpecError):
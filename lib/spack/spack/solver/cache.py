@@ -0,0 +1,453 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Cache of the results of concretization solves.
+
+Results are stored as JSON files in the ``misc_cache``, under
+``concretization/``, and keyed by a hash of all the inputs of the solve:
+
+* the abstract specs and the options of the solve,
+* the ``packages`` and ``compilers`` configuration,
+* the host platform, operating system and target,
+* the contents of the package directories of all the possible dependencies
+  of the specs, of the modules defining their classes and base classes,
+  like build systems, and of the files implementing the solver,
+* the hashes of the installed specs and of the specs in build caches, when
+  the solve reuses them.
+
+A hit skips the setup, grounding and solve entirely. Entries are evicted
+in least recently used order when the cache holds more entries, or more
+bytes, than configured in ``config:concretization_cache``.
+
+The facts generated from the directives of each package are cached
+separately, so that solves that do miss the cache only generate the facts
+of the packages that changed since the last solve involving them.
+"""
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+import archspec.cpu
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
+
+import spack
+import spack.binary_distribution
+import spack.caches
+import spack.config
+import spack.dependency
+import spack.environment as ev
+import spack.hash_types as ht
+import spack.package
+import spack.platforms
+import spack.repo
+import spack.solver.asp
+import spack.spec
+import spack.store
+import spack.util.crypto
+import spack.util.spack_json as sjson
+
+#: Version of the format of the entries, part of their keys
+cache_format_version = 1
+
+#: Directory of the entries in the ``misc_cache``
+cache_prefix = 'concretization'
+
+#: Files implementing the solver, whose contents are part of the keys
+solver_files = [
+    os.path.join(os.path.dirname(__file__), f)
+    for f in ('asp.py', 'concretize.lp', 'display.lp')
+]
+
+
+def _file_hash(path):
+    return spack.util.crypto.checksum(hashlib.sha256, path)
+
+
+def _directory_hash(path):
+    """Hash of the names and contents of the files in a directory."""
+    hasher = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for name in sorted(files):
+            if name.endswith('.pyc'):
+                continue
+            filename = os.path.join(root, name)
+            hasher.update(os.path.relpath(filename, path).encode('utf-8'))
+            hasher.update(_file_hash(filename).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _class_files(pkg):
+    """Source files of the modules defining a package class and its base
+    classes, like build systems, whose directives contribute to its facts.
+    """
+    files = []
+    for cls in inspect.getmro(pkg):
+        module = sys.modules.get(cls.__module__)
+        path = getattr(module, '__file__', None)
+        if path and path.endswith('.py') and path not in files:
+            files.append(path)
+    return files
+
+
+def _spec_key(spec):
+    """String identifying an abstract spec, including the hashes of its
+    concrete dependencies."""
+    concrete = sorted(s.dag_hash() for s in spec.traverse() if s.concrete)
+    return ' '.join([str(spec)] + ['/' + h for h in concrete])
+
+
+def _reusable_hashes():
+    """Hashes of the specs a solve with ``reuse`` may pick from."""
+    with spack.store.db.read_transaction():
+        hashes = set(s.dag_hash() for s in spack.store.db.query(installed=True))
+    try:
+        index = spack.binary_distribution.update_cache_and_get_specs()
+        hashes.update(s.dag_hash() for s in index)
+    except (spack.binary_distribution.FetchCacheError, IndexError):
+        pass
+    return sorted(hashes)
+
+
+def input_hash(specs, models=0, tests=False, reuse=False):
+    """Hash of all the inputs of a solve of ``specs``.
+
+    Args:
+        specs (list): abstract specs to solve
+        models (int): number of models to search
+        tests (bool or typing.Iterable): tests option of the solve
+        reuse (bool): whether the solve reuses installed specs
+
+    Return:
+        (str): hex digest identifying the result of the solve
+    """
+    spack.solver.asp.check_packages_exist(specs)
+    possible = spack.package.possible_dependencies(
+        *specs,
+        virtuals=set(x.name for x in specs if x.virtual),
+        deptype=spack.dependency.all_deptypes
+    )
+
+    platform = spack.platforms.host()
+    env = ev.active_environment()
+    if tests not in (True, False):
+        tests = sorted(tests)
+
+    class_files = set()
+    for name in possible:
+        if spack.repo.path.is_virtual(name):
+            continue
+        class_files.update(_class_files(spack.repo.path.get_pkg_class(name)))
+
+    inputs = {
+        'format': cache_format_version,
+        'spack': spack.spack_version,
+        'solver': [_file_hash(f) for f in solver_files],
+        'specs': sorted(_spec_key(s) for s in specs),
+        'models': models,
+        'tests': tests,
+        'reuse': reuse,
+        'packages_config': spack.config.get('packages'),
+        'compilers_config': spack.config.get('compilers'),
+        'host': [str(platform), str(platform.operating_system('default_os')),
+                 str(archspec.cpu.host())],
+        'repos': [repo.namespace for repo in spack.repo.path.repos],
+        'packages': dict(
+            (name, _directory_hash(
+                spack.repo.path.dirname_for_package_name(name)))
+            for name in possible
+        ),
+        'package_classes': dict((f, _file_hash(f)) for f in class_files),
+        'dev_specs': env.dev_specs if env else {},
+        'reusable': _reusable_hashes() if reuse else [],
+    }
+    content = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _result_to_dict(result):
+    opt, _, answer = min(result.answers)
+
+    nodes = {}
+    for spec in answer.values():
+        for s in spec.traverse():
+            build_hash = s.build_hash()
+            if build_hash not in nodes:
+                node = s.to_node_dict(hash=ht.build_hash)
+                node[ht.dag_hash.name] = s.dag_hash()
+                nodes[build_hash] = node
+
+    return {
+        'opt': list(opt),
+        'criteria': [list(c) for c in result.criteria],
+        'nmodels': result.nmodels,
+        'answer': dict(
+            (name, spec.build_hash()) for name, spec in answer.items()),
+        'nodes': nodes,
+    }
+
+
+def _result_from_dict(specs, data):
+    # Same as reading the concrete specs of an environment lockfile
+    specs_by_hash = {}
+    for build_hash, node in data['nodes'].items():
+        spec = spack.spec.Spec.from_node_dict(node)
+        setattr(spec, ht.build_hash.attr, build_hash)
+        specs_by_hash[build_hash] = spec
+
+    for build_hash, node in data['nodes'].items():
+        for _, dep_hash, deptypes, _ in (
+                spack.spec.Spec.dependencies_from_node_dict(node)):
+            specs_by_hash[build_hash]._add_dependency(
+                specs_by_hash[dep_hash], deptypes)
+
+    answer = dict(
+        (name, specs_by_hash[h]) for name, h in data['answer'].items())
+    for spec in answer.values():
+        spec._mark_concrete()
+    for spec in answer.values():
+        spack.spec.Spec.ensure_no_deprecated(spec)
+
+    result = spack.solver.asp.Result(specs)
+    result.satisfiable = True
+    result.answers.append((data['opt'], 0, answer))
+    result.criteria = [tuple(c) for c in data['criteria']]
+    result.nmodels = data['nmodels']
+    return result
+
+
+class ConcretizationCache(object):
+    """Least recently used cache of concretization results, keyed by
+    ``input_hash``."""
+
+    def __init__(self, file_cache, max_entries, max_size):
+        """Create a cache stored in a ``FileCache``.
+
+        Args:
+            file_cache (spack.util.file_cache.FileCache): where to store
+                the entries
+            max_entries (int): maximum number of entries
+            max_size (int): maximum total size of the entries in bytes
+        """
+        self.file_cache = file_cache
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    def _key(self, input_hash):
+        return '{0}/{1}.json'.format(cache_prefix, input_hash)
+
+    def fetch(self, input_hash, specs):
+        """Return the result of the solve with the inputs hashed in
+        ``input_hash``, or ``None`` if it is not in the cache.
+
+        Args:
+            input_hash (str): hash of the inputs of the solve
+            specs (list): abstract specs of the solve
+        """
+        key = self._key(input_hash)
+        if not self.file_cache.init_entry(key):
+            return None
+
+        try:
+            with self.file_cache.read_transaction(key) as f:
+                data = sjson.load(f)
+            result = _result_from_dict(specs, data)
+        except spack.spec.SpecDeprecatedError:
+            raise
+        except Exception as e:
+            tty.debug('Ignoring invalid concretization cache entry {0}: {1}'
+                      .format(input_hash, str(e)))
+            return None
+
+        # Mark the entry as the most recently used
+        os.utime(self.file_cache.cache_path(key), None)
+        tty.debug('Reusing cached concretization result {0}'
+                  .format(input_hash))
+        return result
+
+    def store(self, input_hash, result):
+        """Store the result of a satisfiable solve, and evict the least
+        recently used entries if the cache is full.
+
+        Args:
+            input_hash (str): hash of the inputs of the solve
+            result (spack.solver.asp.Result): result of the solve
+        """
+        key = self._key(input_hash)
+        self.file_cache.init_entry(key)
+        with self.file_cache.write_transaction(key) as (old, new):
+            sjson.dump(_result_to_dict(result), new)
+        self.evict()
+
+    def entries(self):
+        """Return the keys of the entries, least recently used first, and
+        their total size in bytes."""
+        directory = self.file_cache.cache_path(cache_prefix)
+        entries, size = [], 0
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+            size += stat.st_size
+        entries.sort()
+        return ['{0}/{1}'.format(cache_prefix, name)
+                for _, name, _ in entries], size
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is within
+        its bounds."""
+        keys, size = self.entries()
+        count = len(keys)
+        for key in keys:
+            if count <= self.max_entries and size <= self.max_size:
+                break
+            try:
+                entry_size = os.path.getsize(self.file_cache.cache_path(key))
+                self.file_cache.remove(key)
+            except OSError:
+                continue
+            count -= 1
+            size -= entry_size
+
+
+def concretization_cache():
+    """Return the concretization cache configured in
+    ``config:concretization_cache``, or ``None`` if it is disabled."""
+    config = spack.config.get('config:concretization_cache', {})
+    if not config.get('enable', False):
+        return None
+    return ConcretizationCache(
+        spack.caches.misc_cache,
+        max_entries=config.get('max_entries', 256),
+        max_size=config.get('max_size', 64) * 1024 * 1024)
+
+
+class PackageFactsCache(object):
+    """Cache of the facts generated from the directives of each package.
+
+    Facts are keyed by the contents of the files defining the package class
+    and its base classes, and by whether the tests of the package are
+    requested. They are kept in memory and in a file per package, which is
+    replaced atomically so that it can be read without locking.
+    """
+
+    #: Directory of the entries in the ``misc_cache``
+    prefix = 'package-facts'
+
+    def __init__(self, file_cache):
+        """Create a cache stored under the root of a ``FileCache``.
+
+        Args:
+            file_cache (spack.util.file_cache.FileCache): where to store
+                the entries
+        """
+        self.file_cache = file_cache
+        self._blocks = {}
+
+    def key(self, pkg, tests):
+        """Key of the facts of a package.
+
+        Args:
+            pkg (spack.package.PackageMeta): class of the package whose facts
+                are cached
+            tests (bool): whether the tests of the package are requested
+
+        Return:
+            (str or None): hex digest identifying the facts, or ``None`` if
+            the package is not defined in a repository and cannot be cached
+        """
+        if not (inspect.isclass(pkg) and pkg.__module__.startswith(
+                spack.repo.repo_namespace + '.')):
+            return None
+
+        files = [os.path.join(os.path.dirname(__file__), 'asp.py')]
+        files.extend(f for f in _class_files(pkg) if f not in files)
+
+        hasher = hashlib.sha256()
+        hasher.update(str(cache_format_version).encode('utf-8'))
+        hasher.update(str(bool(tests)).encode('utf-8'))
+        for path in files:
+            hasher.update(_file_hash(path).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _path(self, pkg_name):
+        namespace = spack.repo.path.repo_for_pkg(pkg_name).namespace
+        return self.file_cache.cache_path(
+            os.path.join(self.prefix, namespace, pkg_name + '.json'))
+
+    def fetch(self, pkg_name, key):
+        """Return the cached facts of a package, or ``None`` if they are not
+        cached or are out of date.
+
+        Args:
+            pkg_name (str): name of the package
+            key (str): key of the facts, from ``key``
+        """
+        entry = self._blocks.get(pkg_name)
+        if entry is None or entry['key'] != key:
+            try:
+                with open(self._path(pkg_name)) as f:
+                    entry = sjson.load(f)
+            except (IOError, OSError, ValueError):
+                return None
+            if entry.get('key') != key:
+                return None
+            self._blocks[pkg_name] = entry
+
+        # Dependencies may have become virtual, or not, with other packages
+        block = entry['block']
+        for name, virtual in block['virtuals'].items():
+            if spack.repo.path.is_virtual(name) != virtual:
+                return None
+        return block
+
+    def store(self, pkg_name, key, block):
+        """Cache the facts of a package.
+
+        Args:
+            pkg_name (str): name of the package
+            key (str): key of the facts, from ``key``
+            block (dict): facts to cache
+        """
+        entry = {'key': key, 'block': block}
+        self._blocks[pkg_name] = entry
+
+        path = self._path(pkg_name)
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            mkdirp(os.path.dirname(path))
+            with open(tmp, 'w') as f:
+                sjson.dump(entry, f)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            tty.debug('Cannot cache the facts of {0}: {1}'.format(
+                pkg_name, str(e)))
+
+
+#: Facts of the packages, shared by all the solves of a process
+_package_facts_cache = None
+
+
+def package_facts_cache():
+    """Return the package facts cache, or ``None`` if it is disabled in
+    ``config:concretization_cache:package_facts``."""
+    global _package_facts_cache
+    config = spack.config.get('config:concretization_cache', {})
+    if not config.get('package_facts', False):
+        return None
+
+    file_cache = spack.caches.misc_cache
+    if (_package_facts_cache is None or
+            _package_facts_cache.file_cache is not file_cache):
+        _package_facts_cache = PackageFactsCache(file_cache)
+    return _package_facts_cache
@@ -83,6 +83,7 @@
 import re
 import sys
 import warnings
+from typing import Any, Dict, Tuple  # novm
 
 import ruamel.yaml as yaml
 import six
@@ -654,6 +655,133 @@ def __repr__(self):
         return str(self)
 
 
+#: Sorted tuples of dependency types, shared by all the edges with the same
+#: types
+_deptype_tuples = {}  # type: Dict[Tuple[str, ...], Tuple[str, ...]]
+
+
+def _interned_deptypes(deptypes):
+    deptypes = tuple(sorted(set(deptypes)))
+    return _deptype_tuples.setdefault(deptypes, deptypes)
+
+
+#: Maximum number of components kept in ``_interned_components``
+_interned_components_size = 65536
+
+#: Components of the concrete specs read from node dicts, keyed by the data
+#: they were read from (see ``_interned_component()``)
+_interned_components = {}  # type: Dict[Tuple[Any, ...], Any]
+
+
+def _frozen(data):
+    """Return a hashable equivalent of some data read from JSON or YAML."""
+    if isinstance(data, dict):
+        return tuple(sorted((k, _frozen(v)) for k, v in data.items()))
+    elif isinstance(data, (list, tuple)):
+        # Lists of strings, like the features of targets, only need a tuple
+        items = tuple(data)
+        try:
+            hash(items)
+        except TypeError:
+            items = tuple(_frozen(v) for v in items)
+        return items
+    return data
+
+
+def _interned_component(key, make):
+    """Return the component of a concrete spec read from some data.
+
+    Concrete specs are not modified in place, so all the concrete nodes
+    with the same name, architecture, compiler, versions, flags or variant
+    values share these objects. Nodes get their own copies when they are
+    made abstract again (see ``Spec._unshare_components()``).
+
+    Args:
+        key (tuple): kind of component, and the data it is read from, as
+            hashable values (see ``_frozen()``)
+        make: function returning the component, if it is not known yet
+    """
+    try:
+        return _interned_components[key]
+    except KeyError:
+        component = make()
+
+    # Long running processes read many specs, so the table is emptied
+    # when it is full, as nodes read later need not share components with
+    # the ones read before
+    if len(_interned_components) >= _interned_components_size:
+        _interned_components.clear()
+    _interned_components[key] = component
+    return component
+
+
+def _not_interned(key, make):
+    return make()
+
+
+#: Maximum number of abstract specs kept in ``_interned_specs``
+_interned_specs_size = 2048
+
+#: Maximum number of results kept in ``_satisfies_results``
+_satisfies_results_size = 65536
+
+#: Abstract specs parsed from strings (see ``interned_spec()``)
+_interned_specs = {}  # type: Dict[str, Spec]
+
+#: Results of ``Spec.satisfies()`` for concrete specs and strings, and the
+#: repositories they were computed with (see ``_satisfies_cache()``)
+_satisfies_results = {}  # type: Dict[Tuple[str, str, bool, bool], bool]
+_satisfies_repo = None
+
+
+def interned_spec(spec_like):
+    """Return the spec for a string, sharing the specs parsed from equal
+    strings. Specs are returned as they are.
+
+    This is meant for constraints that are only read, like queries and the
+    rules of configuration files: each string is parsed once, however
+    many specs are checked against it. The spec returned must not be
+    modified.
+    """
+    if isinstance(spec_like, Spec):
+        return spec_like
+
+    try:
+        return _interned_specs[spec_like]
+    except (KeyError, TypeError):
+        spec = Spec(spec_like)
+
+    # Hashes and spec files are looked up in the database and on disk
+    if isinstance(spec_like, six.string_types) and '/' not in spec_like:
+        if len(_interned_specs) >= _interned_specs_size:
+            _interned_specs.clear()
+        _interned_specs[spec_like] = spec
+    return spec
+
+
+def _satisfies_cache():
+    """Return the memoized results of ``Spec.satisfies()``.
+
+    Results that involve virtual packages depend on the repositories, so
+    they are forgotten when other repositories are used. The cache is
+    emptied when it is full, which keeps lookups cheap.
+    """
+    global _satisfies_repo
+    if (_satisfies_repo is not spack.repo.path or
+            len(_satisfies_results) >= _satisfies_results_size):
+        _satisfies_results.clear()
+        _satisfies_repo = spack.repo.path
+    return _satisfies_results
+
+
+def clear_caches():
+    """Forget the interned abstract specs and components of concrete specs,
+    and the memoized results of ``Spec.satisfies()``."""
+    _interned_components.clear()
+    _interned_specs.clear()
+    _satisfies_results.clear()
+
+
 @lang.lazy_lexicographic_ordering
 class DependencySpec(object):
     """DependencySpecs connect two nodes in the DAG, and contain deptypes.
@@ -670,15 +798,18 @@ class DependencySpec(object):
     - deptypes: list of strings, representing dependency relationships.
     """
 
+    # Large DAGs have many more edges than nodes
+    __slots__ = ('parent', 'spec', 'deptypes')
+
     def __init__(self, parent, spec, deptypes):
         self.parent = parent
         self.spec = spec
-        self.deptypes = tuple(sorted(set(deptypes)))
+        self.deptypes = _interned_deptypes(deptypes)
 
     def update_deptypes(self, deptypes):
         deptypes = set(deptypes)
         deptypes.update(self.deptypes)
-        deptypes = tuple(sorted(deptypes))
+        deptypes = _interned_deptypes(deptypes)
         changed = self.deptypes != deptypes
 
         self.deptypes = deptypes
@@ -749,8 +880,7 @@ def valid_compiler_flags():
 
     def copy(self):
         clone = FlagMap(None)
-        for name, value in self.items():
-            clone[name] = value
+        clone.dict.update(self.dict)
         return clone
 
     def _cmp_iter(self):
@@ -776,6 +906,8 @@ class DependencyMap(lang.HashableMap):
     """Each spec has a DependencyMap containing specs for its dependencies.
        The DependencyMap is keyed by name. """
 
+    __slots__ = ()
+
     def __str__(self):
         return "{deps: %s}" % ', '.join(str(d) for d in sorted(self.values()))
 
@@ -1412,7 +1544,6 @@ def traverse_edges(self, visited=None, d=0, deptype='all',
         canonical_deptype = kwargs.get("canonical_deptype", None)
         if canonical_deptype is None:
             deptype = dp.canonical_deptype(deptype)
-            kwargs["canonical_deptype"] = deptype
         else:
             deptype = canonical_deptype
 
@@ -1427,53 +1558,69 @@ def validate(name, val, allowed_values):
 
         if visited is None:
             visited = set()
-        key = key_fun(self)
 
-        # Node traversal does not yield visited nodes.
-        if key in visited and cover == 'nodes':
-            return
+        all_deptypes = all(t in deptype for t in dp.all_deptypes)
+        if direction == 'children':
+            edges_attr, succ = '_dependencies', operator.attrgetter('spec')
+        else:
+            edges_attr, succ = '_dependents', operator.attrgetter('parent')
 
-        def return_val(dspec):
+        def return_val(node, d, dspec):
             if not dspec:
                 # make a fake dspec for the root.
                 if direction == 'parents':
-                    dspec = DependencySpec(self, None, ())
+                    dspec = DependencySpec(node, None, ())
                 else:
-                    dspec = DependencySpec(None, self, ())
+                    dspec = DependencySpec(None, node, ())
             return (d, dspec) if depth else dspec
 
-        yield_me = yield_root or d > 0
-
-        # Preorder traversal yields before successors
-        if yield_me and order == 'pre':
-            yield return_val(dep_spec)
-
-        # Edge traversal yields but skips children of visited nodes
-        if not (key in visited and cover == 'edges'):
-            visited.add(key)
+        # The traversal uses a stack rather than recursion, so that the cost
+        # of yielding a node does not grow with its depth. Each frame is a
+        # node that was entered: [node, depth, dspec, yield it, visit its
+        # children, iterator over its remaining edges].
+        stack = []
+        node, dspec = self, dep_spec
+        while True:
+            if node is not None:
+                key = key_fun(node)
+
+                # Node traversal does not yield visited nodes.
+                if not (key in visited and cover == 'nodes'):
+                    yield_me = yield_root or d > 0
+
+                    # Preorder traversal yields before successors
+                    if yield_me and order == 'pre':
+                        yield return_val(node, d, dspec)
+
+                    # Edge traversal yields but skips children of visited
+                    # nodes.
+                    expand = not (key in visited and cover == 'edges')
+                    if expand:
+                        visited.add(key)
+                    stack.append([node, d, dspec, yield_me, expand, None])
+                node = None
+
+            if not stack:
+                return
 
-            # This code determines direction and yields the children/parents
-            if direction == 'children':
-                where = self._dependencies
-                succ = lambda dspec: dspec.spec
-            elif direction == 'parents':
-                where = self._dependents
-                succ = lambda dspec: dspec.parent
-            else:
-                raise ValueError('Invalid traversal direction: %s' % direction)
+            frame = stack[-1]
+            if frame[4] and frame[5] is None:
+                # List the edges only after the node was yielded
+                where = getattr(frame[0], edges_attr)
+                frame[5] = iter(sorted(where.dict.items()))
 
-            for name, dspec in sorted(where.items()):
-                dt = dspec.deptypes
-                if dt and not any(d in deptype for d in dt):
+            for name, edge in frame[5] or ():
+                dt = edge.deptypes
+                if dt and not all_deptypes and \
+                        not any(t in deptype for t in dt):
                     continue
-
-                for child in succ(dspec).traverse_edges(
-                        visited, d + 1, deptype, dspec, **kwargs):
-                    yield child
-
-        # Postorder traversal yields after successors
-        if yield_me and order == 'post':
-            yield return_val(dep_spec)
+                node, d, dspec = succ(edge), frame[1] + 1, edge
+                break
+            else:
+                stack.pop()
+                # Postorder traversal yields after successors
+                if frame[3] and order == 'post':
+                    yield return_val(frame[0], frame[1], frame[2])
 
     @property
     def short_spec(self):
@@ -1876,34 +2023,54 @@ def from_node_dict(node):
         for h in ht.hashes:
             setattr(spec, h.attr, node.get(h.name, None))
 
-        spec.name = name
-        spec.namespace = node.get('namespace', None)
+        # Concrete specs share the components read from the same data
+        intern = _not_interned
+        if node.get('concrete', True):
+            intern = _interned_component
+
+        spec.name = intern(('name', name), lambda: name)
+        namespace = node.get('namespace', None)
+        spec.namespace = intern(('namespace', namespace), lambda: namespace)
 
         if 'version' in node or 'versions' in node:
-            spec.versions = vn.VersionList.from_dict(node)
+            key = ('versions', _frozen(node.get('versions')),
+                   node.get('version'))
+            spec.versions = intern(
+                key, lambda: vn.VersionList.from_dict(node))
 
         if 'arch' in node:
-            spec.architecture = ArchSpec.from_dict(node)
+            spec.architecture = intern(
+                ('arch', _frozen(node['arch'])),
+                lambda: ArchSpec.from_dict(node))
 
         if 'compiler' in node:
-            spec.compiler = CompilerSpec.from_dict(node)
+            spec.compiler = intern(
+                ('compiler', _frozen(node['compiler'])),
+                lambda: CompilerSpec.from_dict(node))
         else:
             spec.compiler = None
 
+        def read_variant(name, value):
+            make = lambda: vt.MultiValuedVariant.from_node_dict(name, value)
+            # The patches variant is completed below
+            if name == 'patches':
+                return make()
+            # True == 1, but they are different values of a variant
+            key = ('variant', name, type(value), _frozen(value))
+            return intern(key, make)
+
         if 'parameters' in node:
             for name, value in node['parameters'].items():
                 if name in _valid_compiler_flags:
-                    spec.compiler_flags[name] = value
+                    spec.compiler_flags[name] = intern(
+                        ('flags', tuple(value)), lambda: value)
                 else:
-                    spec.variants[name] = vt.MultiValuedVariant.from_node_dict(
-                        name, value)
+                    spec.variants[name] = read_variant(name, value)
         elif 'variants' in node:
             for name, value in node['variants'].items():
-                spec.variants[name] = vt.MultiValuedVariant.from_node_dict(
-                    name, value
-                )
+                spec.variants[name] = read_variant(name, value)
             for name in FlagMap.valid_compiler_flags():
-                spec.compiler_flags[name] = []
+                spec.compiler_flags[name] = intern(('flags', ()), list)
 
         spec.external_path = None
         spec.external_modules = None
@@ -2388,7 +2555,6 @@ def feq(cfield, sfield):
                 if spec._dup(replacement, deps=False, cleardeps=False):
                     changed = True
 
-                spec._dependencies.owner = spec
                 self_index.update(spec)
                 done = False
                 break
@@ -2648,9 +2814,31 @@ def _mark_root_concrete(self, value=True):
         """Mark just this spec (not dependencies) concrete."""
         if (not value) and self.concrete and self.package.installed:
             return
+        if self._concrete and not value:
+            self._unshare_components()
         self._normal = value
         self._concrete = value
 
+    def _unshare_components(self):
+        """Give this node its own copy of the components it may share with
+        other concrete specs, so that it can be modified."""
+        self.versions = self.versions.copy()
+        if self.architecture:
+            self.architecture = self.architecture.copy()
+        if self.compiler:
+            self.compiler = self.compiler.copy()
+
+        variants = vt.VariantMap(self)
+        for name, variant in self.variants.items():
+            variants[name] = variant.copy()
+            patches = getattr(variant, '_patches_in_order_of_appearance', None)
+            if patches:
+                variants[name]._patches_in_order_of_appearance = patches
+        self.variants = variants
+
+        for name, flags in self.compiler_flags.items():
+            self.compiler_flags[name] = list(flags)
+
     def _mark_concrete(self, value=True):
         """Mark this spec and its dependencies as concrete.
 
@@ -3124,6 +3312,9 @@ def constrain(self, other, deps=True):
                     self, other, 'constrain a concrete spec'
                 )
 
+        if isinstance(other, six.string_types):
+            # Parts of other may become parts of this spec
+            other = interned_spec(other).copy()
         other = self._autospec(other)
 
         if not (self.name == other.name or
@@ -3274,10 +3465,41 @@ def satisfies(self, other, deps=True, strict=False, strict_deps=False):
 
           * `strict`: strict means that we *must* meet all the
             constraints specified on other.
+
+        The results for concrete specs and constraints given as strings are
+        memoized, so matching many specs against the same rules checks each
+        spec only once per rule.
         """
+        if self._concrete and isinstance(other, six.string_types):
+            return self._satisfies_memoized(other, deps, strict)
+        return self._satisfies(interned_spec(other), deps, strict)
 
-        other = self._autospec(other)
+    def _satisfies_memoized(self, other_str, deps, strict):
+        """Memoized ``satisfies()`` of a concrete spec and a string.
 
+        Results are keyed by the DAG hash of this spec when only its node is
+        checked. Constraints on dependencies use the process hash, since the
+        DAG hash does not cover build and test dependencies.
+        """
+        other = interned_spec(other_str)
+        if other.concrete or (other.name and other.name != self.name):
+            # Only the hash of a concrete spec is compared, and names are
+            # compared with the virtual packages this spec provides
+            return self._satisfies(other, deps, strict)
+
+        if deps and other._dependencies:
+            key = (self.process_hash(), other_str, True, strict)
+        else:
+            key = (self.dag_hash(), other_str, False, strict)
+
+        results = _satisfies_cache()
+        try:
+            return results[key]
+        except KeyError:
+            result = results[key] = self._satisfies(other, deps, strict)
+            return result
+
+    def _satisfies(self, other, deps, strict):
         # The only way to satisfy a concrete spec is to match its hash exactly.
         if other.concrete:
             return self.concrete and self.dag_hash() == other.dag_hash()
@@ -3352,7 +3574,7 @@ def satisfies_dependencies(self, other, strict=False):
         """
         This checks constraints on common dependencies against each other.
         """
-        other = self._autospec(other)
+        other = interned_spec(other)
 
         # If there are no constraints to satisfy, we're done.
         if not other._dependencies:
@@ -3479,18 +3701,30 @@ def _dup(self, other, deps=True, cleardeps=True, caches=None):
 
         self._package = None
 
-        # Local node attributes get copied first.
+        # Local node attributes get copied first. Concrete specs are not
+        # modified, so copies of concrete nodes share their components until
+        # they are made abstract (see _unshare_components()).
         self.name = other.name
-        self.versions = other.versions.copy()
-        self.architecture = other.architecture.copy() if other.architecture \
-            else None
-        self.compiler = other.compiler.copy() if other.compiler else None
+        if other._concrete:
+            self.versions = other.versions
+            self.architecture = other.architecture
+            self.compiler = other.compiler
+        else:
+            self.versions = other.versions.copy()
+            self.architecture = other.architecture.copy() \
+                if other.architecture else None
+            self.compiler = other.compiler.copy() if other.compiler else None
         if cleardeps:
             self._dependents = DependencyMap()
             self._dependencies = DependencyMap()
         self.compiler_flags = other.compiler_flags.copy()
         self.compiler_flags.spec = self
-        self.variants = other.variants.copy()
+        if other._concrete:
+            self.variants = vt.VariantMap(self)
+            for name, variant in other.variants.items():
+                self.variants[name] = variant
+        else:
+            self.variants = other.variants.copy()
         self._build_spec = other._build_spec
 
         # FIXME: we manage _patches_in_order_of_appearance specially here
@@ -3647,10 +3881,10 @@ def __contains__(self, spec):
         entire DAG -- we limit them to the root.
 
         """
-        spec = self._autospec(spec)
+        name = interned_spec(spec).name
 
         # if anonymous or same name, we only have to look at the root
-        if not spec.name or spec.name == self.name:
+        if not name or name == self.name:
             return self.satisfies(spec)
         else:
             return any(s.satisfies(spec) for s in self.traverse(root=False))
@@ -118,17 +118,27 @@ def update_package(self, pkg_name):
             pkg_name (str): name of the package to be removed from the index
 
         """
-        package = spack.repo.path.get(pkg_name)
+        metadata = spack.repo.path.get_pkg_metadata(pkg_name)
 
         # Remove the package from the list of packages, if present
-        for pkg_list in self._tag_dict.values():
-            if pkg_name in pkg_list:
-                pkg_list.remove(pkg_name)
+        self.remove_package(pkg_name)
 
         # Add it again under the appropriate tags
-        for tag in getattr(package, 'tags', []):
+        for tag in metadata.tags:
             tag = tag.lower()
-            self._tag_dict[tag].append(package.name)
+            self._tag_dict[tag].append(metadata.name)
+
+    def remove_package(self, pkg_name):
+        """Removes a package from the tag index.
+
+        Args:
+            pkg_name (str): name of the package, possibly with its namespace
+
+        """
+        pkg_name = pkg_name.split('.')[-1]
+        for pkg_list in self._tag_dict.values():
+            if pkg_name in pkg_list:
+                pkg_list.remove(pkg_name)
 
 
 class TagIndexError(spack.error.SpackError):
@@ -22,6 +22,8 @@
 import spack.spec as spec
 import spack.store
 import spack.util.gpg
+import spack.util.spack_json as sjson
+import spack.util.url as url_util
 import spack.util.web as web_util
 from spack.directory_layout import DirectoryLayout
 from spack.paths import test_path
@@ -500,6 +502,7 @@ def mock_list_url(url, recursive=False):
         raise KeyError('Test KeyError handling')
 
     monkeypatch.setattr(web_util, 'list_url', mock_list_url)
+    monkeypatch.setattr(web_util, 'list_url_mtimes', mock_list_url)
 
     test_url = 'file:///fake/keys/dir'
 
@@ -523,6 +526,7 @@ def mock_list_url(url, recursive=False):
         raise Exception('Test Exception handling')
 
     monkeypatch.setattr(web_util, 'list_url', mock_list_url)
+    monkeypatch.setattr(web_util, 'list_url_mtimes', mock_list_url)
 
     test_url = 'file:///fake/keys/dir'
 
@@ -693,3 +697,174 @@ def test_FetchCacheError_pretty_printing_single():
     assert "Multiple errors" not in str_e
     assert "RuntimeError: Oops!" in str_e
     assert str_e.rstrip() == str_e
+
+
+@pytest.mark.usefixtures(
+    'install_mockery_mutable_config', 'mock_packages', 'mock_fetch',
+)
+def test_update_index_reads_new_spec_files(monkeypatch, tmpdir, mutable_config):
+    """Ensure the buildcache index is updated with the spec files pushed
+    since it was generated, unless a full update is requested."""
+    mirror_dir = tmpdir.join('mirror_dir')
+    cache_dir = mirror_dir.join(bindist.build_cache_relative_path())
+    spack.config.set('mirrors', {'test': 'file://' + mirror_dir.strpath})
+
+    read_files = []
+    read_spec_file = bindist._read_spec_file
+
+    def _read_spec_file(spec_url):
+        read_files.append(os.path.basename(spec_url))
+        return read_spec_file(spec_url)
+    monkeypatch.setattr(bindist, '_read_spec_file', _read_spec_file)
+
+    def indexed_specs():
+        with open(cache_dir.join('index.json').strpath) as f:
+            return sorted(r['spec']['name'] for r in
+                          sjson.load(f)['database']['installs'].values())
+
+    b = Spec('b').concretized()
+    install_cmd('--no-cache', b.name)
+    buildcache_cmd('create', '-uad', mirror_dir.strpath, b.name)
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    assert read_files == [bindist.tarball_name(b, '.spec.json')]
+    assert indexed_specs() == ['b']
+
+    # Only the spec files pushed since are read
+    read_files[:] = []
+    a = Spec('a').concretized()
+    install_cmd('--no-cache', a.name)
+    buildcache_cmd('create', '-uad', mirror_dir.strpath, a.name)
+    assert read_files == []
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    assert read_files == [bindist.tarball_name(a, '.spec.json')]
+    assert indexed_specs() == ['a', 'b']
+
+    # Up to date indexes are not regenerated
+    read_files[:] = []
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    assert read_files == []
+
+    # Removed spec files and full updates regenerate the index
+    os.remove(cache_dir.join(bindist.tarball_name(a, '.spec.json')).strpath)
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    assert read_files == [bindist.tarball_name(b, '.spec.json')]
+    assert indexed_specs() == ['b']
+
+    read_files[:] = []
+    buildcache_cmd('update-index', '--full', '-d', mirror_dir.strpath)
+    assert read_files == [bindist.tarball_name(b, '.spec.json')]
+
+
+@pytest.mark.usefixtures(
+    'install_mockery_mutable_config', 'mock_packages', 'mock_fetch',
+    'mock_binary_index'
+)
+def test_sharded_index_lookup(monkeypatch, tmpdir, mutable_config):
+    """Ensure specs are found in the shards of the buildcache index, and that
+    only the shards storing the specs looked for are fetched."""
+    mirror_dir = tmpdir.join('mirror_dir')
+    mirror_url = 'file://' + mirror_dir.strpath
+    spack.config.set('mirrors', {'test': mirror_url})
+
+    s = Spec('libdwarf').concretized()
+    install_cmd('--no-cache', s.name)
+    buildcache_cmd('create', '-uad', mirror_dir.strpath, s.name)
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+
+    cache_dir = mirror_dir.join(bindist.build_cache_relative_path())
+    with open(cache_dir.join('index.shards.json').strpath) as f:
+        table = sjson.load(f)['shards']
+    shards = dict((h[:2], table['files'][h[:2]])
+                  for h in (s.dag_hash(), s['libelf'].dag_hash()))
+    assert sorted(table['files']) == sorted(shards)
+
+    read_urls = []
+    read_from_url = web_util.read_from_url
+
+    def _read_from_url(url, *args, **kwargs):
+        read_urls.append(url)
+        return read_from_url(url, *args, **kwargs)
+    monkeypatch.setattr(web_util, 'read_from_url', _read_from_url)
+
+    # Only the table of the shards is fetched when updating the index
+    bindist.binary_index.update()
+    assert read_urls == [url_util.join(
+        mirror_url, bindist.build_cache_relative_path(), 'index.shards.json')]
+
+    # Looking up a spec fetches only the shard storing it, once
+    del read_urls[:]
+    for _ in range(2):
+        found = bindist.binary_index.find_built_spec(s['libelf'])
+        assert [r['mirror_url'] for r in found] == [mirror_url]
+        assert found[0]['spec'].full_hash() == s['libelf'].full_hash()
+    prefix = s['libelf'].dag_hash()[:2]
+    assert read_urls == [url_util.join(
+        mirror_url, bindist.build_cache_relative_path(),
+        bindist.index_shard_file_name(prefix, shards[prefix]))]
+
+    # Listing all the specs reads all the shards
+    assert sorted(x.name for x in bindist.update_cache_and_get_specs()) == [
+        'libdwarf', 'libelf'
+    ]
+
+    # Shards no longer listed are removed from the mirror and the local cache
+    os.remove(*glob.glob(cache_dir.join('*libdwarf*.spec.json').strpath))
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    prefix = s.dag_hash()[:2]
+    if prefix != s['libelf'].dag_hash()[:2]:
+        assert not cache_dir.join(
+            bindist.index_shard_file_name(prefix, shards[prefix])).exists()
+    bindist.binary_index.update()
+    assert bindist.binary_index.find_built_spec(s) is None
+    assert bindist.binary_index.find_built_spec(s['libelf'])
+
+
+@pytest.mark.usefixtures(
+    'install_mockery_mutable_config', 'mock_packages', 'mock_fetch',
+    'mock_binary_index'
+)
+def test_index_lookup_table(monkeypatch, tmpdir, mutable_config):
+    """Ensure specs are found in indices without shards from their lookup
+    table, and only constructed when needed."""
+    mirror_dir = tmpdir.join('mirror_dir')
+    mirror_url = 'file://' + mirror_dir.strpath
+    spack.config.set('mirrors', {'test': mirror_url})
+
+    s = Spec('libdwarf').concretized()
+    install_cmd('--no-cache', s.name)
+    buildcache_cmd('create', '-uad', mirror_dir.strpath, s.name)
+    buildcache_cmd('update-index', '-d', mirror_dir.strpath)
+    cache_dir = mirror_dir.join(bindist.build_cache_relative_path())
+    cache_dir.join('index.shards.json').remove()
+
+    constructed = []
+    from_node_dict = Spec.from_node_dict
+
+    def _from_node_dict(node):
+        constructed.append(node['name'])
+        return from_node_dict(node)
+    monkeypatch.setattr(Spec, 'from_node_dict', staticmethod(_from_node_dict))
+
+    bindist.binary_index.update()
+    lookup_tables = glob.glob(os.path.join(
+        bindist.binary_index._index_cache_root, '*.lookup.json'))
+    assert len(lookup_tables) == 1
+
+    # Full hashes are compared without constructing specs
+    found = bindist.get_mirrors_for_spec(
+        s['libelf'], full_hash_match=True, index_only=True)
+    assert [r['mirror_url'] for r in found] == [mirror_url]
+    assert constructed == []
+
+    # Only the spec accessed and its dependencies are constructed
+    found = bindist.binary_index.find_built_spec(s)
+    assert found[0]['spec'] == s
+    assert found[0]['spec'].full_hash() == s.full_hash()
+    assert sorted(constructed) == ['libdwarf', 'libelf']
+
+    # A new instance reads the cached lookup table rather than the index
+    monkeypatch.setattr(bindist, 'index_lookup_table', None)
+    binary_index = bindist.BinaryCacheIndex(
+        bindist.binary_index._index_cache_root)
+    binary_index.regenerate_spec_cache()
+    assert binary_index.find_by_hash(s['libelf'].dag_hash())
@@ -3,13 +3,21 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import gzip
+import io
 import os
 import os.path
+import tarfile
+from contextlib import closing
 
 import pytest
 
 import spack.binary_distribution
+import spack.config
 import spack.spec
+import spack.store
+import spack.util.spack_json as sjson
+from spack.util.executable import which
 
 install = spack.main.SpackCommand('install')
 
@@ -39,3 +47,227 @@ def test_build_tarball_overwrite(
 
         with pytest.raises(spack.binary_distribution.NoOverwriteException):
             spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_build_tarball_compression(
+        compression, install_mockery, mock_fetch, monkeypatch, tmpdir):
+    if compression == 'zstd' and not which('zstd'):
+        pytest.skip('zstd is not in PATH')
+
+    spec = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(spec))
+    with tmpdir.as_cwd():
+        spack.binary_distribution.build_tarball(
+            spec, '.', unsigned=True, compression=compression)
+
+    cache_prefix = spack.binary_distribution.build_cache_prefix(str(tmpdir))
+    with open(os.path.join(cache_prefix, spack.binary_distribution.tarball_name(
+            spec, '.spec.json'))) as f:
+        spec_dict = sjson.load(f)
+    assert spec_dict['binary_cache_format'] == {
+        'version': spack.binary_distribution.binary_cache_format_version,
+        'compression': compression}
+
+    # zstd packages are not stored under the name older clients download
+    spackfile_path = os.path.join(
+        cache_prefix, spack.binary_distribution.tarball_path_name(
+            spec, spack.binary_distribution.archive_extensions[compression]))
+    assert os.path.exists(spackfile_path)
+    assert os.path.exists(os.path.join(
+        cache_prefix, spack.binary_distribution.tarball_path_name(
+            spec, '.spack'))) == (compression == 'gzip')
+
+    # The archive is downloaded from a mirror whatever its name
+    mirrors = {'test': 'file://' + str(tmpdir)}
+    with spack.config.override('mirrors', mirrors):
+        downloaded_path = spack.binary_distribution.download_tarball(spec)
+    assert os.path.basename(downloaded_path) == os.path.basename(spackfile_path)
+
+    # Install the spec again from the tarball
+    spack.binary_distribution.extract_tarball(
+        spec, spackfile_path, unsigned=True, force=True)
+    assert os.path.isdir(os.path.join(
+        spec.prefix, spack.store.layout.metadata_dir))
+
+    # Clients of older formats refuse to install the tarball
+    with tmpdir.as_cwd():
+        spack.binary_distribution.build_tarball(
+            spec, '.', force=True, unsigned=True, compression=compression)
+    monkeypatch.setattr(
+        spack.binary_distribution, 'binary_cache_format_version', 1)
+    with pytest.raises(spack.binary_distribution.UnknownFormatException):
+        spack.binary_distribution.extract_tarball(
+            spec, spackfile_path, unsigned=True, force=True)
+
+
+def test_parallel_gzip_file(tmpdir):
+    data = b''.join(str(i).encode('utf-8') for i in range(10000))
+    path = str(tmpdir.join('data.gz'))
+    with open(path, 'wb') as f:
+        gzip_file = spack.binary_distribution.ParallelGzipFile(
+            f, jobs=3, chunk_size=1000)
+        for i in range(0, len(data), 700):
+            gzip_file.write(data[i:i + 700])
+        gzip_file.close()
+
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_gzip_reader_bounded_reads():
+    # Several members of very compressible data, as written by
+    # ParallelGzipFile, read in the small chunks of tarfile
+    data = b''.join(str(i).encode('utf-8') * 1000 for i in range(2000))
+    members = [data[i:i + len(data) // 3]
+               for i in range(0, len(data), len(data) // 3)]
+    stream = io.BytesIO(b''.join(_gzip_member(m) for m in members))
+
+    reader = spack.binary_distribution.GzipReader(stream, block_size=4096)
+    chunks = []
+    while True:
+        chunk = reader.read(10240)
+        if not chunk:
+            break
+        # Only what is asked for is decompressed, so reads do not copy
+        # the rest of a large decompressed buffer
+        assert len(chunk) <= 10240
+        assert len(reader.input) <= 4096
+        chunks.append(chunk)
+    assert b''.join(chunks) == data
+    assert reader.read() == b''
+
+
+def _gzip_member(data):
+    out = io.BytesIO()
+    with closing(gzip.GzipFile(fileobj=out, mode='wb')) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def test_extract_tarball_checksum_mismatch(
+        install_mockery, mock_fetch, tmpdir):
+    spec = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(spec))
+    with tmpdir.as_cwd():
+        spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+    # Record a wrong checksum in the spec file of the .spack archive
+    cache_prefix = spack.binary_distribution.build_cache_prefix(str(tmpdir))
+    spackfile_path = os.path.join(
+        cache_prefix, spack.binary_distribution.tarball_path_name(spec, '.spack'))
+    specfile_name = spack.binary_distribution.tarball_name(spec, '.spec.json')
+    contents = tmpdir.mkdir('contents')
+    with closing(tarfile.open(spackfile_path)) as tar:
+        names = tar.getnames()
+        tar.extractall(str(contents))
+    with open(str(contents.join(specfile_name))) as f:
+        spec_dict = sjson.load(f)
+    spec_dict['binary_cache_checksum']['hash'] = 'f' * 64
+    with open(str(contents.join(specfile_name)), 'w') as f:
+        sjson.dump(spec_dict, f)
+    with closing(tarfile.open(spackfile_path, 'w')) as tar:
+        for name in names:
+            tar.add(str(contents.join(name)), arcname=name)
+
+    with pytest.raises(spack.binary_distribution.NoChecksumException):
+        spack.binary_distribution.extract_tarball(
+            spec, spackfile_path, unsigned=True, force=True)
+
+    # Nothing is left in the store
+    assert not os.path.exists(spec.prefix)
+    assert not os.listdir(os.path.join(spack.store.layout.root, '.tmp'))
+
+
+@pytest.mark.parametrize('name,linkname', [
+    ('../outside', None),
+    ('/outside', None),
+    ('prefix/link', '../..'),
+    ('prefix/hardlink', '../../outside'),
+])
+def test_extract_prefix_unsafe_paths(name, linkname, tmpdir):
+    tarfile_path = str(tmpdir.join('prefix.tar.gz'))
+    with closing(tarfile.open(tarfile_path, 'w:gz')) as tar:
+        member = tarfile.TarInfo(name)
+        if linkname is not None:
+            member.type = tarfile.SYMTYPE if 'hard' not in name else tarfile.LNKTYPE
+            member.linkname = linkname
+        tar.addfile(member, io.BytesIO())
+        # a file extracted through the symbolic link
+        tar.addfile(tarfile.TarInfo('prefix/link/file'), io.BytesIO())
+
+    with pytest.raises(spack.binary_distribution.NoChecksumException):
+        spack.binary_distribution.extract_prefix(
+            tarfile_path, str(tmpdir.join('extract')))
+
+
+def test_relocate_package_from_manifest(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+    spec = spack.spec.Spec('trivial-install-test-package').concretized()
+    install(str(spec))
+    old_root, old_prefix = spack.store.layout.root, spec.prefix
+    script = os.path.join('share', 'script.sh')
+    os.makedirs(os.path.join(old_prefix, 'share'))
+    with open(os.path.join(old_prefix, script), 'w') as f:
+        f.write('#!/bin/sh\nexec {0}/bin/tool --root={1}\n'.format(
+            old_prefix, old_root))
+    spack.binary_distribution.build_tarball(
+        spec, str(tmpdir.join('mirror')), unsigned=True)
+
+    # The offsets of the prefixes are recorded for the text file
+    spackfile_path = os.path.join(
+        spack.binary_distribution.build_cache_prefix(str(tmpdir.join('mirror'))),
+        spack.binary_distribution.tarball_path_name(spec, '.spack'))
+    with spack.store.use_store(str(tmpdir.join('new-store'))):
+        new_spec = spack.spec.Spec('trivial-install-test-package').concretized()
+        assert new_spec.prefix != old_prefix
+
+        # Files are not classified again, and text files are only read at
+        # the recorded offsets
+        def _no_mime_type(filename):
+            raise AssertionError('{0} classified again'.format(filename))
+        monkeypatch.setattr(spack.relocate, 'mime_type', _no_mime_type)
+
+        recorded_offsets = []
+        replacements = spack.relocate.PrefixRelocator.replacements
+
+        def _replacements(self, data, offsets=None):
+            recorded_offsets.append(offsets)
+            return replacements(self, data, offsets)
+        monkeypatch.setattr(
+            spack.relocate.PrefixRelocator, 'replacements', _replacements)
+
+        spack.binary_distribution.extract_tarball(
+            new_spec, spackfile_path, unsigned=True)
+
+        manifest = spack.binary_distribution.read_relocation_manifest(
+            new_spec.prefix)
+        assert manifest[script]['kind'] == 'text'
+        assert manifest[script]['type'].startswith('text/')
+        assert len(manifest[script]['offsets']) == 2
+        assert recorded_offsets == [manifest[script]['offsets']]
+
+        with open(os.path.join(new_spec.prefix, script)) as f:
+            assert f.read() == '#!/bin/sh\nexec {0}/bin/tool --root={1}\n'.format(
+                new_spec.prefix, spack.store.layout.root)
+
+
+def test_relocation_manifest_kinds(tmpdir):
+    workdir = tmpdir.mkdir('prefix')
+    workdir.ensure('.spack', 'binary_distribution').write(
+        'buildpath: /old/store\n'
+        'relative_prefix: pkg\n'
+        'spackprefix: /old/spack\n'
+        'relocate_textfiles: []\n'
+        'relocate_binaries: [lib/libfoo.so, bin/foo, lib/libbar.so]\n')
+    workdir.ensure('lib', 'libfoo.so').write_binary(b'\x7fELF\x02\x01\x01')
+    workdir.ensure('bin', 'foo').write_binary(b'\xca\xfe\xba\xbe')
+    workdir.ensure('lib', 'libbar.so').write_binary(b'\x7fELF\x02\x01\x01')
+
+    spack.binary_distribution.write_relocation_manifest(str(workdir), {})
+    files = spack.binary_distribution.read_relocation_manifest(str(workdir))
+
+    # The kind of a binary only depends on its own contents
+    assert files['lib/libfoo.so']['kind'] == 'elf'
+    assert files['bin/foo']['kind'] == 'binary'
+    assert files['lib/libbar.so']['kind'] == 'elf'
@@ -0,0 +1,127 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import json
+
+import pytest
+
+import spack.cmd.bench
+import spack.config
+import spack.database
+import spack.environment as ev
+from spack.main import SpackCommand
+
+bench = SpackCommand('bench')
+
+
+def test_synthetic_database(tmpdir):
+    db = spack.cmd.bench.synthetic_database(str(tmpdir), 400)
+    db = spack.database.Database(str(tmpdir))
+    assert len(db.query_local(installed=any)) == 400
+    assert len(db.query_local(installed=False)) == 20
+    assert len(db.query_local('pkg-3', installed=any)) == 10
+    assert len(db.query_local(explicit=True, installed=any)) == 40
+
+    # Dependencies are in the database with the right reference counts
+    for spec in db.query_local(installed=any):
+        for dep in spec.dependencies():
+            assert db.get_record(dep).ref_count > 0
+
+
+def test_bench_database():
+    out = bench('database', '-n', '100', '-q', '2', '--json')
+    results = json.loads(out)
+    assert results['records'] == 100
+    assert len(results['queries']) == 6
+    assert all(q['count'] == 2 for q in results['queries'])
+
+
+def test_synthetic_lockfile(tmpdir, mutable_mock_env_path):
+    db = spack.cmd.bench.synthetic_database(str(tmpdir), 200, stack_size=20)
+    env_path = tmpdir.ensure('env', dir=True)
+    spack.cmd.bench.synthetic_lockfile(str(env_path), db)
+
+    env = ev.Environment(str(env_path))
+    roots = db.query_local(installed=any)
+    roots = [s for s in roots if not db.get_record(s).ref_count]
+    assert len(env.concretized_order) == len(roots)
+    assert len(list(env.all_specs())) == 200
+    for spec in env.all_specs():
+        assert spec.concrete
+        assert spec.dag_hash() == spec.build_hash()
+
+
+def test_bench_specs(mutable_mock_env_path):
+    results = json.loads(bench('specs', '-n', '100', '--json'))
+    assert results['records'] == 100
+    assert [r['name'] for r in results['loads']] == ['database', 'lockfile']
+    for r in results['loads']:
+        assert r['specs'] == 100
+        assert r['nodes'] == 100
+        assert r['load'] >= 0 and r['traverse'] >= 0 and r['copy'] >= 0
+
+
+def test_bench_concretize(mock_packages, config):
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Only the clingo concretizer has solve phases')
+
+    out = bench('concretize', '--json', 'mpileaks', 'mpich@:0.1')
+    results = json.loads(out)
+    assert [r['spec'] for r in results['specs']] == ['mpileaks', 'mpich@:0.1']
+    assert [r['satisfiable'] for r in results['specs']] == [True, False]
+    for result in results['specs']:
+        assert set(result['phases']) == set(spack.cmd.bench.solver_phases)
+        assert result['total'] >= sum(result['phases'].values())
+        assert result['statistics']['atoms'] > 0
+
+
+def _run(*times):
+    return {'specs': [{
+        'spec': 'mpileaks',
+        'phases': dict(zip(spack.cmd.bench.solver_phases, times)),
+        'total': sum(times),
+    }]}
+
+
+def test_bench_compare(tmpdir):
+    before = tmpdir.join('before.json')
+    before.write(json.dumps(_run(1.0, 0.1, 2.0, 1.0, 0.01)))
+
+    after = tmpdir.join('after.json')
+    after.write(json.dumps(_run(1.05, 0.1, 2.0, 1.0, 0.04)))
+    out = bench('compare', str(before), str(after))
+    assert 'REGRESSION' not in out
+
+    after.write(json.dumps(_run(1.0, 0.1, 3.0, 1.0, 0.01)))
+    out = bench('compare', str(before), str(after), fail_on_error=False)
+    assert bench.returncode == 1
+    assert [line.split()[1] for line in out.splitlines()
+            if 'REGRESSION' in line] == ['ground', 'total']
+
+
+def test_bench_buildcache(database):
+    results = json.loads(bench('buildcache', '--json', 'mpileaks ^mpich'))
+    assert len(results['specs']) == 1
+    formats = results['specs'][0]['formats']
+    assert formats[0]['compression'] == 'gzip'
+    for f in formats:
+        assert f['size'] > 0
+        assert f['push'] >= 0 and f['pull'] >= 0
+
+
+def test_bench_buildcache_synthetic():
+    results = json.loads(bench('buildcache', '--json', '--synthetic', '1'))
+    assert [s['spec'] for s in results['specs']] == ['synthetic']
+    gzip_result = results['specs'][0]['formats'][0]
+    assert gzip_result['compression'] == 'gzip'
+    assert gzip_result['pull'] >= 0 and gzip_result['reference'] >= 0
+
+
+def test_bench_relocate():
+    results = json.loads(bench(
+        'relocate', '--json', '-n', '3', '-s', '4', '-p', '5'))
+    assert [r['name'] for r in results['relocations']] == ['text', 'binary']
+    for r in results['relocations']:
+        assert r['bytes'] == 3 * 4 * 1024
@@ -11,11 +11,16 @@
 
 import llnl.util.lang
 
+import spack.build_systems.autotools
+import spack.caches
 import spack.compilers
 import spack.concretize
 import spack.error
 import spack.platforms
 import spack.repo
+import spack.solver.asp
+import spack.solver.cache
+import spack.util.file_cache
 import spack.variant as vt
 from spack.concretize import find_spec
 from spack.spec import Spec
@@ -1357,3 +1362,206 @@ def test_concrete_specs_are_not_modified_on_reuse(
         s = spack.spec.Spec(spec_str).concretized(reuse=True)
         assert s.package.installed is expect_installed
         assert s.satisfies(spec_str, strict=True)
+
+
+@pytest.fixture()
+def concretization_cache(tmpdir, mutable_config, monkeypatch):
+    """Enable the concretization cache, in a temporary misc_cache."""
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Only results of the clingo concretizer are cached')
+
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir)))
+    spack.config.set('config:concretization_cache', {
+        'enable': True, 'max_entries': 2, 'max_size': 1})
+    return spack.solver.cache.concretization_cache()
+
+
+def _forbid_solve(monkeypatch):
+    def _solve(*args, **kwargs):
+        raise AssertionError('the solver should not run')
+    monkeypatch.setattr(spack.solver.asp.PyclingoDriver, 'solve', _solve)
+
+
+@pytest.mark.usefixtures('mock_packages')
+def test_concretization_cache_hit(concretization_cache, monkeypatch):
+    expected = Spec('mpileaks ^mpich').concretized()
+    mpi = spack.concretize.concretize_specs_together(Spec('mpi'))[0]
+    assert len(concretization_cache.entries()[0]) == 2
+
+    _forbid_solve(monkeypatch)
+    s = Spec('mpileaks ^mpich').concretized()
+    assert s.concrete
+    assert s.dag_hash() == expected.dag_hash()
+    assert s.build_hash() == expected.build_hash()
+    assert s['mpi'].name == 'mpich'
+
+    # Virtual roots are concretized to their providers
+    assert spack.concretize.concretize_specs_together(Spec('mpi'))[0] == mpi
+
+
+@pytest.mark.usefixtures('mock_packages')
+def test_concretization_cache_keys(concretization_cache):
+    key = spack.solver.cache.input_hash([Spec('mpileaks')])
+    assert key == spack.solver.cache.input_hash([Spec('mpileaks')])
+    assert key != spack.solver.cache.input_hash([Spec('mpileaks+debug')])
+    assert key != spack.solver.cache.input_hash(
+        [Spec('mpileaks')], tests=True)
+
+    spack.config.set('packages:mpileaks', {'version': ['2.2']})
+    assert key != spack.solver.cache.input_hash([Spec('mpileaks')])
+
+
+@pytest.mark.usefixtures('mock_packages')
+def test_concretization_cache_tracks_build_systems(
+        concretization_cache, monkeypatch):
+    key = spack.solver.cache.input_hash([Spec('a')])
+
+    # Directives of base classes, like build systems, are inputs of the solve
+    file_hash = spack.solver.cache._file_hash
+    autotools = spack.build_systems.autotools.__file__
+
+    def _file_hash(path):
+        return 'changed' if path == autotools else file_hash(path)
+
+    monkeypatch.setattr(spack.solver.cache, '_file_hash', _file_hash)
+    assert key != spack.solver.cache.input_hash([Spec('a')])
+
+
+def test_concretization_cache_tracks_package_files(
+        concretization_cache, repo_with_changing_recipe, monkeypatch):
+    assert Spec('root').concretized()['changing'].satisfies('fee=True')
+
+    repo_with_changing_recipe.change(
+        {'delete_variant': True, 'add_variant': True})
+    s = Spec('root').concretized()
+    assert 'fee' not in s['changing'].variants
+    assert s['changing'].satisfies('fum=True')
+    assert len(concretization_cache.entries()[0]) == 2
+
+
+@pytest.mark.usefixtures('mock_packages')
+def test_concretization_cache_eviction(concretization_cache, monkeypatch):
+    for spec in ('libelf', 'libdwarf', 'mpich'):
+        Spec(spec).concretized()
+
+    # Only the two most recently used results are kept
+    keys, _ = concretization_cache.entries()
+    assert len(keys) == 2
+    _forbid_solve(monkeypatch)
+    Spec('mpich').concretized()
+    with pytest.raises(AssertionError):
+        Spec('libelf').concretized()
+
+    concretization_cache.max_size = 0
+    concretization_cache.evict()
+    assert concretization_cache.entries() == ([], 0)
+
+
+class _FactsCollector(object):
+    """Solver driver collecting the facts of a setup as strings."""
+
+    def __init__(self):
+        self.facts = []
+
+    def fact(self, head, assumption=False):
+        self.facts.append(str(head))
+
+    def newline(self):
+        pass
+
+    def h1(self, name):
+        pass
+
+    def h2(self, name):
+        pass
+
+
+def _setup_facts(*specs):
+    collector = _FactsCollector()
+    spack.solver.asp.SpackSolverSetup().setup(
+        collector, [Spec(s) for s in specs], tests=['mpileaks'])
+    return collector.facts
+
+
+@pytest.fixture()
+def package_facts_cache(tmpdir, mutable_config, monkeypatch):
+    """Enable the package facts cache, in a temporary misc_cache."""
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir)))
+    monkeypatch.setattr(spack.solver.cache, '_package_facts_cache', None)
+    spack.config.set('config:concretization_cache', {'package_facts': True})
+
+    recorded = []
+    record = spack.solver.asp.SpackSolverSetup.record_directive_rules
+
+    def _record(self, pkg, tests):
+        recorded.append(pkg.name)
+        return record(self, pkg, tests)
+
+    monkeypatch.setattr(
+        spack.solver.asp.SpackSolverSetup, 'record_directive_rules', _record)
+    return recorded
+
+
+@pytest.mark.usefixtures('mock_packages')
+def test_package_facts_are_replayed(package_facts_cache, monkeypatch):
+    spack.config.set('config:concretization_cache:package_facts', False)
+    expected = _setup_facts('mpileaks', 'dt-diamond')
+
+    spack.config.set('config:concretization_cache:package_facts', True)
+    assert _setup_facts('mpileaks', 'dt-diamond') == expected
+    assert 'mpileaks' in package_facts_cache
+
+    # Facts are read back from the disk by other processes
+    del package_facts_cache[:]
+    monkeypatch.setattr(spack.solver.cache, '_package_facts_cache', None)
+    assert _setup_facts('mpileaks', 'dt-diamond') == expected
+    assert not package_facts_cache
+
+
+def test_package_facts_of_changed_packages_are_regenerated(
+        package_facts_cache, repo_with_changing_recipe):
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Package facts are only used by the clingo concretizer')
+
+    assert Spec('root').concretized()['changing'].satisfies('fee=True')
+    assert set(['root', 'changing']) <= set(package_facts_cache)
+
+    del package_facts_cache[:]
+    repo_with_changing_recipe.change(
+        {'delete_variant': True, 'add_variant': True})
+    s = Spec('root').concretized()
+    assert 'fee' not in s['changing'].variants
+    assert s['changing'].satisfies('fum=True')
+    assert package_facts_cache == ['changing']
+
+
+@pytest.mark.parametrize('specs', [
+    ['mpileaks', 'mpileaks@2.2 +debug', 'mpi', 'dt-diamond ^dt-diamond-bottom'],
+    ['mpileaks ^mpich@3.0.4', 'mpileaks ^zmpi', 'mpileaks@:2.1', 'libelf'],
+])
+@pytest.mark.usefixtures('config', 'mock_packages')
+def test_solve_separately(specs):
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Only the clingo concretizer solves specs in a batch')
+
+    specs = [Spec(s) for s in specs]
+    results = spack.solver.asp.solve_separately(specs)
+    for spec, result in zip(specs, results):
+        assert result.specs[0].dag_hash() == spec.concretized().dag_hash()
+
+
+@pytest.mark.usefixtures('config', 'mock_packages')
+def test_solve_separately_falls_back():
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Only the clingo concretizer solves specs in a batch')
+
+    specs = [Spec(s) for s in [
+        'mpileaks', 'libelf os=debian6', 'mpileaks%gcc@4.5.0', 'mpich@:0.1',
+        'mpileaks+nonexistent', 'libdwarf'
+    ]]
+    results = spack.solver.asp.solve_separately(specs)
+    assert [r is None for r in results] == [
+        False, True, True, True, True, False]
+    assert results[5].specs[0].satisfies('libdwarf')
@@ -9,6 +9,7 @@
 import tempfile
 
 import pytest
+import ruamel.yaml.comments
 from six import StringIO
 
 from llnl.util.filesystem import mkdirp, touch
@@ -807,6 +808,102 @@ def test_config_parse_list_in_dict(tmpdir):
         assert "mirrors.yaml:5" in str(e)
 
 
+@pytest.fixture()
+def cached_config_file(tmpdir, monkeypatch):
+    """A configuration file old enough to be cached, and a function that
+    reads it while counting how many times it is parsed."""
+    filename = str(tmpdir.join('mirrors.yaml'))
+    with open(filename, 'w') as f:
+        f.write("""\
+mirrors:
+  # The first mirror
+  foo: http://foobar.com/baz
+  bar::
+    fetch: http://barbaz.com/foo
+    push: http://barbaz.com/foo
+""")
+    os.utime(filename, (0, 0))
+
+    parsed = []
+
+    def load_config(*args, **kwargs):
+        parsed.append(filename)
+        return _load_config(*args, **kwargs)
+
+    _load_config = syaml.load_config
+    monkeypatch.setattr(syaml, 'load_config', load_config)
+
+    def read(schema=spack.schema.mirrors.schema):
+        return spack.config.read_config_file(filename, schema)
+    return filename, read, parsed
+
+
+def test_config_file_cache(cached_config_file):
+    filename, read, parsed = cached_config_file
+    data = read()
+    assert parsed == [filename]
+
+    # The cached data is the same, including marks and comments
+    cached = read()
+    assert parsed == [filename]
+    assert cached == data
+    assert cached['mirrors']._start_mark.name == filename
+    assert [k._start_mark.line for k in cached['mirrors']] == [2, 3]
+    assert [k.override for k in cached['mirrors'] if k == 'bar'] == [True]
+    assert syaml.dump_config(cached) == syaml.dump_config(data)
+    assert '# The first mirror' in syaml.dump_config(cached)
+
+    # The file is read again once it is modified...
+    with open(filename, 'a') as f:
+        f.write('  baz: http://bazfoo.com/bar\n')
+    os.utime(filename, (0, 0))
+    assert 'baz' in read()['mirrors']
+    assert len(parsed) == 2
+
+    # ...or if it is read with another schema
+    with pytest.raises(spack.config.ConfigFormatError):
+        read(spack.schema.repos.schema)
+    assert len(parsed) == 3
+
+
+def test_config_file_cache_comments(cached_config_file, monkeypatch):
+    filename, read, parsed = cached_config_file
+
+    # Before Python 3.11, ordered dicts are pickled without their slots,
+    # where ruamel mappings keep their comments
+    def reduce_without_slots(self):
+        return (type(self), (), vars(self) or None, None, iter(self.items()))
+    monkeypatch.setattr(
+        ruamel.yaml.comments.CommentedMap, '__reduce__', reduce_without_slots)
+
+    data = read()
+    cached = read()
+    assert parsed == [filename]
+    assert syaml.dump_config(cached) == syaml.dump_config(data)
+    assert '# The first mirror' in syaml.dump_config(cached)
+
+
+def test_config_file_cache_ignores_recent_files(cached_config_file):
+    filename, read, parsed = cached_config_file
+    os.utime(filename, None)
+    read()
+    read()
+    assert len(parsed) == 2
+
+
+def test_config_file_cache_ignores_invalid_files(cached_config_file):
+    filename, read, parsed = cached_config_file
+    with open(filename, 'w') as f:
+        f.write('mirrors:\n  foo: [1, 2, 3]\n')
+    os.utime(filename, (0, 0))
+
+    # Errors are reported with the marks of the file every time
+    for _ in range(2):
+        with pytest.raises(spack.config.ConfigFormatError, match='mirrors.yaml:2'):
+            read()
+    assert len(parsed) == 2
+
+
 def test_bad_config_section(mock_low_high_config):
     """Test that getting or setting a bad section gives an error."""
     with pytest.raises(spack.config.ConfigSectionError):
@@ -37,6 +37,7 @@
 import spack.paths
 import spack.platforms
 import spack.repo
+import spack.spec
 import spack.stage
 import spack.store
 import spack.subprocess_context
@@ -164,6 +165,13 @@ def clear_recorded_monkeypatches():
     spack.subprocess_context.clear_patches()
 
 
+@pytest.fixture(autouse=True)
+def clear_spec_caches():
+    """Forget the results memoized by Spec.satisfies() in each test."""
+    yield
+    spack.spec.clear_caches()
+
+
 @pytest.fixture(scope='session', autouse=True)
 def record_monkeypatch_setattr():
     import _pytest
@@ -192,6 +200,15 @@ def no_path_access(monkeypatch):
 #
 # Disable any active Spack environment BEFORE all tests
 #
+@pytest.fixture(scope='session', autouse=True)
+def mock_config_cache(tmpdir_factory):
+    """Keep the configuration files cached by tests out of the user cache."""
+    saved_path = spack.config.config_cache_path
+    spack.config.config_cache_path = str(tmpdir_factory.mktemp('config_cache'))
+    yield
+    spack.config.config_cache_path = saved_path
+
+
 @pytest.fixture(scope='session', autouse=True)
 def clean_user_environment():
     spack_env_value = os.environ.pop(ev.spack_env_var, None)
@@ -131,8 +131,10 @@ def test_removed_upstream_dep(upstream_and_downstream_db):
         new_downstream = spack.database.Database(
             downstream_db.root, upstream_dbs=[upstream_db])
         new_downstream._fail_when_missing_deps = True
+        new_downstream._read()
+        # Missing dependencies are found when specs are built
         with pytest.raises(spack.database.MissingDependenciesError):
-            new_downstream._read()
+            new_downstream.query_local('y')
 
 
 @pytest.mark.usefixtures('config')
@@ -958,3 +960,231 @@ def test_reindex_when_all_prefixes_are_removed(mutable_database, mock_store):
         mutable_database.remove(s)
 
     assert len(mutable_database.query_local(installed=False, explicit=True)) == 0
+
+
+@pytest.fixture()
+def sqlite_database(mutable_database):
+    """SQLite-backed database sharing the store of ``mutable_database``."""
+    db = spack.database.Database(mutable_database.root, backend='sqlite')
+    # Import the records of index.json
+    with db.write_transaction():
+        pass
+    return db
+
+
+def _query_hashes(db, **kwargs):
+    return sorted(s.dag_hash() for s in db.query_local(**kwargs))
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='SQLite is not available')
+def test_sqlite_backend_imports_json(mutable_database, sqlite_database):
+    assert os.path.exists(sqlite_database._sqlite_path)
+    for installed in (True, False, any):
+        assert (_query_hashes(sqlite_database, installed=installed) ==
+                _query_hashes(mutable_database, installed=installed))
+
+    # A new database reads the records back from the SQLite file
+    db = spack.database.Database(mutable_database.root, backend='sqlite')
+    assert _query_hashes(db, installed=any) == _query_hashes(
+        mutable_database, installed=any)
+    for spec in db.query_local(installed=any):
+        assert spec.concrete
+        assert spec == mutable_database.query_one(spec, installed=any)
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='SQLite is not available')
+def test_sqlite_backend_reads_only_changes(sqlite_database, monkeypatch):
+    reader = spack.database.Database(sqlite_database.root, backend='sqlite')
+    reader.query_local()
+
+    def _fail(*args, **kwargs):
+        raise AssertionError('all the records were read again')
+
+    monkeypatch.setattr(reader, '_load_installs', _fail)
+
+    # Reading again without changes does not even look at the records
+    monkeypatch.setattr(reader._sqlite, 'read', _fail)
+    reader.query_local()
+    monkeypatch.undo()
+    monkeypatch.setattr(reader, '_load_installs', _fail)
+
+    spec = sqlite_database.query_one('mpileaks ^mpich')
+    sqlite_database.remove(spec)
+    assert not reader.query_local('mpileaks ^mpich')
+    assert spec.dag_hash() not in reader._data
+
+    sqlite_database.add(spec, spack.store.layout)
+    rec = reader.get_record('mpileaks ^mpich')
+    assert rec.installed
+    mpich = next(d for d in rec.spec.traverse() if d.name == 'mpich')
+    assert mpich is reader.get_record('mpich').spec
+    assert _query_hashes(reader) == _query_hashes(sqlite_database)
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='SQLite is not available')
+def test_sqlite_backend_writes_only_changes(sqlite_database, monkeypatch):
+    written = []
+
+    def _write(installs, deleted=(), replace=False):
+        written.append((sorted(installs), sorted(deleted), replace))
+        return 0
+
+    monkeypatch.setattr(sqlite_database._sqlite, 'write', _write)
+    spec = sqlite_database.query_one('externaltool')
+    sqlite_database.update_explicit(spec, True)
+    assert written == [([spec.dag_hash()], [], False)]
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='SQLite is not available')
+def test_sqlite_backend_select(sqlite_database):
+    index = sqlite_database._sqlite
+    records = index.select(name='mpileaks')
+    assert len(records) == len(sqlite_database.query_local('mpileaks'))
+    assert all(r['installed'] and r['explicit'] for r in records)
+
+    callpath = sqlite_database.query_one('callpath ^mpich')
+    record, = index.select(hash=callpath.dag_hash())
+    assert record['name'] == 'callpath'
+    assert record['version'] == str(callpath.version)
+    assert record['path'] == callpath.prefix
+    assert record['ref_count'] == 1
+
+    with pytest.raises(ValueError):
+        index.select(spec='callpath')
+
+
+@pytest.mark.skipif(not spack.database._use_sqlite,
+                    reason='SQLite is not available')
+def test_json_backend_imports_newer_sqlite(mutable_database, sqlite_database):
+    sqlite_database.remove('mpileaks ^mpich')
+    assert not mutable_database.query_local('mpileaks ^mpich')
+
+    # Writing index.json makes it the newest file again
+    mutable_database.remove('mpileaks ^zmpi')
+    assert mutable_database._newest_index() == mutable_database._index_path
+    assert not sqlite_database.query_local('mpileaks ^zmpi')
+    assert not sqlite_database.query_local('mpileaks ^mpich')
+
+
+def _loaded_names(db):
+    return set(rec.name for rec in db._data.values() if rec.spec_loaded)
+
+
+def test_specs_are_built_lazily(database):
+    db = spack.database.Database(database.root)
+    with db.read_transaction():
+        assert db._data and not _loaded_names(db)
+        for rec in db._data.values():
+            assert rec.name and rec.version
+
+    assert len(db.query_local('libelf')) == 1
+    assert _loaded_names(db) == set(['libelf'])
+
+    # Dependencies are built with the spec, and shared among specs
+    mpileaks, = db.query_local('mpileaks ^mpich')
+    assert set(['mpileaks', 'callpath', 'mpich']) <= _loaded_names(db)
+    assert not _loaded_names(db) & set(
+        ['externaltest', 'externaltool', 'trivial-smoke-test'])
+    assert mpileaks['libelf'].dag_hash() == db.query_one('libelf').dag_hash()
+    assert mpileaks.concrete
+    assert mpileaks == database.query_one('mpileaks ^mpich')
+
+    # Dependents are connected before listing them
+    dependents = db.installed_relatives('callpath ^mpich', 'parents')
+    assert [s.name for s in dependents] == ['mpileaks']
+
+
+def test_unbuilt_specs_are_written_back(mutable_database):
+    db = spack.database.Database(mutable_database.root)
+    with db.write_transaction():
+        pass
+    assert not _loaded_names(db)
+
+    with open(db._index_path) as f:
+        installs = json.load(f)['database']['installs']
+    assert sorted(installs) == sorted(
+        s.dag_hash() for s in mutable_database.query_local(installed=any))
+    assert all(installs[s.dag_hash()]['spec']['name'] == s.name
+               for s in mutable_database.query_local(installed=any))
+
+    db = spack.database.Database(mutable_database.root)
+    assert (sorted(db.query_local(installed=any)) ==
+            sorted(mutable_database.query_local(installed=any)))
+
+
+@pytest.mark.parametrize('query_spec,kwargs', [
+    ('mpileaks', {}),
+    ('mpileaks ^mpich', {}),
+    ('mpi', {}),
+    (any, {'explicit': True}),
+    (any, {'explicit': False}),
+    (any, {'installed': False}),
+    (any, {'installed': any}),
+    ('mpileaks', {'installed': any, 'explicit': True}),
+    (any, {'start_date': datetime.datetime(2000, 1, 1)}),
+    (any, {'end_date': datetime.datetime(2000, 1, 1)}),
+])
+def test_query_index_matches_scan(mutable_database, query_spec, kwargs):
+    mutable_database.remove('mpileaks ^zmpi')
+    expected = _query_hashes_without_index(
+        mutable_database, query_spec, **kwargs)
+    # Results are in the same order, not only the same
+    assert _queried_hashes(mutable_database, query_spec, **kwargs) == expected
+
+
+def _queried_hashes(db, query_spec, **kwargs):
+    with db.read_transaction():
+        return [s.dag_hash() for s in db._query(query_spec, **kwargs)]
+
+
+def _query_hashes_without_index(db, query_spec, **kwargs):
+    db._use_query_index = False
+    try:
+        return _queried_hashes(db, query_spec, **kwargs)
+    finally:
+        db._use_query_index = True
+
+
+def test_query_index_hash_prefix(database):
+    with database.read_transaction():
+        index = spack.database.QueryIndex(database._data)
+    for key in database._data:
+        assert index.with_hash_prefix(key[:7]) == [key]
+        assert database.get_by_hash_local(key[:7])[0].dag_hash() == key
+    assert index.with_hash_prefix('') == sorted(database._data)
+    assert index.with_hash_prefix('zzzzzzz') == []
+
+
+def test_query_index_dependents_closure(database):
+    callpath = database.query_one('callpath ^mpich').dag_hash()
+    mpich = database.query_one('mpich').dag_hash()
+    dependents = set(s.dag_hash() for s in database.query_local(
+        'mpileaks ^mpich', installed=any))
+    with database.read_transaction():
+        index = spack.database.QueryIndex(database._data)
+    assert index.dependents_closure([callpath]) == dependents
+    assert index.dependents_closure([mpich]) == dependents | set([callpath])
+
+
+def test_query_index_is_updated(mutable_database):
+    mpileaks = mutable_database.query_one('mpileaks ^mpich')
+    assert mutable_database.query_local('mpileaks ^mpich', explicit=True)
+    assert mutable_database._query_index
+
+    mutable_database.update_explicit(mpileaks, False)
+    assert mutable_database._query_index is None
+    assert not mutable_database.query_local('mpileaks ^mpich', explicit=True)
+
+    mutable_database.remove(mpileaks)
+    assert not mutable_database.query_local('mpileaks ^mpich')
+    assert not mutable_database.installed_relatives(
+        'callpath ^mpich', 'parents')
+
+    mutable_database.add(mpileaks, spack.store.layout)
+    assert mutable_database.query_local('mpileaks ^mpich')
+    assert mutable_database.installed_relatives(
+        'callpath ^mpich', 'parents') == set([mpileaks])
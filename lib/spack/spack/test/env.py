@@ -7,8 +7,10 @@
 
 import pytest
 
+import spack.config
 import spack.environment as ev
 import spack.spec
+import spack.util.parallel
 
 
 def test_hash_change_no_rehash_concrete(tmpdir, mock_packages, config):
@@ -46,3 +48,27 @@ def test_activate_should_require_an_env():
 
     with pytest.raises(TypeError):
         ev.activate(env=None)
+
+
+def test_concretize_separately_in_batch(tmpdir, mock_packages, config, monkeypatch):
+    if spack.config.get('config:concretizer') == 'original':
+        pytest.skip('Only the clingo concretizer solves specs in a batch')
+
+    # Only the spec which constrains its os is concretized on its own
+    concretized_alone = []
+
+    def _parallel_map(func, arguments, **kwargs):
+        concretized_alone.extend(str(x[0][0]) for x in arguments)
+        return [func(x) for x in arguments]
+    monkeypatch.setattr(spack.util.parallel, 'parallel_map', _parallel_map)
+
+    env = ev.Environment(tmpdir.strpath)
+    user_specs = ['mpileaks', 'mpileaks@2.2', 'libelf os=debian6', 'mpi']
+    for spec in user_specs:
+        env.add(spack.spec.Spec(spec))
+    env.concretize()
+
+    assert concretized_alone == [str(spack.spec.Spec('libelf os=debian6'))]
+    for user_spec, (_, concrete) in zip(user_specs, env.concretized_specs()):
+        expected = spack.spec.Spec(user_spec).concretized()
+        assert concrete.dag_hash() == expected.dag_hash()
@@ -5,6 +5,7 @@
 
 import os
 import shutil
+import threading
 
 import py
 import pytest
@@ -14,12 +15,16 @@
 import llnl.util.tty as tty
 
 import spack.binary_distribution
+import spack.build_environment
 import spack.compilers
+import spack.config
+import spack.hooks
 import spack.installer as inst
 import spack.package_prefs as prefs
 import spack.repo
 import spack.spec
 import spack.store
+import spack.util.jobserver
 import spack.util.lock as lk
 
 
@@ -1180,6 +1185,163 @@ def test_install_skip_patch(install_mockery, mock_fetch):
     assert inst.package_id(spec.package) in installer.installed
 
 
+@pytest.mark.parametrize('concurrent', [1, 3])
+def test_install_concurrent_packages(install_mockery, mock_fetch, concurrent):
+    """Test that all packages of the DAG get installed with concurrent builds."""
+    const_arg = installer_args(['mpileaks'], {'fake': True,
+                                              'concurrent_packages': concurrent})
+    installer = create_installer(const_arg)
+    assert installer.concurrent_packages == concurrent
+
+    installer.install()
+
+    spec, _ = const_arg[0]
+    for s in spec.traverse():
+        assert inst.package_id(s.package) in installer.installed
+        assert spack.store.db.query_one(s, installed=True)
+    assert not installer.active_builds
+
+
+@pytest.mark.parametrize('jobserver', [False, True])
+def test_concurrent_packages_share_jobs(install_mockery, mock_fetch,
+                                        mutable_config, monkeypatch,
+                                        jobserver):
+    """Test that concurrent builds split the global job budget, which
+    tools that cannot join the jobserver use with one too."""
+    spack.config.set('config:jobserver', jobserver)
+    monkeypatch.setattr(spack.build_environment, 'determine_number_of_jobs',
+                        lambda parallel: 16)
+    const_arg = installer_args(['b'], {'fake': True, 'concurrent_packages': 3})
+    installer = create_installer(const_arg)
+
+    installer.install()
+
+    assert installer.build_jobs == 5
+
+
+def test_concurrent_packages_from_config(install_mockery, mutable_config):
+    """Test that the number of concurrent builds defaults to the config."""
+    spack.config.set('config:concurrent_packages', 4)
+    installer = create_installer(installer_args(['b'], {}))
+    assert installer.concurrent_packages == 4
+
+    installer = create_installer(installer_args(['b'], {'concurrent_packages': 2}))
+    assert installer.concurrent_packages == 2
+
+
+def test_install_with_jobserver(install_mockery, mock_fetch, mutable_config,
+                                monkeypatch):
+    """Test that builds take and give back job slots of the jobserver."""
+    spack.config.set('config:jobserver', True)
+    spack.config.set('config:build_jobs', 2)
+
+    slots = []
+    take_job = inst.PackageInstaller._take_job
+
+    def _take_job(installer, pkg_id):
+        take_job(installer, pkg_id)
+        slots.append(installer.job_slots[pkg_id])
+
+    const_arg = installer_args(['mpileaks'], {'fake': True,
+                                              'concurrent_packages': 4})
+    installer = create_installer(const_arg)
+    monkeypatch.setattr(inst.PackageInstaller, '_take_job', _take_job)
+    installer.install()
+
+    spec, _ = const_arg[0]
+    assert inst.package_id(spec.package) in installer.installed
+
+    # Only two jobs, so builds use the implicit slot or the single token
+    assert slots
+    assert set(slots) <= set([spack.util.jobserver.implicit_slot,
+                              spack.util.jobserver.token])
+    assert not installer.job_slots
+    assert installer.jobserver is None
+
+
+def test_can_start_build_jobserver(install_mockery):
+    """Test that no build is started when the jobserver has no free slot."""
+    const_arg = installer_args(['b'], {'concurrent_packages': 2})
+    installer = create_installer(const_arg)
+    installer._init_queue()
+
+    installer.jobserver = spack.util.jobserver.JobServer.create(1)
+    try:
+        installer._take_job('x')
+        assert not installer._can_start_build()
+
+        installer._release_job('x')
+        assert installer._can_start_build()
+    finally:
+        installer.jobserver.close()
+
+
+def test_can_start_build(install_mockery):
+    """Test that only tasks without uninstalled dependencies are started."""
+    const_arg = installer_args(['a'], {'concurrent_packages': 2})
+    installer = create_installer(const_arg)
+    installer._init_queue()
+
+    # 'b' is ready to build
+    assert installer._can_start_build()
+
+    # but not once all build slots are taken
+    installer.active_builds = {'x': None, 'y': None}
+    assert not installer._can_start_build()
+
+    # 'a' still needs 'b' once 'b' is taken from the queue
+    installer.active_builds = {}
+    task = installer._pop_task()
+    assert task.pkg.name == 'b'
+    assert not installer._can_start_build()
+
+
+def test_terminate_builds(install_mockery):
+    """Test that background builds are killed on termination."""
+    class MockBuild(object):
+        terminated = False
+
+        def terminate(self):
+            self.terminated = True
+
+    const_arg = installer_args(['b'], {'concurrent_packages': 2})
+    installer = create_installer(const_arg)
+    installer._init_queue()
+    task = installer._pop_task()
+
+    build = MockBuild()
+    installer.active_builds[task.pkg_id] = (task, build)
+    installer._terminate_builds()
+
+    assert build.terminated
+    assert not installer.active_builds
+
+
+def test_install_concurrent_fail_fast(install_mockery, monkeypatch):
+    """Test that a failed background build stops the install when failing
+    fast."""
+    class FailedBuild(object):
+        def poll(self):
+            return True
+
+        def complete(self):
+            raise inst.InstallError('mock build failure')
+
+    def _install(installer, task, wait=True):
+        return FailedBuild()
+
+    const_arg = installer_args(['a'], {'fail_fast': True,
+                                       'concurrent_packages': 2})
+    installer = create_installer(const_arg)
+    monkeypatch.setattr(inst.PackageInstaller, '_install_task', _install)
+
+    with pytest.raises(inst.InstallError, match='mock build failure'):
+        installer.install()
+
+    assert not installer.installed
+    assert not installer.active_builds
+
+
 def test_overwrite_install_backup_success(temporary_store, config, mock_packages,
                                           tmpdir):
     """
@@ -1272,3 +1434,52 @@ def remove(self, spec):
     # Make sure that `remove` was called on the database after an unsuccessful
     # attempt to restore the backup.
     assert fake_db.called
+
+
+@pytest.mark.parametrize('concurrent', [1, 2])
+def test_install_prefetched_binaries(install_mockery, mutable_config,
+                                     monkeypatch, concurrent):
+    """Test that binaries are downloaded in the background, and extracted in
+    the background with concurrent installs."""
+    spack.config.set('config:binary_prefetch', 2)
+    spack.config.set('mirrors', {'test': 'file:///no/such/mirror'})
+
+    events = []
+
+    def _get_mirrors_for_spec(spec, full_hash_match=False):
+        return [{'mirror_url': 'file:///no/such/mirror', 'spec': spec}]
+
+    def _download_tarball(spec, preferred_mirrors=None):
+        events.append(('download', spec.name, threading.current_thread()))
+        return '/no/such/{0}.spack'.format(spec.name)
+
+    def _extract_tarball(spec, filename, **kwargs):
+        assert filename == '/no/such/{0}.spack'.format(spec.name)
+        events.append(('extract', spec.name, threading.current_thread()))
+
+    monkeypatch.setattr(spack.binary_distribution, 'get_mirrors_for_spec',
+                        _get_mirrors_for_spec)
+    monkeypatch.setattr(spack.binary_distribution, 'download_tarball',
+                        _download_tarball)
+    monkeypatch.setattr(spack.binary_distribution, 'extract_tarball',
+                        _extract_tarball)
+    monkeypatch.setattr(spack.hooks, 'post_install', _noop)
+
+    const_arg = installer_args(['a'], {'concurrent_packages': concurrent})
+    installer = create_installer(const_arg)
+    installer.install()
+
+    spec, _ = const_arg[0]
+    names = sorted(s.name for s in spec.traverse())
+    for s in spec.traverse():
+        assert spack.store.db.query_one(s, installed=True)
+        assert s.package.installed_from_binary_cache
+    assert installer.prefetcher is None
+
+    main = threading.current_thread()
+    downloads = [e for e in events if e[0] == 'download']
+    extractions = [e for e in events if e[0] == 'extract']
+    assert sorted(e[1] for e in downloads) == names
+    assert sorted(e[1] for e in extractions) == names
+    assert all(e[2] is not main for e in downloads)
+    assert all((e[2] is not main) == (concurrent > 1) for e in extractions)
@@ -4,6 +4,10 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import subprocess
+import sys
+
+import pytest
 
 import llnl.util.filesystem as fs
 
@@ -61,3 +65,36 @@ def test_get_version_bad_git(tmpdir, working_env):
 
     os.environ["PATH"] = str(tmpdir)
     assert spack.spack_version == get_version()
+
+
+#: Modules that printing the version or the prefix of Spack should not need
+slow_modules = [
+    'spack.environment.environment', 'spack.repo', 'spack.solver.asp',
+    'spack.spec', 'spack.store', 'jinja2', 'jsonschema',
+]
+
+
+def run_spack(*args):
+    """Run bin/spack in a new process, with lazy imports enabled."""
+    env = os.environ.copy()
+    env.pop('SPACK_LAZY_IMPORTS', None)
+    process = subprocess.Popen(
+        [sys.executable, spack.paths.spack_script] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    out, err = process.communicate()
+    assert process.returncode == 0, err
+    return out.decode('utf-8'), err.decode('utf-8')
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5),
+                    reason='lazy imports require Python 3.5')
+@pytest.mark.parametrize('command', [['--version'], ['location', '-r']])
+def test_startup_imports(command):
+    _, err = run_spack('--import-profile', '--lines', 'all', *command)
+    lines = err.strip().split('\n')
+    assert lines[0].endswith(' seconds')
+    assert lines[2].split() == ['cumtime', 'owntime', 'module']
+
+    executed = set(line.split()[-1] for line in lines[3:])
+    assert 'spack.main' in executed
+    assert not executed.intersection(slow_modules)
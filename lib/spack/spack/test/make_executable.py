@@ -13,7 +13,9 @@
 import tempfile
 import unittest
 
-from spack.build_environment import MakeExecutable
+import spack.build_environment
+import spack.util.jobserver
+from spack.build_environment import MakeExecutable, NinjaExecutable
 from spack.util.environment import path_put_first
 
 
@@ -110,3 +112,52 @@ def test_make_jobs_env(self):
         self.assertEqual(make(output=str, jobs_env='MAKE_PARALLELISM',
                               _dump_env=dump_env).strip(), '-j8')
         self.assertEqual(dump_env['MAKE_PARALLELISM'], '8')
+
+    def test_make_jobserver(self):
+        server = spack.util.jobserver.JobServer.create(4)
+        spack.util.jobserver.connect(server.path)
+        try:
+            make = MakeExecutable('make', 8, supports_jobserver=True)
+            dump_env = {}
+            self.assertEqual(make(output=str, _dump_env=dump_env).strip(), '')
+            self.assertIn('--jobserver-auth=', dump_env['MAKEFLAGS'])
+
+            self.assertEqual(make(parallel=False, output=str,
+                                  _dump_env=dump_env).strip(), '')
+            self.assertEqual(dump_env['MAKEFLAGS'], '')
+
+            # Executables that are not jobserver clients keep using -j
+            ctest = MakeExecutable('make', 8)
+            self.assertEqual(ctest(output=str).strip(), '-j8')
+        finally:
+            spack.util.jobserver.client().close()
+            spack.util.jobserver._client = None
+            server.close()
+
+    def test_ninja_jobserver(self):
+        server = spack.util.jobserver.JobServer.create(4)
+        spack.util.jobserver.connect(server.path)
+        try:
+            for version, flags in (('1.13.1', ''), ('1.12.1', '-j8')):
+                ninja_exe = os.path.join(self.tmpdir, 'ninja')
+                with open(ninja_exe, 'w') as f:
+                    f.write('#!/bin/sh\n')
+                    f.write('test "$1" = --version && echo {0} || echo "$@"'
+                            .format(version))
+                os.chmod(ninja_exe, 0o700)
+                spack.build_environment._ninja_jobserver_support.clear()
+
+                # ninja 1.13 joins the jobserver through its FIFO, older
+                # versions keep using -j
+                ninja = NinjaExecutable('ninja', 8)
+                dump_env = {}
+                self.assertEqual(
+                    ninja(output=str, _dump_env=dump_env).strip(), flags)
+                self.assertEqual(
+                    '--jobserver-auth=fifo:{0}'.format(server.path) in
+                    dump_env.get('MAKEFLAGS', ''), not flags)
+        finally:
+            spack.build_environment._ninja_jobserver_support.clear()
+            spack.util.jobserver.client().close()
+            spack.util.jobserver._client = None
+            server.close()
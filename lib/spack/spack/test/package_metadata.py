@@ -0,0 +1,145 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import pytest
+
+import spack.package_metadata
+import spack.repo
+import spack.spec
+from spack.package_metadata import DynamicPackageError, read_package_source
+
+static_package = '''\
+from spack import *
+
+
+class Example(CMakePackage):
+    """An example package."""
+
+    homepage = "http://www.example.com"
+    url = "http://www.example.com/example-1.0.tar.gz"
+    tags = ['tag1', 'tag2']
+
+    version('1.1', sha256='abcdef')
+    version('1.0', sha256='012345')
+
+    variant('mpi', default=True, description='Use MPI')
+
+    depends_on('zlib')
+    depends_on('mpi', when='+mpi')
+    provides('blas', 'lapack@3:', when='@1.1:')
+    conflicts('%intel', '@:1.0')
+
+    with when('+mpi'):
+        provides('scalapack')
+        conflicts('%pgi')
+
+    def cmake_args(self):
+        return [self.define_from_variant('ENABLE_MPI', 'mpi')]
+'''
+
+
+def test_read_package_source():
+    data = read_package_source(static_package, 'example')
+    assert data['class_name'] == 'Example'
+    assert data['bases'] == ['CMakePackage']
+    assert data['doc'] == 'An example package.'
+    assert data['attributes']['tags'] == ['tag1', 'tag2']
+    assert ['provides', ['scalapack'], {}, ['+mpi']] in data['directives']
+
+    metadata = spack.package_metadata.PackageMetadata('builtin.example', data)
+    assert metadata.static
+    assert metadata.tags == ['tag1', 'tag2']
+    assert [str(v) for v in metadata.versions] == ['1.0', '1.1']
+    # Variants and dependencies of the base class are included
+    assert metadata.variants == ['build_type', 'ipo', 'mpi']
+    assert metadata.dependencies == ['cmake', 'mpi', 'zlib']
+    assert metadata.conflicts == {
+        '%intel': ['@:1.0'], '%pgi': ['+mpi'], '+ipo': ['^cmake@:3.8']}
+    assert not metadata.has_patches
+    assert dict(
+        (str(spec), sorted(str(w) for w in when))
+        for spec, when in metadata.provided.items()
+    ) == {
+        'blas': ['example@1.1:'],
+        'lapack@3:': ['example@1.1:'],
+        'scalapack': ['example+mpi'],
+    }
+
+
+@pytest.mark.parametrize('body', [
+    # Directives in control flow
+    "    for v in ['1.0', '1.1']:\n        version(v)",
+    "    if True:\n        depends_on('zlib')",
+    # Arguments that are not literals
+    "    variant('x', values=any_combination_of('a', 'b'))",
+    "    depends_on('zlib', when=WHEN)",
+    "    versions = ['1.0']\n    version(*versions)",
+    # Calls to functions that may call directives
+    "    filter_compiler_wrappers('mpicc')",
+    # Attributes exposed by the metadata that are not literals
+    "    tags = ['a'] + ['b']",
+    # Context managers other than when()
+    "    with open('foo') as f:\n        pass",
+])
+def test_read_package_source_dynamic(body):
+    source = 'class Example(Package):\n{0}\n'.format(body)
+    with pytest.raises(DynamicPackageError):
+        read_package_source(source, 'example')
+
+
+@pytest.mark.parametrize('source', [
+    # Base class that is another package
+    'class Example(Zlib):\n    pass\n',
+    # No class, or a class created dynamically
+    'Example = type("Example", (Package,), {})\n',
+    # Invalid syntax
+    'class Example(Package)\n    pass\n',
+])
+def test_read_package_source_unknown_class(source):
+    with pytest.raises(DynamicPackageError):
+        read_package_source(source, 'example')
+
+
+def test_metadata_matches_package_classes(mock_packages):
+    repo = spack.repo.path.get_repo('builtin.mock')
+    static = 0
+    for name in repo.all_package_names():
+        metadata = repo.get_pkg_metadata(name)
+        if not metadata.static:
+            continue
+        static += 1
+
+        pkg_class = repo.get_pkg_class(name)
+        assert metadata.doc == pkg_class.__doc__
+        assert metadata.tags == getattr(pkg_class, 'tags', [])
+        assert metadata.versions == sorted(pkg_class.versions)
+        assert metadata.variants == sorted(pkg_class.variants)
+        assert metadata.dependencies == sorted(pkg_class.dependencies)
+        assert metadata.provided == pkg_class.provided
+        assert metadata.conflicts == dict(
+            (spec, [str(when) for when, _ in conditions])
+            for spec, conditions in pkg_class.conflicts.items())
+        assert metadata.has_patches == (bool(pkg_class.patches) or any(
+            dependency.patches
+            for conditions in pkg_class.dependencies.values()
+            for dependency in conditions.values()))
+    assert static
+
+
+def test_metadata_does_not_import_packages(mutable_mock_repo):
+    repo = mutable_mock_repo.get_repo('builtin.mock')
+    metadata = mutable_mock_repo.get_pkg_metadata('mpich')
+    assert metadata.static
+    assert metadata.tags == ['tag1', 'tag2']
+    assert spack.spec.Spec('mpi@:3') in metadata.provided
+    assert 'mpich' not in repo._modules
+
+    # Dynamic packages are read from their class
+    metadata = repo.get_pkg_metadata('builtin.mock.simple-inheritance')
+    assert not metadata.static
+
+
+def test_metadata_of_unknown_package(mutable_mock_repo):
+    with pytest.raises(spack.repo.UnknownPackageError):
+        mutable_mock_repo.get_pkg_metadata('builtin.mock.nonexistent')
@@ -6,6 +6,7 @@
 import os.path
 import re
 import shutil
+import struct
 
 import pytest
 
@@ -151,6 +152,51 @@ def _factory(rpaths, message="Hello world!"):
     return _factory
 
 
+@pytest.fixture()
+def make_elf(tmpdir):
+    """Factory fixture that writes a minimal ELF object with a PT_LOAD segment
+    mapping the whole file and a dynamic section with a single RPATH entry.
+    """
+    def _factory(rpath, elf_class=64, byteorder='<', tag=15):
+        base = 0x400000
+        ehsize, phentsize, dynsize = {32: (52, 32, 8), 64: (64, 56, 16)}[elf_class]
+        ident = b'\x7fELF' + struct.pack(
+            'BBB', elf_class // 32, 1 if byteorder == '<' else 2, 1
+        ) + b'\0' * 9
+
+        dynamic_offset = ehsize + 2 * phentsize
+        strtab_offset = dynamic_offset + 3 * dynsize
+        strtab = b'\0' + rpath + b'\0libc.so.6\0'
+        size = strtab_offset + len(strtab)
+
+        if elf_class == 32:
+            header = struct.pack(byteorder + 'HHIIIIIHHHHHH', 2, 3, 1, 0, ehsize,
+                                 0, 0, ehsize, phentsize, 2, 0, 0, 0)
+            phdr = byteorder + 'IIIIIIII'
+            phdrs = struct.pack(phdr, 1, 0, base, base, size, size, 5, 0x1000)
+            phdrs += struct.pack(phdr, 2, dynamic_offset, base + dynamic_offset,
+                                 base + dynamic_offset, 3 * dynsize,
+                                 3 * dynsize, 6, 4)
+            dyn = byteorder + 'iI'
+        else:
+            header = struct.pack(byteorder + 'HHIQQQIHHHHHH', 2, 62, 1, 0, ehsize,
+                                 0, 0, ehsize, phentsize, 2, 0, 0, 0)
+            phdr = byteorder + 'IIQQQQQQ'
+            phdrs = struct.pack(phdr, 1, 5, 0, base, base, size, size, 0x1000)
+            phdrs += struct.pack(phdr, 2, 6, dynamic_offset,
+                                 base + dynamic_offset, base + dynamic_offset,
+                                 3 * dynsize, 3 * dynsize, 8)
+            dyn = byteorder + 'qQ'
+        entries = (struct.pack(dyn, 5, base + strtab_offset) +
+                   struct.pack(dyn, tag, 1) + struct.pack(dyn, 0, 0))
+
+        elf = tmpdir.join('object-{0}-{1}'.format(elf_class, tag))
+        elf.write_binary(ident + header + phdrs + entries + strtab)
+        return str(elf)
+
+    return _factory
+
+
 @pytest.fixture()
 def make_dylib(tmpdir_factory):
     """Create a shared library with unfriendly qualities.
@@ -507,3 +553,130 @@ def test_fixup_macos_rpaths(make_dylib, make_object_file):
     # (this is a corner case for GCC installation)
     (root, filename) = make_object_file()
     assert not fixup_rpath(root, filename)
+
+
+def test_prefix_relocator_text(tmpdir):
+    prefixes = collections.OrderedDict([
+        ('/old/root', '/new/root'),
+        ('/old/root/pkg-abc', '/elsewhere/pkg-abc'),
+        ('/unchanged', '/unchanged'),
+    ])
+    fpath = tmpdir.join('file.txt')
+    fpath.write(
+        '/old/root/pkg-def/lib\n'
+        '-L/old/root/pkg-abc/lib "/old/root/pkg-abc"\n'
+        '/nested/old/root/pkg-abc /unchanged\n')
+
+    relocator = spack.relocate.PrefixRelocator(prefixes)
+    assert relocator.relocate(str(fpath))
+    # The longest old prefix is replaced, and only at the start of paths
+    assert fpath.read() == (
+        '/new/root/pkg-def/lib\n'
+        '-L/elsewhere/pkg-abc/lib "/elsewhere/pkg-abc"\n'
+        '/nested/old/root/pkg-abc /unchanged\n')
+
+    # Files without old prefixes are not written
+    assert not relocator.relocate(str(fpath))
+    assert not relocator.relocate(str(tmpdir.ensure('empty.txt')))
+
+
+def test_prefix_relocator_binary(tmpdir):
+    prefixes = {b'/old/root': b'/new', b'/old/root/pkg-abc': b'/abc'}
+    fpath = tmpdir.join('binary')
+    fpath.write_binary(b'\x7fELF/old/root/lib\0/old/root/pkg-abc/lib\0')
+
+    spack.relocate.PrefixRelocator(prefixes, binary=True).relocate(str(fpath))
+    assert fpath.read_binary() == (
+        b'\x7fELF/new//////lib\0/abc//////////////lib\0')
+
+
+@pytest.mark.parametrize('concurrency', [1, 2])
+def test_relocate_text_files(concurrency, tmpdir):
+    files = []
+    for i in range(4):
+        fpath = tmpdir.join('file-{0}.txt'.format(i))
+        fpath.write('#!/old/root/bin/python\n/old/root/pkg-{0}\n'.format(i))
+        files.append(str(fpath))
+
+    spack.relocate.relocate_text(
+        files, {'/old/root': '/new/root'}, concurrency=concurrency)
+    for i, fpath in enumerate(files):
+        with open(fpath) as f:
+            assert f.read() == (
+                '#!/new/root/bin/python\n/new/root/pkg-{0}\n'.format(i))
+
+    # Errors are reported from the worker processes too
+    with pytest.raises(spack.relocate.BinaryTextReplaceError):
+        spack.relocate.relocate_text_bin(
+            files, {'/new/root': '/much/longer/root'}, concurrency=concurrency)
+
+
+def test_relocate_text_bin_at_offsets(tmpdir):
+    fpath = tmpdir.join('binary')
+    data = b'\x7fELF/old/root/a\0/old/root/b\0/old/root/c\0'
+    fpath.write_binary(data)
+    offsets = spack.relocate.prefix_offsets(str(fpath), [b'/old/root'])
+    assert offsets == [4, 16, 28]
+
+    # Only the recorded offsets are relocated, e.g. not those of RPATHs
+    spack.relocate.relocate_text_bin(
+        [str(fpath)], {b'/old/root': b'/new'},
+        offsets={str(fpath): ([4, 28], len(data))})
+    assert fpath.read_binary() == (
+        b'\x7fELF/new//////a\0/old/root/b\0/new//////c\0')
+
+    # Files which changed since the offsets were recorded are searched
+    spack.relocate.relocate_text_bin(
+        [str(fpath)], {b'/old/root': b'/new'},
+        offsets={str(fpath): ([], len(data) + 1)})
+    assert b'/old/root' not in fpath.read_binary()
+
+
+@pytest.mark.parametrize('elf_class', [32, 64])
+@pytest.mark.parametrize('byteorder', ['<', '>'])
+@pytest.mark.parametrize('tag', [15, 29])
+def test_set_elf_rpaths_in_place(elf_class, byteorder, tag, make_elf,
+                                 monkeypatch):
+    elf = make_elf(b'/old/root/lib:/usr/lib64', elf_class, byteorder, tag)
+    assert spack.relocate._elf_rpaths_for(elf) == ['/old/root/lib', '/usr/lib64']
+
+    # Values that fit are written without calling patchelf
+    monkeypatch.setattr(spack.relocate, '_patchelf', None)
+    assert spack.relocate._set_elf_rpaths(elf, ['/new/lib', '/usr/lib64']) == ''
+    assert spack.relocate._elf_rpaths_for(elf) == ['/new/lib', '/usr/lib64']
+    with open(elf, 'rb') as f:
+        rpath = spack.relocate.read_elf_rpath(f)
+        assert list(rpath.tags) == [tag]
+        f.seek(rpath.offset)
+        assert f.read(26) == b'/new/lib:/usr/lib64' + b'\0' * 6 + b'l'
+    assert spack.relocate.elf_rpath_ranges(elf) == [
+        [rpath.offset, rpath.offset + 19]
+    ]
+
+    # Growing the string table is left to patchelf
+    assert not spack.relocate._set_elf_rpaths_in_place(
+        elf, '/a/much/longer/root/lib:/usr/lib64')
+
+
+@pytest.mark.requires_executables('gcc')
+@skip_unless_linux
+def test_set_elf_rpaths_in_place_executable(hello_world, monkeypatch):
+    executable = str(hello_world(rpaths=['/usr/lib/foo', '/usr/lib64']))
+    assert spack.relocate._elf_rpaths_for(executable) == [
+        '/usr/lib/foo', '/usr/lib64'
+    ]
+
+    monkeypatch.setattr(spack.relocate, '_patchelf', None)
+    spack.relocate._set_elf_rpaths(executable, ['/usr/lib', '/usr/lib64'])
+    assert spack.relocate._elf_rpaths_for(executable) == ['/usr/lib', '/usr/lib64']
+    assert spack.util.executable.Executable(executable)(output=str) == (
+        'Hello world!'
+    )
+
+
+def test_read_elf_rpath_errors(tmpdir):
+    fpath = tmpdir.join('not-an-elf')
+    fpath.write_binary(b'#!/bin/sh\necho hello\n')
+    with open(str(fpath), 'rb') as f:
+        with pytest.raises(spack.relocate.ElfParsingError):
+            spack.relocate.read_elf_rpath(f)
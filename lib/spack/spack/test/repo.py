@@ -4,11 +4,15 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import shutil
 
 import pytest
 
+import spack.caches
 import spack.paths
 import spack.repo
+import spack.util.file_cache
+import spack.util.naming
 
 
 @pytest.fixture()
@@ -86,3 +90,107 @@ def test_namespace_hasattr(attr_name, exists, mutable_mock_repo):
 def test_all_package_names_is_cached_correctly():
     assert 'mpi' in spack.repo.all_package_names(include_virtuals=True)
     assert 'mpi' not in spack.repo.all_package_names(include_virtuals=False)
+
+
+@pytest.fixture()
+def indexed_repo(mutable_mock_repo, extra_repo, tmpdir, monkeypatch):
+    """A repository with two packages, with its own misc cache"""
+    mutable_mock_repo.put_first(extra_repo)
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir)))
+    for name in ('pkg-a', 'pkg-b'):
+        write_package(extra_repo, name, 'mpi')
+    spack.repo.FastPackageChecker._paths_cache.pop(
+        extra_repo.packages_path, None)
+    yield extra_repo
+    spack.repo.FastPackageChecker._paths_cache.pop(
+        extra_repo.packages_path, None)
+
+
+def write_package(repo, name, virtual):
+    pkg_dir = os.path.join(repo.packages_path, name)
+    if not os.path.isdir(pkg_dir):
+        os.mkdir(pkg_dir)
+    with open(os.path.join(pkg_dir, 'package.py'), 'w') as f:
+        f.write("""from spack import *
+
+class {0}(Package):
+    provides('{1}')
+""".format(spack.util.naming.mod_to_class(name), virtual))
+
+
+def reload_repo(repo):
+    """Read a repository again, as a new Spack process would"""
+    spack.repo.FastPackageChecker._paths_cache.pop(repo.packages_path, None)
+    new_repo = spack.repo.Repo(repo.root)
+    spack.repo.path.remove(spack.repo.path.repos[0])
+    spack.repo.path.put_first(new_repo)
+    return new_repo
+
+
+def test_package_fingerprints_are_reused(indexed_repo, monkeypatch):
+    checker = spack.repo.FastPackageChecker(indexed_repo.packages_path)
+    assert sorted(checker) == ['pkg-a', 'pkg-b']
+
+    # Package files are not read again when their stats did not change
+    hashed = []
+
+    def fingerprint(pkg_file, previous=None):
+        if previous is None or os.path.getsize(pkg_file) != previous.size:
+            hashed.append(os.path.basename(os.path.dirname(pkg_file)))
+        return _fingerprint_package(pkg_file, previous)
+
+    _fingerprint_package = spack.repo._fingerprint_package
+    monkeypatch.setattr(spack.repo, '_fingerprint_package', fingerprint)
+    write_package(indexed_repo, 'pkg-b', 'lapack')
+    repo = reload_repo(indexed_repo)
+    assert sorted(repo._pkg_checker) == ['pkg-a', 'pkg-b']
+    assert hashed == ['pkg-b']
+    assert (repo._pkg_checker['pkg-a'] ==
+            checker['pkg-a'])
+    assert (repo._pkg_checker['pkg-b'].content_hash !=
+            checker['pkg-b'].content_hash)
+
+
+def test_package_fingerprints_follow_added_and_removed_packages(
+        indexed_repo):
+    spack.repo.FastPackageChecker(indexed_repo.packages_path)
+
+    write_package(indexed_repo, 'pkg-c', 'lapack')
+    shutil.rmtree(os.path.join(indexed_repo.packages_path, 'pkg-a'))
+    checker = reload_repo(indexed_repo)._pkg_checker
+    assert sorted(checker) == ['pkg-b', 'pkg-c']
+
+    # The persisted table is up to date
+    assert sorted(checker._read_fingerprints()['packages']) == [
+        'pkg-b', 'pkg-c']
+
+
+def test_repo_index_updates_changed_packages(indexed_repo, monkeypatch):
+    assert indexed_repo.provider_index.providers_for('mpi')
+
+    updated = []
+
+    def update(self, pkg_fullname):
+        updated.append(pkg_fullname)
+        _update(self, pkg_fullname)
+
+    _update = spack.repo.ProviderIndexer.update
+    monkeypatch.setattr(spack.repo.ProviderIndexer, 'update', update)
+
+    # Nothing is updated when no package changed
+    repo = reload_repo(indexed_repo)
+    assert len(repo.provider_index.providers_for('mpi')) == 2
+    assert updated == []
+
+    # Only changed packages are updated, removed ones are dropped
+    with open(os.path.join(indexed_repo.packages_path, 'pkg-a',
+                           'package.py'), 'a') as f:
+        f.write('# changed\n')
+    write_package(indexed_repo, 'pkg-c', 'lapack')
+    shutil.rmtree(os.path.join(indexed_repo.packages_path, 'pkg-b'))
+    repo = reload_repo(indexed_repo)
+    providers = repo.provider_index.providers_for
+    assert sorted(updated) == ['extra_test_repo.pkg-a', 'extra_test_repo.pkg-c']
+    assert [s.name for s in providers('mpi')] == ['pkg-a']
+    assert [s.name for s in providers('lapack')] == ['pkg-c']
@@ -0,0 +1,151 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import spack.paths
+import spack.server
+
+pytestmark = [
+    pytest.mark.skipif(not spack.server.supported(),
+                       reason='requires passing file descriptors'),
+    pytest.mark.skipif(sys.platform == 'win32', reason='requires fork'),
+]
+
+
+@pytest.fixture()
+def socket_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.server, 'socket_dir', str(tmpdir.join('sock')))
+    monkeypatch.delenv('SPACK_SERVER', raising=False)
+    yield tmpdir.join('sock')
+
+
+@pytest.fixture()
+def server(socket_dir, mock_packages, config):
+    """Server running in a thread, without loading all of Spack first."""
+    path = spack.server.socket_path(spack.paths.prefix)
+    server = spack.server.Server(path)
+    server._mtimes = server._current_mtimes()
+    server._package_mtimes = server._current_mtimes(server._package_files())
+
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    while not os.path.exists(path) and thread.is_alive():
+        thread.join(0.01)
+
+    yield server
+
+    server.stop()
+    thread.join()
+
+
+def test_forward_without_server(socket_dir):
+    assert spack.server.forward(['--version'], spack.paths.prefix) is None
+    assert not socket_dir.check()
+
+
+def test_forward_disabled(server, monkeypatch):
+    monkeypatch.setenv('SPACK_SERVER', '0')
+    assert spack.server.forward(['--version'], spack.paths.prefix) is None
+    assert server.requests == 0
+
+
+def test_forward_command(server, capfd):
+    capfd.readouterr()
+    code = spack.server.forward(['location', '-r'], spack.paths.prefix)
+    out, _ = capfd.readouterr()
+
+    assert code == 0
+    assert out.strip() == spack.paths.prefix
+    assert server.requests == 1
+
+    code = spack.server.forward(['location', '--nonexistent'],
+                                spack.paths.prefix)
+    assert code != 0
+    assert server.requests == 2
+
+
+def test_status_and_stop(server):
+    status = spack.server.request(server.path, {'command': 'status'})
+    assert status['pid'] == os.getpid()
+    assert status['requests'] == 0
+
+    spack.server.request(server.path, {'command': 'stop'})
+    assert server._stopped
+
+
+def test_fallback_on_changed_files(server, tmpdir):
+    changed = tmpdir.join('changed.yaml')
+    changed.write('')
+    server._mtimes[str(changed)] = None
+
+    assert spack.server.forward(['--version'], spack.paths.prefix) is None
+    assert server.outdated
+    assert server.requests == 0
+
+
+def test_package_files_checked_periodically(server, tmpdir):
+    changed = tmpdir.join('package.py')
+    changed.write('')
+    server._package_mtimes[str(changed)] = None
+    message = {'argv': ['--version'], 'env': dict(os.environ),
+               'python': spack.server._python()}
+
+    # Package files are not checked again before the interval elapsed
+    server._packages_checked = time.time()
+    assert server._refuse(message) is None
+
+    server._packages_checked -= spack.server.package_check_interval
+    assert server._refuse(message) == 'files changed'
+    assert server.outdated
+
+
+def test_watched_files_skip_lazy_modules(server, monkeypatch):
+    class LazyModule(types.ModuleType):
+        def __getattribute__(self, name):
+            raise AssertionError('lazy module accessed')
+
+    monkeypatch.setitem(sys.modules, 'lazy_module', LazyModule('lazy_module'))
+    assert spack.server.__file__ in server._watched_files()
+
+
+def test_fallback_on_command_line_scopes(server, tmpdir):
+    argv = ['-C', str(tmpdir), '--version']
+    assert spack.server.forward(argv, spack.paths.prefix) is None
+    assert not server.outdated
+    assert server.requests == 0
+
+
+def test_fallback_on_environment(server):
+    # The server runs in this process, so only the client environment differs
+    python = spack.server._python()
+    env = dict(os.environ, SPACK_USER_CONFIG_PATH='/nonexistent')
+    message = {'argv': ['--version'], 'env': env, 'python': python}
+    assert server._refuse(message) == 'SPACK_USER_CONFIG_PATH changed'
+
+    env = dict(os.environ, SPACK_PYTHON='/nonexistent/python')
+    message = {'argv': ['--version'], 'env': env, 'python': python}
+    assert server._refuse(message) == 'SPACK_PYTHON changed'
+
+    env = dict(os.environ, SPACK_COLOR='never')
+    message = {'argv': ['--version'], 'env': env, 'python': python}
+    assert server._refuse(message) is None
+
+
+@pytest.mark.parametrize('python', [
+    None,
+    {'executable': '/nonexistent/python', 'version': list(sys.version_info)},
+    {'executable': sys.executable, 'version': [2, 7, 18, 'final', 0]},
+])
+def test_fallback_on_python(server, python):
+    message = {'argv': ['--version'], 'env': dict(os.environ)}
+    if python:
+        message['python'] = python
+    assert server._refuse(message) == 'Python changed'
@@ -5,6 +5,8 @@
 """
 These tests check Spec DAG operations using dummy packages.
 """
+import sys
+
 import pytest
 
 import spack.error
@@ -989,3 +991,18 @@ def test_spec_tree_respect_deptypes(self):
         assert 'version-test-pkg' in out
         out = s.tree(deptypes=('link', 'run'))
         assert 'version-test-pkg' not in out
+
+
+def test_traverse_deeper_than_recursion_limit():
+    # Traversals don't recurse, so DAGs can be deeper than the stack
+    depth = sys.getrecursionlimit() + 100
+    nodes = [Spec('node-{0}'.format(i)) for i in range(depth)]
+    for parent, child in zip(nodes, nodes[1:]):
+        parent._add_dependency(child, ('build', 'link'))
+    names = [s.name for s in nodes]
+
+    assert [s.name for s in nodes[0].traverse()] == names
+    assert [s.name for s in nodes[0].traverse(order='post')] == names[::-1]
+    assert [d for d, _ in nodes[-1].traverse(
+        direction='parents', depth=True)] == list(range(depth))
+    assert [s.name for s in nodes[0].copy().traverse()] == names
@@ -9,6 +9,7 @@
 
 import spack.directives
 import spack.error
+import spack.spec
 from spack.error import SpecError, UnsatisfiableSpecError
 from spack.spec import (
     Spec,
@@ -22,6 +23,7 @@
     UnknownVariantError,
     substitute_abstract_variants,
 )
+from spack.version import VersionList
 
 
 def make_spec(spec_like, concrete):
@@ -1240,3 +1242,37 @@ def test_merge_anonymous_spec_with_named_spec(anonymous, named, expected):
     changed = s.constrain(named)
     assert changed
     assert s == Spec(expected)
+
+
+def test_interned_spec():
+    spec = spack.spec.interned_spec('mpileaks@2.3 ^mpich')
+    assert spec == Spec('mpileaks@2.3 ^mpich')
+    assert spack.spec.interned_spec('mpileaks@2.3 ^mpich') is spec
+    assert spack.spec.interned_spec(spec) is spec
+
+    # Constraining a spec doesn't modify the interned spec
+    constrained = Spec('mpileaks')
+    constrained.constrain('mpileaks@2.3 ^mpich')
+    constrained.versions.intersect(VersionList(['2.3.1']))
+    assert str(spec.versions) == '2.3'
+
+
+def test_satisfies_memoized_with_build_dependencies(mock_packages):
+    specs = []
+    for version in ('3.20', '3.21'):
+        spec = Spec.from_literal({
+            'cmake-client@1.0': {'cmake@{0}:build'.format(version): None}})
+        spec._mark_concrete()
+        specs.append(spec)
+
+    # Build dependencies are not part of the DAG hash
+    old, new = specs
+    assert old.dag_hash() == new.dag_hash()
+
+    for _ in range(2):
+        assert old.satisfies('cmake-client@1.0')
+        assert new.satisfies('cmake-client@1.0')
+        assert old.satisfies('^cmake@3.20')
+        assert not new.satisfies('^cmake@3.20')
+        assert '^cmake@3.21' in new
+        assert not new.satisfies('cmake-client@2.0')
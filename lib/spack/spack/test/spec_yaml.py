@@ -393,3 +393,42 @@ def test_legacy_yaml(tmpdir, install_mockery, mock_packages):
     spec = Spec.from_yaml(yaml)
     concrete_spec = spec.concretized()
     assert concrete_spec.eq_dag(spec)
+
+
+def test_concrete_specs_share_node_components(install_mockery, mock_packages):
+    spec = Spec('mpileaks').concretized()
+    node_dict = spec['callpath'].to_node_dict()
+    first, second = Spec.from_node_dict(node_dict), Spec.from_node_dict(
+        node_dict)
+    assert first.eq_node(second)
+    for attr in ('versions', 'architecture', 'compiler'):
+        assert getattr(first, attr) is getattr(second, attr)
+    for name, variant in first.variants.items():
+        assert second.variants[name] is variant
+
+    # Abstract specs get their own components
+    node_dict['concrete'] = False
+    abstract = Spec.from_node_dict(node_dict)
+    assert abstract.architecture == first.architecture
+    assert abstract.architecture is not first.architecture
+
+    # Copies share the components until they are made abstract
+    copy = first.copy()
+    assert copy.architecture is first.architecture
+    copy._mark_concrete(False)
+    assert copy.architecture is not first.architecture
+    copy.architecture.os = 'fe'
+    copy.versions = spack.version.ver('2.0')
+    assert first.eq_node(second)
+
+
+def test_interned_node_components_are_bounded(
+        install_mockery, mock_packages, monkeypatch):
+    monkeypatch.setattr(spack.spec, '_interned_components_size', 4)
+    node_dict = Spec('mpileaks').concretized()['callpath'].to_node_dict()
+    spec = Spec.from_node_dict(node_dict)
+    assert 0 < len(spack.spec._interned_components) <= 4
+    assert spec.eq_node(Spec.from_node_dict(node_dict))
+
+    spack.spec.clear_caches()
+    assert not spack.spec._interned_components
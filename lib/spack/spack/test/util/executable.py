@@ -83,3 +83,11 @@ def test_which(tmpdir):
     exe = ex.which("spack-test-exe")
     assert exe is not None
     assert exe.path == str(tmpdir.join("spack-test-exe"))
+
+
+def test_executable_cwd(tmpdir):
+    python = ex.Executable(sys.executable)
+    output = python('-c', 'import os; print(os.getcwd())',
+                    output=str, cwd=str(tmpdir))
+    assert os.path.realpath(output.strip()) == os.path.realpath(str(tmpdir))
+    assert os.getcwd() != str(tmpdir)
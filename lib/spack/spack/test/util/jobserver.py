@@ -0,0 +1,118 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Tests for the GNU make jobserver implementation"""
+import os
+import sys
+
+import pytest
+
+import spack.util.jobserver as jobserver
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='Jobservers use named pipes')
+
+
+@pytest.fixture()
+def server():
+    server = jobserver.JobServer.create(3)
+    yield server
+    server.close()
+
+
+def test_jobserver_slots(server):
+    """Test that the jobserver hands out as many job slots as jobs."""
+    slots = [server.acquire() for _ in range(3)]
+    assert slots[0] == jobserver.implicit_slot
+    assert slots[1:] == [jobserver.token] * 2
+
+    # All the job slots are taken
+    assert server.acquire() is None
+
+    server.release(slots.pop())
+    assert server.acquire() == jobserver.token
+
+    server.release(jobserver.implicit_slot)
+    assert server.acquire() == jobserver.implicit_slot
+
+
+def test_jobserver_close_removes_fifo():
+    server = jobserver.JobServer.create(2)
+    fifo_dir = os.path.dirname(server.path)
+    assert os.path.exists(server.path)
+    server.close()
+    assert not os.path.exists(fifo_dir)
+
+    # Joining a jobserver does not remove its FIFO
+    server = jobserver.JobServer.create(2)
+    joined = jobserver.JobServer(server.path)
+    joined.close()
+    assert os.path.exists(server.path)
+    server.close()
+
+
+def test_jobserver_client_shares_tokens(server):
+    """Test that clients draw tokens from the jobserver's pool."""
+    client = jobserver.JobServerClient(server.path)
+    try:
+        token = os.read(client.read_fd, 1)
+        assert token == jobserver.token
+
+        # One token left for the server besides its implicit slot
+        assert server.acquire() == jobserver.implicit_slot
+        assert server.acquire() == jobserver.token
+        assert server.acquire() is None
+
+        os.write(client.write_fd, token)
+        assert server.acquire() == jobserver.token
+    finally:
+        client.close()
+
+
+def test_jobserver_client_makeflags(server):
+    client = jobserver.JobServerClient(server.path)
+    try:
+        makeflags = client.makeflags(3)
+        assert makeflags == '-j3 --jobserver-auth={0},{1}'.format(
+            client.read_fd, client.write_fd)
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize('makeflags,expected', [
+    ('', None),
+    ('-j4', None),
+    (' -j4 --jobserver-auth=fifo:/tmp/GMfifo1234', '/tmp/GMfifo1234'),
+])
+def test_jobserver_path(makeflags, expected):
+    assert jobserver.jobserver_path(makeflags) == expected
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='Jobserver file descriptors are reopened via /proc')
+def test_jobserver_path_from_fds():
+    r, w = os.pipe()
+    try:
+        for option in ('--jobserver-auth', '--jobserver-fds'):
+            makeflags = ' -j4 {0}={1},{2}'.format(option, r, w)
+            assert jobserver.jobserver_path(makeflags) == \
+                '/proc/{0}/fd/{1}'.format(os.getpid(), r)
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_jobserver_from_environment(server):
+    environ = {'MAKEFLAGS': '-j3 --jobserver-auth=fifo:{0}'.format(server.path)}
+    joined = jobserver.JobServer.from_environment(environ)
+    try:
+        assert joined.path == server.path
+        assert not joined.owner
+    finally:
+        joined.close()
+
+    assert jobserver.JobServer.from_environment({}) is None
+    environ = {'MAKEFLAGS': '--jobserver-auth=fifo:/does/not/exist'}
+    assert jobserver.JobServer.from_environment(environ) is None
@@ -0,0 +1,133 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import sys
+import threading
+
+import pytest
+
+from six import StringIO
+
+import spack.util.imp.startup as startup
+
+pytestmark = pytest.mark.skipif(
+    sys.version_info < (3, 5), reason='requires importlib from Python 3.5')
+
+module_source = '''\
+import sys
+sys.executed_test_modules.append(__name__)
+value = __name__
+'''
+
+
+@pytest.fixture()
+def test_package(tmpdir, monkeypatch):
+    """Package whose modules record when they are executed."""
+    package = tmpdir.ensure('lazy_test_pkg', dir=True)
+    package.join('__init__.py').write(module_source)
+    package.join('mod.py').write(
+        module_source + 'import lazy_test_pkg.other\n')
+    package.join('other.py').write(module_source)
+    package.join('slow.py').write(
+        'import time\ntime.sleep(0.2)\n' + module_source)
+    package.join('bad.py').write(
+        module_source + 'raise ValueError(value)\n')
+
+    monkeypatch.syspath_prepend(str(tmpdir))
+    monkeypatch.setattr(
+        sys, 'executed_test_modules', [], raising=False)
+    yield sys.executed_test_modules
+
+    for name in list(sys.modules):
+        if name.startswith('lazy_test_pkg'):
+            del sys.modules[name]
+
+
+def install(monkeypatch, *finders):
+    monkeypatch.setattr(sys, 'meta_path', list(finders) + sys.meta_path)
+
+
+def test_lazy_imports(test_package, monkeypatch):
+    install(monkeypatch, startup.LazyFinder(prefixes=('lazy_test_pkg',)))
+
+    import lazy_test_pkg.mod
+    assert test_package == []
+
+    # Importing a lazy module again doesn't execute it
+    import lazy_test_pkg.mod  # noqa: F811
+    assert test_package == []
+
+    # Using an attribute executes the module and its parents, and keeps
+    # the submodules imported before
+    assert lazy_test_pkg.mod.value == 'lazy_test_pkg.mod'
+    assert test_package == ['lazy_test_pkg', 'lazy_test_pkg.mod']
+    assert lazy_test_pkg.value == 'lazy_test_pkg'
+    assert 'other' in dir(lazy_test_pkg)
+
+    assert lazy_test_pkg.other.value == 'lazy_test_pkg.other'
+    assert test_package == [
+        'lazy_test_pkg', 'lazy_test_pkg.mod', 'lazy_test_pkg.other']
+
+
+def test_lazy_imports_threads(test_package, monkeypatch):
+    install(monkeypatch, startup.LazyFinder(prefixes=('lazy_test_pkg',)))
+
+    import lazy_test_pkg.slow
+    values = []
+
+    def use_module():
+        values.append(lazy_test_pkg.slow.value)
+
+    # Threads using the module wait until it is executed, once
+    threads = [threading.Thread(target=use_module) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert values == ['lazy_test_pkg.slow'] * 4
+    assert test_package.count('lazy_test_pkg.slow') == 1
+
+
+def test_lazy_imports_error(test_package, monkeypatch):
+    install(monkeypatch, startup.LazyFinder(prefixes=('lazy_test_pkg',)))
+
+    import lazy_test_pkg.bad
+    with pytest.raises(ValueError) as first:
+        lazy_test_pkg.bad.value
+
+    # The module is not executed again, and raises the same error
+    with pytest.raises(ValueError) as second:
+        lazy_test_pkg.bad.value
+    assert second.value is first.value
+    assert test_package.count('lazy_test_pkg.bad') == 1
+
+
+def test_lazy_imports_exclude(test_package, monkeypatch):
+    install(monkeypatch, startup.LazyFinder(
+        prefixes=('lazy_test_pkg',), exclude=('lazy_test_pkg.mod',)))
+
+    import lazy_test_pkg.mod  # noqa: F401
+    assert test_package == ['lazy_test_pkg.mod']
+
+
+def test_import_profile(test_package, monkeypatch):
+    profiler = startup.ImportProfiler()
+    install(monkeypatch,
+            startup.LazyFinder(prefixes=('lazy_test_pkg.other',)),
+            profiler)
+
+    import lazy_test_pkg.mod  # noqa: F401
+    assert test_package == ['lazy_test_pkg', 'lazy_test_pkg.mod']
+
+    # Lazy modules are not timed until they are executed
+    assert 'lazy_test_pkg.other' not in profiler.times
+    for name in test_package:
+        cumulative, own = profiler.times[name]
+        assert 0 <= own <= cumulative
+
+    out = StringIO()
+    profiler.report(lines=1, out=out)
+    lines = out.getvalue().strip().split('\n')
+    assert lines[0].startswith('2 modules imported in')
+    assert lines[-1].split()[-1] in test_package
@@ -6,6 +6,7 @@
 
 import ordereddict_backport
 import pytest
+from six.moves.urllib.error import HTTPError
 
 import llnl.util.tty as tty
 
@@ -174,6 +175,41 @@ def test_get_header():
         spack.util.web.get_header(headers, 'ContentLength')
 
 
+def test_read_from_url_if_modified(monkeypatch):
+    class MockResponse(object):
+        def __init__(self, headers):
+            self.headers = headers
+            self.closed = False
+
+        def geturl(self):
+            return url
+
+        def close(self):
+            self.closed = True
+
+    responses = []
+
+    def mock_urlopen(req, *args, **kwargs):
+        if honor_conditionals and req.get_header('If-none-match') == '"v1"':
+            raise HTTPError(url, 304, 'Not Modified', {}, None)
+        responses.append(MockResponse({'ETag': '"v1"'}))
+        return responses[-1]
+
+    monkeypatch.setattr(spack.util.web, '_urlopen', mock_urlopen)
+    url = 'http://example.com/build_cache/index.shards.json'
+
+    honor_conditionals = True
+    _, headers, response = spack.util.web.read_from_url_if_modified(url)
+    assert spack.util.web.get_header_or_none(headers, 'ETag') == '"v1"'
+    assert spack.util.web.read_from_url_if_modified(url, etag='"v1"') is None
+    assert spack.util.web.read_from_url_if_modified(url, etag='"v0"')
+
+    # Servers ignoring conditional requests are detected by the ETag
+    honor_conditionals = False
+    assert spack.util.web.read_from_url_if_modified(url, etag='"v1"') is None
+    assert responses[-1].closed
+
+
 def test_list_url(tmpdir):
     testpath = str(tmpdir)
 
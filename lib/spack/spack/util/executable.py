@@ -96,6 +96,8 @@ def __call__(self, *args, **kwargs):
                 an exception even if ``fail_on_error`` is set to ``True``
             ignore_quotes (bool): If False, warn users that quotes are not needed
                 as Spack does not use a shell. Defaults to False.
+            cwd (str): Directory to run the executable in, instead of the
+                working directory of Spack
             input: Where to read stdin from
             output: Where to send stdout
             error: Where to send stderr
@@ -146,6 +148,7 @@ def __call__(self, *args, **kwargs):
         fail_on_error = kwargs.pop('fail_on_error', True)
         ignore_errors = kwargs.pop('ignore_errors', ())
         ignore_quotes = kwargs.pop('ignore_quotes', False)
+        cwd = kwargs.pop('cwd', None)
 
         # If they just want to ignore one error code, make it a tuple.
         if isinstance(ignore_errors, int):
@@ -195,7 +198,9 @@ def streamify(arg, mode):
                 stdin=istream,
                 stderr=estream,
                 stdout=ostream,
-                env=env)
+                env=env,
+                cwd=cwd,
+                close_fds=False)
             out, err = proc.communicate()
 
             result = None
@@ -0,0 +1,310 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Import hooks installed by ``bin/spack`` before it imports ``spack.main``.
+
+Starting the ``spack`` command imports most of Spack, even for commands
+that only print a path or a version. This module provides two finders
+for ``sys.meta_path``:
+
+* ``LazyFinder`` defers the execution of Spack modules until one of
+  their attributes is used. ``import spack.spec`` then only creates an
+  empty module, and its code runs when ``spack.spec.Spec`` is first
+  needed, if ever.
+* ``ImportProfiler`` records the time taken to import each module, which
+  ``spack --import-profile`` reports.
+
+Both need ``importlib`` from Python 3.5 or later, and do nothing on older
+versions of Python.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import time
+import types
+
+#: Modules, and their submodules, that are loaded lazily
+lazy_modules = ('spack', 'llnl', 'archspec', 'jinja2', 'jsonschema', 'ruamel')
+
+#: Modules that are always executed when imported. Package modules are
+#: loaded by repositories, and ``spack.util.imp`` contains these hooks.
+eager_modules = ('spack.pkg', 'spack.util.imp')
+
+#: Import profiler installed by ``enable_import_profile()``, if any
+profiler = None
+
+
+def _supported():
+    return sys.version_info >= (3, 5)
+
+
+def _matches(name, prefixes):
+    return any(name == p or name.startswith(p + '.') for p in prefixes)
+
+
+class _DelegatingFinder(object):
+    """Finder that asks the finders after it in ``sys.meta_path`` for the
+    spec of a module, and lets subclasses change the spec they return."""
+
+    def find_spec(self, name, path, target=None):
+        try:
+            finders = sys.meta_path[sys.meta_path.index(self) + 1:]
+        except ValueError:
+            return None
+
+        for finder in finders:
+            find_spec = getattr(finder, 'find_spec', None)
+            if find_spec is None:
+                continue
+            spec = find_spec(name, path, target)
+            if spec is not None:
+                return self.wrap(spec)
+        return None
+
+    def wrap(self, spec):
+        return spec
+
+
+#: Attributes of lazy modules that the import system uses, and that can be
+#: read without executing the module
+_import_attributes = frozenset([
+    '__class__', '__file__', '__loader__', '__name__', '__package__',
+    '__path__', '__spec__'
+])
+
+
+class _LazyState(object):
+    """Loader state of a lazy module: the attributes it was created with,
+    and the lock and outcome of its execution."""
+
+    def __init__(self, initial):
+        self.initial = initial
+        self.lock = threading.RLock()
+        self.executing = False
+        self.error = None
+
+
+def _execute(module):
+    """Execute the code of a lazy module once, and keep the attributes that
+    were set on it while it was lazy, such as its submodules.
+
+    Other threads wait until the module is executed, while the thread
+    executing it sees it partially initialized, as with circular imports.
+    The module stays lazy until its code succeeds, and the error of a failed
+    execution is raised again every time the module is used.
+    """
+    module_dict = types.ModuleType.__getattribute__(module, '__dict__')
+    spec = module_dict['__spec__']
+    state = spec.loader_state
+
+    with state.lock:
+        if state.error is not None:
+            raise state.error
+        if state.executing or type(module) is not _LazyModule:
+            return
+
+        changed = dict((k, v) for k, v in module_dict.items()
+                       if k not in state.initial or state.initial[k] is not v)
+        state.executing = True
+        try:
+            spec.loader.exec_module(module)
+        except BaseException as e:
+            state.error = e
+            raise
+        finally:
+            state.executing = False
+
+        module_dict.update(changed)
+        if type(module) is _LazyModule:
+            module.__class__ = types.ModuleType
+
+
+class _LazyModule(types.ModuleType):
+    """Module that is executed when one of its attributes is first used.
+
+    Unlike the modules of ``importlib.util.LazyLoader``, these are not
+    executed when the import system reads their spec, so importing a lazy
+    module again, or one of its submodules, keeps it lazy.
+    """
+
+    def __getattribute__(self, attr):
+        if attr in _import_attributes:
+            return types.ModuleType.__getattribute__(self, attr)
+        _execute(self)
+        return types.ModuleType.__getattribute__(self, attr)
+
+    def __delattr__(self, attr):
+        _execute(self)
+        types.ModuleType.__delattr__(self, attr)
+
+
+class _LazyLoader(object):
+    """Loader that makes the modules of another loader lazy."""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__spec__.loader = self.loader
+        module.__loader__ = self.loader
+        module.__spec__.loader_state = _LazyState(dict(module.__dict__))
+        module.__class__ = _LazyModule
+
+
+class LazyFinder(_DelegatingFinder):
+    """Finder that loads the pure Python modules matching some prefixes
+    lazily.
+
+    Args:
+        prefixes (tuple): names of the modules to load lazily, including
+            their submodules
+        exclude (tuple): names of modules to always load eagerly,
+            including their submodules
+    """
+
+    def __init__(self, prefixes=lazy_modules, exclude=eager_modules):
+        self.prefixes = prefixes
+        self.exclude = exclude
+
+    def find_spec(self, name, path, target=None):
+        if not _matches(name, self.prefixes) or _matches(name, self.exclude):
+            return None
+        return super(LazyFinder, self).find_spec(name, path, target)
+
+    def wrap(self, spec):
+        import importlib.machinery
+
+        # Modules created by their loader, like extensions, can't be lazy
+        loader = spec.loader
+        if isinstance(loader, _TimedLoader):
+            loader = loader.loader
+        if isinstance(loader, (importlib.machinery.SourceFileLoader,
+                               importlib.machinery.SourcelessFileLoader)):
+            spec.loader = _LazyLoader(spec.loader)
+        return spec
+
+
+class _TimedLoader(object):
+    """Loader that records the time taken to execute a module."""
+
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler.measure(
+            module.__name__, self.loader.exec_module, module)
+
+
+class ImportProfiler(_DelegatingFinder):
+    """Finder that records the time taken to execute each module.
+
+    The cumulative time of a module includes the time taken to import the
+    modules it imports, and its own time does not. Modules that are loaded
+    lazily are timed when they are executed, if ever.
+    """
+
+    def __init__(self):
+        #: module name -> [cumulative time, own time], in seconds
+        self.times = {}
+        self._children = []
+
+    def wrap(self, spec):
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def measure(self, name, function, *args):
+        """Call a function, and add its duration to the times of a module.
+
+        Args:
+            name (str): name of the module being imported
+            function: function to call with the remaining arguments
+        """
+        self._children.append(0.0)
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.time() - start
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+
+            times = self.times.setdefault(name, [0.0, 0.0])
+            times[0] += elapsed
+            times[1] += elapsed - children
+
+    def report(self, lines=-1, out=None):
+        """Print the modules that took the most time to import.
+
+        Args:
+            lines (int): number of modules to print, or -1 for all of them
+            out (file): stream to print to, defaults to ``sys.stderr``
+        """
+        out = out or sys.stderr
+        total = sum(own for _, own in self.times.values())
+        by_time = sorted(
+            self.times.items(), key=lambda item: item[1][0], reverse=True)
+        if lines >= 0:
+            by_time = by_time[:lines]
+
+        print('%d modules imported in %.3f seconds' % (
+            len(self.times), total), file=out)
+        print('', file=out)
+        print('%10s %10s  %s' % ('cumtime', 'owntime', 'module'), file=out)
+        for name, (cumulative, own) in by_time:
+            print('%10.3f %10.3f  %s' % (cumulative, own, name), file=out)
+
+
+def enable_lazy_imports():
+    """Load Spack modules lazily from now on, unless ``SPACK_LAZY_IMPORTS``
+    is set to ``0`` in the environment.
+
+    Returns:
+        The ``LazyFinder`` added to ``sys.meta_path``, or None if lazy
+        imports are disabled or not supported.
+    """
+    if not _supported() or os.environ.get('SPACK_LAZY_IMPORTS') == '0':
+        return None
+
+    finder = LazyFinder()
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def enable_import_profile():
+    """Record the time taken to import each module from now on.
+
+    This must be called before ``enable_lazy_imports()``, so that lazy
+    modules are timed when they are executed rather than when they are
+    imported.
+
+    Returns:
+        The ``ImportProfiler`` added to ``sys.meta_path``, or None if it is
+        not supported.
+    """
+    global profiler
+    if not _supported():
+        return None
+
+    if profiler is None:
+        profiler = ImportProfiler()
+        sys.meta_path.insert(0, profiler)
+    return profiler
@@ -0,0 +1,221 @@
+# Copyright 2013-2021 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Implementation of the GNU make jobserver protocol.
+
+A jobserver is a pipe holding one token (a single byte) for each job that
+can run on top of the one job every client is implicitly entitled to.
+Clients read a token from the pipe before starting an additional job and
+write it back once the job is done, so that all the clients sharing the
+pipe never run more jobs in total than the number the pipe was created for.
+
+Spack creates a jobserver on a named pipe (FIFO) for an install session,
+or joins the one advertised in ``MAKEFLAGS`` if Spack itself runs under
+``make``.  The installer takes a job slot for each build process it starts,
+and build processes connect to the same FIFO so that ``make``, ``ninja``
+and the compilers invoked through Spack's compiler wrappers draw their
+additional jobs from the same pool of tokens.
+"""
+
+import errno
+import os
+import re
+import shutil
+import tempfile
+
+import llnl.util.tty as tty
+
+#: Byte written to the jobserver for each token, as GNU make does
+token = b'+'
+
+#: Job slot every client owns without reading a token
+implicit_slot = b''
+
+#: Pattern matching the jobserver in ``MAKEFLAGS``, either as a FIFO
+#: (``--jobserver-auth=fifo:PATH``) or as a pair of file descriptors
+#: (``--jobserver-auth=R,W`` or ``--jobserver-fds=R,W`` for make < 4.2)
+_makeflags_re = re.compile(
+    r'--jobserver-(?:auth|fds)=(?:fifo:(?P<fifo>\S+)|(?P<r>\d+),(?P<w>\d+))')
+
+#: Connection to the jobserver of the current build process, if any
+_client = None
+
+
+def _set_inheritable(fd):
+    # File descriptors are inheritable by default before Python 3.4
+    if hasattr(os, 'set_inheritable'):
+        os.set_inheritable(fd, True)  # novermin
+
+
+class JobServer(object):
+    """Server side of the jobserver, used by the process that starts builds.
+
+    Job slots are taken without blocking: ``acquire`` returns ``None``
+    when all the jobs allowed are already running.
+    """
+
+    def __init__(self, path, owner=False):
+        """Open the jobserver on the FIFO at ``path``.
+
+        Args:
+            path (str): path to the FIFO of the jobserver
+            owner (bool): whether the FIFO is removed on ``close``
+        """
+        self.path = path
+        self.owner = owner
+
+        # Open our own file description of the FIFO so that it can be
+        # non-blocking without affecting the other clients.
+        self.fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+        # The implicit job slot of this process
+        self._implicit_free = True
+
+    @classmethod
+    def create(cls, jobs):
+        """Create a new jobserver for ``jobs`` jobs in total.
+
+        Args:
+            jobs (int): maximum number of jobs running at the same time
+        """
+        tmpdir = tempfile.mkdtemp(prefix='spack-jobserver-')
+        path = os.path.join(tmpdir, 'fifo')
+        os.mkfifo(path, 0o600)
+
+        server = cls(path, owner=True)
+        os.write(server.fd, token * (max(jobs, 1) - 1))
+        tty.debug('Created a jobserver for {0} jobs at {1}'.format(jobs, path))
+        return server
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        """Join the jobserver advertised in ``MAKEFLAGS``, if any.
+
+        Args:
+            environ (dict or None): environment to look into, defaults to
+                ``os.environ``
+
+        Returns:
+            JobServer or None: the jobserver, or ``None`` if there is no
+                usable jobserver in the environment
+        """
+        environ = os.environ if environ is None else environ
+        path = jobserver_path(environ.get('MAKEFLAGS', ''))
+        if not path:
+            return None
+
+        try:
+            server = cls(path)
+        except OSError as e:
+            tty.debug('Cannot join the jobserver at {0}: {1}'.format(path, e))
+            return None
+
+        tty.debug('Joined the jobserver at {0}'.format(path))
+        return server
+
+    def acquire(self):
+        """Take a job slot without waiting for it.
+
+        Returns:
+            bytes or None: the token taken, which is ``implicit_slot`` for the
+                implicit job slot of this process, or ``None`` if there is no
+                free job slot
+        """
+        if self._implicit_free:
+            self._implicit_free = False
+            return implicit_slot
+
+        try:
+            return os.read(self.fd, 1) or None
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None
+            raise
+
+    def release(self, job_token):
+        """Give back a job slot taken with ``acquire``.
+
+        Args:
+            job_token (bytes): the token returned by ``acquire``
+        """
+        if job_token == implicit_slot:
+            self._implicit_free = True
+        elif job_token:
+            os.write(self.fd, job_token)
+
+    def close(self):
+        """Close the jobserver, removing its FIFO if this process created it."""
+        os.close(self.fd)
+        if self.owner:
+            shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+
+class JobServerClient(object):
+    """Client side of the jobserver, used by build processes.
+
+    The FIFO is opened twice, once for reading and once for writing tokens,
+    and both file descriptors are inherited by the processes spawned during
+    the build so that they can be advertised in ``MAKEFLAGS``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.read_fd = os.open(path, os.O_RDWR)
+        self.write_fd = os.open(path, os.O_RDWR)
+        _set_inheritable(self.read_fd)
+        _set_inheritable(self.write_fd)
+
+    def makeflags(self, jobs, fifo=False):
+        """Return the value of ``MAKEFLAGS`` making ``make`` a client of this
+        jobserver.
+
+        Args:
+            jobs (int): total number of jobs of the jobserver
+            fifo (bool): advertise the path of the FIFO rather than the
+                inherited file descriptors, for clients like ``ninja`` that
+                only open the jobserver by path
+        """
+        if fifo:
+            return '-j{0} --jobserver-auth=fifo:{1}'.format(jobs, self.path)
+        return '-j{0} --jobserver-auth={1},{2}'.format(
+            jobs, self.read_fd, self.write_fd)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def jobserver_path(makeflags):
+    """Return a path the jobserver advertised in ``MAKEFLAGS`` can be opened
+    from, or ``None`` if there is none.
+
+    Jobservers passed as file descriptors can only be reopened through
+    ``/proc`` so they are only supported on Linux.
+
+    Args:
+        makeflags (str): value of ``MAKEFLAGS``
+    """
+    match = _makeflags_re.search(makeflags)
+    if not match:
+        return None
+
+    if match.group('fifo'):
+        return match.group('fifo')
+
+    path = '/proc/{0}/fd/{1}'.format(os.getpid(), match.group('r'))
+    return path if os.path.exists(path) else None
+
+
+def connect(path):
+    """Connect the current build process to the jobserver at ``path``."""
+    global _client
+    _client = JobServerClient(path)
+    return _client
+
+
+def client():
+    """Return the connection of the current build process to a jobserver,
+    or ``None`` if it is not connected to any."""
+    return _client
@@ -7,6 +7,7 @@
 
 import ordereddict_backport
 
+import spack.package_metadata
 import spack.provider_index
 import spack.util.naming
 from spack.dependency import Dependency
@@ -98,6 +99,12 @@ def get_pkg_class(self, name):
                 "bad namespace: %s" % self.namespace)
         return self.spec_to_pkg[name]
 
+    def get_pkg_metadata(self, name):
+        pkg_class = self.get_pkg_class(name)
+        return spack.package_metadata.PackageMetadata(
+            '%s.%s' % (self.namespace, pkg_class.name),
+            package_class=pkg_class)
+
     def exists(self, name):
         return name in self.spec_to_pkg
 
@@ -5,6 +5,7 @@
 
 from __future__ import print_function
 
+import calendar
 import codecs
 import errno
 import multiprocessing.pool
@@ -89,7 +90,22 @@ def uses_ssl(parsed_url):
     ))(sys.version_info)
 
 
-def read_from_url(url, accept_content_type=None):
+def read_from_url(url, accept_content_type=None, headers=None):
+    """Open the resource at ``url``.
+
+    Args:
+        url (str): URL of the resource
+        accept_content_type (str): if given, resources whose content type
+            does not start with this string are ignored
+        headers (dict): extra headers of the request
+
+    Returns:
+        The URL the resource was read from, the headers of the response and
+        the response itself, or ``(None, None, None)`` if the resource is
+        ignored because of its content type. If ``headers`` make the request
+        conditional and the server replies that the resource was not
+        modified, the response is ``None``.
+    """
     url = url_util.parse(url)
     context = None
 
@@ -111,7 +127,7 @@ def read_from_url(url, accept_content_type=None):
             if not __UNABLE_TO_VERIFY_SSL:
                 context = ssl._create_unverified_context()
 
-    req = Request(url_util.format(url))
+    req = Request(url_util.format(url), headers=headers or {})
     content_type = None
     is_web_url = url.scheme in ('http', 'https')
     if accept_content_type and is_web_url:
@@ -131,6 +147,8 @@ def read_from_url(url, accept_content_type=None):
     try:
         response = _urlopen(req, timeout=_timeout, context=context)
     except URLError as err:
+        if headers and getattr(err, 'code', None) == 304:
+            return url_util.format(url), err.info(), None
         raise SpackWebError('Download failed: {ERROR}'.format(
             ERROR=str(err)))
 
@@ -153,6 +171,38 @@ def read_from_url(url, accept_content_type=None):
     return response.geturl(), response.headers, response
 
 
+def read_from_url_if_modified(url, etag=None, last_modified=None):
+    """Open the resource at ``url``, unless it has not changed since the copy
+    of it that the caller has was fetched.
+
+    The request is made conditional with the ``ETag`` and ``Last-Modified``
+    headers of the response to the previous request. Servers which ignore
+    conditional requests are detected by the ``ETag`` of their response.
+
+    Args:
+        url (str): URL of the resource
+        etag (str): ``ETag`` of the copy of the caller
+        last_modified (str): ``Last-Modified`` date of the copy of the caller
+
+    Returns:
+        The URL, headers and response of the request like ``read_from_url``,
+        or None if the resource was not modified.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    url, response_headers, response = read_from_url(url, headers=headers)
+    if response is None:
+        return None
+    if etag and get_header_or_none(response_headers, 'ETag') == etag:
+        response.close()
+        return None
+    return url, response_headers, response
+
+
 def warn_no_ssl_cert_checking():
     tty.warn("Spack will not check SSL certificates. You need to update "
              "your Python to enable certificate verification.")
@@ -306,7 +356,7 @@ def remove_url(url, recursive=False):
     # Don't even try for other URL schemes.
 
 
-def _iter_s3_contents(contents, prefix):
+def _iter_s3_contents(contents, prefix, mtimes=False):
     for entry in contents:
         key = entry['Key']
 
@@ -318,10 +368,14 @@ def _iter_s3_contents(contents, prefix):
         if key == '.':
             continue
 
-        yield key
+        if mtimes:
+            yield key, calendar.timegm(entry['LastModified'].utctimetuple())
+        else:
+            yield key
 
 
-def _list_s3_objects(client, bucket, prefix, num_entries, start_after=None):
+def _list_s3_objects(client, bucket, prefix, num_entries, start_after=None,
+                     mtimes=False):
     list_args = dict(
         Bucket=bucket,
         Prefix=prefix[1:],
@@ -336,19 +390,20 @@ def _list_s3_objects(client, bucket, prefix, num_entries, start_after=None):
     if result['IsTruncated']:
         last_key = result['Contents'][-1]['Key']
 
-    iter = _iter_s3_contents(result['Contents'], prefix)
+    iter = _iter_s3_contents(result['Contents'], prefix, mtimes)
 
     return iter, last_key
 
 
-def _iter_s3_prefix(client, url, num_entries=1024):
+def _iter_s3_prefix(client, url, num_entries=1024, mtimes=False):
     key = None
     bucket = url.netloc
     prefix = re.sub(r'^/*', '/', url.path)
 
     while True:
         contents, key = _list_s3_objects(
-            client, bucket, prefix, num_entries, start_after=key)
+            client, bucket, prefix, num_entries, start_after=key,
+            mtimes=mtimes)
 
         for x in contents:
             yield x
@@ -387,6 +442,39 @@ def list_url(url, recursive=False):
         return gcs.get_all_blobs(recursive=recursive)
 
 
+def list_url_mtimes(url):
+    """Return the modification times of the files directly under a URL.
+
+    Args:
+        url (str): URL of the directory
+
+    Returns:
+        A dict of the names of the files mapped to their modification time,
+        in seconds since the epoch, or to ``None`` if the storage does not
+        report it cheaply.
+    """
+    url = url_util.parse(url)
+
+    local_path = url_util.local_file_path(url)
+    if local_path:
+        mtimes = {}
+        for subpath in os.listdir(local_path):
+            path = os.path.join(local_path, subpath)
+            if os.path.isfile(path):
+                mtimes[subpath] = os.stat(path).st_mtime
+        return mtimes
+
+    if url.scheme == 's3':
+        s3 = s3_util.create_s3_session(url)
+        return dict(
+            (key, mtime) for key, mtime in _iter_s3_prefix(s3, url, mtimes=True)
+            if '/' not in key)
+
+    elif url.scheme == 'gs':
+        gcs = gcs_util.GCSBucket(url)
+        return dict.fromkeys(gcs.get_all_blobs(recursive=False))
+
+
 def spider(root_urls, depth=0, concurrency=32):
     """Get web pages from root URLs.
 
@@ -675,6 +763,14 @@ def unfuzz(header):
         raise
 
 
+def get_header_or_none(headers, header_name):
+    """Same as ``get_header``, but return None if there is no such header."""
+    try:
+        return get_header(headers, header_name)
+    except KeyError:
+        return None
+
+
 class SpackWebError(spack.error.SpackError):
     """Superclass for Spack web spidering errors."""
 
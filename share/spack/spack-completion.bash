@@ -335,9 +335,9 @@ _spacktivate() {
 _spack() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -H --all-help --color -c --config -C --config-scope -d --debug --show-cores --timestamp --pdb -e --env -D --env-dir -E --no-env --use-env-repo -k --insecure -l --enable-locks -L --disable-locks -m --mock -p --profile --sorted-profile --lines -v --verbose --stacktrace -V --version --print-shell-vars"
+        SPACK_COMPREPLY="-h --help -H --all-help --color -c --config -C --config-scope -d --debug --show-cores --timestamp --pdb -e --env -D --env-dir -E --no-env --use-env-repo -k --insecure -l --enable-locks -L --disable-locks -m --mock -p --profile --sorted-profile --lines --import-profile -v --verbose --stacktrace -V --version --print-shell-vars"
     else
-        SPACK_COMPREPLY="activate add analyze arch audit blame bootstrap build-env buildcache cd checksum ci clean clone commands compiler compilers concretize config containerize create deactivate debug dependencies dependents deprecate dev-build develop diff docs edit env extensions external fetch find flake8 gc gpg graph help info install license list load location log-parse maintainers mark mirror module monitor patch pkg providers pydoc python reindex remove rm repo resource restage solve spec stage style tags test test-env tutorial undevelop uninstall unit-test unload url verify versions view"
+        SPACK_COMPREPLY="activate add analyze arch audit bench blame bootstrap build-env buildcache cd checksum ci clean clone commands compiler compilers concretize config containerize create deactivate debug dependencies dependents deprecate dev-build develop diff docs edit env extensions external fetch find flake8 gc gpg graph help info install license list load location log-parse maintainers mark mirror module monitor patch pkg providers pydoc python reindex remove rm repo resource restage server solve spec stage style tags test test-env tutorial undevelop uninstall unit-test unload url verify versions view"
     fi
 }
 
@@ -420,6 +420,54 @@ _spack_audit_list() {
     SPACK_COMPREPLY="-h --help"
 }
 
+_spack_bench() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help"
+    else
+        SPACK_COMPREPLY="database specs concretize buildcache relocate compare"
+    fi
+}
+
+_spack_bench_database() {
+    SPACK_COMPREPLY="-h --help -n --records -q --queries --json"
+}
+
+_spack_bench_specs() {
+    SPACK_COMPREPLY="-h --help -n --records --json"
+}
+
+_spack_bench_concretize() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -r --repeat --reuse --json"
+    else
+        _all_packages
+    fi
+}
+
+_spack_bench_buildcache() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -j --jobs -s --synthetic --json"
+    else
+        _all_packages
+    fi
+}
+
+_spack_bench_relocate() {
+    SPACK_COMPREPLY="-h --help -n --files -s --size -p --prefixes -j --jobs --json"
+}
+
+_spack_bench_compare() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -t --threshold --min-time"
+    else
+        SPACK_COMPREPLY=""
+    fi
+}
+
 _spack_blame() {
     if $list_options
     then
@@ -502,7 +550,7 @@ _spack_buildcache() {
 _spack_buildcache_create() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -r --rel -f --force -u --unsigned -a --allow-root -k --key -d --directory -m --mirror-name --mirror-url --rebuild-index --spec-file --only"
+        SPACK_COMPREPLY="-h --help -r --rel -f --force -u --unsigned -a --allow-root -k --key -d --directory -m --mirror-name --mirror-url --rebuild-index --spec-file --compression --only"
     else
         _all_packages
     fi
@@ -564,7 +612,7 @@ _spack_buildcache_sync() {
 }
 
 _spack_buildcache_update_index() {
-    SPACK_COMPREPLY="-h --help -d --mirror-url -k --keys"
+    SPACK_COMPREPLY="-h --help -d --mirror-url -k --keys --full"
 }
 
 _spack_cd() {
@@ -1171,7 +1219,7 @@ _spack_info() {
 _spack_install() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help --only -u --until -j --jobs --reuse --overwrite --fail-fast --keep-prefix --keep-stage --dont-restage --use-cache --no-cache --cache-only --monitor --monitor-save-local --monitor-no-auth --monitor-tags --monitor-keep-going --monitor-host --monitor-prefix --include-build-deps --no-check-signature --require-full-hash-match --show-log-on-error --source -n --no-checksum --deprecated -v --verbose --fake --only-concrete --no-add -f --file --clean --dirty --test --run-tests --log-format --log-file --help-cdash --cdash-upload-url --cdash-build --cdash-site --cdash-track --cdash-buildstamp -y --yes-to-all"
+        SPACK_COMPREPLY="-h --help --only -u --until -j --jobs --reuse --concurrent-packages --overwrite --fail-fast --keep-prefix --keep-stage --dont-restage --use-cache --no-cache --cache-only --monitor --monitor-save-local --monitor-no-auth --monitor-tags --monitor-keep-going --monitor-host --monitor-prefix --include-build-deps --no-check-signature --require-full-hash-match --show-log-on-error --source -n --no-checksum --deprecated -v --verbose --fake --only-concrete --no-add -f --file --clean --dirty --test --run-tests --log-format --log-file --help-cdash --cdash-upload-url --cdash-build --cdash-site --cdash-track --cdash-buildstamp -y --yes-to-all"
     else
         _all_packages
     fi
@@ -1636,6 +1684,27 @@ _spack_restage() {
     fi
 }
 
+_spack_server() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help"
+    else
+        SPACK_COMPREPLY="start stop status"
+    fi
+}
+
+_spack_server_start() {
+    SPACK_COMPREPLY="-h --help --timeout -f --foreground"
+}
+
+_spack_server_stop() {
+    SPACK_COMPREPLY="-h --help"
+}
+
+_spack_server_status() {
+    SPACK_COMPREPLY="-h --help"
+}
+
 _spack_solve() {
     if $list_options
     then